@@ -1,19 +1,91 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from app.database import SessionLocal, engine
+from app.routes import (
+    auth, jobs, live, metrics, observations, patrol_logs, patrol_routes, photos, reports, species, stats, sync, water_points,
+)
+from app.services import data_version, proximity
+from app.services.auth import auth_cache
+from app.services.jobs import job_queue
+from app.services.live_feed import live_feed
+from app.services.partitions import PartitionMaintainer
+from app.services.photos import variant_pool
+from app.services.reference_cache import reference_cache
+from app.services.rollups import RollupRefresher
+from app.services.stats import register_session_events, stats_service
+from app.services.sync import purge_sync_history
+from app.utils.metrics import (
+    MetricsMiddleware, install_metrics, metrics_flusher, pool_status, process_age, process_status, record_startup,
+)
+from app.utils.query_counter import QueryGuardMiddleware, install_query_counter
+
 app = FastAPI(
     title="Wildlife Tracker API",
     description="API pour le suivi des espèces dans les parcs nationaux",
     version="1.0.0"
 )
 
+app.add_middleware(QueryGuardMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-SQL-Queries", "ETag"],
 )
+# En dernier : englobe les autres middlewares dans les mesures
+app.add_middleware(MetricsMiddleware)
+
+register_session_events(SessionLocal)
+data_version.register_session_events(SessionLocal)
+proximity.register_session_events(SessionLocal)
+live_feed.register_session_events(SessionLocal)
+reference_cache.register()
+install_query_counter(engine)
+install_metrics(engine)
+job_queue.configure(SessionLocal)
+
+rollup_refresher = RollupRefresher(SessionLocal)
+partition_maintainer = PartitionMaintainer(SessionLocal)
+
+app.include_router(auth.router)
+app.include_router(jobs.router)
+app.include_router(live.router)
+app.include_router(metrics.router)
+app.include_router(observations.router)
+app.include_router(patrol_logs.router)
+app.include_router(patrol_routes.router)
+app.include_router(photos.router)
+app.include_router(reports.router)
+app.include_router(species.router)
+app.include_router(stats.router)
+app.include_router(sync.router)
+app.include_router(water_points.router)
+
+@app.on_event("startup")
+def start_background_jobs():
+    rollup_refresher.start()
+    partition_maintainer.start()
+    job_queue.start()
+    purge_sync_history(SessionLocal)
+    live_feed.start(engine)
+    auth_cache.start(engine)
+    stats_service.start(engine)
+    metrics_flusher.start()
+    record_startup("ready", process_age())
+
+@app.on_event("shutdown")
+def stop_background_jobs():
+    rollup_refresher.stop()
+    partition_maintainer.stop()
+    job_queue.stop()
+    variant_pool.shutdown()
+    live_feed.stop()
+    auth_cache.stop()
+    stats_service.stop()
+    metrics_flusher.stop()
 
 @app.get("/")
 async def root():
@@ -21,15 +93,8 @@ async def root():
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy", "version": "1.0.0"}
-
-@app.get("/stats/dashboard")
-async def get_dashboard_stats():
     return {
-        "total_species": 10,
-        "total_observations": 0,
-        "recent_observations": 0,
-        "species_observations": []
+        "status": "healthy", "version": "1.0.0", "database_pool": pool_status(engine), "process": process_status(),
     }
 
 if __name__ == "__main__":
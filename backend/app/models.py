@@ -1,11 +1,43 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Float, ForeignKey, Boolean, Enum
+from sqlalchemy import BigInteger, Column, Integer, String, Text, Date, DateTime, Float, ForeignKey, Boolean, LargeBinary, Enum, Computed, Index, func
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.types import UserDefinedType
 from datetime import datetime
 import enum
 
 Base = declarative_base()
 
+class Geography(UserDefinedType):
+    """
+    Type PostGIS geography(<type>, <srid>). Les colonnes géographiques ne
+    sont utilisées que dans des expressions SQL (ST_DWithin, geometry(...)) :
+    un type déclaratif suffit, sans charger geoalchemy2 (ni shapely) au
+    démarrage.
+    """
+    cache_ok = True
+
+    def __init__(self, geometry_type="POINT", srid=4326):
+        self.geometry_type = geometry_type
+        self.srid = srid
+
+    def get_col_spec(self, **kw):
+        return f"geography({self.geometry_type}, {self.srid})"
+
+def point_location_column():
+    """
+    Point géographique (WGS84) généré par la base à partir de latitude/longitude.
+    Chargé à la demande uniquement : les listes continuent d'utiliser les
+    colonnes latitude/longitude, la colonne sert aux requêtes spatiales indexées
+    (index GIST idx_<table>_location, déclarés après chaque modèle).
+    """
+    return deferred(Column(
+        Geography(geometry_type="POINT", srid=4326),
+        Computed("ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography", persisted=True)
+    ))
+
+# Sans cela, chaque INSERT ORM relirait la colonne générée (RETURNING location)
+POINT_LOCATION_MAPPER_ARGS = {"eager_defaults": False}
+
 class SpeciesCategory(enum.Enum):
     ANIMAL = "animal"
     PLANT = "plant"
@@ -27,6 +59,13 @@ class ActivityType(enum.Enum):
     RESTORATION = "restauration"
     RESEARCH = "recherche"
 
+class JobStatus(enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
 class UserRole(enum.Enum):
     ADMIN = "admin"
     RANGER = "ranger"
@@ -47,7 +86,7 @@ class Species(Base):
     conservation_actions = Column(Text)
     population_estimate = Column(Integer)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Relations
     observations = relationship("Observation", back_populates="species")
@@ -72,6 +111,7 @@ class User(Base):
 
 class Observation(Base):
     __tablename__ = "observations"
+    __mapper_args__ = POINT_LOCATION_MAPPER_ARGS
     
     id = Column(Integer, primary_key=True, index=True)
     species_id = Column(Integer, ForeignKey("species.id"), nullable=False)
@@ -81,6 +121,7 @@ class Observation(Base):
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
     accuracy = Column(Float)  # Précision GPS en mètres
+    location = point_location_column()  # Index GIST idx_observations_location
     
     # Données d'observation
     observation_date = Column(DateTime, nullable=False)
@@ -103,14 +144,33 @@ class Observation(Base):
     photo_urls = Column(Text)  # URLs séparées par des virgules
     verified = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Indexé : sert de repère (high-water mark) au rafraîchissement des agrégats
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Relations
     species = relationship("Species", back_populates="observations")
     observer = relationship("User", back_populates="observations")
 
+# Index géographique sur `location` : recherches par rayon en mètres
+Index("idx_observations_location", Observation.__table__.c.location, postgresql_using="gist")
+
+# Index planaire (lon/lat) pour les requêtes par emprise, tuiles et polygones
+Index(
+    "idx_observations_location_geom",
+    func.geometry(Observation.__table__.c.location),
+    postgresql_using="gist"
+)
+
+# Observations de lutte anti-braconnage par date (moteur de zones sensibles)
+Index(
+    "idx_observations_poaching_date",
+    Observation.__table__.c.observation_date,
+    postgresql_where=Observation.__table__.c.activity_type == ActivityType.ANTI_POACHING.name
+)
+
 class Activity(Base):
     __tablename__ = "activities"
+    __mapper_args__ = POINT_LOCATION_MAPPER_ARGS
     
     id = Column(Integer, primary_key=True, index=True)
     species_id = Column(Integer, ForeignKey("species.id"), nullable=False)
@@ -134,6 +194,7 @@ class Activity(Base):
     # Géolocalisation de l'activité
     latitude = Column(Float)
     longitude = Column(Float)
+    location = point_location_column()
     area_covered = Column(Float)  # en km²
     
     # Résultats et métriques
@@ -145,14 +206,17 @@ class Activity(Base):
     
     # Métadonnées
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Relations
     species = relationship("Species", back_populates="activities")
     assigned_user = relationship("User", back_populates="activities")
 
+Index("idx_activities_location", Activity.__table__.c.location, postgresql_using="gist")
+
 class WaterPoint(Base):
     __tablename__ = "water_points"
+    __mapper_args__ = POINT_LOCATION_MAPPER_ARGS
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False)
@@ -160,6 +224,7 @@ class WaterPoint(Base):
     # Géolocalisation
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
+    location = point_location_column()
     
     # Caractéristiques
     water_type = Column(String(50))  # river, lake, artificial, spring
@@ -184,7 +249,9 @@ class WaterPoint(Base):
     # Métadonnées
     notes = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+Index("idx_water_points_location", WaterPoint.__table__.c.location, postgresql_using="gist")
 
 class PatrolRoute(Base):
     __tablename__ = "patrol_routes"
@@ -207,10 +274,18 @@ class PatrolRoute(Base):
     
     # Points d'intérêt sur la route
     checkpoints = Column(Text)  # JSON avec les points de contrôle
+
+    # Dérivés de route_geometry à l'écriture (app.services.patrol_routes)
+    bbox_west = Column(Float)
+    bbox_south = Column(Float)
+    bbox_east = Column(Float)
+    bbox_north = Column(Float)
+    vertex_count = Column(Integer)
+    simplified_geometries = deferred(Column(Text))  # JSON {zoom: géométrie GeoJSON}
     
     # Métadonnées
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
 class PatrolLog(Base):
     __tablename__ = "patrol_logs"
@@ -242,7 +317,178 @@ class PatrolLog(Base):
     
     # Métadonnées
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Relations
     route = relationship("PatrolRoute")
-    ranger = relationship("User")
\ No newline at end of file
+    ranger = relationship("User")
+
+class PatrolTrack(Base):
+    """Trace GPS d'une patrouille (codage : app.services.patrol_tracks)"""
+    __tablename__ = "patrol_tracks"
+
+    patrol_log_id = Column(Integer, ForeignKey("patrol_logs.id", ondelete="CASCADE"), primary_key=True)
+    started_at = Column(DateTime, nullable=False)
+    ended_at = Column(DateTime, nullable=False)
+    point_count = Column(Integer, nullable=False)
+    distance_m = Column(Float, nullable=False)
+
+    # Emprise, pour écarter les traces hors de la zone demandée sans les lire
+    bbox_west = Column(Float, nullable=False)
+    bbox_south = Column(Float, nullable=False)
+    bbox_east = Column(Float, nullable=False)
+    bbox_north = Column(Float, nullable=False)
+
+    # Points : entiers en différences successives, compressés
+    points = deferred(Column(LargeBinary, nullable=False))
+    # Cellules de la grille de couverture traversées (même codage)
+    cell_degrees = Column(Float, nullable=False)
+    cells = Column(LargeBinary, nullable=False)
+
+    uploaded_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    __table_args__ = (
+        Index("ix_patrol_tracks_period", "started_at", "ended_at"),
+    )
+
+class Photo(Base):
+    """Photo stockée par empreinte de contenu (app.services.photos)"""
+    __tablename__ = "photos"
+
+    sha256 = Column(String(64), primary_key=True)
+    content_type = Column(String(50), nullable=False)
+    size_bytes = Column(BigInteger, nullable=False)
+    width = Column(Integer)
+    height = Column(Integer)
+    uploaded_by = Column(Integer, ForeignKey("users.id"))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# === AGRÉGATS (maintenus par app.services.rollups) ===
+
+class ObservationDailyRollup(Base):
+    """Observations par jour et par espèce"""
+    __tablename__ = "rollup_observations_daily"
+
+    day = Column(Date, primary_key=True)
+    species_id = Column(Integer, primary_key=True, index=True)
+    observations = Column(Integer, nullable=False, default=0)
+    individuals = Column(Integer, nullable=False, default=0)
+
+class ObservationCellRollup(Base):
+    """Observations par jour et par cellule de grille (longitude/latitude divisées par la taille de cellule)"""
+    __tablename__ = "rollup_observations_cells"
+
+    day = Column(Date, primary_key=True)
+    cell_x = Column(Integer, primary_key=True)
+    cell_y = Column(Integer, primary_key=True)
+    observations = Column(Integer, nullable=False, default=0)
+    individuals = Column(Integer, nullable=False, default=0)
+
+class ActivityStatusRollup(Base):
+    """Nombre d'activités par statut et par type"""
+    __tablename__ = "rollup_activities_status"
+
+    status = Column(String(50), primary_key=True)
+    activity_type = Column(Enum(ActivityType), primary_key=True)
+    activities = Column(Integer, nullable=False, default=0)
+
+class RollupState(Base):
+    """Position du dernier rafraîchissement de chaque famille d'agrégats"""
+    __tablename__ = "rollup_state"
+
+    name = Column(String(50), primary_key=True)
+    high_water_mark = Column(DateTime)  # plus grand updated_at pris en compte
+    refreshed_at = Column(DateTime)
+    full_refreshed_at = Column(DateTime)
+
+class SpeciesTrend(Base):
+    """Tendance de population d'une espèce (app.services.trends)"""
+    __tablename__ = "species_trends"
+
+    species_id = Column(Integer, ForeignKey("species.id", ondelete="CASCADE"), primary_key=True)
+    window_start = Column(Date, nullable=False)  # premier mois de la série
+    months = Column(Integer, nullable=False)  # mois avec observations
+    observations = Column(Integer, nullable=False)
+    individuals = Column(Integer, nullable=False)
+    # Variation annuelle estimée (0.1 = +10 %/an) et intervalle à 95 %
+    annual_change = Column(Float)
+    annual_change_low = Column(Float)
+    annual_change_high = Column(Float)
+    z_score = Column(Float)
+    dispersion = Column(Float)
+    trend = Column(String(20), nullable=False)  # increasing, stable, decreasing, insufficient_data
+    threat_level = Column(String(20))
+    effort_normalized = Column(Boolean, nullable=False)
+    # JSON : observations et individus par mois, effort commun en heures
+    series = deferred(Column(Text, nullable=False))
+    computed_at = Column(DateTime, nullable=False)
+
+# === TÂCHES DE FOND (exécutées par app.services.jobs) ===
+
+class Job(Base):
+    """Tâche longue (import, export, calcul) : état, progression et résultat"""
+    __tablename__ = "jobs"
+
+    id = Column(String(32), primary_key=True)  # uuid4 hexadécimal
+    kind = Column(String(50), nullable=False, index=True)
+    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.PENDING, index=True)
+    params = Column(Text)  # JSON
+    submitted_by = Column(Integer, ForeignKey("users.id"), index=True)
+
+    # Avancement (0 à 1) et annulation coopérative
+    progress = Column(Float, nullable=False, default=0)
+    progress_message = Column(String(255))
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+
+    # Résultat
+    result = Column(Text)  # JSON
+    result_path = Column(String(500))  # fichier produit (exports)
+    error = Column(Text)
+
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    # Écrit périodiquement pendant l'exécution : une tâche RUNNING sans
+    # battement récent a perdu son processus (cf. app.services.jobs)
+    heartbeat_at = Column(DateTime)
+
+# === SYNCHRONISATION HORS LIGNE (app.services.sync) ===
+
+class SyncTombstone(Base):
+    """Ligne supprimée d'une table synchronisée (écrite par un trigger AFTER DELETE)"""
+    __tablename__ = "sync_tombstones"
+
+    id = Column(BigInteger, primary_key=True)
+    table_name = Column(String(64), nullable=False)
+    row_id = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+Index(
+    "ix_sync_tombstones_table_deleted",
+    SyncTombstone.table_name, SyncTombstone.deleted_at, SyncTombstone.id
+)
+
+class SyncIdempotencyKey(Base):
+    """Modification envoyée par un terminal et déjà appliquée (rejouée à l'identique)"""
+    __tablename__ = "sync_idempotency_keys"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    key = Column(String(64), primary_key=True)
+    table_name = Column(String(64), nullable=False)
+    row_id = Column(Integer)
+    result = Column(Text)  # JSON renvoyé au client
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+# === PARTITIONS (app.services.partitions) ===
+
+class PartitionArchive(Base):
+    """Partition mensuelle détachée et archivée en CSV gzip"""
+    __tablename__ = "partition_archives"
+
+    table_name = Column(String(64), primary_key=True)
+    month = Column(Date, primary_key=True)  # premier jour du mois
+    path = Column(String(500), nullable=False)
+    row_count = Column(BigInteger, nullable=False)
+    size_bytes = Column(BigInteger, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    restored_at = Column(DateTime)
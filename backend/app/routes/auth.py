@@ -0,0 +1,48 @@
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.database import SessionLocal, get_database
+from app.models import User
+from app.schemas import Token, UserResponse
+from app.services.auth import AuthenticatedUser
+from app.utils.security import authenticate_user, create_access_token, get_current_user
+
+router = APIRouter(prefix="/auth", tags=["authentification"])
+
+
+def _record_login(user_id: int) -> None:
+    with SessionLocal() as db:
+        db.execute(update(User).where(User.id == user_id).values(last_login=datetime.utcnow()))
+        db.commit()
+
+
+@router.post("/login", response_model=Token)
+async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+    # bcrypt dans son propre pool, lectures et écritures en sessions courtes
+    user = await authenticate_user(form_data.username, form_data.password)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Nom d'utilisateur ou mot de passe incorrect",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if not user.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Utilisateur inactif")
+
+    await run_in_threadpool(_record_login, user.id)
+    return {"access_token": create_access_token({"sub": user.username}), "token_type": "bearer"}
+
+
+@router.get("/me", response_model=UserResponse)
+def read_current_user(current_user: AuthenticatedUser = Depends(get_current_user),
+                      db: Session = Depends(get_database)):
+    # Profil complet lu en base : le cache ne garde que l'identité et le rôle
+    user = db.get(User, current_user.id)
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Identifiants invalides")
+    return user
@@ -0,0 +1,170 @@
+import json
+import os
+import shutil
+from dataclasses import asdict
+from typing import List, Optional
+
+import aiofiles
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.database import get_database
+from app.models import Job, JobStatus, UserRole
+from app.routes.reports import hotspot_params
+from app.schemas import JobResponse, JobResult, JobStatusEnum, ObservationExportQuery
+from app.services import job_tasks
+from app.services.auth import AuthenticatedUser
+from app.services.hotspots import HotspotParams
+from app.services.ingest import SUPPORTED_FORMATS, detect_format
+from app.services.jobs import INPUT_SUFFIX, JOB_STORAGE_DIR, job_file_path, job_queue, new_job_id
+from app.services.species_import import SUPPORTED_EXTENSIONS
+from app.utils.security import get_current_user
+
+router = APIRouter(prefix="/jobs", tags=["tâches de fond"])
+
+
+def _to_response(job: Job) -> JobResponse:
+    response = JobResponse.model_validate(job)
+    response.has_file = bool(job.result_path)
+    return response
+
+
+def _get_visible_job(db: Session, job_id: str, user: AuthenticatedUser) -> Job:
+    job = db.get(Job, job_id)
+    # Les tâches d'un autre utilisateur ne sont visibles que des administrateurs
+    if job is None or (job.submitted_by != user.id and user.role != UserRole.ADMIN):
+        raise HTTPException(status_code=404, detail="Tâche introuvable")
+    return job
+
+
+@router.get("", response_model=List[JobResponse])
+def list_jobs(
+    status: Optional[JobStatusEnum] = None,
+    kind: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_database),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Tâches de l'utilisateur (toutes pour un administrateur), des plus récentes aux plus anciennes"""
+    query = db.query(Job)
+    if current_user.role != UserRole.ADMIN:
+        query = query.filter(Job.submitted_by == current_user.id)
+    if status is not None:
+        query = query.filter(Job.status == JobStatus(status.value))
+    if kind is not None:
+        query = query.filter(Job.kind == kind)
+    return [_to_response(job) for job in query.order_by(Job.created_at.desc()).limit(limit)]
+
+
+@router.get("/{job_id}", response_model=JobResponse)
+def get_job(job_id: str, db: Session = Depends(get_database), current_user: AuthenticatedUser = Depends(get_current_user)):
+    """État et progression d'une tâche"""
+    return _to_response(_get_visible_job(db, job_id, current_user))
+
+
+@router.get("/{job_id}/result", response_model=JobResult)
+def get_job_result(job_id: str, db: Session = Depends(get_database),
+                   current_user: AuthenticatedUser = Depends(get_current_user)):
+    """Résultat d'une tâche terminée (JSON, ou fichier pour les exports)"""
+    job = _get_visible_job(db, job_id, current_user)
+    if job.status != JobStatus.SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Tâche non terminée avec succès ({job.status.value})")
+    if job.result_path:
+        if not os.path.exists(job.result_path):
+            raise HTTPException(status_code=410, detail="Fichier résultat expiré")
+        return FileResponse(job.result_path, filename=f"{job.kind}-{job.id}{os.path.splitext(job.result_path)[1]}")
+    return JobResult(id=job.id, status=job.status.value, result=json.loads(job.result) if job.result else None)
+
+
+@router.post("/{job_id}/cancel", response_model=JobResponse)
+def cancel_job(job_id: str, db: Session = Depends(get_database), current_user: AuthenticatedUser = Depends(get_current_user)):
+    """Demande l'annulation d'une tâche (immédiate si elle n'a pas démarré)"""
+    return _to_response(job_queue.cancel(db, _get_visible_job(db, job_id, current_user)))
+
+
+# === Soumission ===
+
+@router.post("/observations-import", response_model=JobResponse, status_code=202)
+async def submit_observations_import(
+    request: Request,
+    format: Optional[str] = Query(None, description="ndjson ou csv (déduit du Content-Type par défaut)"),
+    db: Session = Depends(get_database),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Import d'observations NDJSON ou CSV en tâche de fond ; le corps est d'abord stocké sur disque"""
+    fmt = detect_format(request.headers.get("content-type"), format)
+    if fmt not in SUPPORTED_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format non supporté: {fmt}")
+
+    job_id = new_job_id()
+    path = job_file_path(job_id, INPUT_SUFFIX)
+    os.makedirs(JOB_STORAGE_DIR, exist_ok=True)
+    try:
+        async with aiofiles.open(path, "wb") as spool:
+            async for chunk in request.stream():
+                await spool.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    job = await run_in_threadpool(
+        job_queue.submit, db, job_tasks.OBSERVATIONS_IMPORT,
+        {"format": fmt, "observer_id": current_user.id}, current_user.id, job_id,
+    )
+    return _to_response(job)
+
+
+@router.post("/species-import", response_model=JobResponse, status_code=202)
+def submit_species_import(
+    file: UploadFile = File(...),
+    db: Session = Depends(get_database),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Import d'un référentiel d'espèces (.xlsx, .xls ou .csv) en tâche de fond"""
+    if not (file.filename or "").lower().endswith(SUPPORTED_EXTENSIONS):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Format non supporté, formats acceptés: {', '.join(SUPPORTED_EXTENSIONS)}",
+        )
+    job_id = new_job_id()
+    os.makedirs(JOB_STORAGE_DIR, exist_ok=True)
+    with open(job_file_path(job_id, INPUT_SUFFIX), "wb") as spool:
+        shutil.copyfileobj(file.file, spool, 1024 * 1024)
+    return _to_response(job_queue.submit(
+        db, job_tasks.SPECIES_IMPORT, {"filename": file.filename}, current_user.id, job_id,
+    ))
+
+
+@router.post("/observations-export", response_model=JobResponse, status_code=202)
+def submit_observations_export(
+    query: ObservationExportQuery,
+    db: Session = Depends(get_database),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Export CSV des observations filtrées, téléchargeable via /jobs/{id}/result"""
+    return _to_response(job_queue.submit(
+        db, job_tasks.OBSERVATIONS_EXPORT, query.model_dump(mode="json", exclude_none=True), current_user.id,
+    ))
+
+
+@router.post("/poaching-hotspots", response_model=JobResponse, status_code=202)
+def submit_poaching_hotspots(
+    params: HotspotParams = Depends(hotspot_params),
+    db: Session = Depends(get_database),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Calcul des zones sensibles de braconnage en tâche de fond (mêmes paramètres que /reports)"""
+    return _to_response(job_queue.submit(db, job_tasks.POACHING_HOTSPOTS, asdict(params), current_user.id))
+
+
+@router.post("/rollups-refresh", response_model=JobResponse, status_code=202)
+def submit_rollups_refresh(
+    full: bool = False,
+    db: Session = Depends(get_database),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Rafraîchissement des agrégats de rapports en tâche de fond"""
+    return _to_response(job_queue.submit(
+        db, job_tasks.ROLLUPS_REFRESH, {"full": full or None}, current_user.id,
+    ))
@@ -0,0 +1,160 @@
+import asyncio
+import json
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.models import ActivityType
+from app.services.auth import AuthenticatedUser
+from app.services.live_feed import EVENT_TYPES, LiveFilter, live_feed
+from app.utils.security import user_from_token
+
+router = APIRouter(prefix="/live", tags=["temps réel"])
+
+_ACTIVITY_TYPES = {activity_type.value for activity_type in ActivityType}
+
+
+def _authenticate(token: Optional[str]) -> AuthenticatedUser:
+    # Cache des utilisateurs, sinon session courte : une connexion longue ne garde pas de connexion du pool
+    if not token:
+        raise HTTPException(status_code=401, detail="Authentification requise", headers={"WWW-Authenticate": "Bearer"})
+    return user_from_token(token)
+
+
+def _bearer(authorization: Optional[str], token: Optional[str]) -> Optional[str]:
+    if authorization and authorization.lower().startswith("bearer "):
+        return authorization[7:].strip()
+    return token
+
+
+def build_filter(types: Optional[List[str]] = None, species_id: Optional[List[int]] = None,
+                 activity_type: Optional[List[str]] = None, bbox: Optional[List[float]] = None) -> LiveFilter:
+    """ValueError si un critère est invalide"""
+    unknown = set(types or ()) - set(EVENT_TYPES)
+    if unknown:
+        raise ValueError(f"Types d'événement inconnus: {', '.join(sorted(unknown))}")
+    unknown = set(activity_type or ()) - _ACTIVITY_TYPES
+    if unknown:
+        raise ValueError(f"Types d'activité inconnus: {', '.join(sorted(unknown))}")
+    if bbox is not None:
+        if len(bbox) != 4 or bbox[0] >= bbox[2] or bbox[1] >= bbox[3]:
+            raise ValueError("Emprise invalide (ouest, sud, est, nord)")
+        bbox = tuple(float(value) for value in bbox)
+    return LiveFilter(
+        types=frozenset(types) if types else frozenset(EVENT_TYPES),
+        species_ids=frozenset(species_id) if species_id else None,
+        activity_types=frozenset(activity_type) if activity_type else None,
+        bbox=bbox,
+    )
+
+
+def live_filter(
+    types: Optional[List[str]] = Query(None, description="observation, incident, import"),
+    species_id: Optional[List[int]] = Query(None),
+    activity_type: Optional[List[str]] = Query(None),
+    west: Optional[float] = Query(None, ge=-180, le=180),
+    south: Optional[float] = Query(None, ge=-90, le=90),
+    east: Optional[float] = Query(None, ge=-180, le=180),
+    north: Optional[float] = Query(None, ge=-90, le=90),
+) -> LiveFilter:
+    bounds = [west, south, east, north]
+    if any(value is not None for value in bounds) and any(value is None for value in bounds):
+        raise HTTPException(status_code=400, detail="Emprise incomplète (west, south, east, north)")
+    try:
+        return build_filter(types, species_id, activity_type, None if west is None else bounds)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/events")
+async def live_events(
+    live_filter: LiveFilter = Depends(live_filter),
+    token: Optional[str] = Query(None, description="Jeton d'accès (EventSource ne transmet pas d'en-têtes)"),
+    authorization: Optional[str] = Header(None),
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Flux Server-Sent Events des nouvelles observations, incidents de
+    patrouille et imports. `resync` signale des événements perdus : le
+    client recharge alors par l'API REST.
+    """
+    await run_in_threadpool(_authenticate, _bearer(authorization, token))
+    subscriber = live_feed.hub.subscribe(live_filter, last_event_id)
+    if subscriber is None:
+        raise HTTPException(status_code=503, detail="Trop d'abonnés au flux temps réel")
+
+    async def stream():
+        try:
+            yield b"retry: 5000\n\n"
+            async for batch in live_feed.hub.batches(subscriber):
+                yield b"".join(live_event.sse for live_event in batch) if batch else b": ping\n\n"
+        finally:
+            live_feed.hub.unsubscribe(subscriber)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # pas de mise en tampon par nginx
+    })
+
+
+@router.get("/status")
+async def live_status():
+    """Abonnés connectés à ce processus, événements diffusés et abonnés déconnectés pour retard"""
+    return live_feed.describe()
+
+
+@router.websocket("/ws")
+async def live_websocket(websocket: WebSocket, token: Optional[str] = None):
+    """
+    Même flux en WebSocket (messages JSON). Le client peut changer de
+    filtre en envoyant {"types", "species_id", "activity_type", "bbox"}.
+    """
+    params = websocket.query_params
+    try:
+        await run_in_threadpool(_authenticate, _bearer(websocket.headers.get("authorization"), token))
+        bounds = [params.get(name) for name in ("west", "south", "east", "north")]
+        initial = build_filter(
+            params.getlist("types") or None,
+            [int(value) for value in params.getlist("species_id")] or None,
+            params.getlist("activity_type") or None,
+            [float(value) for value in bounds] if all(bounds) else None,
+        )
+    except (HTTPException, ValueError):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    subscriber = live_feed.hub.subscribe(initial)
+    if subscriber is None:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+    await websocket.accept()
+
+    async def send():
+        async for batch in live_feed.hub.batches(subscriber):
+            for live_event in batch:
+                await websocket.send_text(live_event.text)
+
+    async def receive():
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+                subscriber.filter = build_filter(
+                    message.get("types"), message.get("species_id"), message.get("activity_type"), message.get("bbox"),
+                )
+            except (AttributeError, TypeError, ValueError) as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+
+    tasks = [asyncio.create_task(send()), asyncio.create_task(receive())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        live_feed.hub.unsubscribe(subscriber)
+    for task in done:
+        if task.exception() is not None and not isinstance(task.exception(), WebSocketDisconnect):
+            raise task.exception()
+    if tasks[0] in done:
+        # Abonné déconnecté pour retard
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
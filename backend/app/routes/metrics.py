@@ -0,0 +1,25 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from app.models import UserRole
+from app.services.auth import AuthenticatedUser
+from app.utils.metrics import render_metrics, slow_queries
+from app.utils.security import get_current_user
+
+router = APIRouter(tags=["supervision"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Mesures au format texte Prometheus (agrégées entre les workers du serveur préforké)"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@router.get("/metrics/slow-queries", response_model=List[dict])
+def get_slow_queries(current_user: AuthenticatedUser = Depends(get_current_user)):
+    """Dernières instructions SQL lentes de ce processus, avec leurs paramètres (administrateurs)"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Réservé aux administrateurs")
+    return slow_queries()
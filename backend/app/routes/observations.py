@@ -0,0 +1,181 @@
+import asyncio
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.database import engine, get_database
+from app.schemas import MAX_SPATIAL_RESULTS, ActivityTypeEnum, ImportResult, ObservationResponse, PolygonQuery
+from app.services.auth import AuthenticatedUser
+from app.services.ingest import SUPPORTED_FORMATS, detect_format, ingest_observations
+from app.services.listing import list_observations
+from app.services.spatial import (
+    observation_density, observations_in_bbox, observations_in_polygon,
+    observations_within_radius,
+)
+from app.services.tiles import TILE_CACHE_TTL, get_tile, is_valid_tile
+from app.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER
+from app.utils.projection import parse_fields
+from app.utils.security import get_current_user
+from app.utils.streams import ChunkQueueReader, open_text_stream
+
+router = APIRouter(prefix="/observations", tags=["observations"])
+
+
+@router.get("")
+def get_observations(
+    response: Response,
+    species_id: Optional[int] = None,
+    observer_id: Optional[int] = None,
+    activity_type: Optional[ActivityTypeEnum] = None,
+    verified: Optional[bool] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    cursor: Optional[str] = Query(None, description=f"Valeur de l'en-tête {NEXT_CURSOR_HEADER} de la page précédente"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = Query(None, description="Champs à renvoyer, ex. id,species_id,latitude,longitude"),
+    db: Session = Depends(get_database),
+):
+    """Observations paginées par curseur (de la plus récente à la plus ancienne)"""
+    items, next_cursor = list_observations(
+        db,
+        species_id=species_id, observer_id=observer_id, activity_type=activity_type, verified=verified,
+        start_date=start_date, end_date=end_date,
+        fields=parse_fields(fields, ObservationResponse), cursor=cursor, limit=limit,
+    )
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return items
+
+
+@router.post("/bulk", response_model=ImportResult)
+async def bulk_import_observations(
+    request: Request,
+    format: Optional[str] = Query(None, description="ndjson ou csv (déduit du Content-Type par défaut)"),
+    db: Session = Depends(get_database),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    """
+    Import en streaming d'observations au format NDJSON ou CSV.
+
+    Débit : l'objectif de 50 000 lignes/s par worker n'est pas atteint.
+    Mesuré sur un cœur (API et PostgreSQL sur la même machine) : environ
+    12 000 lignes/s de bout en bout. Pour 100 000 lignes NDJSON :
+    décodage JSON 1,0 s, validation `ObservationBase` 1,6 s, mise en forme
+    CSV 1,4 s, puis COPY 3,4 s côté serveur (index, clés étrangères,
+    routage des partitions ; COPY seul plafonne vers 30 000 lignes/s).
+    La taille des lots n'y change rien. Avec un cœur de plus pour
+    PostgreSQL, COPY recouvre la validation du lot suivant.
+    """
+    fmt = detect_format(request.headers.get("content-type"), format)
+    if fmt not in SUPPORTED_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format non supporté: {fmt}")
+
+    # Le corps est lu au fil de l'eau et consommé dans un thread :
+    # la boucle d'événements n'est jamais bloquée par la base
+    reader = ChunkQueueReader()
+    consumer = asyncio.ensure_future(
+        run_in_threadpool(ingest_observations, db, open_text_stream(reader), fmt, current_user.id)
+    )
+    await reader.feed(request.stream(), consumer)
+    return await consumer
+
+
+@router.get("/export")
+def export_observations_columnar(
+    format: str = Query("parquet", pattern="^(parquet|arrow)$"),
+    species_id: Optional[List[int]] = Query(None),
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    west: Optional[float] = Query(None, ge=-180, le=180),
+    south: Optional[float] = Query(None, ge=-90, le=90),
+    east: Optional[float] = Query(None, ge=-180, le=180),
+    north: Optional[float] = Query(None, ge=-90, le=90),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Export Parquet ou Arrow IPC des observations filtrées, envoyé en streaming"""
+    # pyarrow (et pandas, qu'il charge) seulement au premier export
+    from app.services.columnar_export import COLUMNAR_FORMATS, export_observations
+
+    bounds = (west, south, east, north)
+    bbox = None
+    if any(value is not None for value in bounds):
+        if any(value is None for value in bounds) or west >= east or south >= north:
+            raise HTTPException(status_code=400, detail="Emprise invalide")
+        bbox = bounds
+    media_type, extension = COLUMNAR_FORMATS[format]
+    return StreamingResponse(
+        export_observations(
+            engine, format, species_ids=species_id, start_date=start_date, end_date=end_date, bbox=bbox,
+        ),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="observations{extension}"'},
+    )
+
+
+@router.get("/tiles/{z}/{x}/{y}")
+def get_observation_tile(
+    z: int,
+    x: int,
+    y: int,
+    species_id: Optional[int] = None,
+    db: Session = Depends(get_database),
+):
+    """Observations d'une tuile Web Mercator (GeoJSON, agrégées aux petits zooms)"""
+    if not is_valid_tile(z, x, y):
+        raise HTTPException(status_code=404, detail="Tuile inexistante")
+    content, _ = get_tile(db, z, x, y, species_id)
+    return Response(
+        content=content,
+        media_type="application/geo+json",
+        headers={"Cache-Control": f"public, max-age={int(TILE_CACHE_TTL)}"},
+    )
+
+
+@router.get("/nearby")
+def get_observations_nearby(
+    latitude: float = Query(..., ge=-90, le=90),
+    longitude: float = Query(..., ge=-180, le=180),
+    radius_m: float = Query(1000, gt=0, le=100_000),
+    species_id: Optional[int] = None,
+    limit: int = Query(MAX_SPATIAL_RESULTS, ge=1, le=MAX_SPATIAL_RESULTS),
+    db: Session = Depends(get_database),
+):
+    """Observations dans un rayon (mètres), triées par distance (GeoJSON)"""
+    return observations_within_radius(db, latitude, longitude, radius_m, species_id, limit)
+
+
+@router.get("/bbox")
+def get_observations_in_bbox(
+    west: float = Query(..., ge=-180, le=180),
+    south: float = Query(..., ge=-90, le=90),
+    east: float = Query(..., ge=-180, le=180),
+    north: float = Query(..., ge=-90, le=90),
+    species_id: Optional[int] = None,
+    limit: int = Query(MAX_SPATIAL_RESULTS, ge=1, le=MAX_SPATIAL_RESULTS),
+    db: Session = Depends(get_database),
+):
+    """Observations contenues dans une emprise (GeoJSON)"""
+    if west >= east or south >= north:
+        raise HTTPException(status_code=400, detail="Emprise invalide")
+    return observations_in_bbox(db, west, south, east, north, species_id, limit)
+
+
+@router.post("/within-polygon")
+def get_observations_in_polygon(query: PolygonQuery, db: Session = Depends(get_database)):
+    """Observations contenues dans un polygone GeoJSON"""
+    return observations_in_polygon(db, query.geometry, query.species_id, query.limit)
+
+
+@router.get("/density")
+def get_observation_density(
+    latitude: float = Query(..., ge=-90, le=90),
+    longitude: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(10, gt=0, le=500),
+    db: Session = Depends(get_database),
+):
+    """Densité d'observations par espèce autour d'un point"""
+    return observation_density(db, latitude, longitude, radius_km)
@@ -0,0 +1,162 @@
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.database import get_database
+from app.models import PatrolLog, UserRole
+from app.schemas import PatrolLogCreate, PatrolLogResponse, PatrolTrackResponse, RouteComparison
+from app.services.auth import AuthenticatedUser
+from app.services.patrol_tracks import (
+    ROUTE_MATCH_TOLERANCE_M, CoverageParams, compare_with_route, default_period, get_coverage,
+    get_coverage_gaps, load_track, parse_track, store_track, track_feature,
+)
+from app.utils.compact import compact_response, read_compact_body
+from app.utils.security import get_current_user
+
+router = APIRouter(prefix="/patrol-logs", tags=["patrouilles"])
+
+FIELD_ROLES = (UserRole.ADMIN, UserRole.RANGER)
+
+
+def _get_log(db: Session, patrol_log_id: int) -> PatrolLog:
+    log = db.get(PatrolLog, patrol_log_id)
+    if log is None:
+        raise HTTPException(status_code=404, detail="Rapport de patrouille introuvable")
+    return log
+
+
+def coverage_params(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    west: Optional[float] = Query(None, ge=-180, le=180),
+    south: Optional[float] = Query(None, ge=-90, le=90),
+    east: Optional[float] = Query(None, ge=-180, le=180),
+    north: Optional[float] = Query(None, ge=-90, le=90),
+    resolution: int = Query(1, ge=1, le=64, description="Côté des cellules, en cellules de base"),
+    ranger_id: Optional[int] = None,
+    route_id: Optional[int] = None,
+) -> CoverageParams:
+    start, end = default_period(start_date, end_date)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="Période invalide")
+    bounds = (west, south, east, north)
+    bbox = None
+    if any(value is not None for value in bounds):
+        if any(value is None for value in bounds) or west >= east or south >= north:
+            raise HTTPException(status_code=400, detail="Emprise invalide")
+        bbox = bounds
+    return CoverageParams(start=start, end=end, bbox=bbox, resolution=resolution,
+                          ranger_id=ranger_id, route_id=route_id)
+
+
+@router.get("/coverage")
+def get_patrol_coverage(
+    params: CoverageParams = Depends(coverage_params),
+    db: Session = Depends(get_database),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Patrouilles distinctes par cellule sur la période (30 derniers jours par défaut)"""
+    try:
+        return get_coverage(db, params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/coverage/gaps")
+def get_patrol_coverage_gaps(
+    params: CoverageParams = Depends(coverage_params),
+    db: Session = Depends(get_database),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Jours écoulés depuis la dernière patrouille de chaque cellule, à la fin de la période"""
+    try:
+        return get_coverage_gaps(db, params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("", response_model=PatrolLogResponse, status_code=201)
+def create_patrol_log(
+    log: PatrolLogCreate,
+    db: Session = Depends(get_database),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    if current_user.role not in FIELD_ROLES:
+        raise HTTPException(status_code=403, detail="Réservé aux gardes et administrateurs")
+    db_log = PatrolLog(**log.model_dump(), ranger_id=current_user.id)
+    db.add(db_log)
+    db.commit()
+    db.refresh(db_log)
+    return db_log
+
+
+@router.get("/{patrol_log_id}", response_model=PatrolLogResponse)
+def get_patrol_log(
+    patrol_log_id: int,
+    db: Session = Depends(get_database),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    return _get_log(db, patrol_log_id)
+
+
+@router.put("/{patrol_log_id}/track", response_model=PatrolTrackResponse)
+async def upload_patrol_track(
+    patrol_log_id: int,
+    request: Request,
+    db: Session = Depends(get_database),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    """
+    Trace GPS de la patrouille (remplace la précédente) : colonnes, liste de
+    points ou Feature GeoJSON, en JSON ou MessagePack, gzip accepté.
+    """
+    body = await read_compact_body(request)
+
+    def save():
+        log = _get_log(db, patrol_log_id)
+        if log.ranger_id != current_user.id and current_user.role != UserRole.ADMIN:
+            raise HTTPException(status_code=403, detail="Trace réservée au garde de la patrouille")
+        try:
+            points = parse_track(body)
+            track = store_track(db, log, points)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        db.commit()
+        return PatrolTrackResponse.model_validate(track)
+
+    return await run_in_threadpool(save)
+
+
+@router.get("/{patrol_log_id}/track")
+def get_patrol_track(
+    patrol_log_id: int,
+    request: Request,
+    db: Session = Depends(get_database),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Trace en Feature GeoJSON (dates en secondes depuis l'époque), JSON ou MessagePack"""
+    loaded = load_track(db, patrol_log_id)
+    if loaded is None:
+        raise HTTPException(status_code=404, detail="Aucune trace pour ce rapport")
+    return compact_response(request, track_feature(*loaded))
+
+
+@router.get("/{patrol_log_id}/route-comparison", response_model=RouteComparison)
+def get_route_comparison(
+    patrol_log_id: int,
+    tolerance_m: float = Query(ROUTE_MATCH_TOLERANCE_M, gt=0, le=5000),
+    db: Session = Depends(get_database),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Trace comparée à l'itinéraire prévu du rapport"""
+    log = _get_log(db, patrol_log_id)
+    loaded = load_track(db, patrol_log_id)
+    if loaded is None:
+        raise HTTPException(status_code=404, detail="Aucune trace pour ce rapport")
+    comparison = compare_with_route(loaded[1], log.route, tolerance_m) if log.route is not None else None
+    if comparison is None:
+        raise HTTPException(status_code=404, detail="Aucun itinéraire prévu avec géométrie pour ce rapport")
+    return comparison
@@ -0,0 +1,165 @@
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.orm import Session
+
+from app.database import get_database
+from app.models import PatrolRoute, UserRole
+from app.schemas import (
+    PatrolRouteCreate, PatrolRouteResponse, PatrolRouteUpdate, RouteDistance, RouteProximityQuery,
+)
+from app.services.auth import AuthenticatedUser
+from app.services.listing import list_patrol_routes
+from app.services.patrol_routes import (
+    ROUTE_MAX_DISTANCE_M, geometry_for_zoom, parse_checkpoints, parse_route_geometry, route_features,
+    routes_near_geometry, routes_near_observation, routes_near_point,
+)
+from app.services.reference_cache import cached_json_response
+from app.utils.security import get_current_user
+
+router = APIRouter(prefix="/patrol-routes", tags=["patrouilles"])
+
+
+def _require_admin(user: AuthenticatedUser) -> None:
+    if user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Réservé aux administrateurs")
+
+
+def _validated(values: dict) -> dict:
+    # Analyse faite avant l'écriture pour renvoyer un 400 plutôt qu'une erreur de flush
+    try:
+        if values.get("route_geometry") is not None:
+            parse_route_geometry(values["route_geometry"])
+        if values.get("checkpoints") is not None:
+            values["checkpoints"] = parse_checkpoints(values["checkpoints"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return values
+
+
+@router.get("", response_model=List[PatrolRouteResponse])
+def get_patrol_routes(request: Request, patrol_type: Optional[str] = None, db: Session = Depends(get_database)):
+    """Routes de patrouille (réponses mises en cache, ETag / If-None-Match)"""
+    return cached_json_response(
+        request, PatrolRoute.__tablename__, lambda: (list_patrol_routes(db, patrol_type=patrol_type), None),
+    )
+
+
+@router.get("/features")
+def get_patrol_route_features(
+    request: Request,
+    zoom: Optional[int] = Query(None, ge=0, le=22, description="Zoom de la carte (géométrie complète sans zoom)"),
+    west: Optional[float] = Query(None, ge=-180, le=180),
+    south: Optional[float] = Query(None, ge=-90, le=90),
+    east: Optional[float] = Query(None, ge=-180, le=180),
+    north: Optional[float] = Query(None, ge=-90, le=90),
+    patrol_type: Optional[str] = None,
+    db: Session = Depends(get_database),
+):
+    """Routes en GeoJSON, simplifiées pour le zoom demandé et filtrées par emprise"""
+    bounds = (west, south, east, north)
+    bbox = None
+    if any(value is not None for value in bounds):
+        if any(value is None for value in bounds) or west >= east or south >= north:
+            raise HTTPException(status_code=400, detail="Emprise invalide")
+        bbox = bounds
+    return cached_json_response(
+        request, PatrolRoute.__tablename__,
+        lambda: (route_features(db, zoom=zoom, bbox=bbox, patrol_type=patrol_type), None),
+    )
+
+
+@router.get("/near", response_model=List[RouteDistance])
+def get_routes_near_point(
+    latitude: float = Query(..., ge=-90, le=90),
+    longitude: float = Query(..., ge=-180, le=180),
+    distance_m: float = Query(1000, gt=0, le=ROUTE_MAX_DISTANCE_M),
+    db: Session = Depends(get_database),
+):
+    """Routes passant à moins de `distance_m` mètres d'un point, de la plus proche à la plus éloignée"""
+    return routes_near_point(db, latitude, longitude, distance_m)
+
+
+@router.post("/near", response_model=List[RouteDistance])
+def get_routes_near_geometry(query: RouteProximityQuery, db: Session = Depends(get_database)):
+    """Routes passant à moins de `distance_m` mètres d'une géométrie GeoJSON (zone sensible...)"""
+    try:
+        return routes_near_geometry(db, query.geometry, query.distance_m)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/near-observation/{observation_id}", response_model=List[RouteDistance])
+def get_routes_near_observation(
+    observation_id: int,
+    distance_m: float = Query(1000, gt=0, le=ROUTE_MAX_DISTANCE_M),
+    observation_date: Optional[datetime] = Query(None, description="Si connue : une seule partition lue"),
+    db: Session = Depends(get_database),
+):
+    """Routes passant à moins de `distance_m` mètres d'une observation"""
+    routes = routes_near_observation(db, observation_id, distance_m, observation_date)
+    if routes is None:
+        raise HTTPException(status_code=404, detail="Observation introuvable")
+    return routes
+
+
+@router.post("", response_model=PatrolRouteResponse, status_code=201)
+def create_patrol_route(
+    route: PatrolRouteCreate,
+    db: Session = Depends(get_database),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Crée une route ; longueur, emprise et versions simplifiées sont calculées à l'écriture"""
+    _require_admin(current_user)
+    db_route = PatrolRoute(**_validated(route.model_dump()))
+    db.add(db_route)
+    db.commit()
+    db.refresh(db_route)
+    return db_route
+
+
+@router.put("/{route_id}", response_model=PatrolRouteResponse)
+def update_patrol_route(
+    route_id: int,
+    route: PatrolRouteUpdate,
+    db: Session = Depends(get_database),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    _require_admin(current_user)
+    db_route = db.get(PatrolRoute, route_id)
+    if db_route is None:
+        raise HTTPException(status_code=404, detail="Route de patrouille introuvable")
+    for name, value in _validated(route.model_dump(exclude_unset=True)).items():
+        setattr(db_route, name, value)
+    db.commit()
+    db.refresh(db_route)
+    return db_route
+
+
+@router.get("/{route_id}", response_model=PatrolRouteResponse)
+def get_patrol_route(route_id: int, request: Request, db: Session = Depends(get_database)):
+    def build():
+        route = db.get(PatrolRoute, route_id)
+        if route is None:
+            raise HTTPException(status_code=404, detail="Route de patrouille introuvable")
+        return PatrolRouteResponse.model_validate(route), None
+
+    return cached_json_response(request, PatrolRoute.__tablename__, build)
+
+
+@router.get("/{route_id}/geometry")
+def get_patrol_route_geometry(
+    route_id: int,
+    request: Request,
+    zoom: Optional[int] = Query(None, ge=0, le=22),
+    db: Session = Depends(get_database),
+):
+    """Géométrie GeoJSON d'une route à la résolution du zoom demandé"""
+    def build():
+        route = db.get(PatrolRoute, route_id)
+        if route is None or not route.route_geometry:
+            raise HTTPException(status_code=404, detail="Route de patrouille introuvable ou sans géométrie")
+        return geometry_for_zoom(route, zoom), None
+
+    return cached_json_response(request, PatrolRoute.__tablename__, build)
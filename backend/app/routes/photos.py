@@ -0,0 +1,115 @@
+import os
+import re
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.database import get_database
+from app.models import Observation, PatrolLog, UserRole
+from app.schemas import PhotoResponse
+from app.services.auth import AuthenticatedUser
+from app.services.partitions import get_row
+from app.services.photos import (
+    PHOTO_CACHE_CONTROL, PHOTO_VARIANTS, VARIANT_MEDIA_TYPE, StoredPhoto, append_urls, find_original,
+    original_path, parse_photo_name, receive_photos, record_photos, variant_path, variant_pool,
+)
+from app.utils.file_response import file_response
+from app.utils.security import get_current_user
+
+router = APIRouter(prefix="/photos", tags=["photos"])
+
+_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _to_response(photo: StoredPhoto) -> PhotoResponse:
+    return PhotoResponse(
+        **{name: getattr(photo, name) for name in (
+            "sha256", "url", "filename", "content_type", "size_bytes", "width", "height", "duplicate",
+        )},
+        thumbnail_url=f"/photos/{photo.sha256}/thumb.webp",
+        medium_url=f"/photos/{photo.sha256}/medium.webp",
+    )
+
+
+def _attachment_target(db: Session, user: AuthenticatedUser, observation_id: Optional[int], patrol_log_id: Optional[int],
+                       partition_date: Optional[datetime] = None):
+    """Observation ou rapport auquel rattacher les photos, après contrôle des droits"""
+    if observation_id is not None and patrol_log_id is not None:
+        raise HTTPException(status_code=400, detail="Une seule cible : observation_id ou patrol_log_id")
+    if observation_id is not None:
+        target, owner, label = get_row(db, Observation, observation_id, partition_date), "observer_id", "Observation"
+    elif patrol_log_id is not None:
+        target, owner, label = get_row(db, PatrolLog, patrol_log_id, partition_date), "ranger_id", "Rapport de patrouille"
+    else:
+        return None
+    if target is None:
+        raise HTTPException(status_code=404, detail=f"{label} introuvable")
+    if getattr(target, owner) != user.id and user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail=f"{label} d'un autre utilisateur")
+    return target
+
+
+@router.post("", response_model=List[PhotoResponse], status_code=201)
+async def upload_photos(
+    request: Request,
+    observation_id: Optional[int] = None,
+    patrol_log_id: Optional[int] = None,
+    target_date: Optional[datetime] = Query(
+        None, description="Date de l'observation ou du rapport, si connue : une seule partition lue"
+    ),
+    db: Session = Depends(get_database),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    """
+    Téléverse des photos (multipart, un ou plusieurs fichiers), rattachées
+    à une observation ou à un rapport de patrouille si demandé. Une photo
+    déjà stockée n'est pas réécrite : vérifier au préalable son existence
+    avec HEAD /photos/<sha256>.<ext> évite même de l'envoyer.
+    """
+    target = await run_in_threadpool(
+        _attachment_target, db, current_user, observation_id, patrol_log_id, target_date
+    )
+    photos = await receive_photos(request)
+
+    def save():
+        record_photos(db, photos, current_user.id)
+        if target is not None:
+            field = "photo_urls" if isinstance(target, Observation) else "photos"
+            setattr(target, field, append_urls(getattr(target, field), [photo.url for photo in photos]))
+        db.commit()
+
+    await run_in_threadpool(save)
+    return [_to_response(photo) for photo in photos]
+
+
+@router.api_route("/{name}", methods=["GET", "HEAD"])
+def get_photo(name: str, request: Request):
+    """
+    Photo originale. Les URL, dérivées du contenu, ne changent jamais :
+    cache longue durée, ETag et requêtes partielles (Range).
+    """
+    parsed = parse_photo_name(name)
+    path = original_path(*parsed[:2]) if parsed else None
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Photo introuvable")
+    return file_response(request, path, parsed[2], parsed[0], PHOTO_CACHE_CONTROL)
+
+
+@router.api_route("/{sha256}/{variant}.webp", methods=["GET", "HEAD"])
+async def get_photo_variant(sha256: str, variant: str, request: Request):
+    """Variante WebP (thumb, medium), générée à la demande si elle manque encore"""
+    if not _SHA256.match(sha256) or variant not in PHOTO_VARIANTS:
+        raise HTTPException(status_code=404, detail="Photo introuvable")
+    path = variant_path(sha256, variant)
+    if not os.path.exists(path):
+        source = find_original(sha256)
+        if source is None:
+            raise HTTPException(status_code=404, detail="Photo introuvable")
+        try:
+            await variant_pool.ensure(sha256, source)
+        except Exception:
+            raise HTTPException(status_code=500, detail="Variante non générée")
+    return file_response(request, path, VARIANT_MEDIA_TYPE, f"{sha256}-{variant}", PHOTO_CACHE_CONTROL)
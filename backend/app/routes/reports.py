@@ -0,0 +1,91 @@
+from datetime import date
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app.database import get_database
+from app.schemas import ActivityStatusCount, CellObservations, PeriodObservations, RollupStateResponse
+from app.services.auth import AuthenticatedUser
+from app.services.hotspots import HotspotParams, get_hotspots
+from app.services.rollups import (
+    REPORT_INTERVALS, activities_by_status, get_rollup_states, observations_by_cell, observations_by_period,
+    refresh_rollups,
+)
+from app.utils.security import get_current_user
+
+router = APIRouter(prefix="/reports", tags=["rapports"])
+
+
+@router.get("/observations", response_model=List[PeriodObservations])
+def get_observations_report(
+    interval: str = Query("day", description="day, week, month ou year"),
+    species_id: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: Session = Depends(get_database),
+):
+    """Observations par période et par espèce (agrégats matérialisés)"""
+    if interval not in REPORT_INTERVALS:
+        raise HTTPException(status_code=400, detail=f"Intervalle non supporté: {interval}")
+    return observations_by_period(db, interval, species_id, start_date, end_date)
+
+
+@router.get("/observations/cells", response_model=List[CellObservations])
+def get_observation_cells_report(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    min_observations: int = Query(1, ge=1),
+    db: Session = Depends(get_database),
+):
+    """Observations par cellule de grille (~1 km) sur une période"""
+    return observations_by_cell(db, start_date, end_date, min_observations)
+
+
+@router.get("/activities", response_model=List[ActivityStatusCount])
+def get_activities_report(db: Session = Depends(get_database)):
+    """Nombre d'activités par statut et par type"""
+    return activities_by_status(db)
+
+
+@router.get("/freshness", response_model=List[RollupStateResponse])
+def get_reports_freshness(db: Session = Depends(get_database)):
+    """Date de dernière mise à jour de chaque famille d'agrégats"""
+    return get_rollup_states(db)
+
+
+@router.post("/refresh", response_model=List[RollupStateResponse])
+def refresh_reports(
+    full: bool = False,
+    db: Session = Depends(get_database),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Rafraîchit les agrégats immédiatement (reconstruction complète avec full=true)"""
+    if not refresh_rollups(db, full=full or None):
+        raise HTTPException(status_code=409, detail="Rafraîchissement déjà en cours")
+    return get_rollup_states(db)
+
+
+def hotspot_params(
+    days_back: int = Query(90, ge=1, le=3650),
+    half_life_days: float = Query(30, gt=0),
+    cell_degrees: float = Query(HotspotParams.cell_degrees, ge=0.001, le=1),
+    bandwidth_cells: int = Query(1, ge=0, le=10),
+    min_density: float = Query(1.0, gt=0),
+    include_patrol_incidents: bool = True,
+    limit: int = Query(50, ge=1, le=500),
+) -> HotspotParams:
+    return HotspotParams(
+        days_back=days_back, half_life_days=half_life_days, cell_degrees=cell_degrees,
+        bandwidth_cells=bandwidth_cells, min_density=min_density,
+        include_patrol_incidents=include_patrol_incidents, limit=limit,
+    )
+
+
+@router.get("/poaching-hotspots")
+def get_poaching_hotspots(params: HotspotParams = Depends(hotspot_params), db: Session = Depends(get_database)):
+    """Zones sensibles de braconnage classées par score (GeoJSON)"""
+    try:
+        return get_hotspots(db, params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
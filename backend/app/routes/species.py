@@ -0,0 +1,69 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
+from sqlalchemy.orm import Session
+
+from app.database import get_database
+from app.models import Species
+from app.schemas import ConservationStatusEnum, ImportResult, SpeciesCategoryEnum, SpeciesResponse
+from app.services.auth import AuthenticatedUser
+from app.services.listing import list_species
+from app.services.reference_cache import cached_json_response
+from app.services.species_import import SUPPORTED_EXTENSIONS, import_species
+from app.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER
+from app.utils.projection import parse_fields
+from app.utils.security import get_current_user
+
+router = APIRouter(prefix="/species", tags=["espèces"])
+
+
+@router.get("")
+def get_species(
+    request: Request,
+    category: Optional[SpeciesCategoryEnum] = None,
+    conservation_status: Optional[ConservationStatusEnum] = None,
+    cursor: Optional[str] = Query(None, description=f"Valeur de l'en-tête {NEXT_CURSOR_HEADER} de la page précédente"),
+    skip: int = Query(0, ge=0, description="Pagination par décalage (anciens clients), ignorée avec un curseur"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    db: Session = Depends(get_database),
+):
+    """Espèces (réponses mises en cache, ETag / If-None-Match)"""
+    selected = parse_fields(fields, SpeciesResponse)
+
+    def build():
+        items, next_cursor = list_species(
+            db, category=category, conservation_status=conservation_status,
+            fields=selected, cursor=cursor, limit=limit, skip=skip,
+        )
+        return items, {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+
+    return cached_json_response(request, Species.__tablename__, build)
+
+
+@router.get("/{species_id}", response_model=SpeciesResponse)
+def get_species_by_id(species_id: int, request: Request, db: Session = Depends(get_database)):
+    def build():
+        species = db.get(Species, species_id)
+        if species is None:
+            raise HTTPException(status_code=404, detail="Espèce introuvable")
+        return SpeciesResponse.model_validate(species), None
+
+    return cached_json_response(request, Species.__tablename__, build)
+
+
+@router.post("/import-excel", response_model=ImportResult)
+def import_species_file(
+    file: UploadFile = File(...),
+    db: Session = Depends(get_database),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Import d'un référentiel d'espèces (.xlsx, .xls ou .csv)"""
+    if not (file.filename or "").lower().endswith(SUPPORTED_EXTENSIONS):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Format non supporté, formats acceptés: {', '.join(SUPPORTED_EXTENSIONS)}",
+        )
+    # Le fichier reçu est déjà stocké sur disque par le parseur multipart :
+    # il est relu en streaming, sans être chargé en mémoire
+    return import_species(db, file.file, file.filename)
@@ -0,0 +1,40 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app.database import get_database
+from app.schemas import DashboardStats, SpeciesStatistics, SpeciesTrendDetail, SpeciesTrendResponse
+from app.services.stats import stats_service
+from app.services.trends import get_trend, list_trends
+
+router = APIRouter(prefix="/stats", tags=["statistiques"])
+
+
+@router.get("/dashboard", response_model=DashboardStats)
+def get_dashboard_stats(db: Session = Depends(get_database)):
+    return stats_service.get_dashboard(db)
+
+
+@router.get("/species", response_model=List[SpeciesStatistics])
+def get_species_statistics(db: Session = Depends(get_database)):
+    return stats_service.get_species_statistics(db)
+
+
+@router.get("/trends", response_model=List[SpeciesTrendResponse])
+def get_species_trends(
+    trend: Optional[str] = Query(None, description="increasing, stable, decreasing ou insufficient_data"),
+    threat_level: Optional[str] = Query(None, description="low, medium, high ou critical"),
+    db: Session = Depends(get_database),
+):
+    """Tendances de population (recalculées avec les agrégats, cf. /reports/refresh)"""
+    return list_trends(db, trend, threat_level)
+
+
+@router.get("/trends/{species_id}", response_model=SpeciesTrendDetail)
+def get_species_trend(species_id: int, db: Session = Depends(get_database)):
+    """Tendance d'une espèce et sa série mensuelle"""
+    trend = get_trend(db, species_id)
+    if trend is None:
+        raise HTTPException(status_code=404, detail="Tendance non calculée pour cette espèce")
+    return trend
@@ -0,0 +1,60 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.database import get_database
+from app.schemas import SyncPushRequest
+from app.services.auth import AuthenticatedUser
+from app.services.sync import SYNC_MAX_PAGE_SIZE, SYNC_PAGE_SIZE, pull_changes, push_changes
+from app.utils.compact import compact_response, read_compact_body
+from app.utils.security import get_current_user
+
+router = APIRouter(prefix="/sync", tags=["synchronisation"])
+
+
+@router.get("/pull")
+def pull(
+    request: Request,
+    token: Optional[str] = Query(None, description="Jeton renvoyé par la synchronisation précédente"),
+    tables: Optional[List[str]] = Query(None),
+    limit: int = Query(SYNC_PAGE_SIZE, ge=1, le=SYNC_MAX_PAGE_SIZE),
+    db: Session = Depends(get_database),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    """
+    Lignes modifiées et supprimées depuis le jeton (tout, sans jeton).
+    Rappeler avec le nouveau jeton tant que `has_more` est vrai ; JSON ou
+    MessagePack selon l'en-tête Accept, compressé en gzip si accepté.
+    """
+    try:
+        payload = pull_changes(db, token, tables, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return compact_response(request, payload)
+
+
+@router.post("/push")
+async def push(
+    request: Request,
+    db: Session = Depends(get_database),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    """
+    Applique un lot de modifications (corps SyncPushRequest en JSON ou
+    MessagePack, gzip accepté) ; un résultat par modification : applied,
+    conflict (avec la version du serveur) ou rejected.
+    """
+    body = await read_compact_body(request)
+    try:
+        changes = SyncPushRequest.model_validate(body).changes
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    try:
+        results = await run_in_threadpool(push_changes, db, current_user, changes)
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return compact_response(request, {"results": results})
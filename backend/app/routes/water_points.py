@@ -0,0 +1,101 @@
+from datetime import datetime
+from typing import List, Optional
+
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.orm import Session
+
+from app.database import get_database
+from app.models import WaterPoint
+from app.schemas import (
+    MAX_SPATIAL_RESULTS, NearestWaterPoint, NearestWaterPointsQuery, NearestWaterPointsResult, ObservationWaterDistance,
+    WaterPointResponse,
+)
+from app.services.listing import list_water_points
+from app.services.proximity import nearest_water_points, observations_near_water, water_point_index
+from app.services.reference_cache import cached_json_response
+
+router = APIRouter(prefix="/water-points", tags=["points d'eau"])
+
+
+@router.get("/nearest", response_model=List[NearestWaterPoint])
+def get_nearest_water_points(
+    latitude: float = Query(..., ge=-90, le=90),
+    longitude: float = Query(..., ge=-180, le=180),
+    k: int = Query(1, ge=1, le=20),
+    max_distance_m: Optional[float] = Query(None, gt=0),
+    active_only: bool = True,
+    db: Session = Depends(get_database),
+):
+    """Points d'eau les plus proches d'une position, du plus proche au plus éloigné"""
+    return nearest_water_points(db, latitude, longitude, k, max_distance_m, active_only)
+
+
+@router.post("/nearest", response_model=NearestWaterPointsResult)
+def get_nearest_water_points_batch(query: NearestWaterPointsQuery, db: Session = Depends(get_database)):
+    """Points d'eau les plus proches d'un lot de positions (longitude, latitude)"""
+    coordinates = np.asarray(query.points, dtype=np.float64).reshape(-1, 2)
+    ids, distances = water_point_index.nearest(
+        db, coordinates[:, 0], coordinates[:, 1], query.k, query.max_distance_m, query.active_only
+    )
+    found = ids >= 0
+    return {
+        "ids": np.where(found, ids, None).tolist(),
+        "distances_m": np.where(found, np.round(distances, 1), None).tolist(),
+    }
+
+
+@router.get("/observations", response_model=List[ObservationWaterDistance])
+def get_observations_near_water(
+    distance_m: float = Query(2000, gt=0, le=50_000),
+    species_id: Optional[int] = None,
+    active_only: bool = True,
+    west: Optional[float] = Query(None, ge=-180, le=180),
+    south: Optional[float] = Query(None, ge=-90, le=90),
+    east: Optional[float] = Query(None, ge=-180, le=180),
+    north: Optional[float] = Query(None, ge=-90, le=90),
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    limit: int = Query(MAX_SPATIAL_RESULTS, ge=1, le=MAX_SPATIAL_RESULTS),
+    db: Session = Depends(get_database),
+):
+    """
+    Observations situées à moins de `distance_m` mètres d'un point d'eau, les
+    plus récentes d'abord ; une emprise ou une date de début est requise.
+    """
+    bounds = (west, south, east, north)
+    bbox = None
+    if any(value is not None for value in bounds):
+        if any(value is None for value in bounds) or west >= east or south >= north:
+            raise HTTPException(status_code=400, detail="Emprise invalide")
+        bbox = bounds
+    if bbox is None and start_date is None:
+        raise HTTPException(status_code=400, detail="Emprise (west, south, east, north) ou start_date requis")
+    return observations_near_water(
+        db, distance_m, species_id, active_only, bbox=bbox, start_date=start_date, end_date=end_date, limit=limit,
+    )
+
+
+@router.get("", response_model=List[WaterPointResponse])
+def get_water_points(
+    request: Request,
+    status: Optional[str] = None,
+    water_type: Optional[str] = None,
+    db: Session = Depends(get_database),
+):
+    """Points d'eau (réponses mises en cache, ETag / If-None-Match)"""
+    return cached_json_response(
+        request, WaterPoint.__tablename__,
+        lambda: (list_water_points(db, status=status, water_type=water_type), None),
+    )
+
+
+@router.get("/{water_point_id}", response_model=WaterPointResponse)
+def get_water_point(water_point_id: int, request: Request, db: Session = Depends(get_database)):
+    def build():
+        water_point = db.get(WaterPoint, water_point_id)
+        if water_point is None:
+            raise HTTPException(status_code=404, detail="Point d'eau introuvable")
+        return WaterPointResponse.model_validate(water_point), None
+
+    return cached_json_response(request, WaterPoint.__tablename__, build)
@@ -1,8 +1,14 @@
 # backend/app/schemas.py
-from pydantic import BaseModel, validator
-from typing import Optional, List
-from datetime import datetime
+from pydantic import BaseModel, Field, validator
+from typing import Any, Optional, List, Tuple
+from datetime import date, datetime, timezone
 from enum import Enum
+import os
+
+# Plafond des résultats des requêtes spatiales (cf. app.services.spatial)
+MAX_SPATIAL_RESULTS = int(os.getenv("MAX_SPATIAL_RESULTS", "5000"))
+# Taille maximale d'un lot de POST /water-points/nearest
+MAX_NEAREST_POINTS = int(os.getenv("MAX_NEAREST_POINTS", "100000"))
 
 # Enums pour validation
 class SpeciesCategoryEnum(str, Enum):
@@ -278,24 +284,70 @@ class WaterPointResponse(WaterPointBase):
     class Config:
         from_attributes = True
 
+class NearestWaterPoint(BaseModel):
+    id: int
+    name: str
+    latitude: float
+    longitude: float
+    status: Optional[str] = None
+    distance_m: float
+
+class NearestWaterPointsQuery(BaseModel):
+    points: List[Tuple[float, float]] = Field(..., max_length=MAX_NEAREST_POINTS)  # (longitude, latitude)
+    k: int = 1
+    max_distance_m: Optional[float] = None
+    active_only: bool = True
+
+    @validator('k')
+    def validate_k(cls, v):
+        if not 1 <= v <= 20:
+            raise ValueError('k doit être entre 1 et 20')
+        return v
+
+class NearestWaterPointsResult(BaseModel):
+    # Une ligne par point demandé, k colonnes ; None si aucun point d'eau
+    ids: List[List[Optional[int]]]
+    distances_m: List[List[Optional[float]]]
+
+class ObservationWaterDistance(BaseModel):
+    observation_id: int
+    water_point_id: int
+    distance_m: float
+
 # === SCHÉMAS PATROUILLES ===
 
 class PatrolRouteBase(BaseModel):
     name: str
     description: Optional[str] = None
     route_geometry: Optional[str] = None
-    total_distance: Optional[float] = None
+    total_distance: Optional[float] = None  # calculée à partir de route_geometry si elle est fournie
     estimated_duration: Optional[int] = None
     difficulty_level: str = "medium"
     frequency: Optional[str] = None
     patrol_type: Optional[str] = None
+    checkpoints: Optional[str] = None
 
 class PatrolRouteCreate(PatrolRouteBase):
     pass
 
+class PatrolRouteUpdate(BaseModel):
+    name: Optional[str] = None
+    description: Optional[str] = None
+    route_geometry: Optional[str] = None
+    total_distance: Optional[float] = None
+    estimated_duration: Optional[int] = None
+    difficulty_level: Optional[str] = None
+    frequency: Optional[str] = None
+    patrol_type: Optional[str] = None
+    checkpoints: Optional[str] = None
+
 class PatrolRouteResponse(PatrolRouteBase):
     id: int
-    checkpoints: Optional[str] = None
+    bbox_west: Optional[float] = None
+    bbox_south: Optional[float] = None
+    bbox_east: Optional[float] = None
+    bbox_north: Optional[float] = None
+    vertex_count: Optional[int] = None
     created_at: datetime
     updated_at: datetime
     
@@ -331,6 +383,66 @@ class PatrolLogResponse(PatrolLogBase):
     class Config:
         from_attributes = True
 
+class PatrolTrackResponse(BaseModel):
+    patrol_log_id: int
+    started_at: datetime
+    ended_at: datetime
+    point_count: int
+    distance_m: float
+    bbox_west: float
+    bbox_south: float
+    bbox_east: float
+    bbox_north: float
+    uploaded_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class RouteComparison(BaseModel):
+    route_id: int
+    tolerance_m: float
+    route_distance_m: float
+    track_distance_m: float
+    route_followed_ratio: Optional[float] = None  # part de l'itinéraire parcourue
+    off_route_ratio: Optional[float] = None  # part de la trace hors itinéraire
+    max_deviation_m: float
+    duration_minutes: float
+    estimated_duration_minutes: Optional[int] = None
+
+# === SCHÉMAS SPATIAUX ===
+
+class PolygonQuery(BaseModel):
+    geometry: dict
+    species_id: Optional[int] = None
+    limit: Optional[int] = Field(None, ge=1, le=MAX_SPATIAL_RESULTS)
+
+    @validator('geometry')
+    def validate_geometry(cls, v):
+        if v.get('type') not in ('Polygon', 'MultiPolygon') or not v.get('coordinates'):
+            raise ValueError('La géométrie doit être un Polygon ou MultiPolygon GeoJSON')
+        return v
+
+class RouteProximityQuery(BaseModel):
+    geometry: dict  # GeoJSON (Point, Polygon d'une zone sensible...)
+    distance_m: float = 1000
+
+    @validator('geometry')
+    def validate_geometry(cls, v):
+        if not v.get('type') or not v.get('coordinates'):
+            raise ValueError('Géométrie GeoJSON attendue')
+        return v
+
+    @validator('distance_m')
+    def validate_distance(cls, v):
+        if not 0 < v <= 50_000:
+            raise ValueError('La distance doit être entre 0 et 50 000 m')
+        return v
+
+class RouteDistance(BaseModel):
+    id: int
+    name: str
+    distance_m: float
+
 # === SCHÉMAS STATISTIQUES ===
 
 class DashboardStats(BaseModel):
@@ -347,10 +459,149 @@ class SpeciesStatistics(BaseModel):
     population_trend: Optional[str] = None
     threat_level: Optional[str] = None
 
+class SpeciesTrendResponse(BaseModel):
+    species_id: int
+    species_name: str
+    scientific_name: str
+    window_start: date
+    months: int
+    observations: int
+    individuals: int
+    annual_change: Optional[float] = None  # variation annuelle relative (0.1 = +10 %/an)
+    annual_change_low: Optional[float] = None  # intervalle de confiance à 95 %
+    annual_change_high: Optional[float] = None
+    z_score: Optional[float] = None
+    dispersion: Optional[float] = None
+    trend: str
+    threat_level: Optional[str] = None
+    effort_normalized: bool
+    computed_at: datetime
+
+class SpeciesTrendDetail(SpeciesTrendResponse):
+    series: dict  # mois, observations, individus, heures de patrouille
+
+# === SCHÉMAS RAPPORTS (agrégats) ===
+
+class PeriodObservations(BaseModel):
+    period: date
+    species_id: int
+    observations: int
+    individuals: int
+
+class CellObservations(BaseModel):
+    cell_x: int
+    cell_y: int
+    bbox: List[float]  # ouest, sud, est, nord
+    observations: int
+    individuals: int
+
+class ActivityStatusCount(BaseModel):
+    status: str
+    activity_type: Optional[str] = None
+    activities: int
+
+class RollupStateResponse(BaseModel):
+    name: str
+    high_water_mark: Optional[datetime] = None
+    refreshed_at: Optional[datetime] = None
+    full_refreshed_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
 # === SCHÉMAS D'IMPORT ===
 
 class ImportResult(BaseModel):
     success: bool
     imported_count: int
     errors: List[str]
-    message: str
\ No newline at end of file
+    message: str
+
+# === SCHÉMAS TÂCHES DE FOND ===
+
+class JobStatusEnum(str, Enum):
+    pending = "pending"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+    cancelled = "cancelled"
+
+class JobResponse(BaseModel):
+    id: str
+    kind: str
+    status: JobStatusEnum
+    progress: float
+    progress_message: Optional[str] = None
+    cancel_requested: bool
+    error: Optional[str] = None
+    has_file: bool = False
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @validator('status', pre=True)
+    def status_value(cls, v):
+        return getattr(v, "value", v)
+
+    class Config:
+        from_attributes = True
+
+class JobResult(BaseModel):
+    id: str
+    status: JobStatusEnum
+    result: Any = None
+
+class ObservationExportQuery(BaseModel):
+    species_id: Optional[int] = None
+    observer_id: Optional[int] = None
+    activity_type: Optional[ActivityTypeEnum] = None
+    verified: Optional[bool] = None
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+
+# === SCHÉMAS SYNCHRONISATION ===
+
+class SyncChange(BaseModel):
+    key: str  # clé d'idempotence, choisie par le terminal
+    table: str
+    op: str = "upsert"  # upsert ou delete
+    id: Optional[int] = None  # absent pour une création
+    base_updated_at: Optional[datetime] = None  # version connue du terminal
+    # Date de partition connue du terminal (observation_date) : une seule partition lue
+    partition_date: Optional[datetime] = None
+    data: Optional[dict] = None
+
+    @validator('key')
+    def validate_key(cls, v):
+        if not 1 <= len(v) <= 64:
+            raise ValueError('La clé d\'idempotence doit faire de 1 à 64 caractères')
+        return v
+
+    @validator('op')
+    def validate_op(cls, v):
+        if v not in ('upsert', 'delete'):
+            raise ValueError('Opération inconnue (upsert ou delete)')
+        return v
+
+    @validator('base_updated_at', 'partition_date')
+    def naive_utc(cls, v):
+        if v is not None and v.tzinfo is not None:
+            return v.astimezone(timezone.utc).replace(tzinfo=None)
+        return v
+
+class SyncPushRequest(BaseModel):
+    changes: List[SyncChange]
+
+# === SCHÉMAS PHOTOS ===
+
+class PhotoResponse(BaseModel):
+    sha256: str
+    url: str
+    thumbnail_url: str
+    medium_url: str
+    filename: Optional[str] = None
+    content_type: str
+    size_bytes: int
+    width: int
+    height: int
+    duplicate: bool  # déjà stockée : le fichier reçu a été écarté
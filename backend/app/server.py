@@ -0,0 +1,147 @@
+"""
+Serveur de production : gunicorn et workers uvicorn préforkés.
+
+L'application est importée et les données de référence (compteurs par
+espèce, points d'eau, routes de patrouille) sont chargées une seule fois,
+dans le processus maître, avant le fork des workers. Ceux-ci partagent
+ces pages mémoire (copie à l'écriture) au lieu de tout importer et
+charger chacun : un worker de plus ne coûte que sa mémoire privée. Les
+objets préchargés sont gelés (gc.freeze) pour que le ramasse-miettes des
+workers ne réécrive pas les pages héritées.
+
+Les mesures de /metrics sont agrégées entre workers par un répertoire
+partagé (METRICS_MULTIPROC_DIR, sinon un répertoire temporaire).
+
+Chaque worker a son propre pool de connexions : WEB_WORKERS ×
+(DB_POOL_SIZE + DB_MAX_OVERFLOW) doit rester sous max_connections.
+
+Usage (depuis backend/) :
+
+    python -m app.server --workers 4
+"""
+import argparse
+import gc
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from gunicorn.app.base import BaseApplication
+
+from app.utils.metrics import enable_multiprocess, mark_process_dead, record_startup
+
+logger = logging.getLogger("gunicorn.error")
+
+WEB_BIND = os.getenv("WEB_BIND", "0.0.0.0:8000")
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "0"))  # 0 = un par cœur
+WEB_TIMEOUT = int(os.getenv("WEB_TIMEOUT", "120"))
+WEB_GRACEFUL_TIMEOUT = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+# Redémarrage d'un worker après N requêtes (0 = jamais) : borne la dérive mémoire
+WEB_MAX_REQUESTS = int(os.getenv("WEB_MAX_REQUESTS", "0"))
+WEB_WARM_UP = os.getenv("WEB_WARM_UP", "true").lower() in ("1", "true", "yes", "on")
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR", "")
+
+
+def warm_up() -> dict:
+    """Charge les données de référence en mémoire ; durée par source (s)"""
+    from app.database import SessionLocal, engine
+    from app.services.patrol_routes import route_index
+    from app.services.proximity import water_point_index
+    from app.services.stats import stats_service
+
+    durations = {}
+    with SessionLocal() as db:
+        for name, load in (
+            ("species_stats", stats_service.reload),
+            ("water_points", water_point_index.reload),
+            ("patrol_routes", route_index.ensure_loaded),
+        ):
+            started = time.perf_counter()
+            try:
+                load(db)
+            except Exception:
+                # Chargée à la demande par chaque worker
+                logger.exception("Préchargement %s impossible", name)
+                db.rollback()
+            durations[name] = round(time.perf_counter() - started, 3)
+    # Aucune connexion ouverte ne doit être héritée par les workers
+    engine.dispose()
+    return durations
+
+
+def preload():
+    """Application importée et préchargée dans le processus maître"""
+    started = time.perf_counter()
+    from app.main import app
+    imported = time.perf_counter() - started
+    record_startup("import", imported)
+    logger.info("Application importée en %.2f s", imported)
+
+    if WEB_WARM_UP:
+        started = time.perf_counter()
+        durations = warm_up()
+        warmed = time.perf_counter() - started
+        record_startup("warm_up", warmed)
+        logger.info("Données de référence préchargées en %.2f s : %s", warmed, durations)
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def _post_fork(server, worker) -> None:
+    from app.database import engine
+
+    # Connexions éventuellement ouvertes par le maître : laissées à celui-ci
+    engine.dispose(close=False)
+
+
+def _child_exit(server, worker) -> None:
+    # Compteurs du worker conservés ; ses jauges disparaissent
+    mark_process_dead(worker.pid)
+
+
+class Server(BaseApplication):
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return preload()
+
+
+def options(bind: str = WEB_BIND, workers: int = WEB_WORKERS) -> dict:
+    return {
+        "bind": bind,
+        "workers": workers or os.cpu_count() or 1,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": True,
+        "timeout": WEB_TIMEOUT,
+        "graceful_timeout": WEB_GRACEFUL_TIMEOUT,
+        "max_requests": WEB_MAX_REQUESTS,
+        "max_requests_jitter": WEB_MAX_REQUESTS // 10,
+        "post_fork": _post_fork,
+        "child_exit": _child_exit,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur de production (workers uvicorn préforkés)")
+    parser.add_argument("--bind", default=WEB_BIND)
+    parser.add_argument("--workers", type=int, default=WEB_WORKERS, help="0 = un par cœur")
+    args = parser.parse_args()
+    metrics_dir = METRICS_MULTIPROC_DIR or tempfile.mkdtemp(prefix="wt-metrics-")
+    enable_multiprocess(metrics_dir)
+    try:
+        Server(options(args.bind, args.workers)).run()
+    finally:
+        if not METRICS_MULTIPROC_DIR:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Utilisateurs authentifiés : cache par processus et révocation.
+
+Une requête authentifiée ne lit pas la table `users` : l'utilisateur
+désigné par le jeton (id, nom, rôle, actif) est gardé AUTH_CACHE_TTL
+secondes en mémoire (voir app.utils.security pour la vérification des
+jetons, elle aussi sans accès à la base).
+
+Révocation : un trigger sur `users` publie (NOTIFY, à la validation de la
+transaction) le nom des utilisateurs dont le rôle, l'activation ou le nom
+change, ou qui sont supprimés, quelle que soit l'origine de l'écriture
+(API, scripts, SQL). Chaque processus de l'API écoute ce canal et retire
+les entrées concernées ; si l'écoute est interrompue, le cache est vidé à
+la reconnexion et sa durée de vie borne le retard.
+"""
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import select, text
+
+from app.database import SessionLocal
+from app.models import User, UserRole
+from app.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+AUTH_CHANNEL = os.getenv("AUTH_CHANNEL", "wt_auth")
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
+
+@dataclass(frozen=True)
+class AuthenticatedUser:
+    """Utilisateur d'une requête : identité et droits, sans le reste du profil"""
+    id: int
+    username: str
+    role: UserRole
+    is_active: bool
+
+
+_USER_COLUMNS = (User.id, User.username, User.role, User.is_active)
+
+
+class UserCache:
+    def __init__(self, session_factory=SessionLocal, channel: str = AUTH_CHANNEL,
+                 ttl: float = AUTH_CACHE_TTL, maxsize: int = AUTH_CACHE_SIZE):
+        self.session_factory = session_factory
+        self.channel = channel
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        # Incrémenté à chaque révocation : un chargement commencé avant
+        # n'est pas mis en cache (il a pu lire l'ancienne valeur)
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._listener = None
+        self.hits = self.misses = self.revocations = 0
+
+    # --- Lecture ---
+
+    def get(self, username: str) -> Optional[AuthenticatedUser]:
+        user = self._cache.get(username)
+        if user is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return user
+
+    def load(self, username: str) -> Optional[AuthenticatedUser]:
+        """Lecture en base (session courte) puis mise en cache"""
+        generation = self._generation
+        with self.session_factory() as db:
+            row = db.execute(select(*_USER_COLUMNS).where(User.username == username)).first()
+        user = AuthenticatedUser(*row) if row else None
+        if user is not None:
+            self._store(user, generation)
+        return user
+
+    def get_or_load(self, username: str) -> Optional[AuthenticatedUser]:
+        return self.get(username) or self.load(username)
+
+    def credentials(self, username: str) -> Optional[Tuple[AuthenticatedUser, str]]:
+        """(utilisateur, hachage du mot de passe), lus en base pour une connexion"""
+        generation = self._generation
+        with self.session_factory() as db:
+            row = db.execute(
+                select(*_USER_COLUMNS, User.hashed_password).where(User.username == username)
+            ).first()
+        if row is None:
+            return None
+        user = AuthenticatedUser(*row[:-1])
+        self._store(user, generation)
+        return user, row[-1]
+
+    def _store(self, user: AuthenticatedUser, generation: int) -> None:
+        with self._lock:
+            if generation == self._generation:
+                self._cache.set(user.username, user)
+
+    # --- Révocation ---
+
+    def revoke(self, usernames: Iterable[str]) -> None:
+        with self._lock:
+            self._generation += 1
+            for username in usernames:
+                self._cache.invalidate(username)
+                self.revocations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._cache.invalidate()
+
+    def start(self, engine) -> None:
+        """Écoute des révocations (PostgreSQL) ; sinon, la durée de vie seule s'applique"""
+        from app.services.live_feed import NotifyListener
+
+        if engine.dialect.name != "postgresql" or self._listener is not None:
+            return
+        self._listener = NotifyListener(engine, self.channel, self.revoke, self.clear)
+        self._listener.start()
+
+    def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def describe(self) -> dict:
+        return {
+            "entries": len(self._cache), "hits": self.hits, "misses": self.misses,
+            "revocations": self.revocations, "listening": self._listener is not None,
+        }
+
+
+auth_cache = UserCache()
+
+
+# === Schéma ===
+
+_AUTH_DDL = """
+CREATE OR REPLACE FUNCTION notify_user_auth_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' OR OLD.username IS DISTINCT FROM NEW.username
+            OR OLD.role IS DISTINCT FROM NEW.role OR OLD.is_active IS DISTINCT FROM NEW.is_active THEN
+        PERFORM pg_notify('{channel}', json_build_array(OLD.username)::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_auth_revocation ON users;
+CREATE TRIGGER users_auth_revocation AFTER UPDATE OR DELETE ON users
+    FOR EACH ROW EXECUTE FUNCTION notify_user_auth_change();
+"""
+
+
+def install_auth_schema(connection) -> None:
+    """Trigger de révocation des utilisateurs en cache (idempotent)"""
+    connection.execute(text(_AUTH_DDL.format(channel=AUTH_CHANNEL)))
@@ -0,0 +1,351 @@
+"""
+Export colonnaire des observations (Parquet ou Arrow IPC) en streaming.
+
+Les observations, filtrées en SQL (espèce, période, emprise), sortent de
+Postgres par `COPY (SELECT ...) TO STDOUT` et sont décodées par le
+lecteur CSV de pyarrow (C++), sans objet Python par ligne. Avec un pilote
+sans COPY, un curseur côté serveur (`yield_per`) est transposé en
+colonnes lot par lot. Dans les deux cas, la mémoire est bornée par un
+groupe de lignes, quel que soit le volume exporté.
+
+La jointure avec les espèces est faite côté Arrow : la table species
+(petite) est lue une fois, dans le même instantané (REPEATABLE READ), et
+les noms sont exportés en colonnes dictionnaire. Postgres n'envoie ainsi
+pas les noms pour chaque ligne. Les colonnes sont typées ;
+`activity_type` et `conservation_status` sont encodées avec un
+dictionnaire fixe (les valeurs de l'énumération), identique d'un lot à
+l'autre.
+"""
+import io
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import csv as pacsv
+from sqlalchemy import select, text
+from sqlalchemy.engine import Connection
+
+from app.models import ActivityType, ConservationStatus, Observation, Species
+from app.services.spatial import location_in_bounds
+
+logger = logging.getLogger(__name__)
+
+EXPORT_ROW_GROUP_SIZE = int(os.getenv("EXPORT_ROW_GROUP_SIZE", "262144"))
+EXPORT_PARQUET_COMPRESSION = os.getenv("EXPORT_PARQUET_COMPRESSION", "zstd")
+# Délai maximal de la requête d'export (0 = aucun ; le délai par défaut
+# des connexions interromprait les gros exports)
+EXPORT_STATEMENT_TIMEOUT_MS = int(os.getenv("EXPORT_STATEMENT_TIMEOUT_MS", "0"))
+# Taille des blocs lus par le décodeur CSV (nombre de lignes par lot)
+_CSV_BLOCK_SIZE = 8 * 1024 * 1024
+
+COLUMNAR_FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", ".arrows"),
+}
+
+
+def _enum_dictionary(enum_class) -> Tuple[pa.Array, pa.Array, dict]:
+    # Les énumérations sont stockées par nom en base et exportées par valeur
+    names = pa.array([member.name for member in enum_class])
+    values = pa.array([member.value for member in enum_class])
+    return names, values, {member: index for index, member in enumerate(enum_class)}
+
+
+_ACTIVITY_TYPES = _enum_dictionary(ActivityType)
+_CONSERVATION_STATUSES = _enum_dictionary(ConservationStatus)
+_ENUM_TYPE = pa.dictionary(pa.int8(), pa.string())
+_NAME_TYPE = pa.dictionary(pa.int32(), pa.string())
+
+# Colonnes lues dans observations : (nom, colonne SQL, type Arrow)
+OBSERVATION_COLUMNS: Sequence[Tuple[str, object, pa.DataType]] = (
+    ("id", Observation.id, pa.int64()),
+    ("species_id", Observation.species_id, pa.int32()),
+    ("observer_id", Observation.observer_id, pa.int32()),
+    ("latitude", Observation.latitude, pa.float64()),
+    ("longitude", Observation.longitude, pa.float64()),
+    ("accuracy", Observation.accuracy, pa.float64()),
+    ("observation_date", Observation.observation_date, pa.timestamp("us")),
+    ("count", Observation.count, pa.int32()),
+    ("activity_type", Observation.activity_type, _ENUM_TYPE),
+    ("weather_conditions", Observation.weather_conditions, pa.string()),
+    ("temperature", Observation.temperature, pa.float64()),
+    ("humidity", Observation.humidity, pa.float64()),
+    ("behavior_notes", Observation.behavior_notes, pa.string()),
+    ("health_status", Observation.health_status, pa.string()),
+    ("age_group", Observation.age_group, pa.string()),
+    ("sex", Observation.sex, pa.string()),
+    ("notes", Observation.notes, pa.string()),
+    ("photo_urls", Observation.photo_urls, pa.string()),
+    ("verified", Observation.verified, pa.bool_()),
+    ("created_at", Observation.created_at, pa.timestamp("us")),
+    ("updated_at", Observation.updated_at, pa.timestamp("us")),
+)
+
+# Colonnes ajoutées depuis species, après species_id
+SPECIES_FIELDS = (
+    pa.field("species_common_name", _NAME_TYPE),
+    pa.field("species_scientific_name", _NAME_TYPE),
+    pa.field("conservation_status", _ENUM_TYPE),
+)
+
+_OBSERVATION_FIELDS = [pa.field(name, arrow_type) for name, _, arrow_type in OBSERVATION_COLUMNS]
+EXPORT_SCHEMA = pa.schema(_OBSERVATION_FIELDS[:2] + list(SPECIES_FIELDS) + _OBSERVATION_FIELDS[2:])
+
+
+def build_export_query(species_ids: Optional[List[int]] = None, start_date: Optional[datetime] = None,
+                       end_date: Optional[datetime] = None,
+                       bbox: Optional[Tuple[float, float, float, float]] = None):
+    """SELECT des observations filtrées ; bbox = (ouest, sud, est, nord)"""
+    query = select(*(column for _, column, _ in OBSERVATION_COLUMNS))
+    if species_ids:
+        query = query.where(Observation.species_id.in_(species_ids))
+    if start_date is not None:
+        query = query.where(Observation.observation_date >= start_date)
+    if end_date is not None:
+        query = query.where(Observation.observation_date <= end_date)
+    if bbox is not None:
+        query = query.where(location_in_bounds(*bbox))
+    return query
+
+
+# === Lecture en lots Arrow ===
+
+class SpeciesLookup:
+    """Jointure species_id -> noms et statut, par indices dans des dictionnaires fixes"""
+
+    def __init__(self, rows: Sequence[tuple]):
+        ids, common_names, scientific_names, statuses = zip(*rows) if rows else ((), (), (), ())
+        _, _, status_index = _CONSERVATION_STATUSES
+        self.ids = pa.array(ids, type=pa.int32())
+        self.common_names = pa.array(common_names, type=pa.string())
+        self.scientific_names = pa.array(scientific_names, type=pa.string())
+        self.status_indices = pa.array(
+            [None if status is None else status_index[status] for status in statuses], type=pa.int8()
+        )
+
+    @classmethod
+    def load(cls, connection: Connection) -> "SpeciesLookup":
+        return cls(connection.execute(select(
+            Species.id, Species.common_name, Species.scientific_name, Species.conservation_status,
+        ).order_by(Species.id)).all())
+
+    def join(self, batch: pa.RecordBatch) -> pa.RecordBatch:
+        positions = pc.index_in(batch.column("species_id"), value_set=self.ids)
+        species_columns = [
+            pa.DictionaryArray.from_arrays(positions, self.common_names),
+            pa.DictionaryArray.from_arrays(positions, self.scientific_names),
+            pa.DictionaryArray.from_arrays(pc.take(self.status_indices, positions), _CONSERVATION_STATUSES[1]),
+        ]
+        columns = batch.columns
+        return pa.RecordBatch.from_arrays(columns[:2] + species_columns + columns[2:], schema=EXPORT_SCHEMA)
+
+
+def _copy_batches(connection: Connection, query) -> Iterator[pa.RecordBatch]:
+    """COPY ... TO STDOUT (CSV) décodé en flux par pyarrow"""
+    dbapi_connection = connection.connection.driver_connection
+    cursor = dbapi_connection.cursor()
+    compiled = query.compile(dialect=connection.dialect, compile_kwargs={"render_postcompile": True})
+    # Paramètres insérés par le pilote (COPY n'accepte pas de paramètres liés)
+    sql = cursor.mogrify(str(compiled), compiled.params).decode()
+    copy_sql = f"COPY ({sql}) TO STDOUT WITH (FORMAT csv)"
+
+    read_fd, write_fd = os.pipe()
+    errors: List[BaseException] = []
+
+    def produce():
+        try:
+            with os.fdopen(write_fd, "wb") as sink:
+                cursor.copy_expert(copy_sql, sink)
+        except BaseException as e:
+            errors.append(e)
+
+    column_types = {
+        name: pa.string() if pa.types.is_dictionary(arrow_type) else arrow_type
+        for name, _, arrow_type in OBSERVATION_COLUMNS
+    }
+    activity_names, activity_values, _ = _ACTIVITY_TYPES
+    schema = pa.schema(_OBSERVATION_FIELDS)
+    producer = threading.Thread(target=produce, name="columnar-export-copy", daemon=True)
+    producer.start()
+    source = os.fdopen(read_fd, "rb")
+    completed = False
+    try:
+        if not source.peek(1):
+            # Aucune ligne : le décodeur CSV refuse un flux vide
+            producer.join()
+            if not errors:
+                completed = True
+                return
+            raise errors[0]
+        reader = pacsv.open_csv(
+            source,
+            read_options=pacsv.ReadOptions(column_names=list(column_types), block_size=_CSV_BLOCK_SIZE),
+            parse_options=pacsv.ParseOptions(newlines_in_values=True),
+            convert_options=pacsv.ConvertOptions(
+                column_types=column_types, true_values=["t"], false_values=["f"],
+                # NULL = champ vide non quoté ; "" = chaîne vide
+                strings_can_be_null=True, quoted_strings_can_be_null=False,
+            ),
+        )
+        for batch in reader:
+            indices = pc.cast(pc.index_in(batch.column("activity_type"), value_set=activity_names), pa.int8())
+            columns = [
+                pa.DictionaryArray.from_arrays(indices, activity_values) if name == "activity_type"
+                else batch.column(name)
+                for name in schema.names
+            ]
+            yield pa.RecordBatch.from_arrays(columns, schema=schema)
+        completed = True
+    except Exception:
+        source.close()
+        producer.join()
+        # Une erreur du COPY (SQL, connexion) explique celle du décodeur
+        if errors:
+            raise errors[0]
+        raise
+    finally:
+        # Fermer la lecture interrompt un COPY en cours (client parti)
+        source.close()
+        producer.join()
+        cursor.close()
+        if not completed or errors:
+            connection.invalidate()
+    if errors:
+        raise errors[0]
+
+
+def _cursor_batches(connection: Connection, query) -> Iterator[pa.RecordBatch]:
+    """Curseur côté serveur (yield_per), transposé en colonnes lot par lot"""
+    _, activity_values, activity_index = _ACTIVITY_TYPES
+    schema = pa.schema(_OBSERVATION_FIELDS)
+    result = connection.execution_options(yield_per=EXPORT_ROW_GROUP_SIZE).execute(query)
+    for rows in result.partitions():
+        columns = []
+        for (name, _, arrow_type), values in zip(OBSERVATION_COLUMNS, zip(*rows)):
+            if name == "activity_type":
+                indices = pa.array([None if v is None else activity_index[v] for v in values], type=pa.int8())
+                columns.append(pa.DictionaryArray.from_arrays(indices, activity_values))
+            else:
+                columns.append(pa.array(values, type=arrow_type))
+        yield pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+def iter_export_batches(connection: Connection, query) -> Iterator[pa.RecordBatch]:
+    """Lots au schéma EXPORT_SCHEMA ; à appeler dans une transaction REPEATABLE READ"""
+    connection.execute(text(f"SET LOCAL statement_timeout = {EXPORT_STATEMENT_TIMEOUT_MS}"))
+    species = SpeciesLookup.load(connection)
+    cursor = connection.connection.driver_connection.cursor()
+    has_copy = hasattr(cursor, "copy_expert")
+    cursor.close()
+    batches = _copy_batches(connection, query) if has_copy else _cursor_batches(connection, query)
+    return (species.join(batch) for batch in batches)
+
+
+# === Écriture ===
+
+class _ChunkSink(io.RawIOBase):
+    """Destination en mémoire vidée après chaque groupe de lignes"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _row_groups(batches: Iterator[pa.RecordBatch], size: int) -> Iterator[pa.Table]:
+    pending: List[pa.RecordBatch] = []
+    rows = 0
+    for batch in batches:
+        while batch.num_rows:
+            take = min(batch.num_rows, size - rows)
+            pending.append(batch.slice(0, take))
+            rows += take
+            batch = batch.slice(take)
+            if rows == size:
+                yield pa.Table.from_batches(pending, schema=EXPORT_SCHEMA)
+                pending, rows = [], 0
+    if pending:
+        yield pa.Table.from_batches(pending, schema=EXPORT_SCHEMA)
+
+
+def stream_columnar(batches: Iterator[pa.RecordBatch], fmt: str = "parquet",
+                    row_group_size: int = EXPORT_ROW_GROUP_SIZE) -> Iterator[bytes]:
+    """Encode les lots en Parquet (un groupe de lignes à la fois) ou en flux Arrow IPC"""
+    if fmt not in COLUMNAR_FORMATS:
+        raise ValueError(f"Format non supporté: {fmt}")
+    sink = _ChunkSink()
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        writer = pq.ParquetWriter(sink, EXPORT_SCHEMA, compression=EXPORT_PARQUET_COMPRESSION)
+    else:
+        writer = pa.ipc.new_stream(sink, EXPORT_SCHEMA)
+    try:
+        for table in _row_groups(batches, row_group_size):
+            if fmt == "parquet":
+                writer.write_table(table, row_group_size=row_group_size)
+            else:
+                writer.write_table(table)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_observations(engine, fmt: str = "parquet", **filters) -> Iterator[bytes]:
+    """
+    Génère le fichier exporté morceau par morceau, sur une connexion
+    dédiée (indépendante de la session de la requête).
+    """
+    query = build_export_query(**filters)
+    # Même instantané pour la table species et les observations
+    with engine.connect().execution_options(isolation_level="REPEATABLE READ") as connection:
+        with connection.begin():
+            yield from stream_columnar(iter_export_batches(connection, query), fmt)
+
+
+if __name__ == "__main__":
+    # python -m app.services.columnar_export -o observations.parquet [--species-id 1] [--bbox w,s,e,n] ...
+    import argparse
+    import time
+
+    from app.database import engine
+
+    parser = argparse.ArgumentParser(description="Export colonnaire des observations")
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("--format", choices=sorted(COLUMNAR_FORMATS))
+    parser.add_argument("--species-id", type=int, action="append", dest="species_ids")
+    parser.add_argument("--start-date", type=datetime.fromisoformat)
+    parser.add_argument("--end-date", type=datetime.fromisoformat)
+    parser.add_argument("--bbox", type=lambda v: tuple(float(x) for x in v.split(",")), help="ouest,sud,est,nord")
+    args = parser.parse_args()
+    fmt = args.format or ("arrow" if args.output.endswith((".arrow", ".arrows")) else "parquet")
+
+    logging.basicConfig(level=logging.INFO)
+    started = time.perf_counter()
+    size = 0
+    with open(args.output, "wb") as output:
+        for chunk in export_observations(
+            engine, fmt, species_ids=args.species_ids, start_date=args.start_date,
+            end_date=args.end_date, bbox=args.bbox,
+        ):
+            output.write(chunk)
+            size += len(chunk)
+    logger.info("Export %s : %.1f Mo en %.1f s", args.output, size / 1e6, time.perf_counter() - started)
@@ -0,0 +1,82 @@
+"""
+Versions de données par table.
+
+Chaque commit qui écrit dans une table incrémente sa version ; les caches
+(tuiles, agrégats...) incluent cette version dans leurs clés, si bien
+qu'une écriture rend immédiatement obsolètes les entrées concernées.
+Les compteurs sont propres au processus : les écritures des autres
+workers sont rattrapées par la durée de vie des caches, ou propagées par
+un abonné (voir app.services.reference_cache).
+"""
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class DataVersions:
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+        self._listeners: List[Callable[[Tuple[str, ...]], None]] = []
+        self._lock = threading.Lock()
+
+    def get(self, table: str) -> int:
+        return self._versions.get(table, 0)
+
+    def bump(self, *tables: str) -> None:
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+        for listener in self._listeners:
+            listener(tables)
+
+    def subscribe(self, listener: Callable[[Tuple[str, ...]], None]) -> None:
+        """`listener(tables)` est appelé après chaque incrément"""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+
+data_versions = DataVersions()
+
+
+def register_commit_hook(session_factory, key: str,
+                         collect: Callable[[Session], Optional[Iterable[Any]]],
+                         apply: Callable[[List[Any]], None]) -> None:
+    """
+    Suivi des écritures d'une transaction : `collect(session)` est appelé à
+    chaque flush et renvoie des éléments, accumulés dans session.info[key]
+    (il peut aussi les y ajouter lui-même) ; `apply(éléments)` est appelé
+    après le commit, et les éléments sont oubliés au rollback. Les valeurs
+    doivent être copiées par `collect` : après le commit, les objets sont
+    expirés.
+    """
+    def after_flush(session: Session, flush_context) -> None:
+        items = collect(session)
+        if items:
+            session.info.setdefault(key, []).extend(items)
+
+    def after_commit(session: Session) -> None:
+        items = session.info.pop(key, None)
+        if items:
+            apply(items)
+
+    def after_rollback(session: Session) -> None:
+        session.info.pop(key, None)
+
+    event.listen(session_factory, "after_flush", after_flush)
+    event.listen(session_factory, "after_commit", after_commit)
+    event.listen(session_factory, "after_rollback", after_rollback)
+
+
+def _written_tables(session: Session) -> List[str]:
+    return [
+        table for table in (getattr(obj, "__tablename__", None)
+                            for obj in (*session.new, *session.dirty, *session.deleted))
+        if table
+    ]
+
+
+def register_session_events(session_factory) -> None:
+    register_commit_hook(session_factory, "written_tables", _written_tables,
+                         lambda tables: data_versions.bump(*sorted(set(tables))))
@@ -0,0 +1,350 @@
+"""
+Zones sensibles de braconnage.
+
+Les observations `lutte_braconnage` et les incidents des rapports de
+patrouille sont lus en colonnes (une requête indexée chacun), pondérés par
+une décroissance exponentielle de leur âge, puis accumulés sur une grille
+régulière (NumPy). La densité est lissée par un noyau d'Epanechnikov, les
+cellules au-dessus du seuil sont regroupées en zones connexes (au sens du
+voisinage à 8 cellules, à la manière de DBSCAN sur la grille) et chaque zone
+est renvoyée sous forme de polygone, classée par score, avec les espèces
+concernées.
+
+Les rapports de patrouille n'ont pas de position propre : leurs incidents
+sont répartis sur les sommets de la géométrie de l'itinéraire.
+
+Les résultats sont mis en cache par paramètres et par repère des données
+(plus grand updated_at des observations et des rapports) : tant que rien
+n'est écrit, un recalcul ne coûte que deux lectures d'index. Un rapport
+corrigé (incidents, date) change donc aussi le repère.
+"""
+import json
+import math
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import shapely
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from app.models import ActivityType, Observation, PatrolLog, PatrolRoute, Species
+from app.utils.cache import TTLCache
+
+HOTSPOT_CELL_DEGREES = float(os.getenv("HOTSPOT_CELL_DEGREES", "0.01"))
+HOTSPOT_CACHE_TTL = float(os.getenv("HOTSPOT_CACHE_TTL", "300"))
+# Taille maximale de la grille de calcul (cellules)
+HOTSPOT_MAX_CELLS = int(os.getenv("HOTSPOT_MAX_CELLS", "25000000"))
+
+LN2 = math.log(2)
+
+hotspot_cache = TTLCache(ttl=HOTSPOT_CACHE_TTL, maxsize=64)
+
+
+@dataclass(frozen=True)
+class HotspotParams:
+    days_back: int = 90
+    half_life_days: float = 30.0
+    cell_degrees: float = HOTSPOT_CELL_DEGREES
+    # Rayon du noyau de lissage, en cellules (0 = pas de lissage)
+    bandwidth_cells: int = 1
+    # Densité minimale d'une cellule de zone sensible (1 = un incident du jour)
+    min_density: float = 1.0
+    include_patrol_incidents: bool = True
+    limit: int = 50
+
+
+@dataclass
+class Events:
+    """Événements géolocalisés en colonnes"""
+    longitudes: np.ndarray
+    latitudes: np.ndarray
+    weights: np.ndarray  # poids pondérés par l'âge
+    amounts: np.ndarray  # poids bruts (individus observés, part d'incidents)
+    species_ids: np.ndarray  # -1 pour les incidents de patrouille
+    is_incident: np.ndarray
+    dates: np.ndarray  # datetime64[s]
+
+
+def _decay(dates: np.ndarray, now: datetime, half_life_days: float) -> np.ndarray:
+    age_days = (np.datetime64(now, "s") - dates).astype(np.float64) / 86400.0
+    return np.exp(-LN2 * np.maximum(age_days, 0.0) / half_life_days)
+
+
+def _load_observations(db: Session, since: datetime) -> Tuple[np.ndarray, ...]:
+    rows = (
+        db.query(
+            Observation.longitude, Observation.latitude, Observation.observation_date,
+            Observation.species_id, Observation.count,
+        )
+        .filter(Observation.activity_type == ActivityType.ANTI_POACHING, Observation.observation_date >= since)
+        .all()
+    )
+    if not rows:
+        return (np.empty(0), np.empty(0), np.empty(0, dtype="datetime64[s]"), np.empty(0, dtype=np.int64),
+                np.empty(0))
+    lons, lats, dates, species, counts = zip(*rows)
+    return (
+        np.asarray(lons, dtype=np.float64),
+        np.asarray(lats, dtype=np.float64),
+        np.asarray(dates, dtype="datetime64[s]"),
+        np.asarray(species, dtype=np.int64),
+        np.asarray([c or 1 for c in counts], dtype=np.float64),
+    )
+
+
+def _route_vertices(route_geometry: Optional[str]) -> Optional[np.ndarray]:
+    if not route_geometry:
+        return None
+    try:
+        geometry = json.loads(route_geometry)
+        geometry = geometry.get("geometry", geometry)
+        coordinates = np.asarray(geometry["coordinates"], dtype=np.float64).reshape(-1, 2)
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+    return coordinates if len(coordinates) else None
+
+
+def _load_patrol_incidents(db: Session, since: datetime) -> Tuple[np.ndarray, ...]:
+    rows = (
+        db.query(PatrolLog.patrol_date, PatrolLog.incidents_reported, PatrolRoute.route_geometry)
+        .join(PatrolRoute, PatrolLog.route_id == PatrolRoute.id)
+        .filter(PatrolLog.patrol_date >= since, PatrolLog.incidents_reported > 0)
+        .all()
+    )
+    lons, lats, dates, weights = [], [], [], []
+    parsed: Dict[str, Optional[np.ndarray]] = {}
+    for patrol_date, incidents, route_geometry in rows:
+        if route_geometry not in parsed:
+            parsed[route_geometry] = _route_vertices(route_geometry)
+        vertices = parsed[route_geometry]
+        if vertices is None:
+            continue
+        lons.append(vertices[:, 0])
+        lats.append(vertices[:, 1])
+        dates.append(np.full(len(vertices), np.datetime64(patrol_date, "s")))
+        weights.append(np.full(len(vertices), incidents / len(vertices)))
+    if not lons:
+        return np.empty(0), np.empty(0), np.empty(0, dtype="datetime64[s]"), np.empty(0)
+    return np.concatenate(lons), np.concatenate(lats), np.concatenate(dates), np.concatenate(weights)
+
+
+def load_events(db: Session, params: HotspotParams, now: datetime) -> Events:
+    since = now - timedelta(days=params.days_back)
+    lons, lats, dates, species, counts = _load_observations(db, since)
+    parts = [(lons, lats, dates, counts, species, np.zeros(len(lons), dtype=bool))]
+    if params.include_patrol_incidents:
+        p_lons, p_lats, p_dates, p_weights = _load_patrol_incidents(db, since)
+        parts.append((p_lons, p_lats, p_dates, p_weights,
+                      np.full(len(p_lons), -1, dtype=np.int64), np.ones(len(p_lons), dtype=bool)))
+    lons, lats, dates, weights, species, incidents = (np.concatenate(column) for column in zip(*parts))
+    return Events(
+        longitudes=lons, latitudes=lats,
+        weights=weights * _decay(dates, now, params.half_life_days), amounts=weights,
+        species_ids=species, is_incident=incidents, dates=dates,
+    )
+
+
+# === Calcul sur grille ===
+
+def _kernel(bandwidth: int) -> np.ndarray:
+    """Noyau d'Epanechnikov 2D normalisé (somme 1)"""
+    offsets = np.arange(-bandwidth, bandwidth + 1)
+    dx, dy = np.meshgrid(offsets, offsets, indexing="ij")
+    u2 = (dx ** 2 + dy ** 2) / float((bandwidth + 1) ** 2)
+    kernel = np.clip(1.0 - u2, 0.0, None)
+    return kernel / kernel.sum()
+
+
+def _smooth(grid: np.ndarray, bandwidth: int) -> np.ndarray:
+    if bandwidth <= 0:
+        return grid
+    kernel = _kernel(bandwidth)
+    padded = np.pad(grid, bandwidth)
+    nx, ny = grid.shape
+    out = np.zeros_like(grid)
+    for i in range(kernel.shape[0]):
+        for j in range(kernel.shape[1]):
+            if kernel[i, j]:
+                out += kernel[i, j] * padded[i:i + nx, j:j + ny]
+    return out
+
+
+# Demi-voisinage : avec les arêtes symétriques, couvre les 8 voisins
+_NEIGHBOUR_OFFSETS = ((1, 0), (0, 1), (1, 1), (1, -1))
+
+
+def _label_components(mask: np.ndarray) -> np.ndarray:
+    """
+    Composantes connexes (8-voisinage) d'un masque booléen ; 0 = fond, zones
+    numérotées 1..n dans l'ordre de leur première cellule.
+
+    Union-find vectorisé sur les arêtes entre cellules voisines du masque :
+    chaque passage rattache chaque racine à la plus petite racine voisine
+    (union), puis compresse les chemins par sauts de pointeurs (find). Une
+    zone longue et fine se résout en O(log n) passages, pas en O(diamètre).
+    """
+    nx, ny = mask.shape
+    count = int(np.count_nonzero(mask))
+    labels = np.zeros((nx, ny), dtype=np.int64)
+    if not count:
+        return labels
+    ids = np.full((nx, ny), -1, dtype=np.int64)
+    ids[mask] = np.arange(count)
+    sources, targets = [], []
+    for dx, dy in _NEIGHBOUR_OFFSETS:
+        a = ids[:nx - dx, max(-dy, 0):ny - max(dy, 0)]
+        b = ids[dx:, max(dy, 0):ny - max(-dy, 0)]
+        linked = (a >= 0) & (b >= 0)
+        sources.append(a[linked])
+        targets.append(b[linked])
+    sources, targets = np.concatenate(sources), np.concatenate(targets)
+
+    # Les pointeurs vont toujours vers un indice plus petit : pas de cycle,
+    # et la racine d'une zone est sa première cellule
+    parent = np.arange(count)
+    while True:
+        roots_a, roots_b = parent[sources], parent[targets]
+        crossing = roots_a != roots_b
+        if not crossing.any():
+            break
+        roots_a, roots_b = roots_a[crossing], roots_b[crossing]
+        np.minimum.at(parent, np.maximum(roots_a, roots_b), np.minimum(roots_a, roots_b))
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+        sources, targets = sources[crossing], targets[crossing]
+
+    # Renumérotation compacte 1..n, dans l'ordre des racines
+    labels[mask] = np.cumsum(parent == np.arange(count))[parent]
+    return labels
+
+
+def compute_hotspots(events: Events, params: HotspotParams, species_names: Dict[int, str]) -> List[dict]:
+    if not len(events.weights):
+        return []
+    size = params.cell_degrees
+    pad = params.bandwidth_cells
+    ix = np.floor(events.longitudes / size).astype(np.int64)
+    iy = np.floor(events.latitudes / size).astype(np.int64)
+    x0, y0 = int(ix.min()) - pad, int(iy.min()) - pad
+    nx, ny = int(ix.max()) - x0 + 1 + pad, int(iy.max()) - y0 + 1 + pad
+    if nx * ny > HOTSPOT_MAX_CELLS:
+        raise ValueError(f"Grille trop grande ({nx} x {ny} cellules) : augmenter la taille des cellules")
+    gx, gy = ix - x0, iy - y0
+
+    grid = np.bincount(gx * ny + gy, weights=events.weights, minlength=nx * ny).reshape(nx, ny)
+    # Lissage normalisé : une cellule isolée garde son poids au centre du noyau
+    density = _smooth(grid, pad) / (_kernel(pad).max() if pad else 1.0)
+    labels = _label_components(density >= params.min_density)
+    zones = int(labels.max())
+    if not zones:
+        return []
+
+    # Agrégats par zone, vectorisés ; le score est la somme des poids
+    # pondérés par l'âge des événements de la zone
+    peak = np.zeros(zones + 1)
+    np.maximum.at(peak, labels.ravel(), density.ravel())
+    event_zone = labels[gx, gy]
+    score = np.bincount(event_zone, weights=events.weights, minlength=zones + 1)
+    observed = ~events.is_incident
+    observations = np.bincount(event_zone[observed], minlength=zones + 1)
+    incidents = np.bincount(event_zone[events.is_incident], weights=events.amounts[events.is_incident],
+                            minlength=zones + 1)
+
+    ranked = np.argsort(-score[1:])[: params.limit] + 1
+    cells_x, cells_y = np.nonzero(labels)
+    cell_zone = labels[cells_x, cells_y]
+    order = np.argsort(cell_zone, kind="stable")
+    cells_x, cells_y, cell_zone = cells_x[order], cells_y[order], cell_zone[order]
+    bounds = np.searchsorted(cell_zone, np.arange(zones + 2))
+
+    hotspots = []
+    for rank, zone in enumerate(ranked.tolist(), start=1):
+        zx = cells_x[bounds[zone]:bounds[zone + 1]] + x0
+        zy = cells_y[bounds[zone]:bounds[zone + 1]] + y0
+        polygon = shapely.unary_union(shapely.box(zx * size, zy * size, (zx + 1) * size, (zy + 1) * size))
+        polygon = shapely.set_precision(polygon, 1e-7)
+        weights = density[zx - x0, zy - y0]
+        center = [float(np.average((zx + 0.5) * size, weights=weights)),
+                  float(np.average((zy + 0.5) * size, weights=weights))]
+
+        zone_events = event_zone == zone
+        zone_species = events.species_ids[zone_events & observed]
+        species_ids, species_counts = np.unique(zone_species, return_counts=True)
+        species_order = np.argsort(-species_counts, kind="stable")
+        last_seen = events.dates[zone_events].max()
+
+        hotspots.append({
+            "type": "Feature",
+            "geometry": shapely.geometry.mapping(polygon),
+            "properties": {
+                "rank": rank,
+                "score": round(float(score[zone]), 3),
+                "peak_density": round(float(peak[zone]), 3),
+                "center": center,
+                "cells": int(len(zx)),
+                "observations": int(observations[zone]),
+                "patrol_incidents": round(float(incidents[zone]), 1),
+                "last_seen": str(last_seen) if zone_events.any() else None,
+                "species": [
+                    {
+                        "species_id": int(species_ids[i]),
+                        "species_name": species_names.get(int(species_ids[i])),
+                        "observations": int(species_counts[i]),
+                    }
+                    for i in species_order
+                ],
+            },
+        })
+    return hotspots
+
+
+# === Point d'entrée ===
+
+def data_high_water_mark(db: Session) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Repère des données : deux lectures d'index, sans parcours de table"""
+    return (
+        db.query(func.max(Observation.updated_at)).scalar(),
+        db.query(func.max(PatrolLog.updated_at)).scalar(),
+    )
+
+
+def get_hotspots(db: Session, params: HotspotParams) -> dict:
+    key = (params, data_high_water_mark(db))
+    return hotspot_cache.get_or_set(key, lambda: _build(db, params))
+
+
+def _build(db: Session, params: HotspotParams) -> dict:
+    now = datetime.utcnow()
+    events = load_events(db, params, now)
+    species_ids = np.unique(events.species_ids[events.species_ids >= 0]).tolist()
+    names = dict(db.query(Species.id, Species.common_name).filter(Species.id.in_(species_ids))) if species_ids else {}
+    return {
+        "type": "FeatureCollection",
+        "features": compute_hotspots(events, params, names),
+        "properties": {"computed_at": now.isoformat(), "events": int(len(events.weights))},
+    }
+
+
+# === Schéma ===
+
+# Colonne ajoutée après la création de patrol_logs ; le trigger (fonction
+# installée par app.services.sync) couvre les mises à jour hors ORM
+_HOTSPOTS_DDL = """
+ALTER TABLE patrol_logs ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITHOUT TIME ZONE;
+UPDATE patrol_logs SET updated_at = COALESCE(created_at, timezone('utc', now())) WHERE updated_at IS NULL;
+CREATE INDEX IF NOT EXISTS ix_patrol_logs_updated_at ON patrol_logs (updated_at);
+DROP TRIGGER IF EXISTS patrol_logs_updated_at ON patrol_logs;
+CREATE TRIGGER patrol_logs_updated_at BEFORE UPDATE ON patrol_logs
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+"""
+
+
+def install_hotspots_schema(connection) -> None:
+    """updated_at des rapports de patrouille, repère du cache (idempotent)"""
+    connection.execute(text(_HOTSPOTS_DDL))
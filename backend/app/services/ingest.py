@@ -0,0 +1,197 @@
+"""
+Import en masse d'observations (synchronisation des terminaux de terrain).
+
+Le flux NDJSON ou CSV est lu ligne à ligne, validé par lots avec les règles
+de `ObservationBase`, puis écrit avec `COPY ... FROM STDIN` (ou un INSERT
+multi-lignes si le pilote ne supporte pas COPY). Chaque lot est validé et
+committé indépendamment : la mémoire utilisée ne dépend que de la taille
+des lots, pas de celle du fichier envoyé.
+
+Le débit reste limité par le décodage et la validation en Python, et par
+COPY côté serveur (mesures dans la route POST /observations/bulk).
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime, timezone
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterator, List, Optional, Set, TextIO, Tuple
+
+from pydantic import TypeAdapter
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.models import ActivityType, Observation, Species
+from app.schemas import ImportResult, ObservationBase
+from app.services.data_version import data_versions
+from app.services.live_feed import import_event, live_feed
+from app.services.stats import observation_deltas, stats_service
+from app.utils.batches import ErrorReport, chunked, validate_batch
+
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "5000"))
+SUPPORTED_FORMATS = ("ndjson", "csv")
+
+_COLUMNS = (
+    "species_id", "observer_id", "latitude", "longitude", "accuracy",
+    "observation_date", "count", "activity_type", "weather_conditions",
+    "temperature", "humidity", "behavior_notes", "health_status", "age_group",
+    "sex", "notes", "photo_urls", "verified", "created_at", "updated_at",
+)
+_COPY_SQL = f"COPY {Observation.__tablename__} ({', '.join(_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+
+
+def detect_format(content_type: Optional[str], fmt: Optional[str] = None) -> str:
+    if fmt:
+        return fmt.lower()
+    if content_type and "csv" in content_type:
+        return "csv"
+    return "ndjson"
+
+
+def iter_ndjson_records(stream: TextIO) -> Iterator[Tuple[int, object]]:
+    """Produit (numéro de ligne, dict) ou (numéro de ligne, message d'erreur)"""
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, f"JSON invalide ({e})"
+            continue
+        if not isinstance(record, dict):
+            yield line_no, "un objet JSON est attendu"
+            continue
+        yield line_no, record
+
+
+def iter_csv_records(stream: TextIO) -> Iterator[Tuple[int, object]]:
+    reader = csv.DictReader(stream)
+    for record in reader:
+        # Les cellules vides correspondent aux champs optionnels absents
+        yield reader.line_num, {k: v for k, v in record.items() if k and v not in ("", None)}
+
+
+_batch_adapter = TypeAdapter(List[ObservationBase])
+
+ProgressCallback = Callable[[int, int], None]
+
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _to_row(obs: ObservationBase, observer_id: int, now: datetime) -> tuple:
+    activity_type = ActivityType(obs.activity_type.value).name if obs.activity_type else None
+    return (
+        obs.species_id, observer_id, obs.latitude, obs.longitude, obs.accuracy,
+        _naive_utc(obs.observation_date), obs.count, activity_type, obs.weather_conditions,
+        obs.temperature, obs.humidity, obs.behavior_notes, obs.health_status, obs.age_group,
+        obs.sex, obs.notes, obs.photo_urls, False, now, now,
+    )
+
+
+def _write_batch(db: Session, rows: List[tuple]) -> None:
+    dbapi_connection = db.connection().connection.driver_connection
+    cursor = dbapi_connection.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            cursor.copy_expert(_COPY_SQL, buffer)
+            return
+    finally:
+        cursor.close()
+
+    # Pilote sans COPY : INSERT multi-lignes (insertmanyvalues)
+    activity_index = _COLUMNS.index("activity_type")
+    db.execute(
+        insert(Observation.__table__),
+        [
+            {
+                **dict(zip(_COLUMNS, row)),
+                "activity_type": ActivityType[row[activity_index]] if row[activity_index] else None,
+            }
+            for row in rows
+        ],
+    )
+
+
+def ingest_observations(db: Session, stream: TextIO, fmt: str, observer_id: int,
+                        batch_size: int = BULK_BATCH_SIZE,
+                        on_progress: Optional[ProgressCallback] = None) -> ImportResult:
+    """
+    Valide et insère les observations d'un flux NDJSON ou CSV ;
+    `on_progress(lignes lues, observations écrites)` après chaque lot
+    """
+    if fmt not in SUPPORTED_FORMATS:
+        raise ValueError(f"Format non supporté: {fmt}")
+
+    known_species: Set[int] = {species_id for (species_id,) in db.query(Species.id)}
+    records = iter_csv_records(stream) if fmt == "csv" else iter_ndjson_records(stream)
+    errors = ErrorReport()
+    imported = processed = 0
+
+    def write(rows: List[tuple], first_line: int, last_line: int) -> Tuple[int, Optional[str]]:
+        deltas = observation_deltas((row[0], row[1], row[6], row[5]) for row in rows)
+        try:
+            _write_batch(db, rows)
+            live_feed.emit(db, [import_event([(row[0], row[2], row[3]) for row in rows])])
+            stats_service.publish(db, deltas)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            return 0, f"Lignes {first_line}-{last_line}: échec de l'écriture ({str(e).splitlines()[0]})"
+        stats_service.apply(deltas)
+        data_versions.bump(Observation.__tablename__)
+        return len(rows), None
+
+    def collect(future: Optional[Future]) -> int:
+        if future is None:
+            return 0
+        count, error = future.result()
+        if error:
+            errors.add(error)
+        return count
+
+    # Un seul lot en cours d'écriture pendant que le suivant est validé :
+    # COPY libère le GIL, et la mémoire reste bornée à deux lots
+    pending: Optional[Future] = None
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        for chunk in chunked(records, batch_size):
+            processed += len(chunk)
+            if on_progress:
+                on_progress(processed, imported)
+            candidates = []
+            for line_no, record in chunk:
+                if isinstance(record, str):
+                    errors.add(f"Ligne {line_no}: {record}")
+                else:
+                    candidates.append((line_no, record))
+            if not candidates:
+                continue
+
+            now = datetime.utcnow()
+            rows = []
+            for line_no, obs in validate_batch(_batch_adapter, candidates, errors):
+                if obs.species_id not in known_species:
+                    errors.add(f"Ligne {line_no}: espèce inconnue (species_id={obs.species_id})")
+                    continue
+                rows.append(_to_row(obs, observer_id, now))
+            if not rows:
+                continue
+
+            imported += collect(pending)
+            pending = writer.submit(write, rows, candidates[0][0], candidates[-1][0])
+        imported += collect(pending)
+
+    return ImportResult(
+        success=errors.count == 0,
+        imported_count=imported,
+        errors=errors.as_list(),
+        message=f"{imported} observations importées, {errors.count} erreurs",
+    )
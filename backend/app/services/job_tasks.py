@@ -0,0 +1,128 @@
+"""
+Gestionnaires des tâches de fond (voir app.services.jobs).
+
+Chacun reçoit un JobContext et les paramètres JSON de la soumission, et
+renvoie le résultat stocké dans la tâche. Les fichiers reçus sont lus
+depuis `context.input_path` ; les exports sont écrits dans
+`context.output_path(...)`.
+"""
+import csv
+import os
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select
+
+from app.models import Observation
+from app.schemas import ActivityTypeEnum
+from app.services.hotspots import HotspotParams, get_hotspots
+from app.services.ingest import ingest_observations
+from app.services.jobs import JobContext, job_handler
+from app.services.listing import observation_filters
+from app.services.rollups import refresh_rollups
+from app.services.species_import import import_species
+from app.utils.streams import open_text_stream
+
+OBSERVATIONS_IMPORT = "observations_import"
+SPECIES_IMPORT = "species_import"
+OBSERVATIONS_EXPORT = "observations_export"
+POACHING_HOTSPOTS = "poaching_hotspots"
+ROLLUPS_REFRESH = "rollups_refresh"
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+
+EXPORT_COLUMNS = (
+    "id", "species_id", "observer_id", "latitude", "longitude", "accuracy", "observation_date", "count",
+    "activity_type", "weather_conditions", "temperature", "humidity", "behavior_notes", "health_status",
+    "age_group", "sex", "notes", "photo_urls", "verified", "created_at", "updated_at",
+)
+
+
+def _file_fraction(file, size: int) -> Optional[float]:
+    # Position dans le fichier brut (en avance du tampon de décodage)
+    return file.tell() / size if size else None
+
+
+@job_handler(OBSERVATIONS_IMPORT)
+def import_observations_job(context: JobContext, params: dict) -> dict:
+    size = os.path.getsize(context.input_path)
+    with open(context.input_path, "rb", buffering=0) as raw:
+        result = ingest_observations(
+            context.db, open_text_stream(raw), params["format"], params["observer_id"],
+            on_progress=lambda lines, imported: context.progress(
+                _file_fraction(raw, size), f"{lines} lignes lues, {imported} observations écrites"
+            ),
+        )
+    return result.model_dump()
+
+
+@job_handler(SPECIES_IMPORT)
+def import_species_job(context: JobContext, params: dict) -> dict:
+    filename = params["filename"]
+    size = os.path.getsize(context.input_path)
+    # Les classeurs sont des archives lues dans le désordre : pas de fraction
+    by_position = filename.lower().endswith(".csv")
+    with open(context.input_path, "rb") as raw:
+        result = import_species(
+            context.db, raw, filename,
+            on_progress=lambda lines, imported: context.progress(
+                _file_fraction(raw, size) if by_position else None,
+                f"{lines} lignes lues, {imported} espèces écrites",
+            ),
+        )
+    return result.model_dump()
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if hasattr(value, "value"):  # Enum
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+@job_handler(OBSERVATIONS_EXPORT)
+def export_observations_job(context: JobContext, params: dict) -> dict:
+    filters = observation_filters(
+        species_id=params.get("species_id"),
+        observer_id=params.get("observer_id"),
+        activity_type=ActivityTypeEnum(params["activity_type"]) if params.get("activity_type") else None,
+        verified=params.get("verified"),
+        start_date=datetime.fromisoformat(params["start_date"]) if params.get("start_date") else None,
+        end_date=datetime.fromisoformat(params["end_date"]) if params.get("end_date") else None,
+    )
+    db = context.db
+    total = db.query(Observation.id).filter(*filters).count()
+    # Curseur côté serveur : seul un lot de lignes est en mémoire à la fois
+    rows = db.execute(
+        select(*(getattr(Observation, column) for column in EXPORT_COLUMNS))
+        .where(*filters)
+        .order_by(Observation.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    exported = 0
+    with open(context.output_path(".csv"), "w", newline="", encoding="utf-8") as output:
+        writer = csv.writer(output)
+        writer.writerow(EXPORT_COLUMNS)
+        for partition in rows.partitions():
+            writer.writerows([_csv_value(value) for value in row] for row in partition)
+            exported += len(partition)
+            context.progress(exported / total if total else None, f"{exported}/{total} observations exportées")
+    return {"format": "csv", "rows": exported}
+
+
+@job_handler(POACHING_HOTSPOTS)
+def poaching_hotspots_job(context: JobContext, params: dict) -> dict:
+    context.progress(0.0, "Calcul des zones sensibles", force=True)
+    return get_hotspots(context.db, HotspotParams(**params))
+
+
+@job_handler(ROLLUPS_REFRESH)
+def refresh_rollups_job(context: JobContext, params: dict) -> dict:
+    context.progress(0.0, "Rafraîchissement des agrégats", force=True)
+    done = refresh_rollups(context.db, full=params.get("full"))
+    if not done:
+        raise RuntimeError("Rafraîchissement déjà en cours")
+    return {"refreshed": True}
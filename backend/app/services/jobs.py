@@ -0,0 +1,396 @@
+"""
+Tâches de fond : imports, exports et calculs longs hors des requêtes HTTP.
+
+Une tâche est une ligne de la table `jobs` (paramètres, état, progression,
+résultat) exécutée par un gestionnaire déclaré avec `@job_handler`. Avec
+JOB_BROKER_URL (Redis), elle est confiée aux workers Celery
+(`celery -A app.worker worker`) ; sans broker, elle tourne dans un pool de
+threads du processus API (développement, tests). Dans les deux cas l'état
+est lu en base : les routes ne dépendent pas du broker.
+
+L'annulation est coopérative : le gestionnaire la constate à son prochain
+appel à `JobContext.progress`. Les lots déjà écrits par un import annulé
+restent en base.
+
+Une tâche en cours écrit un battement (`heartbeat_at`) toutes les
+JOB_HEARTBEAT_SECONDS. Au démarrage de l'API puis périodiquement, les
+tâches RUNNING sans battement depuis JOB_STALE_SECONDS (processus arrêté
+brutalement, worker recyclé) passent en échec et leurs fichiers sont
+supprimés ; sans broker, les tâches restées PENDING (annulées dans le pool
+à l'arrêt) sont relancées.
+"""
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import func, select, text, update
+from sqlalchemy.orm import Session
+
+from app.models import Job, JobStatus
+
+logger = logging.getLogger(__name__)
+
+# Broker Celery (ex. redis://redis:6379/1) ; vide = exécution dans le processus
+JOB_BROKER_URL = os.getenv("JOB_BROKER_URL", "")
+# Taille du pool de threads sans broker
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Fichiers reçus et produits par les tâches (partagé entre API et workers)
+JOB_STORAGE_DIR = os.getenv("JOB_STORAGE_DIR", os.path.join(os.getenv("UPLOAD_DIR", "./uploads"), "jobs"))
+# Intervalle minimal entre deux écritures de progression
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "1"))
+# Durée de conservation des tâches terminées et de leurs fichiers
+JOB_RETENTION_DAYS = float(os.getenv("JOB_RETENTION_DAYS", "7"))
+# Battement des tâches en cours, et délai sans battement au-delà duquel une
+# tâche RUNNING est considérée abandonnée
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "30"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "300"))
+
+RUN_JOB_TASK = "wildlife_tracker.run_job"
+FINISHED_STATUSES = (JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED)
+INPUT_SUFFIX = ".input"
+
+
+class JobCancelled(Exception):
+    """Levée dans le gestionnaire lorsque l'annulation a été demandée"""
+
+
+JobHandler = Callable[["JobContext", dict], Any]
+_handlers: Dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str):
+    """Déclare le gestionnaire d'un type de tâche ; sa valeur de retour (JSON) est le résultat"""
+    def register(handler: JobHandler) -> JobHandler:
+        _handlers[kind] = handler
+        return handler
+    return register
+
+
+def job_kinds() -> List[str]:
+    return sorted(_handlers)
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+def job_file_path(job_id: str, suffix: str) -> str:
+    return os.path.join(JOB_STORAGE_DIR, f"{job_id}{suffix}")
+
+
+def _remove(path: Optional[str]) -> None:
+    if path:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _remove_job_files(job_id: str) -> None:
+    # Entrée et résultats éventuellement partiels : <job_id><suffixe>
+    for path in glob.glob(os.path.join(JOB_STORAGE_DIR, f"{job_id}.*")):
+        _remove(path)
+
+
+class JobContext:
+    """Ce que voit un gestionnaire : session de travail, fichiers, progression"""
+
+    def __init__(self, job_id: str, db: Session, session_factory):
+        self.job_id = job_id
+        self.db = db
+        self.result_path: Optional[str] = None
+        self._session_factory = session_factory
+        self._last_update = 0.0
+
+    @property
+    def input_path(self) -> str:
+        return job_file_path(self.job_id, INPUT_SUFFIX)
+
+    def output_path(self, suffix: str) -> str:
+        """Fichier résultat de la tâche, servi par GET /jobs/{id}/result"""
+        os.makedirs(JOB_STORAGE_DIR, exist_ok=True)
+        self.result_path = job_file_path(self.job_id, suffix)
+        return self.result_path
+
+    def progress(self, fraction: Optional[float] = None, message: Optional[str] = None,
+                 force: bool = False) -> None:
+        """
+        Publie l'avancement (au plus une écriture par JOB_PROGRESS_INTERVAL)
+        et lève JobCancelled si l'annulation a été demandée.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_update < JOB_PROGRESS_INTERVAL:
+            return
+        self._last_update = now
+        values = {}
+        if fraction is not None:
+            values["progress"] = min(max(fraction, 0.0), 1.0)
+        if message is not None:
+            values["progress_message"] = message[:255]
+        # Session distincte : la transaction du gestionnaire n'est pas touchée
+        with self._session_factory() as session:
+            if values:
+                statement = update(Job).where(Job.id == self.job_id).values(**values).returning(Job.cancel_requested)
+            else:
+                statement = select(Job.cancel_requested).where(Job.id == self.job_id)
+            cancelled = session.execute(statement).scalar()
+            session.commit()
+        if cancelled:
+            raise JobCancelled()
+
+
+class _Heartbeat:
+    """Écrit `heartbeat_at` d'une tâche en cours, dans un thread, jusqu'à sa fin"""
+
+    def __init__(self, session_factory, job_id: str, interval: float = JOB_HEARTBEAT_SECONDS):
+        self.session_factory = session_factory
+        self.job_id = job_id
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self):
+        if self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name=f"job-heartbeat-{self.job_id}", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                with self.session_factory() as session:
+                    session.execute(
+                        update(Job).where(Job.id == self.job_id, Job.status == JobStatus.RUNNING)
+                        .values(heartbeat_at=datetime.utcnow())
+                    )
+                    session.commit()
+            except Exception:
+                logger.exception("Battement de la tâche %s impossible", self.job_id)
+
+
+def run_job(session_factory, job_id: str) -> None:
+    """Exécute une tâche en attente (appelé par le pool local ou par un worker Celery)"""
+    with session_factory() as db:
+        now = datetime.utcnow()
+        # Prise en charge atomique : une tâche redélivrée, déjà prise ou
+        # annulée entre-temps n'est pas relancée
+        claimed = db.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == JobStatus.PENDING, Job.cancel_requested.is_(False))
+            .values(status=JobStatus.RUNNING, started_at=now, heartbeat_at=now)
+            .returning(Job.kind, Job.params)
+        ).first()
+        db.commit()
+        if claimed is None:
+            return
+        kind, params = claimed
+
+        context = JobContext(job_id, db, session_factory)
+        try:
+            handler = _handlers.get(kind)
+            if handler is None:
+                raise ValueError(f"Type de tâche inconnu: {kind}")
+            with _Heartbeat(session_factory, job_id):
+                result = handler(context, json.loads(params or "{}"))
+            values = {
+                "status": JobStatus.SUCCEEDED, "progress": 1.0,
+                "result": json.dumps(result, default=str), "result_path": context.result_path,
+            }
+        except JobCancelled:
+            db.rollback()
+            values = {"status": JobStatus.CANCELLED}
+        except Exception as e:
+            logger.exception("Tâche %s (%s) en échec", job_id, kind)
+            db.rollback()
+            values = {"status": JobStatus.FAILED, "error": str(e).splitlines()[0] if str(e) else repr(e)}
+
+        if values["status"] != JobStatus.SUCCEEDED:
+            _remove(context.result_path)
+        _remove(context.input_path)
+        db.execute(update(Job).where(Job.id == job_id).values(finished_at=datetime.utcnow(), **values))
+        db.commit()
+
+
+def create_celery_app(broker_url: str = JOB_BROKER_URL):
+    from celery import Celery
+
+    celery_app = Celery("wildlife_tracker", broker=broker_url)
+    celery_app.conf.update(
+        # Les états et résultats sont en base (table jobs)
+        task_ignore_result=True,
+        # Tâches longues : un worker ne réserve pas de tâche d'avance
+        worker_prefetch_multiplier=1,
+        task_acks_late=True,
+        broker_connection_retry_on_startup=True,
+    )
+    return celery_app
+
+
+class JobQueue:
+    """Soumission, annulation et purge des tâches ; dispatch Celery ou local"""
+
+    def __init__(self, broker_url: str = JOB_BROKER_URL, workers: int = JOB_WORKERS):
+        self.broker_url = broker_url
+        self.workers = workers
+        self.session_factory = None
+        self._celery = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    @property
+    def backend(self) -> str:
+        return "celery" if self.broker_url else "local"
+
+    def configure(self, session_factory) -> None:
+        self.session_factory = session_factory
+
+    def start(self) -> None:
+        if self.session_factory is None:
+            return
+        with self.session_factory() as db:
+            try:
+                purge_expired_jobs(db)
+            except Exception:
+                logger.exception("Échec de la purge des tâches expirées")
+        pending = self.recover()
+        if not self.broker_url:
+            # Le broker garde ses messages ; le pool local, lui, est perdu à l'arrêt
+            for job_id in pending:
+                self._dispatch(job_id)
+            if pending:
+                logger.info("%d tâche(s) en attente relancée(s)", len(pending))
+        if JOB_STALE_SECONDS > 0 and self._watchdog is None:
+            self._stop.clear()
+            self._watchdog = threading.Thread(target=self._watch, name="job-watchdog", daemon=True)
+            self._watchdog.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=2)
+            self._watchdog = None
+        if self._executor is not None:
+            # Les tâches en cours se terminent ; celles en attente restent
+            # PENDING en base et sont relancées au prochain démarrage
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def recover(self) -> List[str]:
+        """Tâches abandonnées passées en échec ; renvoie les tâches en attente"""
+        try:
+            with self.session_factory() as db:
+                failed = fail_stale_jobs(db)
+                pending = list(db.scalars(
+                    select(Job.id).where(Job.status == JobStatus.PENDING, Job.cancel_requested.is_(False))
+                    .order_by(Job.created_at)
+                ))
+        except Exception:
+            logger.exception("Échec de la reprise des tâches")
+            return []
+        if failed:
+            logger.warning("Tâches abandonnées passées en échec : %s", ", ".join(failed))
+        return pending
+
+    def _watch(self) -> None:
+        # Processus arrêté brutalement puis relancé avant JOB_STALE_SECONDS
+        while not self._stop.wait(JOB_STALE_SECONDS / 2):
+            try:
+                with self.session_factory() as db:
+                    fail_stale_jobs(db)
+            except Exception:
+                logger.exception("Échec de la reprise des tâches")
+
+    def submit(self, db: Session, kind: str, params: Optional[dict] = None, submitted_by: Optional[int] = None,
+               job_id: Optional[str] = None) -> Job:
+        if kind not in _handlers:
+            raise ValueError(f"Type de tâche inconnu: {kind}")
+        job = Job(
+            id=job_id or new_job_id(), kind=kind, status=JobStatus.PENDING,
+            params=json.dumps(params or {}, default=str), submitted_by=submitted_by,
+            progress=0.0, cancel_requested=False, created_at=datetime.utcnow(),
+        )
+        db.add(job)
+        db.commit()
+        self._dispatch(job.id)
+        return job
+
+    def cancel(self, db: Session, job: Job) -> Job:
+        if job.status in FINISHED_STATUSES:
+            return job
+        db.execute(update(Job).where(Job.id == job.id).values(cancel_requested=True))
+        # Pas encore démarrée : annulée tout de suite, run_job l'ignorera
+        cancelled_now = db.execute(
+            update(Job).where(Job.id == job.id, Job.status == JobStatus.PENDING)
+            .values(status=JobStatus.CANCELLED, finished_at=datetime.utcnow())
+        ).rowcount
+        db.commit()
+        if cancelled_now:
+            _remove(job_file_path(job.id, INPUT_SUFFIX))
+        db.refresh(job)
+        return job
+
+    def _dispatch(self, job_id: str) -> None:
+        if self.broker_url:
+            if self._celery is None:
+                self._celery = create_celery_app(self.broker_url)
+            self._celery.send_task(RUN_JOB_TASK, args=[job_id])
+            return
+        if self.session_factory is None:
+            raise RuntimeError("JobQueue.configure() doit être appelé avant de soumettre des tâches")
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self._executor.submit(run_job, self.session_factory, job_id)
+
+
+def purge_expired_jobs(db: Session, retention_days: float = JOB_RETENTION_DAYS) -> int:
+    """Supprime les tâches terminées depuis plus de `retention_days` jours et leurs fichiers"""
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    expired = db.query(Job).filter(Job.status.in_(FINISHED_STATUSES), Job.finished_at < cutoff).all()
+    for job in expired:
+        _remove(job.result_path)
+        db.delete(job)
+    db.commit()
+    return len(expired)
+
+
+def fail_stale_jobs(db: Session, stale_seconds: float = JOB_STALE_SECONDS) -> List[str]:
+    """Passe en échec les tâches RUNNING sans battement depuis `stale_seconds` et supprime leurs fichiers"""
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=stale_seconds)
+    failed = list(db.scalars(
+        update(Job)
+        .where(Job.status == JobStatus.RUNNING, func.coalesce(Job.heartbeat_at, Job.started_at) < cutoff)
+        .values(status=JobStatus.FAILED, finished_at=now,
+                error="Tâche interrompue (processus arrêté pendant l'exécution)")
+        .returning(Job.id)
+    ))
+    db.commit()
+    for job_id in failed:
+        _remove_job_files(job_id)
+    return failed
+
+
+# === Schéma ===
+
+_JOBS_DDL = "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP WITHOUT TIME ZONE"
+
+
+def install_jobs_schema(connection) -> None:
+    """Colonnes ajoutées après la création de la table jobs (idempotent)"""
+    connection.execute(text(_JOBS_DDL))
+
+
+job_queue = JobQueue()
@@ -0,0 +1,118 @@
+"""
+Listes paginées par curseur avec projection de champs.
+
+Sans `fields`, les lignes sont sérialisées avec le schéma de réponse
+complet. Avec une projection limitée à des colonnes, seules ces colonnes
+sont lues en base (plus les colonnes de la clé de tri) et aucun objet lié
+n'est chargé.
+"""
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple, Type
+
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from app.models import ActivityType, ConservationStatus, Observation, PatrolRoute, Species, SpeciesCategory, WaterPoint
+from app.schemas import (
+    ActivityTypeEnum, ConservationStatusEnum, ObservationResponse, PatrolRouteResponse, SpeciesCategoryEnum,
+    SpeciesResponse, WaterPointResponse,
+)
+from app.utils.eager import eager_options
+from app.utils.pagination import keyset_paginate
+from app.utils.projection import column_projection
+
+OBSERVATION_KEY = (Observation.observation_date, Observation.id)
+SPECIES_KEY = (Species.id,)
+
+
+def _paginate_projected(db: Session, model, schema: Type[BaseModel], key_columns: Sequence, filters: list,
+                        fields: Optional[List[str]], cursor: Optional[str], limit: int, descending: bool,
+                        offset: int = 0) -> Tuple[list, Optional[str]]:
+    columns = column_projection(model, fields) if fields else None
+    if columns is not None:
+        # Projection légère : lecture des seules colonnes demandées
+        selected = {c.key: c for c in (*columns, *key_columns)}
+        query = db.query(*selected.values()).filter(*filters)
+        rows, next_cursor = keyset_paginate(query, key_columns, cursor, limit, descending, offset)
+        return [{f: row._mapping[f] for f in fields} for row in rows], next_cursor
+
+    # Chargement anticipé des seules relations que le schéma va sérialiser
+    query = db.query(model).options(*eager_options(model, schema, fields)).filter(*filters)
+    rows, next_cursor = keyset_paginate(query, key_columns, cursor, limit, descending, offset)
+    items = [schema.model_validate(row) for row in rows]
+    if fields:
+        return [item.model_dump(include=set(fields)) for item in items], next_cursor
+    return items, next_cursor
+
+
+def observation_filters(*, species_id: Optional[int] = None, observer_id: Optional[int] = None,
+                        activity_type: Optional[ActivityTypeEnum] = None, verified: Optional[bool] = None,
+                        start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> list:
+    """Critères de filtrage communs aux listes et aux exports d'observations"""
+    filters = []
+    if species_id is not None:
+        filters.append(Observation.species_id == species_id)
+    if observer_id is not None:
+        filters.append(Observation.observer_id == observer_id)
+    if activity_type is not None:
+        filters.append(Observation.activity_type == ActivityType(activity_type.value))
+    if verified is not None:
+        filters.append(Observation.verified == verified)
+    if start_date is not None:
+        filters.append(Observation.observation_date >= start_date)
+    if end_date is not None:
+        filters.append(Observation.observation_date <= end_date)
+    return filters
+
+
+def list_observations(db: Session, *, species_id: Optional[int] = None, observer_id: Optional[int] = None,
+                      activity_type: Optional[ActivityTypeEnum] = None, verified: Optional[bool] = None,
+                      start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                      fields: Optional[List[str]] = None, cursor: Optional[str] = None,
+                      limit: int = 100) -> Tuple[list, Optional[str]]:
+    """Observations de la plus récente à la plus ancienne, clé (observation_date, id)"""
+    filters = observation_filters(
+        species_id=species_id, observer_id=observer_id, activity_type=activity_type, verified=verified,
+        start_date=start_date, end_date=end_date,
+    )
+    return _paginate_projected(
+        db, Observation, ObservationResponse, OBSERVATION_KEY, filters, fields, cursor, limit,
+        descending=True,
+    )
+
+
+def list_species(db: Session, *, category: Optional[SpeciesCategoryEnum] = None,
+                 conservation_status: Optional[ConservationStatusEnum] = None,
+                 fields: Optional[List[str]] = None, cursor: Optional[str] = None,
+                 limit: int = 100, skip: int = 0) -> Tuple[list, Optional[str]]:
+    """Espèces par identifiant croissant ; `skip` reste accepté sans curseur"""
+    filters = []
+    if category is not None:
+        filters.append(Species.category == SpeciesCategory(category.value))
+    if conservation_status is not None:
+        filters.append(Species.conservation_status == ConservationStatus(conservation_status.value))
+
+    return _paginate_projected(
+        db, Species, SpeciesResponse, SPECIES_KEY, filters, fields, cursor, limit, descending=False,
+        offset=0 if cursor else skip,
+    )
+
+
+# Données de référence : volumes faibles, listes complètes mises en cache
+# par app.services.reference_cache
+
+def list_water_points(db: Session, *, status: Optional[str] = None,
+                      water_type: Optional[str] = None) -> List[WaterPointResponse]:
+    query = db.query(WaterPoint)
+    if status is not None:
+        query = query.filter(WaterPoint.status == status)
+    if water_type is not None:
+        query = query.filter(WaterPoint.water_type == water_type)
+    return [WaterPointResponse.model_validate(row) for row in query.order_by(WaterPoint.id)]
+
+
+def list_patrol_routes(db: Session, *, patrol_type: Optional[str] = None) -> List[PatrolRouteResponse]:
+    query = db.query(PatrolRoute)
+    if patrol_type is not None:
+        query = query.filter(PatrolRoute.patrol_type == patrol_type)
+    return [PatrolRouteResponse.model_validate(row) for row in query.order_by(PatrolRoute.id)]
@@ -0,0 +1,421 @@
+"""
+Flux temps réel des observations et des incidents de patrouille.
+
+Les écritures validées sont publiées par `NOTIFY` dans la transaction même
+(événements de session SQLAlchemy, imports en masse) : rien n'est émis en
+cas de rollback, et tous les processus de l'API les reçoivent quel que
+soit celui qui a écrit. Chaque processus n'a qu'une connexion en écoute
+(LISTEN) ; un événement y est décodé et sérialisé une seule fois, puis
+distribué aux abonnés (SSE, WebSocket) dont le filtre correspond (types,
+espèces, emprise, type d'activité) : aucun client n'interroge la base.
+
+Chaque abonné a une file bornée. Un client trop lent perd les événements
+suivants et reçoit `resync` (il recharge alors par l'API REST) ; au-delà
+de LIVE_MAX_LAG événements perdus, il est déconnecté. Les derniers
+événements sont gardés pour la reprise après reconnexion (Last-Event-ID).
+Hors PostgreSQL, la diffusion reste interne au processus.
+"""
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func, select as sql_select
+from sqlalchemy.orm import Session
+
+from app.models import Observation, PatrolLog, PatrolRoute
+from app.services.data_version import register_commit_hook
+
+logger = logging.getLogger(__name__)
+
+LIVE_CHANNEL = os.getenv("LIVE_CHANNEL", "wt_live")
+# Événements en attente par abonné (références vers des événements partagés :
+# quelques octets chacune) ; une transaction plus grosse donne un `resync`
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "1024"))
+# Événements perdus au-delà desquels un abonné est déconnecté
+LIVE_MAX_LAG = int(os.getenv("LIVE_MAX_LAG", "4096"))
+LIVE_MAX_SUBSCRIBERS = int(os.getenv("LIVE_MAX_SUBSCRIBERS", "5000"))
+# Événements gardés pour la reprise (Last-Event-ID)
+LIVE_REPLAY_SIZE = int(os.getenv("LIVE_REPLAY_SIZE", "1000"))
+LIVE_HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", "15"))
+LIVE_RECONNECT_SECONDS = float(os.getenv("LIVE_RECONNECT_SECONDS", "5"))
+
+EVENT_TYPES = ("observation", "incident", "import")
+
+# Limite de PostgreSQL : 8000 octets par notification
+_MAX_PAYLOAD = 7900
+_MAX_TEXT = 500
+# Événements gardés dans session.info jusqu'au commit (sans NOTIFY)
+_LOCAL_EVENTS = "live_events"
+
+
+# === Événements ===
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def _enum_value(value):
+    return getattr(value, "value", value)
+
+
+def observation_event(obs: Observation) -> dict:
+    return {
+        "type": "observation",
+        "id": obs.id,
+        "species_id": obs.species_id,
+        "observer_id": obs.observer_id,
+        "latitude": obs.latitude,
+        "longitude": obs.longitude,
+        "observation_date": _iso(obs.observation_date),
+        "count": obs.count,
+        "activity_type": _enum_value(obs.activity_type),
+    }
+
+
+def is_incident(log: PatrolLog) -> bool:
+    return bool(log.incidents_reported) or bool((log.illegal_activities or "").strip())
+
+
+def incident_event(log: PatrolLog, bbox: Optional[list]) -> dict:
+    """`bbox` : emprise de la route de patrouille (None si inconnue)"""
+    return {
+        "type": "incident",
+        "id": log.id,
+        "route_id": log.route_id,
+        "ranger_id": log.ranger_id,
+        "patrol_date": _iso(log.patrol_date),
+        "incidents_reported": log.incidents_reported or 0,
+        "illegal_activities": (log.illegal_activities or "")[:_MAX_TEXT] or None,
+        "bbox": bbox,
+    }
+
+
+def import_event(points: List[Tuple[int, float, float]]) -> dict:
+    """Lot d'import en masse (espèce, latitude, longitude), résumé : les clients concernés rechargent"""
+    species_ids, latitudes, longitudes = zip(*points)
+    return {
+        "type": "import",
+        "count": len(points),
+        "species_ids": sorted(set(species_ids)),
+        "bbox": [min(longitudes), min(latitudes), max(longitudes), max(latitudes)],
+    }
+
+
+def notify_payloads(events: List[dict]) -> Iterable[str]:
+    """Tableaux JSON d'événements, découpés sous la taille maximale d'une notification"""
+    batch, size = [], 2
+    for item in events:
+        encoded = json.dumps(item, separators=(",", ":"))
+        if batch and size + len(encoded) + 1 > _MAX_PAYLOAD:
+            yield "[" + ",".join(batch) + "]"
+            batch, size = [], 2
+        batch.append(encoded)
+        size += len(encoded) + 1
+    if batch:
+        yield "[" + ",".join(batch) + "]"
+
+
+# === Filtres et abonnés ===
+
+@dataclass(frozen=True)
+class LiveFilter:
+    """
+    Filtre d'un abonné. Espèces et type d'activité ne portent que sur les
+    observations (et les espèces d'un import) ; un incident sans emprise
+    connue passe le filtre d'emprise.
+    """
+    types: FrozenSet[str] = frozenset(EVENT_TYPES)
+    species_ids: Optional[FrozenSet[int]] = None
+    activity_types: Optional[FrozenSet[str]] = None
+    bbox: Optional[Tuple[float, float, float, float]] = None  # ouest, sud, est, nord
+
+    def matches(self, data: dict) -> bool:
+        kind = data["type"]
+        if kind not in self.types:
+            return False
+        if kind == "observation":
+            if self.species_ids is not None and data["species_id"] not in self.species_ids:
+                return False
+            if self.activity_types is not None and data["activity_type"] not in self.activity_types:
+                return False
+            if self.bbox is not None:
+                west, south, east, north = self.bbox
+                return west <= data["longitude"] <= east and south <= data["latitude"] <= north
+            return True
+        if kind == "import" and self.species_ids is not None and self.species_ids.isdisjoint(data["species_ids"]):
+            return False
+        if self.bbox is not None and data.get("bbox"):
+            west, south, east, north = self.bbox
+            box_west, box_south, box_east, box_north = data["bbox"]
+            return box_west <= east and box_east >= west and box_south <= north and box_north >= south
+        return True
+
+
+@dataclass(frozen=True)
+class LiveEvent:
+    id: str
+    type: str
+    data: dict
+    text: str  # JSON (WebSocket)
+    sse: bytes  # trame SSE complète
+
+    @classmethod
+    def build(cls, event_id: str, data: dict) -> "LiveEvent":
+        text = json.dumps(data, separators=(",", ":"))
+        frame = (f"id: {event_id}\n" if event_id else "") + f"event: {data['type']}\ndata: {text}\n\n"
+        return cls(event_id, data["type"], data, text, frame.encode())
+
+
+class Subscriber:
+    def __init__(self, live_filter: LiveFilter, queue_size: int = LIVE_QUEUE_SIZE):
+        self.filter = live_filter
+        self.queue: "asyncio.Queue[LiveEvent]" = asyncio.Queue(queue_size)
+        self.missed = 0
+        self.resync = False
+        self.closed = False
+
+    def offer(self, live_event: LiveEvent) -> None:
+        try:
+            self.queue.put_nowait(live_event)
+        except asyncio.QueueFull:
+            # Contre-pression : le client n'a pas vidé sa file, l'événement est perdu pour lui
+            self.missed += 1
+
+
+# === Diffusion ===
+
+class LiveHub:
+    """Abonnés d'un processus ; toutes les méthodes s'exécutent dans la boucle d'événements"""
+
+    def __init__(self, replay_size: int = LIVE_REPLAY_SIZE, max_subscribers: int = LIVE_MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self.subscribers: Set[Subscriber] = set()
+        self.published = self.dropped_subscribers = 0
+        self._boot = uuid.uuid4().hex[:8]
+        self._sequence = 0
+        self._recent: "deque[Tuple[int, LiveEvent]]" = deque(maxlen=replay_size)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    def subscribe(self, live_filter: LiveFilter, last_event_id: Optional[str] = None) -> Optional[Subscriber]:
+        """None si le nombre maximal d'abonnés est atteint"""
+        if len(self.subscribers) >= self.max_subscribers:
+            return None
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        subscriber = Subscriber(live_filter)
+        if last_event_id:
+            self._replay(subscriber, last_event_id)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        subscriber.closed = True
+        self.subscribers.discard(subscriber)
+
+    def _replay(self, subscriber: Subscriber, last_event_id: str) -> None:
+        boot, _, sequence = last_event_id.partition("-")
+        oldest = self._recent[0][0] if self._recent else self._sequence + 1
+        if boot != self._boot or not sequence.isdigit() or int(sequence) < oldest - 1:
+            # Autre processus ou trop ancien : l'écart n'est pas connu
+            subscriber.resync = True
+            return
+        for number, live_event in self._recent:
+            if number > int(sequence) and subscriber.filter.matches(live_event.data):
+                subscriber.offer(live_event)
+
+    def publish(self, events: Iterable[dict]) -> None:
+        for data in events:
+            self._sequence += 1
+            live_event = LiveEvent.build(f"{self._boot}-{self._sequence}", data)
+            self._recent.append((self._sequence, live_event))
+            self.published += 1
+            for subscriber in list(self.subscribers):
+                if subscriber.filter.matches(data):
+                    subscriber.offer(live_event)
+                    if subscriber.missed > LIVE_MAX_LAG:
+                        self.dropped_subscribers += 1
+                        self.unsubscribe(subscriber)
+
+    def call_threadsafe(self, callback, *args) -> None:
+        """Exécute `callback` dans la boucle d'événements (depuis un autre thread)"""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(callback, *args)
+
+    def publish_threadsafe(self, events: List[dict]) -> None:
+        self.call_threadsafe(self.publish, events)
+
+    def resync_all(self) -> None:
+        """Événements possiblement perdus (reconnexion de l'écoute) : tous les abonnés rechargent"""
+        for subscriber in self.subscribers:
+            subscriber.resync = True
+
+    async def batches(self, subscriber: Subscriber,
+                      heartbeat: float = LIVE_HEARTBEAT_SECONDS) -> AsyncIterator[List[LiveEvent]]:
+        """
+        Événements d'un abonné, par lots (tout ce qui attend dans sa file : une
+        écriture réseau par réveil plutôt qu'une par événement) ; lot vide à
+        chaque battement de cœur. S'arrête si l'abonné est déconnecté.
+        """
+        while True:
+            batch = []
+            if subscriber.missed or subscriber.resync:
+                batch.append(LiveEvent.build("", {"type": "resync", "missed": subscriber.missed or None}))
+                subscriber.missed, subscriber.resync = 0, False
+            if subscriber.closed and subscriber.queue.empty():
+                if batch:
+                    yield batch
+                return
+            if not batch:
+                try:
+                    batch.append(await asyncio.wait_for(subscriber.queue.get(), heartbeat))
+                except asyncio.TimeoutError:
+                    yield batch
+                    continue
+            while not subscriber.queue.empty():
+                batch.append(subscriber.queue.get_nowait())
+            yield batch
+
+    def describe(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "dropped_subscribers": self.dropped_subscribers,
+            "lagging": sum(1 for subscriber in self.subscribers if subscriber.missed),
+        }
+
+
+# === Écoute PostgreSQL ===
+
+class NotifyListener:
+    """Thread d'écoute (LISTEN) sur une connexion dédiée, hors du pool"""
+
+    def __init__(self, engine, channel: str, on_events, on_reconnect):
+        self.engine = engine
+        self.channel = channel
+        self.on_events = on_events
+        self.on_reconnect = on_reconnect
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="live-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _run(self) -> None:
+        connected_once = False
+        while not self._stop.is_set():
+            try:
+                self._listen(connected_once)
+            except Exception:
+                logger.exception("Écoute %s interrompue, reconnexion dans %ss", self.channel, LIVE_RECONNECT_SECONDS)
+            connected_once = True
+            self._stop.wait(LIVE_RECONNECT_SECONDS)
+
+    def _listen(self, reconnecting: bool) -> None:
+        cargs, cparams = self.engine.dialect.create_connect_args(self.engine.url)
+        connection = self.engine.dialect.connect(*cargs, **cparams)
+        try:
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {self.channel}")
+            if reconnecting:
+                self.on_reconnect()
+            while not self._stop.is_set():
+                if select.select([connection], [], [], 1.0)[0]:
+                    connection.poll()
+                    events = []
+                    while connection.notifies:
+                        events.extend(json.loads(connection.notifies.pop(0).payload))
+                    if events:
+                        self.on_events(events)
+        finally:
+            connection.close()
+
+
+# === Publication ===
+
+class LiveFeed:
+    def __init__(self, channel: str = LIVE_CHANNEL):
+        self.channel = channel
+        self.hub = LiveHub()
+        self._notify = False
+        self._listener: Optional[NotifyListener] = None
+
+    def register_session_events(self, session_factory) -> None:
+        bind = session_factory.kw.get("bind")
+        self._notify = bind is not None and bind.dialect.name == "postgresql"
+        register_commit_hook(session_factory, _LOCAL_EVENTS, self._collect, self.hub.publish_threadsafe)
+
+    def start(self, engine) -> None:
+        """Démarre l'écoute ; à appeler depuis la boucle d'événements (démarrage de l'application)"""
+        self.hub.attach(asyncio.get_running_loop())
+        if self._notify and self._listener is None:
+            self._listener = NotifyListener(
+                engine, self.channel, self.hub.publish_threadsafe,
+                lambda: self.hub.call_threadsafe(self.hub.resync_all),
+            )
+            self._listener.start()
+
+    def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def emit(self, session: Session, events: List[dict]) -> None:
+        """Publie des événements avec la transaction en cours de `session`"""
+        if not events:
+            return
+        if self._notify:
+            for payload in notify_payloads(events):
+                session.execute(sql_select(func.pg_notify(self.channel, payload)))
+        else:
+            session.info.setdefault(_LOCAL_EVENTS, []).extend(events)
+
+    def _collect(self, session: Session) -> None:
+        events, routes = [], {}
+        for obj in session.new:
+            if isinstance(obj, Observation):
+                events.append(observation_event(obj))
+            elif isinstance(obj, PatrolLog) and is_incident(obj):
+                routes.setdefault(obj.route_id, []).append(obj)
+        if routes:
+            # Emprise des routes lue sur la connexion de la session, sans autoflush
+            bboxes = {}
+            route_ids = [route_id for route_id in routes if route_id is not None]
+            if route_ids:
+                rows = session.connection().execute(
+                    sql_select(PatrolRoute.id, PatrolRoute.bbox_west, PatrolRoute.bbox_south,
+                               PatrolRoute.bbox_east, PatrolRoute.bbox_north).where(PatrolRoute.id.in_(route_ids))
+                )
+                bboxes = {row[0]: list(row[1:]) for row in rows if row[1] is not None}
+            for route_id, logs in routes.items():
+                events.extend(incident_event(log, bboxes.get(route_id)) for log in logs)
+        if events:
+            self.emit(session, events)
+
+    def describe(self) -> dict:
+        return {**self.hub.describe(), "transport": "notify" if self._notify else "local"}
+
+
+live_feed = LiveFeed()
@@ -0,0 +1,543 @@
+"""
+Partitionnement mensuel des observations et des rapports de patrouille.
+
+`observations` (observation_date) et `patrol_logs` (patrol_date) peuvent
+être convertis en tables partitionnées par plage : une partition par mois
+(`<table>_AAAA_MM`) et une partition par défaut pour les dates hors des
+mois créés. Les requêtes bornées sur la colonne de date (listes, exports,
+agrégats, zones sensibles...) ne lisent que les mois concernés, et
+l'entretien (VACUUM, index, archivage) se fait mois par mois.
+
+- `migrate_table` convertit une table existante. Elle pose un verrou
+  exclusif le temps de la copie et garde l'ancienne table sous
+  `<table>_legacy`. Index, triggers, clés étrangères et vues dépendantes
+  sont recréés.
+- `ensure_partitions` crée les mois à venir et sort de la partition par
+  défaut les mois qui y ont des lignes. Elle est appelée périodiquement
+  par PartitionMaintainer.
+- `archive_partition` détache un mois froid, l'écrit en CSV gzip dans
+  PARTITION_ARCHIVE_DIR puis le supprime. `restore_partition` le
+  recharge. Les agrégats (app.services.rollups) conservent les mois
+  archivés.
+
+La clé primaire d'une table partitionnée inclut la colonne de partition
+(id, date), et `id` reste unique par sa séquence. Une clé étrangère ne
+peut donc plus référencer ces tables : celles en ON DELETE CASCADE
+(patrol_tracks) sont remplacées par un trigger équivalent.
+
+    python -m app.services.partitions status | migrate [table...] | drop-legacy [table...] | maintain
+    python -m app.services.partitions archive TABLE AAAA-MM | restore TABLE AAAA-MM
+"""
+import gzip
+import logging
+import os
+import re
+import threading
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app.models import PartitionArchive
+
+logger = logging.getLogger(__name__)
+
+# Tables partitionnables et leur colonne de partition
+PARTITION_COLUMNS = {"observations": "observation_date", "patrol_logs": "patrol_date"}
+# Tables partitionnées à l'initialisation d'une base neuve et entretenues ensuite
+PARTITION_TABLES = [name.strip() for name in os.getenv("PARTITION_TABLES", "observations,patrol_logs").split(",")
+                    if name.strip() in PARTITION_COLUMNS]
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_MAINTENANCE_SECONDS = float(os.getenv("PARTITION_MAINTENANCE_SECONDS", "21600"))
+PARTITION_ARCHIVE_DIR = os.getenv("PARTITION_ARCHIVE_DIR", "./archives")
+# Archivage automatique des mois plus anciens (0 = désactivé)
+PARTITION_ARCHIVE_AFTER_MONTHS = int(os.getenv("PARTITION_ARCHIVE_AFTER_MONTHS", "0"))
+
+# Une seule maintenance à la fois, tous processus confondus
+_ADVISORY_LOCK_KEY = 0x70617274  # "part"
+_MONTH_SUFFIX = re.compile(r"_(\d{4})_(\d{2})$")
+
+
+def _month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def _add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_{month:%Y_%m}"
+
+
+def _default_name(table: str) -> str:
+    return f"{table}_default"
+
+
+# === Catalogue ===
+
+def _exists(connection: Connection, name: str) -> bool:
+    return connection.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar()
+
+
+def is_partitioned(connection: Connection, table: str) -> bool:
+    return connection.execute(
+        text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:name))"),
+        {"name": table},
+    ).scalar()
+
+
+def partition_months(connection: Connection, table: str) -> List[date]:
+    """Mois ayant une partition attachée"""
+    names = connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:name)"
+    ), {"name": table}).scalars()
+    months = []
+    for name in names:
+        match = _MONTH_SUFFIX.search(name)
+        if match and name == partition_name(table, date(int(match[1]), int(match[2]), 1)):
+            months.append(date(int(match[1]), int(match[2]), 1))
+    return sorted(months)
+
+
+def _insert_columns(connection: Connection, table: str) -> str:
+    """Colonnes écrivables (hors colonnes générées), dans l'ordre de la table"""
+    names = connection.execute(text(
+        "SELECT attname FROM pg_attribute WHERE attrelid = to_regclass(:name) AND attnum > 0 "
+        "AND NOT attisdropped AND attgenerated = '' ORDER BY attnum"
+    ), {"name": table}).scalars()
+    return ", ".join(f'"{name}"' for name in names)
+
+
+def archived_months(db: Session, table: str) -> List[date]:
+    """Mois de `table` archivés et non restaurés (partitions supprimées), dans l'ordre"""
+    return list(db.scalars(
+        select(PartitionArchive.month)
+        .where(PartitionArchive.table_name == table, PartitionArchive.restored_at.is_(None))
+        .order_by(PartitionArchive.month)
+    ))
+
+
+def get_row(db: Session, model, row_id: int, partition_date: Optional[datetime] = None,
+            with_for_update: bool = False, populate_existing: bool = False):
+    """
+    Ligne par identifiant. Sans valeur de la colonne de partition, toutes
+    les partitions sont sondées (une lecture d'index chacune) ;
+    `partition_date`, si elle est connue, limite la lecture à son mois, avec
+    repli sur toutes les partitions si la ligne a changé de mois.
+    """
+    column = PARTITION_COLUMNS.get(model.__tablename__)
+    if partition_date is not None and column is not None:
+        month = _month_start(partition_date.date() if isinstance(partition_date, datetime) else partition_date)
+        date_column = getattr(model, column)
+        statement = select(model).where(
+            model.id == row_id,
+            date_column >= datetime.combine(month, datetime.min.time()),
+            date_column < datetime.combine(_add_months(month, 1), datetime.min.time()),
+        )
+        if with_for_update:
+            statement = statement.with_for_update()
+        if populate_existing:
+            statement = statement.execution_options(populate_existing=True)
+        row = db.execute(statement).scalar_one_or_none()
+        if row is not None:
+            return row
+    return db.get(model, row_id, with_for_update=with_for_update, populate_existing=populate_existing)
+
+
+# === Création des partitions ===
+
+def create_month(connection: Connection, table: str, month: date) -> int:
+    """Crée la partition d'un mois ; renvoie le nombre de lignes sorties de la partition par défaut"""
+    column = PARTITION_COLUMNS[table]
+    start, end = month, _add_months(month, 1)
+    default = _default_name(table)
+    moved = 0
+    if _exists(connection, default):
+        # Les lignes du mois doivent quitter la partition par défaut avant la création
+        moved = connection.execute(text(
+            f"CREATE TEMP TABLE _partition_moved AS WITH moved AS ("
+            f"DELETE FROM {default} WHERE {column} >= :start AND {column} < :end RETURNING *"
+            f") SELECT * FROM moved"
+        ), {"start": start, "end": end}).rowcount
+    connection.execute(text(
+        f"CREATE TABLE {partition_name(table, month)} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+    if _exists(connection, "pg_temp._partition_moved"):
+        columns = _insert_columns(connection, table)
+        connection.execute(text(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM _partition_moved"))
+        connection.execute(text("DROP TABLE _partition_moved"))
+    return moved
+
+
+def ensure_partitions(connection: Connection, table: str, months_ahead: int = PARTITION_MONTHS_AHEAD,
+                      today: Optional[date] = None) -> List[date]:
+    """
+    Crée les partitions manquantes du mois en cours aux `months_ahead`
+    suivants, et celles des mois présents dans la partition par défaut
+    (saisies très anciennes ou très lointaines). Renvoie les mois créés.
+    """
+    existing = set(partition_months(connection, table))
+    current = _month_start(today or datetime.utcnow().date())
+    wanted = {_add_months(current, offset) for offset in range(months_ahead + 1)}
+    default = _default_name(table)
+    if _exists(connection, default):
+        column = PARTITION_COLUMNS[table]
+        wanted.update(
+            month.date() if isinstance(month, datetime) else month
+            for month in connection.execute(
+                text(f"SELECT DISTINCT date_trunc('month', {column}) FROM {default} WHERE {column} IS NOT NULL")
+            ).scalars()
+        )
+    created = sorted(wanted - existing)
+    for month in created:
+        moved = create_month(connection, table, month)
+        logger.info("Partition %s créée (%d lignes reprises de %s)", partition_name(table, month), moved, default)
+    return created
+
+
+# === Conversion ===
+
+_CASCADE_FUNCTION = """
+CREATE OR REPLACE FUNCTION {function}()
+RETURNS TRIGGER AS $$
+BEGIN
+    DELETE FROM {child} WHERE {child_column} IN (SELECT {parent_column} FROM deleted_rows);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS {trigger} ON {table};
+CREATE TRIGGER {trigger} AFTER DELETE ON {table}
+    REFERENCING OLD TABLE AS deleted_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION {function}();
+"""
+
+
+def _dependencies(connection: Connection, table: str) -> Dict[str, list]:
+    """Définitions à recréer sur la table partitionnée, lues avant le renommage"""
+    params = {"name": table}
+    return {
+        "indexes": connection.execute(text(
+            "SELECT c.relname, pg_get_indexdef(i.indexrelid), i.indisunique, i.indisprimary "
+            "FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE i.indrelid = to_regclass(:name)"
+        ), params).all(),
+        "triggers": connection.execute(text(
+            "SELECT tgname, pg_get_triggerdef(oid) FROM pg_trigger "
+            "WHERE tgrelid = to_regclass(:name) AND NOT tgisinternal"
+        ), params).all(),
+        "foreign_keys": connection.execute(text(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(:name) AND contype = 'f'"
+        ), params).all(),
+        "referencing": connection.execute(text(
+            "SELECT c.conname, c.conrelid::regclass::text, c.confdeltype, "
+            "(SELECT attname FROM pg_attribute WHERE attrelid = c.conrelid AND attnum = c.conkey[1]), "
+            "(SELECT attname FROM pg_attribute WHERE attrelid = c.confrelid AND attnum = c.confkey[1]), "
+            "array_length(c.conkey, 1) "
+            "FROM pg_constraint c WHERE c.confrelid = to_regclass(:name) AND c.contype = 'f'"
+        ), params).all(),
+        "views": connection.execute(text(
+            "SELECT DISTINCT v.oid, v.relname, v.relkind, pg_get_viewdef(v.oid) FROM pg_depend d "
+            "JOIN pg_rewrite r ON r.oid = d.objid JOIN pg_class v ON v.oid = r.ev_class "
+            "WHERE d.refobjid = to_regclass(:name) AND v.oid <> d.refobjid"
+        ), params).all(),
+    }
+
+
+def migrate_table(connection: Connection, table: str, months_ahead: int = PARTITION_MONTHS_AHEAD) -> int:
+    """
+    Convertit `table` en table partitionnée par mois (dans la transaction
+    de `connection`) ; renvoie le nombre de lignes copiées.
+    """
+    column = PARTITION_COLUMNS[table]
+    if is_partitioned(connection, table):
+        return 0
+    legacy = f"{table}_legacy"
+    if _exists(connection, legacy):
+        raise RuntimeError(f"{legacy} existe déjà : conversion précédente à terminer ou supprimer")
+    connection.execute(text("SET LOCAL statement_timeout = 0"))
+    connection.execute(text(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE"))
+    dependencies = _dependencies(connection, table)
+    view_indexes = {
+        name: connection.execute(text(
+            "SELECT pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid = :oid"
+        ), {"oid": oid}).scalars().all()
+        for oid, name, kind, _ in dependencies["views"] if kind == "m"
+    }
+    sequence = connection.execute(text("SELECT pg_get_serial_sequence(:name, 'id')"), {"name": table}).scalar()
+    first, last = connection.execute(text(f"SELECT min({column}), max({column}) FROM {table}")).one()
+
+    # L'ancienne table et ses index changent de nom ; la nouvelle reprend les noms d'origine
+    connection.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+    for name, _, _, _ in dependencies["indexes"]:
+        connection.execute(text(f'ALTER INDEX "{name}" RENAME TO "{(name + "_legacy")[-63:]}"'))
+    connection.execute(text(
+        f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED "
+        f"INCLUDING STORAGE INCLUDING COMMENTS) PARTITION BY RANGE ({column})"
+    ))
+    connection.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY (id, {column})"))
+    if sequence:
+        connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id"))
+    for name, definition in dependencies["foreign_keys"]:
+        connection.execute(text(f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition}'))
+    for name, definition, unique, primary in dependencies["indexes"]:
+        if primary:
+            continue
+        if unique and column not in definition:
+            logger.warning("Index unique %s non repris : il devrait inclure %s", name, column)
+            continue
+        connection.execute(text(definition))
+
+    # Partitions des mois existants et à venir, puis copie
+    current = _month_start(datetime.utcnow().date())
+    month = _month_start(first) if first else current
+    end = max(_month_start(last) if last else current, _add_months(current, months_ahead))
+    while month <= end:
+        connection.execute(text(
+            f"CREATE TABLE {partition_name(table, month)} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+        ))
+        month = _add_months(month, 1)
+    connection.execute(text(f"CREATE TABLE {_default_name(table)} PARTITION OF {table} DEFAULT"))
+    columns = _insert_columns(connection, legacy)
+    copied = connection.execute(text(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {legacy}")).rowcount
+
+    for name, definition in dependencies["triggers"]:
+        connection.execute(text(definition))
+    for name, child, on_delete, child_column, parent_column, size in dependencies["referencing"]:
+        connection.execute(text(f'ALTER TABLE {child} DROP CONSTRAINT "{name}"'))
+        if on_delete == "c" and size == 1:
+            connection.execute(text(_CASCADE_FUNCTION.format(
+                function=f"cascade_{table}_to_{child}", trigger=f"{table}_cascade_{child}", table=table,
+                child=child, child_column=child_column, parent_column=parent_column,
+            )))
+        else:
+            logger.warning("Clé étrangère %s de %s vers %s supprimée sans équivalent", name, child, table)
+    for oid, name, kind, definition in dependencies["views"]:
+        materialized = "MATERIALIZED VIEW" if kind == "m" else "VIEW"
+        connection.execute(text(f"DROP {materialized} {name}"))
+        connection.execute(text(f"CREATE {materialized} {name} AS {definition}"))
+        for index in view_indexes.get(name, ()):
+            connection.execute(text(index))
+    connection.execute(text(f"ANALYZE {table}"))
+    logger.info("%s partitionnée par mois (%d lignes, ancienne table : %s)", table, copied, legacy)
+    return copied
+
+
+def drop_legacy(connection: Connection, table: str) -> None:
+    """Supprime l'ancienne table une fois la conversion vérifiée"""
+    connection.execute(text(f"DROP TABLE IF EXISTS {table}_legacy"))
+
+
+def partition_new_tables(connection: Connection) -> None:
+    """Initialisation : partitionne les tables configurées encore vides"""
+    for table in PARTITION_TABLES:
+        if not _exists(connection, table) or is_partitioned(connection, table):
+            continue
+        if connection.execute(text(f"SELECT EXISTS (SELECT 1 FROM {table})")).scalar():
+            logger.warning("%s contient déjà des données : python -m app.services.partitions migrate %s",
+                           table, table)
+            continue
+        migrate_table(connection, table)
+        drop_legacy(connection, table)
+
+
+# === Archivage ===
+
+def archive_path(table: str, month: date, directory: str = PARTITION_ARCHIVE_DIR) -> str:
+    return os.path.join(directory, f"{partition_name(table, month)}.csv.gz")
+
+
+def archive_partition(db: Session, table: str, month: date, directory: str = PARTITION_ARCHIVE_DIR) -> PartitionArchive:
+    """
+    Détache le mois, l'écrit en CSV gzip puis supprime la partition (sans
+    commit : tout est annulé si la transaction échoue, le fichier reste)
+    """
+    name = partition_name(table, month)
+    if month not in partition_months(db.connection(), table):
+        raise ValueError(f"Partition {name} introuvable")
+    path = archive_path(table, month, directory)
+    os.makedirs(directory, exist_ok=True)
+    db.execute(text("SET LOCAL statement_timeout = 0"))
+    db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+    columns = _insert_columns(db.connection(), name)
+    cursor = db.connection().connection.driver_connection.cursor()
+    partial = f"{path}.part"
+    try:
+        with gzip.open(partial, "wt", encoding="utf-8", compresslevel=6) as archive:
+            cursor.copy_expert(f"COPY {name} ({columns}) TO STDOUT WITH (FORMAT csv, HEADER)", archive)
+        rows = cursor.rowcount
+    finally:
+        cursor.close()
+    expected = db.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+    if rows != expected:
+        os.remove(partial)
+        raise RuntimeError(f"Archive de {name} incomplète ({rows} lignes sur {expected})")
+    os.replace(partial, path)
+    db.execute(text(f"DROP TABLE {name}"))
+    record = db.get(PartitionArchive, (table, month)) or PartitionArchive(table_name=table, month=month)
+    record.path, record.row_count, record.size_bytes = path, rows, os.path.getsize(path)
+    record.archived_at, record.restored_at = datetime.utcnow(), None
+    db.add(record)
+    logger.info("%s archivée dans %s (%d lignes)", name, path, rows)
+    return record
+
+
+def archive_older_than(db: Session, table: str, months: int, today: Optional[date] = None) -> List[date]:
+    """Archive les mois antérieurs aux `months` derniers (un commit par mois)"""
+    cutoff = _add_months(_month_start(today or datetime.utcnow().date()), -months)
+    archived = []
+    for month in partition_months(db.connection(), table):
+        if month < cutoff:
+            archive_partition(db, table, month)
+            db.commit()
+            archived.append(month)
+    return archived
+
+
+def restore_partition(db: Session, table: str, month: date) -> int:
+    """Recharge un mois archivé (sans commit) ; renvoie le nombre de lignes"""
+    record = db.get(PartitionArchive, (table, month))
+    if record is None or record.restored_at is not None:
+        raise ValueError(f"Aucune archive à restaurer pour {partition_name(table, month)}")
+    connection = db.connection()
+    db.execute(text("SET LOCAL statement_timeout = 0"))
+    if month not in partition_months(connection, table):
+        create_month(connection, table, month)
+    cursor = connection.connection.driver_connection.cursor()
+    try:
+        with gzip.open(record.path, "rt", encoding="utf-8") as archive:
+            columns = archive.readline().strip()
+            cursor.copy_expert(f"COPY {partition_name(table, month)} ({columns}) FROM STDIN WITH (FORMAT csv)", archive)
+        rows = cursor.rowcount
+    finally:
+        cursor.close()
+    record.restored_at = datetime.utcnow()
+    return rows
+
+
+# === Entretien ===
+
+def maintain(db: Session) -> bool:
+    """Partitions à venir (et archivage automatique) des tables partitionnées ; False si déjà en cours"""
+    if not db.execute(select(func.pg_try_advisory_xact_lock(_ADVISORY_LOCK_KEY))).scalar():
+        db.rollback()
+        return False
+    for table in PARTITION_TABLES:
+        if is_partitioned(db.connection(), table):
+            ensure_partitions(db.connection(), table)
+    db.commit()
+    if PARTITION_ARCHIVE_AFTER_MONTHS > 0:
+        for table in PARTITION_TABLES:
+            if is_partitioned(db.connection(), table):
+                archive_older_than(db, table, PARTITION_ARCHIVE_AFTER_MONTHS)
+        db.commit()
+    return True
+
+
+def describe(db: Session) -> List[dict]:
+    """État du partitionnement par table : mois, taille, lignes estimées, archives"""
+    connection = db.connection()
+    result = []
+    for table in PARTITION_COLUMNS:
+        if not _exists(connection, table):
+            continue
+        partitioned = is_partitioned(connection, table)
+        partitions = []
+        if partitioned:
+            partitions = [
+                {"name": name, "rows": max(int(rows), 0), "size_bytes": size}
+                for name, rows, size in connection.execute(text(
+                    "SELECT c.relname, c.reltuples, pg_total_relation_size(c.oid) FROM pg_inherits i "
+                    "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(:name) ORDER BY c.relname"
+                ), {"name": table})
+            ]
+        archives = db.query(PartitionArchive).filter(PartitionArchive.table_name == table).order_by(
+            PartitionArchive.month
+        )
+        result.append({
+            "table": table,
+            "partitioned": partitioned,
+            "partitions": partitions,
+            "archives": [
+                {"month": a.month, "path": a.path, "rows": a.row_count, "restored_at": a.restored_at}
+                for a in archives
+            ],
+        })
+    return result
+
+
+class PartitionMaintainer:
+    """Thread de création périodique des partitions (un par processus, verrou consultatif en base)"""
+
+    def __init__(self, session_factory, interval: float = PARTITION_MAINTENANCE_SECONDS):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="partition-maintainer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def run_once(self) -> None:
+        db = self.session_factory()
+        try:
+            maintain(db)
+        except Exception:
+            db.rollback()
+            logger.exception("Échec de l'entretien des partitions")
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval)
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    from app.database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    command, arguments = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else ("status", [])
+    session = SessionLocal()
+    try:
+        if command == "migrate":
+            for name in arguments or PARTITION_TABLES:
+                migrate_table(session.connection(), name)
+                session.commit()
+        elif command == "drop-legacy":
+            for name in arguments or PARTITION_TABLES:
+                drop_legacy(session.connection(), name)
+            session.commit()
+        elif command == "maintain":
+            maintain(session)
+        elif command in ("archive", "restore"):
+            name, month = arguments[0], datetime.strptime(arguments[1], "%Y-%m").date()
+            if command == "archive":
+                archive_partition(session, name, month)
+            else:
+                logger.info("%d lignes restaurées", restore_partition(session, name, month))
+            session.commit()
+        else:
+            print(json.dumps(describe(session), default=str, indent=2))
+    finally:
+        session.close()
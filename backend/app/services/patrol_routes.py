@@ -0,0 +1,352 @@
+"""
+Géométrie des routes de patrouille : analyse, métriques et simplification.
+
+`route_geometry` (GeoJSON LineString ou MultiLineString, Feature ou
+FeatureCollection acceptées) est analysée une seule fois, à l'écriture
+(événements before_insert / before_update de PatrolRoute) :
+
+- `total_distance` : longueur géodésique en km (haversine) ;
+- `bbox_*` : emprise, pour filtrer les routes d'une vue sans les lire ;
+- `simplified_geometries` : versions Douglas-Peucker par niveau de zoom,
+  avec une tolérance d'une fraction de pixel à ce zoom.
+
+Les cartes demandent le niveau adapté à leur zoom (`geometry_for_zoom`).
+Les recherches « routes à moins de X m de ce point / de cette zone »
+passent par un index STRtree en mémoire, reconstruit après chaque
+écriture (data_versions), puis par un calcul exact de distance dans une
+projection métrique locale.
+
+Les routes écrites avant l'ajout de ces colonnes sont recalculées par
+`python -m app.services.patrol_routes`.
+"""
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import shapely
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.models import Observation, PatrolRoute
+from app.services.data_version import data_versions
+from app.services.partitions import get_row
+from app.utils.geoindex import EARTH_RADIUS_M, haversine_m
+
+# Niveaux de zoom pour lesquels une version simplifiée est stockée ;
+# au-delà du plus grand, la géométrie complète est servie
+ROUTE_SIMPLIFY_ZOOMS = tuple(sorted(
+    int(zoom) for zoom in os.getenv("ROUTE_SIMPLIFY_ZOOMS", "6,9,12,15").split(",") if zoom.strip()
+))
+# Écart maximal toléré, en pixels (tuiles de 256 px) au zoom du niveau
+ROUTE_SIMPLIFY_PIXELS = float(os.getenv("ROUTE_SIMPLIFY_PIXELS", "0.5"))
+# Resynchronisation de l'index (écritures des autres processus)
+ROUTE_INDEX_RESYNC_SECONDS = float(os.getenv("ROUTE_INDEX_RESYNC_SECONDS", "300"))
+# Distance maximale d'une recherche de proximité
+ROUTE_MAX_DISTANCE_M = 50_000
+
+# Mètres par pixel à l'équateur au zoom 0
+_METERS_PER_PIXEL_Z0 = 2 * math.pi * 6_378_137 / 256
+_METERS_PER_DEGREE = EARTH_RADIUS_M * math.pi / 180
+# Six décimales : ~0,1 m
+_COORDINATE_DECIMALS = 6
+
+_LINE_TYPES = ("LineString", "MultiLineString")
+
+
+# === Analyse ===
+
+def _to_line_geometry(data) -> shapely.Geometry:
+    if not isinstance(data, dict):
+        raise ValueError("GeoJSON attendu")
+    if data.get("type") == "Feature":
+        return _to_line_geometry(data.get("geometry"))
+    if data.get("type") == "FeatureCollection":
+        parts = [_to_line_geometry(feature) for feature in data.get("features") or ()]
+        lines = [line for part in parts for line in shapely.get_parts(part)]
+        return shapely.multilinestrings(lines) if len(lines) > 1 else lines[0] if lines else shapely.LineString()
+    if data.get("type") not in _LINE_TYPES:
+        raise ValueError("La géométrie doit être une LineString ou MultiLineString GeoJSON")
+    try:
+        return shapely.geometry.shape(data)
+    except Exception as e:
+        raise ValueError(f"Géométrie invalide: {e}")
+
+
+def parse_route_geometry(value: Optional[str]) -> Optional[shapely.Geometry]:
+    """Géométrie (longitude, latitude) d'une route, None si absente ; ValueError si invalide"""
+    if not value:
+        return None
+    try:
+        data = json.loads(value)
+    except ValueError:
+        raise ValueError("route_geometry n'est pas du JSON valide")
+    geometry = _to_line_geometry(data)
+    if geometry.is_empty:
+        raise ValueError("La géométrie de la route est vide")
+    coordinates = shapely.get_coordinates(geometry)
+    if (np.abs(coordinates[:, 0]) > 180).any() or (np.abs(coordinates[:, 1]) > 90).any():
+        raise ValueError("Coordonnées hors limites (longitude, latitude attendues)")
+    return geometry
+
+
+def parse_checkpoints(value: Optional[str]) -> Optional[str]:
+    """Points de contrôle normalisés (JSON compact) ; ValueError si ce n'est pas du JSON"""
+    if not value:
+        return None
+    try:
+        return json.dumps(json.loads(value), ensure_ascii=False, separators=(",", ":"))
+    except ValueError:
+        raise ValueError("checkpoints n'est pas du JSON valide")
+
+
+def geodesic_length_m(geometry: shapely.Geometry) -> float:
+    total = 0.0
+    for line in shapely.get_parts(geometry):
+        coordinates = shapely.get_coordinates(line)
+        if len(coordinates) > 1:
+            total += float(haversine_m(
+                coordinates[:-1, 0], coordinates[:-1, 1], coordinates[1:, 0], coordinates[1:, 1]
+            ).sum())
+    return total
+
+
+# === Projection locale et simplification ===
+
+def local_projection(longitude0: float, latitude0: float):
+    """(vers mètres, vers degrés) : projection équirectangulaire centrée sur le point donné"""
+    kx = _METERS_PER_DEGREE * math.cos(math.radians(latitude0))
+    ky = _METERS_PER_DEGREE
+
+    def to_meters(coordinates: np.ndarray) -> np.ndarray:
+        return np.column_stack(((coordinates[:, 0] - longitude0) * kx, (coordinates[:, 1] - latitude0) * ky))
+
+    def to_degrees(coordinates: np.ndarray) -> np.ndarray:
+        return np.column_stack((coordinates[:, 0] / kx + longitude0, coordinates[:, 1] / ky + latitude0))
+
+    return to_meters, to_degrees
+
+
+def _geojson(geometry: shapely.Geometry) -> dict:
+    rounded = shapely.transform(geometry, lambda coordinates: np.round(coordinates, _COORDINATE_DECIMALS))
+    return shapely.geometry.mapping(rounded)
+
+
+def simplify_levels(geometry: shapely.Geometry) -> Dict[str, dict]:
+    """Versions Douglas-Peucker par zoom : {zoom: géométrie GeoJSON}"""
+    centroid = geometry.centroid
+    to_meters, to_degrees = local_projection(centroid.x, centroid.y)
+    projected = shapely.transform(geometry, to_meters)
+    cos_latitude = math.cos(math.radians(centroid.y))
+    levels = {}
+    for zoom in ROUTE_SIMPLIFY_ZOOMS:
+        tolerance = ROUTE_SIMPLIFY_PIXELS * _METERS_PER_PIXEL_Z0 * cos_latitude / 2 ** zoom
+        # preserve_topology=False : Douglas-Peucker simple (GEOS)
+        simplified = shapely.simplify(projected, tolerance, preserve_topology=False)
+        levels[str(zoom)] = _geojson(shapely.transform(simplified, to_degrees))
+    return levels
+
+
+def apply_route_metrics(route: PatrolRoute) -> None:
+    """Recalcule les colonnes dérivées de route_geometry (sans effet sans géométrie)"""
+    geometry = parse_route_geometry(route.route_geometry)
+    if geometry is None:
+        route.bbox_west = route.bbox_south = route.bbox_east = route.bbox_north = None
+        route.vertex_count = None
+        route.simplified_geometries = None
+        return
+    route.total_distance = round(geodesic_length_m(geometry) / 1000, 3)
+    route.bbox_west, route.bbox_south, route.bbox_east, route.bbox_north = (float(v) for v in geometry.bounds)
+    route.vertex_count = int(shapely.get_num_coordinates(geometry))
+    route.simplified_geometries = json.dumps(simplify_levels(geometry), separators=(",", ":"))
+
+
+@event.listens_for(PatrolRoute, "before_insert")
+def _route_inserted(mapper, connection, route: PatrolRoute) -> None:
+    apply_route_metrics(route)
+
+
+@event.listens_for(PatrolRoute, "before_update")
+def _route_updated(mapper, connection, route: PatrolRoute) -> None:
+    attrs = inspect(route).attrs
+    # Une longueur saisie à la main est remplacée tant qu'il y a une géométrie
+    if attrs.route_geometry.history.has_changes() or attrs.total_distance.history.has_changes():
+        apply_route_metrics(route)
+
+
+def refresh_route_metrics(db: Session) -> int:
+    """Recalcule les métriques de toutes les routes ayant une géométrie"""
+    routes = db.query(PatrolRoute).filter(PatrolRoute.route_geometry.isnot(None)).all()
+    for route in routes:
+        apply_route_metrics(route)
+    db.commit()
+    return len(routes)
+
+
+# === Lecture ===
+
+def select_level(zoom: Optional[int]) -> Optional[str]:
+    """Niveau stocké à servir pour un zoom de carte (None : géométrie complète)"""
+    if zoom is None:
+        return None
+    for level in ROUTE_SIMPLIFY_ZOOMS:
+        if zoom <= level:
+            return str(level)
+    return None
+
+
+def geometry_for_zoom(route: PatrolRoute, zoom: Optional[int]) -> Optional[dict]:
+    level = select_level(zoom)
+    if level is not None and route.simplified_geometries:
+        geometry = json.loads(route.simplified_geometries).get(level)
+        if geometry is not None:
+            return geometry
+    parsed = parse_route_geometry(route.route_geometry)
+    return _geojson(parsed) if parsed is not None else None
+
+
+def route_feature(route: PatrolRoute, zoom: Optional[int]) -> dict:
+    return {
+        "type": "Feature",
+        "id": route.id,
+        "geometry": geometry_for_zoom(route, zoom),
+        "properties": {
+            "id": route.id,
+            "name": route.name,
+            "patrol_type": route.patrol_type,
+            "difficulty_level": route.difficulty_level,
+            "total_distance": route.total_distance,
+            "estimated_duration": route.estimated_duration,
+            "checkpoints": json.loads(route.checkpoints) if route.checkpoints else None,
+        },
+    }
+
+
+def route_features(db: Session, zoom: Optional[int] = None,
+                   bbox: Optional[Tuple[float, float, float, float]] = None,
+                   patrol_type: Optional[str] = None) -> dict:
+    """Routes en FeatureCollection, à la résolution du zoom ; bbox = (ouest, sud, est, nord)"""
+    query = db.query(PatrolRoute).filter(PatrolRoute.route_geometry.isnot(None))
+    if patrol_type is not None:
+        query = query.filter(PatrolRoute.patrol_type == patrol_type)
+    if bbox is not None:
+        west, south, east, north = bbox
+        query = query.filter(
+            PatrolRoute.bbox_west <= east, PatrolRoute.bbox_east >= west,
+            PatrolRoute.bbox_south <= north, PatrolRoute.bbox_north >= south,
+        )
+    return {
+        "type": "FeatureCollection",
+        "features": [route_feature(route, zoom) for route in query.order_by(PatrolRoute.id)],
+        "zoom_level": select_level(zoom),
+    }
+
+
+# === Proximité ===
+
+class RouteIndex:
+    """Géométries des routes en mémoire et arbre STRtree (longitude, latitude)"""
+
+    def __init__(self, resync_seconds: float = ROUTE_INDEX_RESYNC_SECONDS):
+        self.resync_seconds = resync_seconds
+        self._ids: np.ndarray = np.empty(0, dtype=np.int64)
+        self._names: List[str] = []
+        self._geometries: np.ndarray = np.empty(0, dtype=object)
+        self._tree: Optional[shapely.STRtree] = None
+        self._version: Optional[int] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def ensure_loaded(self, db: Session) -> None:
+        version = data_versions.get(PatrolRoute.__tablename__)
+        with self._lock:
+            if self._version == version and time.monotonic() - self._loaded_at < self.resync_seconds:
+                return
+            ids, names, geometries = [], [], []
+            rows = db.query(PatrolRoute.id, PatrolRoute.name, PatrolRoute.route_geometry).filter(
+                PatrolRoute.route_geometry.isnot(None)
+            )
+            for route_id, name, route_geometry in rows:
+                try:
+                    geometry = parse_route_geometry(route_geometry)
+                except ValueError:
+                    continue  # écrite avant la validation
+                ids.append(route_id)
+                names.append(name)
+                geometries.append(geometry)
+            self._ids = np.asarray(ids, dtype=np.int64)
+            self._names = names
+            self._geometries = np.asarray(geometries, dtype=object)
+            self._tree = shapely.STRtree(self._geometries) if geometries else None
+            self._version = version
+            self._loaded_at = time.monotonic()
+
+    def within_distance(self, db: Session, geometry: shapely.Geometry, distance_m: float) -> List[dict]:
+        """Routes à moins de `distance_m` mètres de la géométrie, de la plus proche à la plus éloignée"""
+        self.ensure_loaded(db)
+        tree, ids, names, geometries = self._tree, self._ids, self._names, self._geometries
+        if tree is None:
+            return []
+
+        # Présélection : emprise élargie de la distance, en degrés
+        west, south, east, north = geometry.bounds
+        dlat = distance_m / _METERS_PER_DEGREE
+        max_latitude = min(max(abs(south), abs(north)) + dlat, 89.0)
+        dlon = distance_m / (_METERS_PER_DEGREE * math.cos(math.radians(max_latitude)))
+        candidates = tree.query(shapely.box(west - dlon, south - dlat, east + dlon, north + dlat))
+        if not len(candidates):
+            return []
+
+        # Distance exacte dans une projection métrique centrée sur la géométrie
+        centroid = geometry.centroid
+        to_meters, _ = local_projection(centroid.x, centroid.y)
+        target = shapely.transform(geometry, to_meters)
+        distances = shapely.distance(
+            target, shapely.transform(geometries[candidates], to_meters)
+        )
+        matched = distances <= distance_m
+        order = np.argsort(distances[matched], kind="stable")
+        selected, selected_distances = candidates[matched][order], distances[matched][order]
+        return [
+            {"id": int(ids[position]), "name": names[position], "distance_m": round(float(distance), 1)}
+            for position, distance in zip(selected.tolist(), selected_distances.tolist())
+        ]
+
+
+route_index = RouteIndex()
+
+
+def routes_near_point(db: Session, latitude: float, longitude: float, distance_m: float) -> List[dict]:
+    return route_index.within_distance(db, shapely.Point(longitude, latitude), distance_m)
+
+
+def routes_near_observation(db: Session, observation_id: int, distance_m: float,
+                            observation_date: Optional[datetime] = None) -> Optional[List[dict]]:
+    """None si l'observation n'existe pas ; `observation_date`, si connue, limite la lecture à une partition"""
+    row = get_row(db, Observation, observation_id, observation_date)
+    if row is None:
+        return None
+    return route_index.within_distance(db, shapely.Point(row.longitude, row.latitude), distance_m)
+
+
+def routes_near_geometry(db: Session, geometry: dict, distance_m: float) -> List[dict]:
+    """Routes proches d'une géométrie GeoJSON (zone sensible, polygone dessiné...)"""
+    try:
+        shape = shapely.geometry.shape(geometry)
+    except Exception as e:
+        raise ValueError(f"Géométrie invalide: {e}")
+    if shape.is_empty:
+        raise ValueError("Géométrie vide")
+    return route_index.within_distance(db, shape, distance_m)
+
+
+if __name__ == "__main__":
+    # python -m app.services.patrol_routes : recalcule les métriques des routes existantes
+    from app.database import SessionLocal
+
+    with SessionLocal() as session:
+        print(f"{refresh_route_metrics(session)} routes recalculées")
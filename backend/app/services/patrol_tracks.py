@@ -0,0 +1,563 @@
+"""
+Traces GPS des patrouilles et couverture du parc.
+
+Une trace (dizaines de milliers de points) est stockée dans `patrol_tracks`
+sous forme d'entiers — longitude et latitude en 1e-7 degré, temps en
+secondes depuis le début — codés en différences successives puis
+compressés (zlib) : quelques octets par point, décodés par NumPy sans
+analyse de texte.
+
+À l'écriture, les cellules de la grille de couverture (grille fixe en
+degrés, COVERAGE_CELL_DEGREES) traversées par la trace sont calculées et
+stockées avec elle. Une couverture sur une période ne relit que ces listes
+de cellules ; seules les traces à cheval sur les bornes de la période sont
+décodées pour être découpées. Une résolution plus grossière regroupe
+k × k cellules.
+
+Les grilles renvoyées sont des rasters : `values[ligne * nx + colonne]`,
+ligne 0 au nord, colonne 0 à l'ouest.
+"""
+import math
+import os
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import shapely
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models import PatrolLog, PatrolRoute, PatrolTrack
+from app.services.data_version import data_versions
+from app.services.patrol_routes import local_projection, parse_route_geometry
+from app.utils.cache import TTLCache
+from app.utils.geoindex import EARTH_RADIUS_M, haversine_m
+
+# Taille des cellules de base (~280 m à l'équateur) ; les traces déjà
+# stockées avec une autre taille sont recalculées à la lecture
+COVERAGE_CELL_DEGREES = float(os.getenv("COVERAGE_CELL_DEGREES", "0.0025"))
+COVERAGE_CACHE_TTL = float(os.getenv("COVERAGE_CACHE_TTL", "300"))
+# Taille maximale d'une grille renvoyée (cellules)
+COVERAGE_MAX_CELLS = int(os.getenv("COVERAGE_MAX_CELLS", "4000000"))
+TRACK_MAX_POINTS = int(os.getenv("TRACK_MAX_POINTS", "200000"))
+# Points aberrants : vitesse au-delà de laquelle un saut isolé est écarté
+TRACK_MAX_SPEED_KMH = float(os.getenv("TRACK_MAX_SPEED_KMH", "80"))
+# Au-delà de cet écart entre deux points (perte de signal), le segment
+# n'est pas considéré comme parcouru
+TRACK_MAX_GAP_M = float(os.getenv("TRACK_MAX_GAP_M", "1000"))
+# Distance à l'itinéraire prévu en deçà de laquelle il est suivi
+ROUTE_MATCH_TOLERANCE_M = float(os.getenv("ROUTE_MATCH_TOLERANCE_M", "100"))
+
+_SCALE = 10 ** 7
+_INT32_MAX = 2 ** 31 - 1
+_METERS_PER_DEGREE = EARTH_RADIUS_M * math.pi / 180
+# Identifiant de cellule : (ix + décalage) * pas + (iy + décalage)
+_CELL_OFFSET = 1 << 24
+_CELL_STRIDE = 1 << 26
+
+coverage_cache = TTLCache(ttl=COVERAGE_CACHE_TTL, maxsize=64)
+
+
+@dataclass
+class TrackPoints:
+    """Points d'une trace en colonnes, triés par date"""
+    longitudes: np.ndarray
+    latitudes: np.ndarray
+    times: np.ndarray  # datetime64[s], UTC
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def subset(self, mask: np.ndarray) -> "TrackPoints":
+        return TrackPoints(self.longitudes[mask], self.latitudes[mask], self.times[mask])
+
+
+# === Lecture et nettoyage des traces reçues ===
+
+def _parse_times(values: Sequence) -> np.ndarray:
+    """Secondes depuis l'époque ou dates ISO 8601 (UTC si sans fuseau)"""
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        seconds = np.asarray(values, dtype=np.float64)
+        if not np.isfinite(seconds).all():
+            raise ValueError("Dates invalides")
+        return np.round(seconds).astype("int64").astype("datetime64[s]")
+    times = []
+    for value in values:
+        try:
+            parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            raise ValueError(f"Date invalide: {value}")
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        times.append(parsed)
+    return np.asarray(times, dtype="datetime64[s]")
+
+
+def parse_track(body) -> TrackPoints:
+    """
+    Trace reçue d'un terminal, sous l'une des formes :
+
+    - colonnes : {"longitudes": [...], "latitudes": [...], "times": [...]} ;
+    - points : {"points": [[longitude, latitude, date], ...]} ;
+    - Feature GeoJSON LineString avec les dates dans `properties.times`
+      (ou `coordTimes`, convention des conversions GPX).
+    """
+    if not isinstance(body, dict):
+        raise ValueError("Objet JSON attendu")
+    if "points" in body:
+        points = body["points"]
+        if not isinstance(points, list) or any(not isinstance(p, (list, tuple)) or len(p) < 3 for p in points):
+            raise ValueError("points : liste de [longitude, latitude, date] attendue")
+        longitudes, latitudes, times = [p[0] for p in points], [p[1] for p in points], [p[2] for p in points]
+    elif body.get("type") == "Feature":
+        geometry = body.get("geometry") or {}
+        properties = body.get("properties") or {}
+        if geometry.get("type") != "LineString":
+            raise ValueError("La géométrie doit être une LineString GeoJSON")
+        coordinates = geometry.get("coordinates") or []
+        longitudes, latitudes = [c[0] for c in coordinates], [c[1] for c in coordinates]
+        times = properties.get("times") or properties.get("coordTimes") or []
+    else:
+        longitudes, latitudes, times = body.get("longitudes"), body.get("latitudes"), body.get("times")
+        if not all(isinstance(column, list) for column in (longitudes, latitudes, times)):
+            raise ValueError("Colonnes longitudes, latitudes et times attendues")
+
+    if not (len(longitudes) == len(latitudes) == len(times)):
+        raise ValueError("Les colonnes de la trace n'ont pas la même longueur")
+    if len(times) > TRACK_MAX_POINTS:
+        raise ValueError(f"Trace trop longue ({len(times)} points, maximum {TRACK_MAX_POINTS})")
+    try:
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError("Coordonnées invalides")
+    return clean_track(TrackPoints(longitudes, latitudes, _parse_times(times)))
+
+
+def clean_track(points: TrackPoints) -> TrackPoints:
+    """Tri par date, doublons de date et sauts isolés (points aberrants) écartés"""
+    lons, lats = points.longitudes, points.latitudes
+    if not (np.isfinite(lons).all() and np.isfinite(lats).all()):
+        raise ValueError("Coordonnées invalides")
+    if (np.abs(lons) > 180).any() or (np.abs(lats) > 90).any():
+        raise ValueError("Coordonnées hors limites (longitude, latitude attendues)")
+
+    order = np.argsort(points.times, kind="stable")
+    points = points.subset(order)
+    if len(points):
+        first = np.ones(len(points), dtype=bool)
+        first[1:] = points.times[1:] != points.times[:-1]
+        points = points.subset(first)
+
+    if len(points) > 2:
+        seconds = np.diff(points.times).astype(np.float64)
+        speeds = haversine_m(points.longitudes[:-1], points.latitudes[:-1],
+                             points.longitudes[1:], points.latitudes[1:]) / seconds * 3.6
+        too_fast = speeds > TRACK_MAX_SPEED_KMH
+        # Aberrant : arrivée et départ trop rapides ; les extrémités sont gardées
+        spike = np.zeros(len(points), dtype=bool)
+        spike[1:-1] = too_fast[:-1] & too_fast[1:]
+        points = points.subset(~spike)
+
+    if len(points) < 2:
+        raise ValueError("La trace doit contenir au moins deux points datés distincts")
+    return points
+
+
+# === Codage ===
+
+def encode_points(points: TrackPoints) -> bytes:
+    columns = np.stack([
+        np.round(points.longitudes * _SCALE).astype(np.int64),
+        np.round(points.latitudes * _SCALE).astype(np.int64),
+        (points.times - points.times[0]).astype(np.int64),
+    ])
+    deltas = np.diff(columns, axis=1, prepend=0)
+    if np.abs(deltas).max() > _INT32_MAX:
+        raise ValueError("Trace trop étendue pour être codée")
+    return zlib.compress(deltas.astype("<i4").tobytes())
+
+
+def decode_points(blob: bytes, started_at: datetime) -> TrackPoints:
+    columns = np.frombuffer(zlib.decompress(blob), dtype="<i4").reshape(3, -1).astype(np.int64).cumsum(axis=1)
+    return TrackPoints(
+        longitudes=columns[0] / _SCALE,
+        latitudes=columns[1] / _SCALE,
+        times=np.datetime64(started_at, "s") + columns[2].astype("timedelta64[s]"),
+    )
+
+
+def encode_cells(cells: np.ndarray) -> bytes:
+    return zlib.compress(np.diff(cells, prepend=0).astype("<i8").tobytes())
+
+
+def decode_cells_batch(blobs: Sequence[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+    """Cellules de plusieurs traces : (identifiants, longueur de chaque liste)"""
+    deltas = [np.frombuffer(zlib.decompress(blob), dtype="<i8") for blob in blobs]
+    lengths = np.fromiter((len(d) for d in deltas), dtype=np.int64, count=len(deltas))
+    if not lengths.sum():
+        return np.empty(0, dtype=np.int64), lengths
+    cells = np.concatenate(deltas).cumsum()
+    # Cumul global ramené à chaque liste : on retranche le total des précédentes
+    ends = np.cumsum(lengths)
+    before = np.concatenate(([0], cells[ends[:-1] - 1]))
+    return cells - np.repeat(before, lengths), lengths
+
+
+# === Cellules ===
+
+def cell_ids(ix: np.ndarray, iy: np.ndarray) -> np.ndarray:
+    return (ix + _CELL_OFFSET) * _CELL_STRIDE + (iy + _CELL_OFFSET)
+
+
+def cell_indices(ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    return ids // _CELL_STRIDE - _CELL_OFFSET, ids % _CELL_STRIDE - _CELL_OFFSET
+
+
+def segment_lengths_m(points: TrackPoints) -> np.ndarray:
+    return haversine_m(points.longitudes[:-1], points.latitudes[:-1], points.longitudes[1:], points.latitudes[1:])
+
+
+def track_cells(points: TrackPoints, cell_degrees: float = COVERAGE_CELL_DEGREES) -> np.ndarray:
+    """Cellules traversées, triées ; les segments longs sont densifiés, sauf au-delà de TRACK_MAX_GAP_M"""
+    lons, lats = points.longitudes, points.latitudes
+    if len(lons) > 1:
+        max_latitude = min(float(np.abs(lats).max()), 89.0)
+        step = cell_degrees * _METERS_PER_DEGREE * math.cos(math.radians(max_latitude)) / 2
+        lengths = segment_lengths_m(points)
+        steps = np.where(lengths <= TRACK_MAX_GAP_M, np.ceil(lengths / step), 1).astype(np.int64)
+        steps = np.maximum(steps, 1)
+        segment = np.repeat(np.arange(len(steps)), steps)
+        fraction = (np.arange(len(segment)) - np.repeat(np.cumsum(steps) - steps, steps)) / np.repeat(steps, steps)
+        lons = np.append(lons[segment] + fraction * (lons[segment + 1] - lons[segment]), lons[-1])
+        lats = np.append(lats[segment] + fraction * (lats[segment + 1] - lats[segment]), lats[-1])
+    ix = np.floor(lons / cell_degrees).astype(np.int64)
+    iy = np.floor(lats / cell_degrees).astype(np.int64)
+    return np.unique(cell_ids(ix, iy))
+
+
+# === Écriture ===
+
+def store_track(db: Session, log: PatrolLog, points: TrackPoints) -> PatrolTrack:
+    """Enregistre (ou remplace) la trace d'un rapport de patrouille ; commit à la charge de l'appelant"""
+    track = db.get(PatrolTrack, log.id) or PatrolTrack(patrol_log_id=log.id)
+    started_at = points.times[0].astype(datetime)
+    ended_at = points.times[-1].astype(datetime)
+    track.started_at, track.ended_at = started_at, ended_at
+    track.point_count = len(points)
+    track.distance_m = round(float(segment_lengths_m(points).sum()), 1)
+    track.bbox_west, track.bbox_east = float(points.longitudes.min()), float(points.longitudes.max())
+    track.bbox_south, track.bbox_north = float(points.latitudes.min()), float(points.latitudes.max())
+    track.points = encode_points(points)
+    track.cell_degrees = COVERAGE_CELL_DEGREES
+    track.cells = encode_cells(track_cells(points))
+    track.uploaded_at = datetime.utcnow()
+    # Horaires du rapport complétés par la trace s'ils n'ont pas été saisis
+    log.start_time = log.start_time or started_at
+    log.end_time = log.end_time or ended_at
+    db.add(track)
+    return track
+
+
+def load_track(db: Session, patrol_log_id: int) -> Optional[Tuple[PatrolTrack, TrackPoints]]:
+    track = db.get(PatrolTrack, patrol_log_id)
+    if track is None:
+        return None
+    return track, decode_points(track.points, track.started_at)
+
+
+def track_feature(track: PatrolTrack, points: TrackPoints) -> dict:
+    return {
+        "type": "Feature",
+        "geometry": {
+            "type": "LineString",
+            "coordinates": np.round(np.column_stack((points.longitudes, points.latitudes)), 7).tolist(),
+        },
+        "properties": {
+            "patrol_log_id": track.patrol_log_id,
+            # Secondes depuis l'époque, relisibles par parse_track
+            "times": points.times.astype(np.int64).tolist(),
+            "distance_m": track.distance_m,
+        },
+    }
+
+
+# === Comparaison avec l'itinéraire prévu ===
+
+def compare_with_route(points: TrackPoints, route: PatrolRoute,
+                       tolerance_m: float = ROUTE_MATCH_TOLERANCE_M) -> Optional[dict]:
+    """
+    Écart entre la trace et l'itinéraire prévu (None sans géométrie) : part
+    de l'itinéraire suivie, part de la trace hors itinéraire, écart maximal.
+    Les calculs se font dans une projection métrique locale, sur des
+    versions simplifiées à tolerance / 5 près.
+    """
+    route_geometry = parse_route_geometry(route.route_geometry)
+    if route_geometry is None:
+        return None
+    centroid = route_geometry.centroid
+    to_meters, _ = local_projection(centroid.x, centroid.y)
+    planned = shapely.simplify(shapely.transform(route_geometry, to_meters), tolerance_m / 5)
+    walked = shapely.simplify(
+        shapely.linestrings(to_meters(np.column_stack((points.longitudes, points.latitudes)))), tolerance_m / 5
+    )
+    followed = shapely.intersection(planned, shapely.buffer(walked, tolerance_m)).length
+    on_route = shapely.intersection(walked, shapely.buffer(planned, tolerance_m)).length
+    deviations = shapely.distance(shapely.points(shapely.get_coordinates(walked)), planned)
+    duration = (points.times[-1] - points.times[0]).astype(np.int64) / 60
+    return {
+        "route_id": route.id,
+        "tolerance_m": tolerance_m,
+        "route_distance_m": round(planned.length, 1),
+        "track_distance_m": round(float(segment_lengths_m(points).sum()), 1),
+        "route_followed_ratio": round(followed / planned.length, 4) if planned.length else None,
+        "off_route_ratio": round(1 - on_route / walked.length, 4) if walked.length else None,
+        "max_deviation_m": round(float(deviations.max()), 1),
+        "duration_minutes": round(float(duration), 1),
+        "estimated_duration_minutes": route.estimated_duration,
+    }
+
+
+# === Couverture ===
+
+@dataclass(frozen=True)
+class CoverageParams:
+    start: datetime
+    end: datetime
+    # Emprise (ouest, sud, est, nord) ; à défaut, celle des routes et des traces
+    bbox: Optional[Tuple[float, float, float, float]] = None
+    # Côté des cellules renvoyées, en cellules de base
+    resolution: int = 1
+    ranger_id: Optional[int] = None
+    route_id: Optional[int] = None
+
+
+@dataclass
+class VisitedCells:
+    """Couples (trace, cellule de base) visités dans la période, dédoublonnés par trace"""
+    tracks: np.ndarray
+    cells: np.ndarray
+    ended_at: np.ndarray  # fin de la visite par trace, en secondes depuis l'époque
+    distance_m: float
+    bounds: Optional[Tuple[float, float, float, float]]
+
+
+def _epoch(value: datetime) -> int:
+    return int(np.datetime64(value, "s").astype(np.int64))
+
+
+def load_visited_cells(db: Session, params: CoverageParams) -> VisitedCells:
+    query = db.query(
+        PatrolTrack.patrol_log_id, PatrolTrack.started_at, PatrolTrack.ended_at, PatrolTrack.cell_degrees,
+        PatrolTrack.cells, PatrolTrack.distance_m, PatrolTrack.bbox_west, PatrolTrack.bbox_south,
+        PatrolTrack.bbox_east, PatrolTrack.bbox_north,
+    ).filter(PatrolTrack.started_at < params.end, PatrolTrack.ended_at > params.start)
+    if params.ranger_id is not None or params.route_id is not None:
+        query = query.join(PatrolLog, PatrolLog.id == PatrolTrack.patrol_log_id)
+        if params.ranger_id is not None:
+            query = query.filter(PatrolLog.ranger_id == params.ranger_id)
+        if params.route_id is not None:
+            query = query.filter(PatrolLog.route_id == params.route_id)
+    if params.bbox is not None:
+        west, south, east, north = params.bbox
+        query = query.filter(PatrolTrack.bbox_east >= west, PatrolTrack.bbox_west <= east,
+                             PatrolTrack.bbox_north >= south, PatrolTrack.bbox_south <= north)
+    rows = query.all()
+
+    # Traces entièrement dans la période : cellules stockées ; les autres
+    # (à cheval sur une borne, ou grille différente) sont décodées et découpées
+    stored = [r for r in rows if r.started_at >= params.start and r.ended_at <= params.end
+              and r.cell_degrees == COVERAGE_CELL_DEGREES]
+    stored_ids = {r.patrol_log_id for r in stored}
+    cells, lengths = decode_cells_batch([r.cells for r in stored])
+    parts = [cells]
+    ended = [np.fromiter((_epoch(r.ended_at) for r in stored), dtype=np.int64, count=len(stored))]
+    part_lengths = [lengths]
+    distance = sum(r.distance_m for r in stored)
+
+    partial = [r for r in rows if r.patrol_log_id not in stored_ids]
+    if partial:
+        blobs = dict(db.query(PatrolTrack.patrol_log_id, PatrolTrack.points)
+                     .filter(PatrolTrack.patrol_log_id.in_([r.patrol_log_id for r in partial])))
+        start, end = np.datetime64(params.start, "s"), np.datetime64(params.end, "s")
+        for row in partial:
+            points = decode_points(blobs[row.patrol_log_id], row.started_at)
+            points = points.subset((points.times >= start) & (points.times <= end))
+            if not len(points):
+                continue
+            track = track_cells(points)
+            parts.append(track)
+            part_lengths.append(np.array([len(track)]))
+            ended.append(np.array([points.times[-1].astype(np.int64)]))
+            distance += float(segment_lengths_m(points).sum()) if len(points) > 1 else 0.0
+
+    lengths = np.concatenate(part_lengths)
+    bounds = None
+    if rows:
+        bounds = (min(r.bbox_west for r in rows), min(r.bbox_south for r in rows),
+                  max(r.bbox_east for r in rows), max(r.bbox_north for r in rows))
+    return VisitedCells(
+        tracks=np.repeat(np.arange(len(lengths)), lengths),
+        cells=np.concatenate(parts).astype(np.int64),
+        ended_at=np.concatenate(ended),
+        distance_m=distance,
+        bounds=bounds,
+    )
+
+
+def _route_bounds(db: Session, params: CoverageParams) -> Optional[Tuple[float, float, float, float]]:
+    query = db.query(func.min(PatrolRoute.bbox_west), func.min(PatrolRoute.bbox_south),
+                     func.max(PatrolRoute.bbox_east), func.max(PatrolRoute.bbox_north))
+    if params.route_id is not None:
+        query = query.filter(PatrolRoute.id == params.route_id)
+    bounds = query.one()
+    return None if bounds[0] is None else tuple(bounds)
+
+
+@dataclass
+class CoverageGrid:
+    west: float
+    north: float
+    size: float
+    nx: int
+    ny: int
+    visits: np.ndarray  # traces distinctes par cellule (ny, nx)
+    last_visit: np.ndarray  # fin de la dernière visite, secondes depuis l'époque (-1 : aucune)
+    tracks: int
+    distance_m: float
+
+
+def compute_coverage_grid(db: Session, params: CoverageParams) -> CoverageGrid:
+    visited = load_visited_cells(db, params)
+    k = params.resolution
+    size = COVERAGE_CELL_DEGREES * k
+    ix, iy = cell_indices(visited.cells)
+    ix, iy = np.floor_divide(ix, k), np.floor_divide(iy, k)
+
+    # Une trace ne compte qu'une fois par cellule regroupée
+    if k > 1 and len(ix):
+        order = np.lexsort((iy, ix, visited.tracks))
+        tracks, ix, iy = visited.tracks[order], ix[order], iy[order]
+        keep = np.ones(len(order), dtype=bool)
+        keep[1:] = (tracks[1:] != tracks[:-1]) | (ix[1:] != ix[:-1]) | (iy[1:] != iy[:-1])
+        tracks, ix, iy = tracks[keep], ix[keep], iy[keep]
+    else:
+        tracks = visited.tracks
+
+    bounds = params.bbox
+    if bounds is None:
+        extents = [b for b in (visited.bounds, _route_bounds(db, params)) if b is not None]
+        if not extents:
+            return CoverageGrid(0.0, 0.0, size, 0, 0, np.zeros((0, 0), dtype=np.int64),
+                                np.zeros((0, 0), dtype=np.int64), 0, 0.0)
+        bounds = (min(b[0] for b in extents), min(b[1] for b in extents),
+                  max(b[2] for b in extents), max(b[3] for b in extents))
+    x0, y0 = math.floor(bounds[0] / size), math.floor(bounds[1] / size)
+    x1, y1 = math.floor(bounds[2] / size), math.floor(bounds[3] / size)
+    nx, ny = x1 - x0 + 1, y1 - y0 + 1
+    if nx * ny > COVERAGE_MAX_CELLS:
+        raise ValueError(f"Grille trop grande ({nx} x {ny} cellules) : réduire l'emprise ou augmenter resolution")
+
+    inside = (ix >= x0) & (ix <= x1) & (iy >= y0) & (iy <= y1)
+    # Ligne 0 au nord
+    flat = (y1 - iy[inside]) * nx + (ix[inside] - x0)
+    visits = np.bincount(flat, minlength=nx * ny)
+    last_visit = np.full(nx * ny, -1, dtype=np.int64)
+    np.maximum.at(last_visit, flat, visited.ended_at[tracks[inside]])
+    return CoverageGrid(
+        west=x0 * size, north=(y1 + 1) * size, size=size, nx=nx, ny=ny,
+        visits=visits.reshape(ny, nx), last_visit=last_visit.reshape(ny, nx),
+        tracks=len(visited.ended_at), distance_m=visited.distance_m,
+    )
+
+
+def _grid_header(grid: CoverageGrid, params: CoverageParams) -> dict:
+    return {
+        "start": params.start.isoformat(),
+        "end": params.end.isoformat(),
+        "cell_degrees": grid.size,
+        "bbox": [grid.west, grid.north - grid.ny * grid.size, grid.west + grid.nx * grid.size, grid.north],
+        "nx": grid.nx,
+        "ny": grid.ny,
+    }
+
+
+def _build_coverage(db: Session, params: CoverageParams) -> dict:
+    grid = compute_coverage_grid(db, params)
+    covered = int((grid.visits > 0).sum())
+    total = grid.nx * grid.ny
+    return {
+        **_grid_header(grid, params),
+        "visits": grid.visits.ravel().tolist(),
+        "summary": {
+            "tracks": grid.tracks,
+            "distance_km": round(grid.distance_m / 1000, 1),
+            "covered_cells": covered,
+            "total_cells": total,
+            "coverage_ratio": round(covered / total, 4) if total else None,
+        },
+    }
+
+
+def _build_gaps(db: Session, params: CoverageParams) -> dict:
+    grid = compute_coverage_grid(db, params)
+    visited = grid.last_visit >= 0
+    days = (_epoch(params.end) - grid.last_visit) / 86400.0
+    values = np.where(visited, np.round(np.maximum(days, 0.0), 1), np.nan).ravel()
+    visited_days = days[visited]
+    return {
+        **_grid_header(grid, params),
+        # Jours entre la dernière visite et la fin de la période (null : pas de visite)
+        "days_since_visit": [None if math.isnan(v) else v for v in values.tolist()],
+        "summary": {
+            "tracks": grid.tracks,
+            "unvisited_cells": int(grid.nx * grid.ny - visited.sum()),
+            "total_cells": grid.nx * grid.ny,
+            "median_days_since_visit": round(float(np.median(visited_days)), 1) if visited_days.size else None,
+        },
+    }
+
+
+def _data_mark(db: Session) -> tuple:
+    return data_versions.get(PatrolTrack.__tablename__), db.query(func.max(PatrolTrack.uploaded_at)).scalar()
+
+
+def get_coverage(db: Session, params: CoverageParams) -> dict:
+    """Nombre de patrouilles distinctes passées par chaque cellule sur la période"""
+    key = ("coverage", params, _data_mark(db))
+    return coverage_cache.get_or_set(key, lambda: _build_coverage(db, params))
+
+
+def get_coverage_gaps(db: Session, params: CoverageParams) -> dict:
+    """Carte des lacunes : ancienneté de la dernière patrouille de chaque cellule"""
+    key = ("gaps", params, _data_mark(db))
+    return coverage_cache.get_or_set(key, lambda: _build_gaps(db, params))
+
+
+def default_period(start: Optional[datetime], end: Optional[datetime], days: int = 30) -> Tuple[datetime, datetime]:
+    end = end or datetime.utcnow()
+    return start or end - timedelta(days=days), end
+
+
+def refresh_track_cells(db: Session) -> int:
+    """Recalcule les cellules des traces stockées avec une autre taille de cellule"""
+    ids: List[int] = [row[0] for row in db.query(PatrolTrack.patrol_log_id)
+                      .filter(PatrolTrack.cell_degrees != COVERAGE_CELL_DEGREES)]
+    for patrol_log_id in ids:
+        track, points = load_track(db, patrol_log_id)
+        track.cell_degrees = COVERAGE_CELL_DEGREES
+        track.cells = encode_cells(track_cells(points))
+        db.commit()
+    return len(ids)
+
+
+if __name__ == "__main__":
+    from app.database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        print(f"{refresh_track_cells(session)} traces recalculées")
+    finally:
+        session.close()
@@ -0,0 +1,219 @@
+"""
+Photos des observations et des rapports de patrouille.
+
+Stockage par empreinte de contenu : une photo est écrite une seule fois
+sous `PHOTO_DIR/<2 premiers caractères>/<sha256>.<ext>`, quel que soit le
+nombre de téléversements ; ses URL (`/photos/<sha256>.<ext>`) sont celles
+rangées dans `Observation.photo_urls` et `PatrolLog.photos`.
+
+Le corps multipart est lu en streaming : chaque morceau est haché puis
+écrit (aiofiles) dans un fichier temporaire, renommé à la fin sous son
+empreinte. Les variantes WebP (vignette, taille moyenne) sont produites
+dans un pool de processus, hors de la boucle d'événements et des threads
+de l'API : lancées dès le téléversement sans l'attendre, ou à la première
+demande si elles manquent encore.
+"""
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import aiofiles
+from fastapi import HTTPException, Request
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.models import Photo
+from app.utils.images import SUPPORTED_FORMATS, make_variants, probe_image
+from app.utils.multipart import PartInfo, iter_multipart
+
+logger = logging.getLogger(__name__)
+
+PHOTO_DIR = os.getenv("PHOTO_DIR", os.path.join(os.getenv("UPLOAD_DIR", "./uploads"), "photos"))
+PHOTO_MAX_BYTES = int(os.getenv("MAX_FILE_SIZE", str(10 * 1024 * 1024)))
+PHOTO_MAX_FILES = int(os.getenv("PHOTO_MAX_FILES", "20"))
+# Processus du pool de génération des variantes
+PHOTO_WORKERS = int(os.getenv("PHOTO_WORKERS", "2"))
+PHOTO_WEBP_QUALITY = int(os.getenv("PHOTO_WEBP_QUALITY", "80"))
+# Contenu immuable (adressé par empreinte) : cache navigateur et proxy d'un an
+PHOTO_CACHE_CONTROL = os.getenv("PHOTO_CACHE_CONTROL", "public, max-age=31536000, immutable")
+
+# Variantes : nom -> plus grand côté en pixels
+PHOTO_VARIANTS = {"thumb": 256, "medium": 1280}
+VARIANT_MEDIA_TYPE = "image/webp"
+
+_NAME = re.compile(r"^([0-9a-f]{64})\.(jpg|png|webp)$")
+_MEDIA_TYPES = {extension: media_type for media_type, extension in SUPPORTED_FORMATS.values()}
+_TMP_DIR = os.path.join(PHOTO_DIR, "tmp")
+
+
+@dataclass
+class StoredPhoto:
+    sha256: str
+    filename: Optional[str]
+    content_type: str
+    size_bytes: int
+    width: int
+    height: int
+    url: str
+    duplicate: bool
+
+
+# === Chemins ===
+
+def photo_url(sha256: str, extension: str) -> str:
+    return f"/photos/{sha256}.{extension}"
+
+
+def original_path(sha256: str, extension: str) -> str:
+    return os.path.join(PHOTO_DIR, sha256[:2], f"{sha256}.{extension}")
+
+
+def variant_path(sha256: str, variant: str) -> str:
+    return os.path.join(PHOTO_DIR, sha256[:2], f"{sha256}.{variant}.webp")
+
+
+def parse_photo_name(name: str) -> Optional[tuple]:
+    """(sha256, extension, type MIME) d'un nom `<sha256>.<ext>`, None s'il est invalide"""
+    match = _NAME.match(name)
+    if match is None:
+        return None
+    sha256, extension = match.groups()
+    return sha256, extension, _MEDIA_TYPES[extension]
+
+
+def find_original(sha256: str) -> Optional[str]:
+    for extension in _MEDIA_TYPES:
+        path = original_path(sha256, extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+# === Pool de processus ===
+
+class VariantPool:
+    """Génère les variantes dans un pool de processus ; une seule génération en cours par photo"""
+
+    def __init__(self, workers: int = PHOTO_WORKERS):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[str, Future] = {}
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn : un fork du processus de l'API (threads, connexions) n'est pas sûr
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def submit(self, sha256: str, source: str) -> Future:
+        future = self._pending.get(sha256)
+        if future is None:
+            variants = [(variant_path(sha256, name), size) for name, size in PHOTO_VARIANTS.items()]
+            future = self._pool().submit(make_variants, source, variants, PHOTO_WEBP_QUALITY)
+            self._pending[sha256] = future
+            future.add_done_callback(lambda done: self._finished(sha256, done))
+        return future
+
+    def _finished(self, sha256: str, future: Future) -> None:
+        self._pending.pop(sha256, None)
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning("Variantes de la photo %s non générées: %s", sha256, future.exception())
+
+    async def ensure(self, sha256: str, source: str) -> None:
+        await asyncio.wrap_future(self.submit(sha256, source))
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+variant_pool = VariantPool()
+
+
+# === Réception ===
+
+async def _finish_part(part: PartInfo, temp_path: str, digest: str, size: int) -> StoredPhoto:
+    try:
+        image_format, width, height = await run_in_threadpool(probe_image, temp_path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"{part.filename}: {e}")
+    content_type, extension = SUPPORTED_FORMATS[image_format]
+    path = original_path(digest, extension)
+    duplicate = os.path.exists(path)
+    if duplicate:
+        os.remove(temp_path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+    return StoredPhoto(
+        sha256=digest, filename=part.filename, content_type=content_type, size_bytes=size,
+        width=width, height=height, url=photo_url(digest, extension), duplicate=duplicate,
+    )
+
+
+async def receive_photos(request: Request) -> List[StoredPhoto]:
+    """
+    Enregistre les fichiers d'un corps multipart (les champs sans fichier
+    sont ignorés). Les variantes sont lancées en arrière-plan.
+    """
+    os.makedirs(_TMP_DIR, exist_ok=True)
+    stored: List[StoredPhoto] = []
+    spool = temp_path = digest = None
+    size = 0
+    try:
+        async for kind, value in iter_multipart(request):
+            if kind == "begin" and value.filename is not None:
+                if len(stored) >= PHOTO_MAX_FILES:
+                    raise HTTPException(status_code=413, detail=f"Au plus {PHOTO_MAX_FILES} photos par envoi")
+                temp_path = os.path.join(_TMP_DIR, uuid.uuid4().hex)
+                spool = await aiofiles.open(temp_path, "wb")
+                digest, size = hashlib.sha256(), 0
+            elif kind == "data" and spool is not None:
+                size += len(value)
+                if size > PHOTO_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Photo trop volumineuse (maximum {PHOTO_MAX_BYTES} octets)")
+                digest.update(value)
+                await spool.write(value)
+            elif kind == "end" and spool is not None:
+                await spool.close()
+                spool = None
+                photo = await _finish_part(value, temp_path, digest.hexdigest(), size)
+                temp_path = None
+                stored.append(photo)
+                if not photo.duplicate:
+                    variant_pool.submit(photo.sha256, original_path(photo.sha256, photo.url.rsplit(".", 1)[1]))
+    finally:
+        if spool is not None:
+            await spool.close()
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+    if not stored:
+        raise HTTPException(status_code=400, detail="Aucun fichier reçu")
+    return stored
+
+
+def record_photos(db: Session, photos: List[StoredPhoto], user_id: int) -> None:
+    """Référence les photos en base (sans effet pour une photo déjà connue)"""
+    rows = {
+        photo.sha256: {
+            "sha256": photo.sha256, "content_type": photo.content_type, "size_bytes": photo.size_bytes,
+            "width": photo.width, "height": photo.height, "uploaded_by": user_id,
+        }
+        for photo in photos
+    }
+    db.execute(pg_insert(Photo).values(list(rows.values())).on_conflict_do_nothing(index_elements=["sha256"]))
+
+
+def append_urls(current: Optional[str], urls: List[str]) -> str:
+    """Ajoute des URL à une liste séparée par des virgules, sans doublon"""
+    existing = [url.strip() for url in (current or "").split(",") if url.strip()]
+    return ",".join(existing + [url for url in dict.fromkeys(urls) if url not in existing])
@@ -0,0 +1,197 @@
+"""
+Proximité des points d'eau, sans aller-retour en base par point.
+
+Les points d'eau sont chargés une fois en mémoire puis tenus à jour à
+chaque commit (événements de session SQLAlchemy) ; l'index spatial
+(app.utils.geoindex) est reconstruit à la première requête qui suit une
+modification, ce qui ne coûte que quelques millisecondes.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models import Observation, WaterPoint
+from app.schemas import MAX_SPATIAL_RESULTS
+from app.services.data_version import register_commit_hook
+from app.services.spatial import location_in_bounds
+from app.utils.geoindex import GridIndex
+
+# Resynchronisation complète périodique (écritures des autres processus)
+WATER_INDEX_RESYNC_SECONDS = float(os.getenv("WATER_INDEX_RESYNC_SECONDS", "3600"))
+# Observations lues par lot pour /water-points/observations
+NEAR_WATER_BATCH_SIZE = int(os.getenv("NEAR_WATER_BATCH_SIZE", "20000"))
+
+ACTIVE_STATUS = "active"
+
+
+def _is_active(status: Optional[str]) -> bool:
+    return status in (None, ACTIVE_STATUS)
+
+
+class WaterPointIndex:
+    """Points d'eau en mémoire et index spatial associé"""
+
+    def __init__(self, resync_seconds: float = WATER_INDEX_RESYNC_SECONDS):
+        self.resync_seconds = resync_seconds
+        # id -> (nom, longitude, latitude, statut)
+        self._points: Dict[int, Tuple[str, float, float, Optional[str]]] = {}
+        # active_only -> index construit à la demande
+        self._indexes: Dict[bool, GridIndex] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.RLock()
+
+    # --- Chargement ---
+
+    def reload(self, db: Session) -> None:
+        rows = db.query(WaterPoint.id, WaterPoint.name, WaterPoint.longitude, WaterPoint.latitude, WaterPoint.status)
+        points = {point_id: (name, lon, lat, status) for point_id, name, lon, lat, status in rows}
+        with self._lock:
+            self._points = points
+            self._indexes = {}
+            self._loaded_at = time.monotonic()
+
+    def ensure_loaded(self, db: Session) -> None:
+        with self._lock:
+            loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.resync_seconds:
+            self.reload(db)
+
+    def mark_stale(self) -> None:
+        with self._lock:
+            self._loaded_at = None
+
+    # --- Écritures ---
+
+    def apply_changes(self, upserted: Iterable[tuple], deleted: Iterable[int]) -> None:
+        """Applique des points d'eau (id, nom, longitude, latitude, statut) écrits ou supprimés"""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            for point_id, name, lon, lat, status in upserted:
+                self._points[point_id] = (name, lon, lat, status)
+            for point_id in deleted:
+                self._points.pop(point_id, None)
+            self._indexes = {}
+
+    # --- Lectures ---
+
+    def _index(self, active_only: bool) -> GridIndex:
+        with self._lock:
+            index = self._indexes.get(active_only)
+            if index is None:
+                selected = [
+                    (point_id, lon, lat)
+                    for point_id, (_, lon, lat, status) in self._points.items()
+                    if not active_only or _is_active(status)
+                ]
+                ids, lons, lats = zip(*selected) if selected else ((), (), ())
+                index = self._indexes[active_only] = GridIndex(ids, lons, lats)
+            return index
+
+    def nearest(self, db: Session, longitudes, latitudes, k: int = 1, max_distance: Optional[float] = None,
+                active_only: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """(ids, distances en mètres) des k points d'eau les plus proches, voir GridIndex.nearest"""
+        self.ensure_loaded(db)
+        return self._index(active_only).nearest(longitudes, latitudes, k=k, max_distance=max_distance)
+
+    def within_distance(self, db: Session, longitudes, latitudes, distance: float,
+                        active_only: bool = True) -> np.ndarray:
+        self.ensure_loaded(db)
+        return self._index(active_only).within_distance(longitudes, latitudes, distance)
+
+    def describe(self, point_id: int) -> Optional[dict]:
+        with self._lock:
+            point = self._points.get(point_id)
+        if point is None:
+            return None
+        name, lon, lat, status = point
+        return {"id": point_id, "name": name, "longitude": lon, "latitude": lat, "status": status}
+
+
+water_point_index = WaterPointIndex()
+
+
+def nearest_water_points(db: Session, latitude: float, longitude: float, k: int = 1,
+                         max_distance: Optional[float] = None, active_only: bool = True) -> List[dict]:
+    ids, distances = water_point_index.nearest(db, [longitude], [latitude], k, max_distance, active_only)
+    results = []
+    for point_id, distance in zip(ids[0].tolist(), distances[0].tolist()):
+        point = water_point_index.describe(point_id) if point_id >= 0 else None
+        if point is not None:
+            results.append({**point, "distance_m": round(distance, 1)})
+    return results
+
+
+def observations_near_water(db: Session, distance: float, species_id: Optional[int] = None,
+                            active_only: bool = True, bbox: Optional[Tuple[float, float, float, float]] = None,
+                            start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                            limit: int = MAX_SPATIAL_RESULTS) -> List[dict]:
+    """
+    Observations à moins de `distance` mètres d'un point d'eau, avec le point
+    le plus proche : les `limit` plus récentes de l'emprise et de la période.
+    Les observations sont lues par lots (curseur côté serveur) jusqu'à en
+    avoir trouvé assez.
+    """
+    query = select(Observation.id, Observation.longitude, Observation.latitude)
+    if bbox is not None:
+        query = query.where(location_in_bounds(*bbox))
+    if start_date is not None:
+        query = query.where(Observation.observation_date >= start_date)
+    if end_date is not None:
+        query = query.where(Observation.observation_date <= end_date)
+    if species_id is not None:
+        query = query.where(Observation.species_id == species_id)
+    query = query.order_by(Observation.observation_date.desc(), Observation.id.desc())
+
+    results = []
+    result = db.execute(query.execution_options(yield_per=NEAR_WATER_BATCH_SIZE))
+    try:
+        for rows in result.partitions():
+            obs_ids, lons, lats = (np.asarray(column) for column in zip(*rows))
+            ids, distances = water_point_index.nearest(db, lons, lats, 1, distance, active_only)
+            matched = np.nonzero(ids[:, 0] >= 0)[0][:limit - len(results)]
+            results.extend(
+                {"observation_id": obs_id, "water_point_id": point_id, "distance_m": round(d, 1)}
+                for obs_id, point_id, d in zip(
+                    obs_ids[matched].tolist(), ids[matched, 0].tolist(), distances[matched, 0].tolist()
+                )
+            )
+            if len(results) >= limit:
+                break
+    finally:
+        result.close()
+    return results
+
+
+# === Événements de session ===
+
+def _water_point_values(obj: WaterPoint) -> tuple:
+    return (obj.id, obj.name, obj.longitude, obj.latitude, obj.status)
+
+
+def _collect_changes(session: Session) -> List[tuple]:
+    changes = []
+    for obj in (*session.new, *session.dirty):
+        if isinstance(obj, WaterPoint):
+            changes.append(("upsert", _water_point_values(obj)))
+    for obj in session.deleted:
+        if isinstance(obj, WaterPoint):
+            changes.append(("delete", obj.id))
+    return changes
+
+
+def _apply_changes(changes: List[tuple]) -> None:
+    water_point_index.apply_changes(
+        [value for kind, value in changes if kind == "upsert"],
+        [value for kind, value in changes if kind == "delete"],
+    )
+
+
+def register_session_events(session_factory) -> None:
+    register_commit_hook(session_factory, "water_point_changes", _collect_changes, _apply_changes)
@@ -0,0 +1,247 @@
+"""
+Cache à deux niveaux des réponses sur les données de référence (espèces,
+points d'eau, routes de patrouille).
+
+Les réponses JSON sérialisées (listes et éléments) sont gardées dans un
+LRU par processus, devant un Redis partagé optionnel. Chaque table a une
+génération dans Redis : toute écriture validée dans ce processus
+(événements de session relayés par data_versions, imports en masse) rend
+immédiatement obsolètes ses entrées locales et incrémente la génération,
+ce qui invalide les entrées Redis pour tous les processus. Les autres
+processus s'en aperçoivent quand leur entrée locale dépasse
+REFERENCE_CACHE_LOCAL_TTL : elle est alors revalidée auprès de Redis,
+sans toucher à la base. Sans Redis, REFERENCE_CACHE_TTL borne le retard
+vis-à-vis des écritures des autres workers.
+
+Les réponses portent un ETag calculé sur le corps : `If-None-Match`
+donne un 304 sans corps, y compris après une invalidation qui n'a pas
+changé le contenu.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from app.services.data_version import data_versions
+from app.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Redis partagé (vide = cache local seul, memory:// = équivalent en mémoire pour les tests)
+REFERENCE_CACHE_REDIS_URL = os.getenv("REFERENCE_CACHE_REDIS_URL", os.getenv("REDIS_URL", ""))
+# Durée de vie des entrées (Redis, ou locales sans Redis)
+REFERENCE_CACHE_TTL = float(os.getenv("REFERENCE_CACHE_TTL", "3600"))
+# Durée pendant laquelle une entrée locale est servie sans consulter Redis
+REFERENCE_CACHE_LOCAL_TTL = float(os.getenv("REFERENCE_CACHE_LOCAL_TTL", "5"))
+# Nombre d'entrées locales par table
+REFERENCE_CACHE_MAXSIZE = int(os.getenv("REFERENCE_CACHE_MAXSIZE", "512"))
+# Pause après une erreur Redis (le cache local continue de servir)
+REFERENCE_CACHE_RETRY_SECONDS = float(os.getenv("REFERENCE_CACHE_RETRY_SECONDS", "30"))
+
+REFERENCE_TABLES = ("species", "water_points", "patrol_routes")
+
+_KEY_PREFIX = "wt:refcache"
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+    headers: Tuple[Tuple[str, str], ...] = ()
+    generation: int = 0  # génération Redis au moment du calcul
+    local_version: int = 0  # data_versions au moment du calcul ou du chargement
+
+    def dumps(self) -> bytes:
+        header = json.dumps([self.generation, self.etag, self.headers], separators=(",", ":"))
+        return header.encode() + b"\n" + self.body
+
+    @classmethod
+    def loads(cls, raw: bytes) -> "CachedResponse":
+        header, body = raw.split(b"\n", 1)
+        generation, etag, headers = json.loads(header)
+        return cls(body=body, etag=etag, headers=tuple(tuple(h) for h in headers), generation=generation)
+
+
+class MemoryBackend:
+    """Sous-ensemble de l'API Redis utilisé ici, en mémoire (tests, développement)"""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name: str):
+        entry = self._data.get(name)
+        if entry is None or entry[0] < time.monotonic():
+            self._data.pop(name, None)
+            return None
+        return entry[1]
+
+    def mget(self, *names: str) -> list:
+        with self._lock:
+            return [self._get(name) for name in names]
+
+    def set(self, name: str, value: Any, ex: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[name] = (time.monotonic() + ex if ex else float("inf"), value)
+
+    def incr(self, name: str) -> int:
+        with self._lock:
+            value = int(self._get(name) or 0) + 1
+            self._data[name] = (float("inf"), str(value).encode())
+            return value
+
+
+def compute_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {value.strip().removeprefix("W/") for value in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+class ReferenceCache:
+    def __init__(self, redis_url: str = REFERENCE_CACHE_REDIS_URL, ttl: float = REFERENCE_CACHE_TTL,
+                 local_ttl: float = REFERENCE_CACHE_LOCAL_TTL, maxsize: int = REFERENCE_CACHE_MAXSIZE,
+                 tables: Iterable[str] = REFERENCE_TABLES):
+        self.redis_url = redis_url
+        self.ttl = ttl
+        self.tables = tuple(tables)
+        local_lifetime = min(local_ttl, ttl) if redis_url else ttl
+        self._local = {table: LRUCache(maxsize=maxsize, ttl=local_lifetime) for table in self.tables}
+        self._backend = None
+        self._backend_down_until = 0.0
+        self.hits = self.remote_hits = self.misses = 0
+
+    # --- Redis ---
+
+    def _get_backend(self):
+        if not self.redis_url or time.monotonic() < self._backend_down_until:
+            return None
+        if self._backend is None:
+            if self.redis_url.startswith("memory://"):
+                self._backend = MemoryBackend()
+            else:
+                import redis
+
+                self._backend = redis.Redis.from_url(
+                    self.redis_url, socket_timeout=0.25, socket_connect_timeout=0.25,
+                )
+        return self._backend
+
+    def _backend_failed(self, error: Exception) -> None:
+        logger.warning("Cache Redis indisponible (%s), cache local seul pendant %ss",
+                       error, REFERENCE_CACHE_RETRY_SECONDS)
+        self._backend_down_until = time.monotonic() + REFERENCE_CACHE_RETRY_SECONDS
+
+    @staticmethod
+    def _generation_key(table: str) -> str:
+        return f"{_KEY_PREFIX}:{table}:gen"
+
+    @staticmethod
+    def _entry_key(table: str, key: str) -> str:
+        return f"{_KEY_PREFIX}:{table}:" + hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+    # --- Lecture ---
+
+    def get_or_build(self, table: str, key: str, build: Callable[[], CachedResponse]) -> CachedResponse:
+        local = self._local[table]
+        local_version = data_versions.get(table)
+        entry: Optional[CachedResponse] = local.get(key)
+        if entry is not None and entry.local_version == local_version:
+            self.hits += 1
+            return entry
+
+        generation = 0
+        backend = self._get_backend()
+        if backend is not None:
+            try:
+                raw_generation, raw = backend.mget(self._generation_key(table), self._entry_key(table, key))
+                generation = int(raw_generation or 0)
+                if raw is not None:
+                    entry = CachedResponse.loads(raw)
+                    if entry.generation == generation:
+                        self.remote_hits += 1
+                        entry = replace(entry, local_version=local_version)
+                        local.set(key, entry)
+                        return entry
+            except Exception as e:
+                self._backend_failed(e)
+                backend = None
+
+        # Génération et version lues avant le calcul : une écriture
+        # concurrente rend l'entrée obsolète au lieu de la masquer
+        self.misses += 1
+        entry = replace(build(), generation=generation, local_version=local_version)
+        local.set(key, entry)
+        if backend is not None:
+            try:
+                backend.set(self._entry_key(table, key), entry.dumps(), ex=int(self.ttl))
+            except Exception as e:
+                self._backend_failed(e)
+        return entry
+
+    # --- Invalidation ---
+
+    def invalidate(self, tables: Iterable[str]) -> None:
+        """Rend obsolètes les entrées des tables données, ici et (via Redis) ailleurs"""
+        tables = [table for table in tables if table in self._local]
+        if not tables:
+            return
+        for table in tables:
+            self._local[table].invalidate()
+        backend = self._get_backend()
+        if backend is None:
+            return
+        try:
+            for table in tables:
+                backend.incr(self._generation_key(table))
+        except Exception as e:
+            self._backend_failed(e)
+
+    def register(self) -> None:
+        """Abonne le cache aux versions de données (écritures validées, imports)"""
+        data_versions.subscribe(self.invalidate)
+
+    def describe(self) -> dict:
+        return {
+            "backend": ("memory" if self.redis_url.startswith("memory://") else "redis") if self.redis_url else "local",
+            "entries": {table: len(cache) for table, cache in self._local.items()},
+            "hits": self.hits, "remote_hits": self.remote_hits, "misses": self.misses,
+        }
+
+
+reference_cache = ReferenceCache()
+
+
+def _serialize(content: Any, headers: Optional[Dict[str, str]] = None) -> CachedResponse:
+    # Même encodage que JSONResponse
+    body = json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"),
+    ).encode("utf-8")
+    return CachedResponse(body=body, etag=compute_etag(body), headers=tuple((headers or {}).items()))
+
+
+def cached_json_response(request: Request, table: str,
+                         build: Callable[[], Tuple[Any, Optional[Dict[str, str]]]]) -> Response:
+    """
+    Réponse JSON servie depuis le cache de référence ; `build()` renvoie
+    (contenu, en-têtes) et n'est appelé qu'en cas d'absence. La clé est
+    le chemin et les paramètres de requête triés.
+    """
+    key = request.url.path + "?" + urlencode(sorted(request.query_params.multi_items()))
+    entry = reference_cache.get_or_build(table, key, lambda: _serialize(*build()))
+    headers = {**dict(entry.headers), "ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
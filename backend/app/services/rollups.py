@@ -0,0 +1,372 @@
+"""
+Agrégats d'analyse matérialisés et rafraîchis incrémentalement.
+
+- rollup_observations_daily : observations par jour et par espèce
+- rollup_observations_cells : observations par jour et par cellule de grille
+- rollup_activities_status  : activités par statut et par type
+
+Chaque rafraîchissement part du plus grand `updated_at` déjà pris en
+compte (high-water mark, table rollup_state ; `updated_at` vaut
+`created_at` à l'insertion) : seuls les jours touchés depuis sont
+recalculés, dans une transaction, si bien que les lecteurs voient les
+anciennes valeurs jusqu'au commit. Les suppressions et les déplacements
+d'une observation vers un autre jour ne laissent pas de trace dans
+`updated_at` : une reconstruction complète est donc faite périodiquement
+(et en cas d'échec de la voie incrémentale), accompagnée d'un
+`REFRESH MATERIALIZED VIEW CONCURRENTLY` des vues de init.sql.
+
+Ces requêtes balayent toute la table : elles s'exécutent avec leur propre
+délai (ROLLUP_STATEMENT_TIMEOUT_MS) et non celui des requêtes de l'API.
+Une reconstruction en échec est retentée avec un délai croissant ; en
+attendant, la voie incrémentale continue de tenir les agrégats à jour.
+
+Les rapports lisent uniquement ces tables : leur coût dépend du nombre de
+jours demandés, pas du volume d'observations.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import Date, Integer, cast, delete, func, insert, select, text
+from sqlalchemy.orm import Session
+
+from app.models import (
+    Activity, ActivityStatusRollup, Observation, ObservationCellRollup, ObservationDailyRollup, RollupState,
+)
+from app.services.partitions import archived_months
+from app.services.trends import refresh_trends
+
+logger = logging.getLogger(__name__)
+
+# Période du rafraîchissement incrémental en arrière-plan (0 = désactivé)
+ROLLUP_REFRESH_SECONDS = float(os.getenv("ROLLUP_REFRESH_SECONDS", "60"))
+# Période de la reconstruction complète
+ROLLUP_FULL_REFRESH_SECONDS = float(os.getenv("ROLLUP_FULL_REFRESH_SECONDS", "86400"))
+# Recouvrement appliqué au repère, pour les transactions validées après
+# coup avec un updated_at antérieur (recalculer un jour est idempotent)
+ROLLUP_OVERLAP_SECONDS = float(os.getenv("ROLLUP_OVERLAP_SECONDS", "300"))
+# Taille des cellules en degrés (~1 km) ; toute modification impose une
+# reconstruction complète
+ROLLUP_CELL_DEGREES = float(os.getenv("ROLLUP_CELL_DEGREES", "0.01"))
+# Délai des requêtes de rafraîchissement (ms, 0 = illimité), au lieu de DB_STATEMENT_TIMEOUT_MS
+ROLLUP_STATEMENT_TIMEOUT_MS = int(os.getenv("ROLLUP_STATEMENT_TIMEOUT_MS", "3600000"))
+# Premier délai avant de retenter une reconstruction complète en échec
+# (doublé à chaque échec, borné par ROLLUP_FULL_REFRESH_SECONDS)
+ROLLUP_FULL_RETRY_SECONDS = float(os.getenv("ROLLUP_FULL_RETRY_SECONDS", "600"))
+
+OBSERVATIONS = "observations"
+ACTIVITIES = "activities"
+
+# Vues matérialisées de init.sql rafraîchies avec les reconstructions complètes
+MATERIALIZED_VIEWS = ("species_statistics",)
+
+# Un seul rafraîchissement à la fois, tous processus confondus
+_ADVISORY_LOCK_KEY = 0x726F6C6C  # "roll"
+
+_day = cast(Observation.observation_date, Date)
+_cell_x = cast(func.floor(Observation.longitude / ROLLUP_CELL_DEGREES), Integer)
+_cell_y = cast(func.floor(Observation.latitude / ROLLUP_CELL_DEGREES), Integer)
+_observations = func.count(Observation.id)
+_individuals = func.coalesce(func.sum(Observation.count), 0)
+
+
+def _state(db: Session, name: str) -> RollupState:
+    state = db.get(RollupState, name)
+    if state is None:
+        state = RollupState(name=name)
+        db.add(state)
+    return state
+
+
+def _observation_rollup_inserts(*criteria):
+    daily = select(_day, Observation.species_id, _observations, _individuals).where(*criteria).group_by(
+        _day, Observation.species_id
+    )
+    cells = select(_day, _cell_x, _cell_y, _observations, _individuals).where(*criteria).group_by(
+        _day, _cell_x, _cell_y
+    )
+    return (
+        insert(ObservationDailyRollup).from_select(
+            ["day", "species_id", "observations", "individuals"], daily
+        ),
+        insert(ObservationCellRollup).from_select(
+            ["day", "cell_x", "cell_y", "observations", "individuals"], cells
+        ),
+    )
+
+
+def _rebuild_observations(db: Session) -> None:
+    # Les agrégats des mois archivés (partitions supprimées) sont conservés ;
+    # un mois restauré est recalculé comme les autres
+    archived = archived_months(db, "observations")
+    if not archived:
+        db.execute(delete(ObservationDailyRollup))
+        db.execute(delete(ObservationCellRollup))
+        criteria = ()
+    else:
+        for rollup in (ObservationDailyRollup, ObservationCellRollup):
+            db.execute(delete(rollup).where(cast(func.date_trunc("month", rollup.day), Date).notin_(archived)))
+        # Agrégats d'un mois archivé figés : une ligne ajoutée depuis dans ce mois n'y entre pas
+        criteria = (cast(func.date_trunc("month", Observation.observation_date), Date).notin_(archived),)
+    for statement in _observation_rollup_inserts(*criteria):
+        db.execute(statement)
+
+
+def _refresh_observation_days(db: Session, since: datetime) -> int:
+    """Recalcule les jours contenant des observations modifiées depuis `since`"""
+    # updated_at n'est pas la clé de partition : chaque partition est sondée (index updated_at)
+    archived = {(month.year, month.month) for month in archived_months(db, "observations")}
+    days: List[date] = [
+        day for (day,) in db.query(_day).filter(Observation.updated_at > since).distinct()
+        if (day.year, day.month) not in archived
+    ]
+    if not days:
+        return 0
+    db.execute(delete(ObservationDailyRollup).where(ObservationDailyRollup.day.in_(days)))
+    db.execute(delete(ObservationCellRollup).where(ObservationCellRollup.day.in_(days)))
+    # Bornes sur observation_date pour profiter de idx_observations_date
+    window = (
+        Observation.observation_date >= datetime.combine(min(days), datetime.min.time()),
+        Observation.observation_date < datetime.combine(max(days) + timedelta(days=1), datetime.min.time()),
+        _day.in_(days),
+    )
+    for statement in _observation_rollup_inserts(*window):
+        db.execute(statement)
+    return len(days)
+
+
+def refresh_observations(db: Session, full: bool = False) -> None:
+    state = _state(db, OBSERVATIONS)
+    upper = db.query(func.max(Observation.updated_at)).scalar()
+    now = datetime.utcnow()
+    if full or state.high_water_mark is None:
+        _rebuild_observations(db)
+        state.full_refreshed_at = now
+    elif upper is not None and upper > state.high_water_mark - timedelta(seconds=ROLLUP_OVERLAP_SECONDS):
+        days = _refresh_observation_days(db, state.high_water_mark - timedelta(seconds=ROLLUP_OVERLAP_SECONDS))
+        logger.debug("Agrégats d'observations : %d jours recalculés", days)
+    state.high_water_mark = upper or state.high_water_mark
+    state.refreshed_at = now
+
+
+def refresh_activities(db: Session, full: bool = False) -> None:
+    # Table de petite taille : recalcul complet, seulement si elle a changé
+    state = _state(db, ACTIVITIES)
+    upper = db.query(func.max(Activity.updated_at)).scalar()
+    now = datetime.utcnow()
+    if full or state.high_water_mark is None or (upper is not None and upper > state.high_water_mark):
+        db.execute(delete(ActivityStatusRollup))
+        status = func.coalesce(Activity.status, "planned")
+        db.execute(insert(ActivityStatusRollup).from_select(
+            ["status", "activity_type", "activities"],
+            select(status, Activity.activity_type, func.count(Activity.id)).group_by(status, Activity.activity_type),
+        ))
+        state.full_refreshed_at = now
+    state.high_water_mark = upper or state.high_water_mark
+    state.refreshed_at = now
+
+
+def _set_statement_timeout(db: Session) -> None:
+    db.execute(text(f"SET LOCAL statement_timeout = {ROLLUP_STATEMENT_TIMEOUT_MS}"))
+
+
+def refresh_materialized_views(db: Session) -> None:
+    _set_statement_timeout(db)
+    existing = set(db.execute(
+        text("SELECT matviewname FROM pg_matviews WHERE matviewname = ANY(:names)"),
+        {"names": list(MATERIALIZED_VIEWS)},
+    ).scalars())
+    for name in MATERIALIZED_VIEWS:
+        if name in existing:
+            db.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {name}"))
+    db.commit()
+
+
+def _full_refresh_due(db: Session) -> bool:
+    state = db.get(RollupState, OBSERVATIONS)
+    return (
+        state is None or state.full_refreshed_at is None
+        or datetime.utcnow() - state.full_refreshed_at > timedelta(seconds=ROLLUP_FULL_REFRESH_SECONDS)
+    )
+
+
+class _FullRebuildBackoff:
+    """Délai avant de retenter une reconstruction complète en échec (par processus)"""
+
+    def __init__(self):
+        self.failures = 0
+        self.retry_at: Optional[float] = None
+
+    def ready(self) -> bool:
+        return self.retry_at is None or time.monotonic() >= self.retry_at
+
+    def failed(self) -> float:
+        self.failures += 1
+        delay = min(ROLLUP_FULL_RETRY_SECONDS * 2 ** (self.failures - 1), ROLLUP_FULL_REFRESH_SECONDS)
+        self.retry_at = time.monotonic() + delay
+        return delay
+
+    def succeeded(self) -> None:
+        self.failures = 0
+        self.retry_at = None
+
+
+_full_backoff = _FullRebuildBackoff()
+
+
+def refresh_rollups(db: Session, full: Optional[bool] = None) -> bool:
+    """
+    Rafraîchit tous les agrégats ; `full=None` laisse choisir entre voie
+    incrémentale et reconstruction. Renvoie False si un autre processus
+    s'en occupe déjà.
+    """
+    if not db.execute(select(func.pg_try_advisory_xact_lock(_ADVISORY_LOCK_KEY))).scalar():
+        db.rollback()
+        return False
+    _set_statement_timeout(db)
+    forced = full is not None
+    if full is None:
+        full = _full_refresh_due(db) and _full_backoff.ready()
+    try:
+        refresh_observations(db, full)
+        refresh_activities(db, full)
+        refresh_trends(db, full)
+        db.commit()
+    except Exception:
+        db.rollback()
+        if full:
+            delay = _full_backoff.failed()
+            state = db.get(RollupState, OBSERVATIONS)
+            if forced or state is None or state.high_water_mark is None:
+                raise
+            # Sans cela, chaque passage retenterait la reconstruction et la
+            # voie incrémentale ne tournerait plus
+            logger.exception("Reconstruction complète des agrégats en échec, nouvel essai dans %.0f s", delay)
+            return refresh_rollups(db, full=False)
+        if not _full_backoff.ready():
+            raise
+        logger.exception("Rafraîchissement incrémental des agrégats en échec, reconstruction complète")
+        return refresh_rollups(db, full=True)
+    if full:
+        _full_backoff.succeeded()
+        refresh_materialized_views(db)
+    return True
+
+
+# === Lectures ===
+
+REPORT_INTERVALS = ("day", "week", "month", "year")
+
+
+def get_rollup_states(db: Session) -> List[RollupState]:
+    return db.query(RollupState).order_by(RollupState.name).all()
+
+
+def observations_by_period(db: Session, interval: str = "day", species_id: Optional[int] = None,
+                           start_date: Optional[date] = None, end_date: Optional[date] = None) -> List[dict]:
+    """Observations et individus par période et par espèce"""
+    rollup = ObservationDailyRollup
+    period = rollup.day if interval == "day" else cast(func.date_trunc(interval, rollup.day), Date)
+    query = db.query(
+        period.label("period"), rollup.species_id,
+        func.sum(rollup.observations), func.sum(rollup.individuals),
+    )
+    if species_id is not None:
+        query = query.filter(rollup.species_id == species_id)
+    if start_date is not None:
+        query = query.filter(rollup.day >= start_date)
+    if end_date is not None:
+        query = query.filter(rollup.day <= end_date)
+    rows = query.group_by(period, rollup.species_id).order_by(period, rollup.species_id)
+    return [
+        {"period": p, "species_id": sid, "observations": int(obs), "individuals": int(ind)}
+        for p, sid, obs, ind in rows
+    ]
+
+
+def observations_by_cell(db: Session, start_date: Optional[date] = None, end_date: Optional[date] = None,
+                         min_observations: int = 1) -> List[dict]:
+    """Observations par cellule de grille sur une période, avec l'emprise de chaque cellule"""
+    rollup = ObservationCellRollup
+    total = func.sum(rollup.observations)
+    query = db.query(rollup.cell_x, rollup.cell_y, total, func.sum(rollup.individuals))
+    if start_date is not None:
+        query = query.filter(rollup.day >= start_date)
+    if end_date is not None:
+        query = query.filter(rollup.day <= end_date)
+    rows = query.group_by(rollup.cell_x, rollup.cell_y).having(total >= min_observations).order_by(total.desc())
+    size = ROLLUP_CELL_DEGREES
+    return [
+        {
+            "cell_x": x, "cell_y": y,
+            "bbox": [round(x * size, 6), round(y * size, 6), round((x + 1) * size, 6), round((y + 1) * size, 6)],
+            "observations": int(obs), "individuals": int(ind),
+        }
+        for x, y, obs, ind in rows
+    ]
+
+
+def activities_by_status(db: Session) -> List[dict]:
+    rows = db.query(ActivityStatusRollup).order_by(ActivityStatusRollup.status, ActivityStatusRollup.activity_type)
+    return [
+        {"status": r.status, "activity_type": r.activity_type.value if r.activity_type else None,
+         "activities": r.activities}
+        for r in rows
+    ]
+
+
+# === Tâche de fond ===
+
+class RollupRefresher:
+    """Thread de rafraîchissement périodique (un par processus, verrou consultatif en base)"""
+
+    def __init__(self, session_factory, interval: float = ROLLUP_REFRESH_SECONDS):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rollup-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+            self._thread = None
+
+    def run_once(self) -> None:
+        db = self.session_factory()
+        try:
+            refresh_rollups(db)
+        except Exception:
+            logger.exception("Échec du rafraîchissement des agrégats")
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval)
+
+
+if __name__ == "__main__":
+    # python -m app.services.rollups [--full] : rafraîchissement ponctuel (cron, maintenance)
+    import sys
+
+    from app.database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    session = SessionLocal()
+    try:
+        done = refresh_rollups(session, full=True if "--full" in sys.argv else None)
+        logger.info("Agrégats rafraîchis" if done else "Rafraîchissement déjà en cours ailleurs")
+    finally:
+        session.close()
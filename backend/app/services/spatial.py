@@ -0,0 +1,135 @@
+"""
+Requêtes spatiales indexées sur les colonnes `location` (PostGIS).
+
+- rayon (mètres)      : ST_DWithin sur la géographie -> idx_observations_location
+- emprise / polygone  : opérateurs sur geometry(location) -> idx_observations_location_geom
+
+Les expressions construites ici sont identiques à celles des index : toute
+variation (cast implicite, autre SRID...) ferait retomber la requête sur un
+parcours séquentiel.
+"""
+import json
+import math
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models import Observation, Species
+from app.schemas import MAX_SPATIAL_RESULTS
+
+WGS84 = 4326
+
+
+def geography_point(longitude: float, latitude: float):
+    return func.geography(func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), WGS84))
+
+
+def location_geometry(model=Observation):
+    """Expression de l'index idx_<table>_location_geom"""
+    return func.geometry(model.location)
+
+
+def location_within_radius(longitude: float, latitude: float, radius_m: float, model=Observation):
+    return func.ST_DWithin(model.location, geography_point(longitude, latitude), radius_m)
+
+
+def location_in_bounds(west: float, south: float, east: float, north: float, model=Observation):
+    return location_geometry(model).op("&&")(func.ST_MakeEnvelope(west, south, east, north, WGS84))
+
+
+def location_in_polygon(geometry: dict, model=Observation):
+    polygon = func.ST_SetSRID(func.ST_GeomFromGeoJSON(json.dumps(geometry)), WGS84)
+    return func.ST_Intersects(location_geometry(model), polygon)
+
+
+OBSERVATION_FEATURE_COLUMNS = (
+    Observation.id, Observation.species_id, Observation.longitude, Observation.latitude,
+    Observation.count, Observation.observation_date, Observation.activity_type,
+)
+
+
+def observation_feature(row, **extra_properties) -> dict:
+    obs_id, species_id, longitude, latitude, count, observation_date, activity_type = row[:7]
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [longitude, latitude]},
+        "properties": {
+            "id": obs_id,
+            "species_id": species_id,
+            "count": count,
+            "observation_date": observation_date.isoformat() if observation_date else None,
+            "activity_type": activity_type.value if activity_type else None,
+            **extra_properties,
+        },
+    }
+
+
+def _feature_collection(features: list, limit: int, **properties) -> dict:
+    truncated = len(features) > limit
+    return {
+        "type": "FeatureCollection",
+        "features": features[:limit],
+        "properties": {**properties, "truncated": truncated},
+    }
+
+
+def _limit(limit: Optional[int]) -> int:
+    return min(limit or MAX_SPATIAL_RESULTS, MAX_SPATIAL_RESULTS)
+
+
+def observations_within_radius(db: Session, latitude: float, longitude: float, radius_m: float,
+                               species_id: Optional[int] = None, limit: Optional[int] = None) -> dict:
+    """Observations à moins de `radius_m` mètres, de la plus proche à la plus éloignée"""
+    limit = _limit(limit)
+    distance = func.ST_Distance(Observation.location, geography_point(longitude, latitude))
+    query = db.query(*OBSERVATION_FEATURE_COLUMNS, distance.label("distance_m")).filter(
+        location_within_radius(longitude, latitude, radius_m)
+    )
+    if species_id is not None:
+        query = query.filter(Observation.species_id == species_id)
+    rows = query.order_by(distance).limit(limit + 1).all()
+    features = [observation_feature(row, distance_m=round(row.distance_m, 1)) for row in rows]
+    return _feature_collection(features, limit, center=[longitude, latitude], radius_m=radius_m)
+
+
+def observations_in_bbox(db: Session, west: float, south: float, east: float, north: float,
+                         species_id: Optional[int] = None, limit: Optional[int] = None) -> dict:
+    limit = _limit(limit)
+    query = db.query(*OBSERVATION_FEATURE_COLUMNS).filter(location_in_bounds(west, south, east, north))
+    if species_id is not None:
+        query = query.filter(Observation.species_id == species_id)
+    rows = query.limit(limit + 1).all()
+    return _feature_collection([observation_feature(row) for row in rows], limit, bbox=[west, south, east, north])
+
+
+def observations_in_polygon(db: Session, geometry: dict, species_id: Optional[int] = None,
+                            limit: Optional[int] = None) -> dict:
+    limit = _limit(limit)
+    query = db.query(*OBSERVATION_FEATURE_COLUMNS).filter(location_in_polygon(geometry))
+    if species_id is not None:
+        query = query.filter(Observation.species_id == species_id)
+    rows = query.limit(limit + 1).all()
+    return _feature_collection([observation_feature(row) for row in rows], limit)
+
+
+def observation_density(db: Session, latitude: float, longitude: float, radius_km: float = 10.0) -> list:
+    """Équivalent indexé de la fonction SQL observation_density_in_area"""
+    area_km2 = math.pi * radius_km * radius_km
+    rows = (
+        db.query(Species.id, Species.common_name, func.count(Observation.id).label("total"))
+        .join(Observation, Observation.species_id == Species.id)
+        .filter(location_within_radius(longitude, latitude, radius_km * 1000))
+        .group_by(Species.id, Species.common_name)
+        .order_by(func.count(Observation.id).desc())
+        .all()
+    )
+    return [
+        {
+            "species_id": species_id,
+            "species_name": name,
+            "observation_count": total,
+            "density_per_km2": total / area_km2,
+        }
+        for species_id, name, total in rows
+    ]
@@ -0,0 +1,236 @@
+"""
+Import en streaming de référentiels d'espèces (Excel / CSV).
+
+Les classeurs .xlsx sont lus avec openpyxl en mode `read_only` (ligne par
+ligne, sans charger la feuille), les .csv avec le lecteur csv standard. Les
+lignes sont validées par lots avec `SpeciesCreate` puis insérées avec
+`INSERT ... ON CONFLICT (scientific_name) DO UPDATE` : la mémoire utilisée
+dépend de la taille des lots et non de celle du fichier. Seules les
+colonnes renseignées sont mises à jour : réimporter une feuille sans
+colonne (ou avec une cellule vide) ne remet pas la valeur existante à
+son défaut.
+"""
+import csv
+import io
+import logging
+import os
+import unicodedata
+from collections import defaultdict
+from datetime import datetime
+from functools import lru_cache
+from typing import BinaryIO, Callable, Dict, FrozenSet, Iterator, List, Optional, Tuple
+
+from pydantic import TypeAdapter
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.models import ConservationStatus, Species, SpeciesCategory
+from app.schemas import ImportResult, SpeciesCreate
+from app.services.data_version import data_versions
+from app.services.stats import species_delta, stats_service
+from app.utils.batches import ErrorReport, chunked, validate_batch
+
+logger = logging.getLogger(__name__)
+
+SPECIES_IMPORT_BATCH_SIZE = int(os.getenv("SPECIES_IMPORT_BATCH_SIZE", "1000"))
+
+SUPPORTED_EXTENSIONS = (".xlsx", ".xlsm", ".xls", ".csv")
+
+# En-têtes acceptés (normalisés : minuscules, sans accents, espaces -> _)
+HEADER_ALIASES = {
+    "common_name": "common_name", "nom_commun": "common_name", "nom": "common_name",
+    "scientific_name": "scientific_name", "nom_scientifique": "scientific_name",
+    "category": "category", "categorie": "category", "type": "category",
+    "conservation_status": "conservation_status", "statut_conservation": "conservation_status",
+    "statut": "conservation_status", "statut_uicn": "conservation_status", "iucn": "conservation_status",
+    "description": "description",
+    "habitat_description": "habitat_description", "habitat": "habitat_description",
+    "threats": "threats", "menaces": "threats",
+    "conservation_actions": "conservation_actions", "actions_conservation": "conservation_actions",
+    "population_estimate": "population_estimate", "population": "population_estimate",
+    "estimation_population": "population_estimate",
+}
+
+CATEGORY_ALIASES = {"plante": "plant", "vegetal": "plant", "flore": "plant", "faune": "animal"}
+
+_UPDATABLE_COLUMNS = (
+    "common_name", "category", "conservation_status", "description", "habitat_description",
+    "threats", "conservation_actions", "population_estimate",
+)
+
+_batch_adapter = TypeAdapter(List[SpeciesCreate])
+
+ProgressCallback = Callable[[int, int], None]
+
+
+def _normalize_header(header) -> Optional[str]:
+    if header is None:
+        return None
+    text = unicodedata.normalize("NFKD", str(header)).encode("ascii", "ignore").decode("ascii")
+    key = text.strip().lower().replace(" ", "_").replace("-", "_")
+    return HEADER_ALIASES.get(key)
+
+
+def _clean_record(headers: List[Optional[str]], values) -> dict:
+    record = {}
+    for field, value in zip(headers, values):
+        if field is None or value is None:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+            if not value:
+                continue
+        if field == "category":
+            value = str(value).lower()
+            value = CATEGORY_ALIASES.get(value, value)
+        elif field == "conservation_status":
+            value = str(value).upper()
+        elif field in ("common_name", "scientific_name") and not isinstance(value, str):
+            value = str(value)
+        record[field] = value
+    return record
+
+
+def _iter_rows(headers_and_rows: Iterator[tuple], first_line: int = 1) -> Iterator[Tuple[int, dict]]:
+    headers: Optional[List[Optional[str]]] = None
+    for line_no, values in enumerate(headers_and_rows, start=first_line):
+        if headers is None:
+            headers = [_normalize_header(h) for h in values]
+            continue
+        record = _clean_record(headers, values)
+        if record:
+            yield line_no, record
+
+
+def iter_xlsx_records(file: BinaryIO) -> Iterator[Tuple[int, dict]]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        yield from _iter_rows(workbook.active.iter_rows(values_only=True))
+    finally:
+        workbook.close()
+
+
+def iter_xls_records(file: BinaryIO) -> Iterator[Tuple[int, dict]]:
+    # Ancien format binaire : xlrd ne sait pas lire en streaming, seule la
+    # première feuille est chargée (on_demand)
+    import xlrd
+
+    workbook = xlrd.open_workbook(file_contents=file.read(), on_demand=True)
+    try:
+        sheet = workbook.sheet_by_index(0)
+        yield from _iter_rows(sheet.row_values(i) for i in range(sheet.nrows))
+    finally:
+        workbook.release_resources()
+
+
+def iter_csv_records(file: BinaryIO) -> Iterator[Tuple[int, dict]]:
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        sample = text.read(4096)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        yield from _iter_rows(csv.reader(text, dialect))
+    finally:
+        text.detach()
+
+
+def iter_species_records(file: BinaryIO, filename: str) -> Iterator[Tuple[int, dict]]:
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension not in SUPPORTED_EXTENSIONS:
+        raise ValueError(f"Format de fichier non supporté: {extension or filename}")
+    if extension == ".csv":
+        return iter_csv_records(file)
+    if extension == ".xls":
+        return iter_xls_records(file)
+    return iter_xlsx_records(file)
+
+
+def _to_values(species: SpeciesCreate, now: datetime) -> dict:
+    """
+    Colonnes renseignées dans le fichier seulement : à la mise à jour, les
+    autres gardent leur valeur ; à la création, elles prennent leur défaut.
+    """
+    values = species.model_dump(exclude_unset=True)
+    if "category" in values:
+        values["category"] = SpeciesCategory(species.category.value)
+    if "conservation_status" in values:
+        values["conservation_status"] = ConservationStatus(species.conservation_status.value)
+    values["created_at"] = now
+    values["updated_at"] = now
+    return values
+
+
+@lru_cache(maxsize=None)
+def _upsert_statement(columns: FrozenSet[str]):
+    """
+    INSERT ... ON CONFLICT (scientific_name) DO UPDATE des seules colonnes
+    fournies. Une requête par ensemble de colonnes, construite une fois :
+    la requête compilée est réutilisée par le cache de SQLAlchemy et
+    exécutée en INSERT multi-lignes (insertmanyvalues).
+    """
+    table = Species.__table__
+    statement = insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.scientific_name],
+        set_={
+            **{column: statement.excluded[column] for column in _UPDATABLE_COLUMNS if column in columns},
+            "updated_at": statement.excluded.updated_at,
+        },
+    ).returning(table.c.id, table.c.common_name, table.c.scientific_name, table.c.conservation_status)
+
+
+def upsert_species_batch(db: Session, rows: List[dict]) -> int:
+    """Insère ou met à jour un lot d'espèces, clé : scientific_name"""
+    # Un INSERT multi-lignes exige les mêmes colonnes pour toutes ses lignes
+    groups: Dict[FrozenSet[str], List[dict]] = defaultdict(list)
+    for row in rows:
+        groups[frozenset(row)].append(row)
+    written = []
+    for columns, group in groups.items():
+        written.extend(db.execute(_upsert_statement(columns), group).all())
+    deltas = [species_delta(*row) for row in written]
+    stats_service.publish(db, deltas)
+    db.commit()
+    stats_service.apply(deltas)
+    data_versions.bump(Species.__tablename__)
+    return len(written)
+
+
+def import_species(db: Session, file: BinaryIO, filename: str,
+                   batch_size: int = SPECIES_IMPORT_BATCH_SIZE,
+                   on_progress: Optional[ProgressCallback] = None) -> ImportResult:
+    """Importe un fichier d'espèces par lots ; `on_progress(lignes lues, espèces écrites)`"""
+    records = iter_species_records(file, filename)
+    errors = ErrorReport()
+    imported = processed = 0
+
+    for chunk in chunked(records, batch_size):
+        processed += len(chunk)
+        now = datetime.utcnow()
+        # Une même espèce ne peut apparaître qu'une fois par INSERT ... ON CONFLICT
+        unique: Dict[str, dict] = {}
+        for _, species in validate_batch(_batch_adapter, chunk, errors):
+            unique[species.scientific_name] = {
+                **unique.get(species.scientific_name, {}), **_to_values(species, now),
+            }
+        if unique:
+            try:
+                imported += upsert_species_batch(db, list(unique.values()))
+            except Exception as e:
+                db.rollback()
+                errors.add(f"Lignes {chunk[0][0]}-{chunk[-1][0]}: échec de l'écriture ({str(e).splitlines()[0]})")
+        if on_progress:
+            on_progress(processed, imported)
+        logger.info("Import espèces %s : %d lignes lues, %d espèces écrites", filename, processed, imported)
+
+    return ImportResult(
+        success=errors.count == 0,
+        imported_count=imported,
+        errors=errors.as_list(),
+        message=f"{imported} espèces importées ou mises à jour, {errors.count} erreurs",
+    )
@@ -0,0 +1,448 @@
+"""
+Moteur de statistiques incrémental.
+
+Les compteurs par espèce sont chargés une seule fois depuis la base, puis
+mis à jour à chaque écriture d'observation (événements de session
+SQLAlchemy, imports en masse). Les lectures du tableau de bord passent par
+un cache TTL invalidé à chaque écriture : aucune requête d'agrégation n'est
+exécutée sur la table observations lors d'un rafraîchissement du tableau de
+bord.
+
+Seul le premier chargement bloque une lecture. Les resynchronisations
+(périodique, ou après une modification / suppression) sont faites par un
+thread de fond, une seule à la fois, pendant que les lectures continuent
+sur l'instantané précédent. Sous PostgreSQL, les écritures sont diffusées
+par `NOTIFY` dans leur transaction, sous forme de compteurs agrégés par
+espèce : les autres processus (workers, tâches Celery) les appliquent dès
+la validation.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import Date, cast, func, inspect, select as sql_select
+from sqlalchemy.orm import Session
+
+from app.models import Observation, Species
+from app.services.data_version import register_commit_hook
+from app.services.trends import trend_summaries
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+RECENT_DAYS = 30
+
+# Durée de vie du cache de lecture (secondes)
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "30"))
+# Resynchronisation complète périodique, pour rattraper les écritures faites
+# par d'autres processus (workers uvicorn, scripts d'import...)
+STATS_RESYNC_SECONDS = float(os.getenv("STATS_RESYNC_SECONDS", "3600"))
+# Canal NOTIFY des écritures (PostgreSQL)
+STATS_CHANNEL = os.getenv("STATS_CHANNEL", "wt_stats")
+
+# Attributs d'une observation dont la modification invalide les compteurs
+_TRACKED_ATTRIBUTES = ("species_id", "observer_id", "count", "observation_date")
+
+
+class SpeciesCounters:
+    """Compteurs agrégés d'une espèce"""
+
+    __slots__ = (
+        "species_id", "common_name", "scientific_name", "conservation_status",
+        "total_observations", "total_individuals", "last_observation_date",
+        "observers", "daily_counts",
+    )
+
+    def __init__(self, species_id: int, common_name: str = "", scientific_name: str = "",
+                 conservation_status: Optional[str] = None):
+        self.species_id = species_id
+        self.common_name = common_name
+        self.scientific_name = scientific_name
+        self.conservation_status = conservation_status
+        self.total_observations = 0
+        self.total_individuals = 0
+        self.last_observation_date: Optional[datetime] = None
+        self.observers: Set[int] = set()
+        # Nombre d'observations par jour sur la fenêtre récente
+        self.daily_counts: Dict[date, int] = {}
+
+    def merge(self, delta: dict, recent_since: date) -> None:
+        """Ajoute un delta produit par `observation_deltas`"""
+        self.total_observations += delta["observations"]
+        self.total_individuals += delta["individuals"]
+        self.observers.update(delta["observers"])
+        if delta["last"] is not None:
+            last = datetime.fromisoformat(delta["last"])
+            if self.last_observation_date is None or last > self.last_observation_date:
+                self.last_observation_date = last
+        for day, total in delta["days"].items():
+            day = date.fromisoformat(day)
+            if day >= recent_since:
+                self.daily_counts[day] = self.daily_counts.get(day, 0) + total
+
+    def recent_observations(self, recent_since: date) -> int:
+        stale_days = [day for day in self.daily_counts if day < recent_since]
+        for day in stale_days:
+            del self.daily_counts[day]
+        return sum(self.daily_counts.values())
+
+    def to_dict(self, recent_since: date) -> dict:
+        return {
+            "species_id": self.species_id,
+            "species_name": self.common_name,
+            "scientific_name": self.scientific_name,
+            "conservation_status": self.conservation_status,
+            "total_observations": self.total_observations,
+            "total_individuals": self.total_individuals,
+            "last_observation_date": self.last_observation_date,
+            "number_of_observers": len(self.observers),
+            "recent_observations": self.recent_observations(recent_since),
+        }
+
+
+def _recent_since() -> date:
+    return datetime.utcnow().date() - timedelta(days=RECENT_DAYS)
+
+
+def _enum_value(value):
+    return getattr(value, "value", value)
+
+
+# === Écritures (deltas) ===
+# Sérialisables en JSON : appliqués localement et diffusés tels quels
+
+def observation_deltas(rows: Iterable[tuple]) -> List[dict]:
+    """Agrège des observations (species_id, observer_id, count, date) par espèce"""
+    recent_since = _recent_since()
+    deltas: Dict[int, dict] = {}
+    observers: Dict[int, Set[int]] = {}
+    for species_id, observer_id, count, observation_date in rows:
+        delta = deltas.get(species_id)
+        if delta is None:
+            delta = deltas[species_id] = {
+                "kind": "observations", "species_id": species_id, "observations": 0, "individuals": 0,
+                "last": None, "observers": [], "days": {},
+            }
+            observers[species_id] = set()
+        delta["observations"] += 1
+        delta["individuals"] += count or 0
+        if observer_id is not None:
+            observers[species_id].add(observer_id)
+        if observation_date is not None:
+            last = observation_date.isoformat()
+            if delta["last"] is None or observation_date > datetime.fromisoformat(delta["last"]):
+                delta["last"] = last
+            day = observation_date.date()
+            if day >= recent_since:
+                key = day.isoformat()
+                delta["days"][key] = delta["days"].get(key, 0) + 1
+    for species_id, delta in deltas.items():
+        delta["observers"] = sorted(observers[species_id])
+    return list(deltas.values())
+
+
+def species_delta(species_id: int, common_name: str, scientific_name: str, conservation_status=None) -> dict:
+    return {
+        "kind": "species", "species_id": species_id, "common_name": common_name,
+        "scientific_name": scientific_name, "conservation_status": _enum_value(conservation_status),
+    }
+
+
+STALE_DELTA = {"kind": "stale"}
+
+
+class StatsService:
+    """Statistiques par espèce maintenues incrémentalement en mémoire"""
+
+    def __init__(self, cache_ttl: float = STATS_CACHE_TTL, resync_seconds: float = STATS_RESYNC_SECONDS,
+                 channel: str = STATS_CHANNEL):
+        self.resync_seconds = resync_seconds
+        self.channel = channel
+        self.cache = TTLCache(ttl=cache_ttl, maxsize=16)
+        self.session_factory = None
+        self._counters: Dict[int, SpeciesCounters] = {}
+        self._loaded_at: Optional[float] = None
+        self._loaded_pid: Optional[int] = None
+        self._stale = False
+        self._lock = threading.RLock()
+        # Un seul rechargement à la fois
+        self._load_lock = threading.Lock()
+        # Écritures reçues pendant un rechargement, rejouées sur les nouveaux compteurs
+        self._replay: Optional[List[dict]] = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._notify = False
+        self._listener = None
+        # Les notifications émises par ce processus sont déjà appliquées
+        self._instance = uuid.uuid4().hex
+
+    # --- Chargement ---
+
+    def reload(self, db: Session) -> None:
+        """Reconstruit tous les compteurs depuis la base (une seule passe)"""
+        with self._load_lock:
+            self._reload(db)
+
+    def _reload(self, db: Session) -> None:
+        with self._lock:
+            self._replay = []
+            self._stale = False
+        try:
+            counters = self._read_counters(db)
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+        recent_since = _recent_since()
+        with self._lock:
+            replay, self._replay = self._replay, None
+            # Une écriture validée juste avant la lecture peut être comptée deux
+            # fois ; la resynchronisation suivante corrige
+            self._merge(counters, replay, recent_since)
+            self._counters = counters
+            self._loaded_at = time.monotonic()
+            self._loaded_pid = os.getpid()
+        self.cache.invalidate()
+
+    def _read_counters(self, db: Session) -> Dict[int, SpeciesCounters]:
+        recent_since = _recent_since()
+        counters: Dict[int, SpeciesCounters] = {}
+
+        for species_id, common_name, scientific_name, status in db.query(
+            Species.id, Species.common_name, Species.scientific_name, Species.conservation_status
+        ):
+            counters[species_id] = SpeciesCounters(species_id, common_name, scientific_name, _enum_value(status))
+
+        totals = db.query(
+            Observation.species_id,
+            func.count(Observation.id),
+            func.coalesce(func.sum(Observation.count), 0),
+            func.max(Observation.observation_date),
+        ).group_by(Observation.species_id)
+        for species_id, total, individuals, last_date in totals:
+            c = counters.setdefault(species_id, SpeciesCounters(species_id))
+            c.total_observations = total
+            c.total_individuals = int(individuals)
+            c.last_observation_date = last_date
+
+        observers = db.query(Observation.species_id, Observation.observer_id).distinct()
+        for species_id, observer_id in observers:
+            counters.setdefault(species_id, SpeciesCounters(species_id)).observers.add(observer_id)
+
+        day = cast(Observation.observation_date, Date)
+        recent = (
+            db.query(Observation.species_id, day, func.count(Observation.id))
+            .filter(Observation.observation_date >= datetime.combine(recent_since, datetime.min.time()))
+            .group_by(Observation.species_id, day)
+        )
+        for species_id, obs_day, total in recent:
+            counters.setdefault(species_id, SpeciesCounters(species_id)).daily_counts[obs_day] = total
+        return counters
+
+    def ensure_loaded(self, db: Session) -> None:
+        """Premier chargement bloquant ; ensuite, resynchronisation en arrière-plan"""
+        with self._lock:
+            loaded_at, stale = self._loaded_at, self._stale
+        if loaded_at is None:
+            with self._load_lock:
+                if self._loaded_at is None:
+                    self._reload(db)
+            return
+        if stale or time.monotonic() - loaded_at > self.resync_seconds:
+            self._request_reload(db)
+
+    def _request_reload(self, db: Optional[Session] = None) -> None:
+        if self._thread is not None:
+            self._wake.set()
+        elif db is not None and self._load_lock.acquire(blocking=False):
+            # Sans thread de fond (scripts) : sur place, les autres lectures gardent l'instantané
+            try:
+                self._reload(db)
+            finally:
+                self._load_lock.release()
+
+    def mark_stale(self) -> None:
+        """Resynchronisation complète demandée ; l'instantané reste servi d'ici là"""
+        with self._lock:
+            self._stale = True
+        self._request_reload()
+
+    # --- Thread de fond et diffusion ---
+
+    def configure(self, session_factory) -> None:
+        bind = session_factory.kw.get("bind")
+        self.session_factory = session_factory
+        self._notify = bind is not None and bind.dialect.name == "postgresql"
+
+    def start(self, engine=None) -> None:
+        """Resynchronisations en arrière-plan, et écoute des autres processus (PostgreSQL)"""
+        from app.services.live_feed import NotifyListener
+
+        if self.session_factory is None or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stats-refresher", daemon=True)
+        self._thread.start()
+        if self._loaded_pid not in (None, os.getpid()) and time.monotonic() - self._loaded_at > self.cache.ttl:
+            # Compteurs hérités du maître (worker recyclé) : écritures manquées depuis
+            self.mark_stale()
+        if self._notify and engine is not None and self._listener is None:
+            self._listener = NotifyListener(engine, self.channel, self._receive, self.mark_stale)
+            self._listener.start()
+
+    def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.resync_seconds if self.resync_seconds > 0 else None)
+            self._wake.clear()
+            if self._stop.is_set() or self._loaded_at is None:
+                # Jamais chargé : le sera par la première lecture
+                continue
+            db = self.session_factory()
+            try:
+                self.reload(db)
+            except Exception:
+                logger.exception("Échec de la resynchronisation des statistiques")
+            finally:
+                db.close()
+
+    def _origin(self) -> str:
+        # Par processus : les workers préforkés héritent de la même instance
+        return f"{os.getpid()}-{self._instance}"
+
+    def publish(self, session: Session, deltas: List[dict]) -> None:
+        """Diffuse des écritures aux autres processus avec la transaction en cours de `session`"""
+        from app.services.live_feed import notify_payloads
+
+        if not self._notify or not deltas:
+            return
+        origin = self._origin()
+        for payload in notify_payloads([{**delta, "origin": origin} for delta in deltas]):
+            session.execute(sql_select(func.pg_notify(self.channel, payload)))
+
+    def _receive(self, deltas: List[dict]) -> None:
+        origin = self._origin()
+        remote = [delta for delta in deltas if delta.get("origin") != origin]
+        if any(delta["kind"] == "stale" for delta in remote):
+            self.mark_stale()
+        elif remote:
+            self.apply(remote)
+
+    # --- Écritures ---
+
+    def apply(self, deltas: List[dict]) -> None:
+        """Applique des écritures validées (`observation_deltas`, `species_delta`)"""
+        recent_since = _recent_since()
+        with self._lock:
+            if self._loaded_at is None and self._replay is None:
+                # Les compteurs seront chargés depuis la base, qui contient déjà ces lignes
+                return
+            if self._replay is not None:
+                self._replay.extend(deltas)
+            self._merge(self._counters, deltas, recent_since)
+        self.cache.invalidate()
+
+    @staticmethod
+    def _merge(counters: Dict[int, SpeciesCounters], deltas: List[dict], recent_since: date) -> None:
+        for delta in deltas:
+            if delta["kind"] == "stale":
+                continue
+            c = counters.setdefault(delta["species_id"], SpeciesCounters(delta["species_id"]))
+            if delta["kind"] == "species":
+                c.common_name = delta["common_name"]
+                c.scientific_name = delta["scientific_name"]
+                c.conservation_status = delta["conservation_status"]
+            else:
+                c.merge(delta, recent_since)
+
+    def record_observations(self, rows: Iterable[tuple]) -> None:
+        """Applique des observations nouvellement insérées (species_id, observer_id, count, date)"""
+        self.apply(observation_deltas(rows))
+
+    def record_species(self, species_id: int, common_name: str, scientific_name: str,
+                       conservation_status=None) -> None:
+        self.apply([species_delta(species_id, common_name, scientific_name, conservation_status)])
+
+    # --- Lectures ---
+
+    def get_dashboard(self, db: Session) -> dict:
+        self.ensure_loaded(db)
+        return self.cache.get_or_set("dashboard", self._build_dashboard)
+
+    def get_species_statistics(self, db: Session) -> List[dict]:
+        """Compteurs par espèce complétés par les tendances (table species_trends)"""
+        summaries = trend_summaries(db)
+        return [
+            {**row, "population_trend": summaries.get(row["species_id"], (None, None))[0],
+             "threat_level": summaries.get(row["species_id"], (None, None))[1]}
+            for row in self.get_dashboard(db)["species_observations"]
+        ]
+
+    def _build_dashboard(self) -> dict:
+        recent_since = _recent_since()
+        with self._lock:
+            rows = [c.to_dict(recent_since) for c in self._counters.values()]
+        rows.sort(key=lambda r: r["total_observations"], reverse=True)
+        return {
+            "total_species": len(rows),
+            "total_observations": sum(r["total_observations"] for r in rows),
+            "recent_observations": sum(r["recent_observations"] for r in rows),
+            "species_observations": rows,
+        }
+
+
+stats_service = StatsService()
+
+
+# === Événements de session ===
+
+def _collect_changes(session: Session) -> List[dict]:
+    rows, deltas = [], []
+    for obj in session.new:
+        if isinstance(obj, Observation):
+            rows.append((obj.species_id, obj.observer_id, obj.count, obj.observation_date))
+        elif isinstance(obj, Species):
+            deltas.append(species_delta(obj.id, obj.common_name, obj.scientific_name, obj.conservation_status))
+
+    stale = any(isinstance(obj, (Observation, Species)) for obj in session.deleted)
+    for obj in session.dirty:
+        if isinstance(obj, Observation):
+            state = inspect(obj)
+            if any(state.attrs[name].history.has_changes() for name in _TRACKED_ATTRIBUTES):
+                stale = True
+        elif isinstance(obj, Species):
+            deltas.append(species_delta(obj.id, obj.common_name, obj.scientific_name, obj.conservation_status))
+
+    deltas.extend(observation_deltas(rows))
+    if stale:
+        # Suppressions / modifications : plus simple et plus sûr de tout recharger
+        deltas = [STALE_DELTA]
+    stats_service.publish(session, deltas)
+    return deltas
+
+
+def _apply_changes(deltas: List[dict]) -> None:
+    if any(delta["kind"] == "stale" for delta in deltas):
+        stats_service.mark_stale()
+    else:
+        stats_service.apply(deltas)
+
+
+def register_session_events(session_factory) -> None:
+    """Branche la mise à jour des compteurs sur les commits des sessions"""
+    stats_service.configure(session_factory)
+    register_commit_hook(session_factory, "stats_deltas", _collect_changes, _apply_changes)
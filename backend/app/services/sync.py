@@ -0,0 +1,440 @@
+"""
+Synchronisation différentielle des terminaux de terrain (mode hors ligne).
+
+Tirage : le client présente le jeton reçu à la synchronisation précédente
+et ne reçoit que les lignes modifiées depuis (colonne `updated_at`,
+écrite par l'ORM ou, pour les UPDATE SQL directs, par le trigger
+update_updated_at_column), ainsi que les identifiants supprimés (table
+sync_tombstones, alimentée par un trigger AFTER DELETE). Les lignes sont
+parcourues par clé (updated_at, id) dans la limite d'un budget par appel ;
+tant que `has_more` est vrai, le client rappelle avec le nouveau jeton.
+Le coût d'un tirage dépend du volume modifié, pas de la taille des tables.
+
+Une transaction peut valider après coup des lignes datées d'avant le
+repère : chaque tirage repart de SYNC_OVERLAP_SECONDS avant celui-ci
+(comme les agrégats) et le client applique les lignes par identifiant,
+si bien qu'une ligne reçue deux fois est sans effet. Un jeton plus ancien
+que la rétention des suppressions impose de recharger la table (`reset`).
+
+Envoi : lots de modifications portant chacune une clé d'idempotence ; une
+modification déjà appliquée n'est pas rejouée, son résultat enregistré
+est renvoyé. Une mise à jour ou une suppression porte l'`updated_at` connu
+du client : s'il ne correspond plus à la base, elle est refusée en
+conflit, avec la version du serveur. Pour une table partitionnée
+(observations), `partition_date` (valeur de observation_date connue du
+client) limite la recherche de la ligne à son mois.
+"""
+import base64
+import json
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import Date, DateTime, Enum, delete, inspect, select, text, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models import (
+    Activity, Observation, PatrolRoute, Species, SyncIdempotencyKey, SyncTombstone, UserRole, WaterPoint,
+)
+from app.schemas import (
+    ActivityCreate, ActivityUpdate, ObservationCreate, ObservationUpdate, SyncChange, WaterPointCreate,
+    WaterPointUpdate,
+)
+from app.services.auth import AuthenticatedUser
+from app.services.partitions import get_row
+
+logger = logging.getLogger(__name__)
+
+# Lignes (et suppressions) renvoyées par appel, toutes tables confondues
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "5000"))
+SYNC_MAX_PAGE_SIZE = 50_000
+# Recouvrement appliqué au repère (transactions validées après coup)
+SYNC_OVERLAP_SECONDS = float(os.getenv("SYNC_OVERLAP_SECONDS", "300"))
+# Rétention des suppressions ; au-delà, les jetons imposent un rechargement
+SYNC_TOMBSTONE_RETENTION_DAYS = float(os.getenv("SYNC_TOMBSTONE_RETENTION_DAYS", "90"))
+# Rétention des clés d'idempotence
+SYNC_IDEMPOTENCY_RETENTION_DAYS = float(os.getenv("SYNC_IDEMPOTENCY_RETENTION_DAYS", "30"))
+# Modifications par envoi
+SYNC_MAX_PUSH_CHANGES = int(os.getenv("SYNC_MAX_PUSH_CHANGES", "1000"))
+
+TOKEN_VERSION = 1
+
+APPLIED = "applied"
+CONFLICT = "conflict"
+REJECTED = "rejected"
+
+
+@dataclass(frozen=True)
+class SyncTable:
+    model: type
+    create_schema: Optional[Type[BaseModel]] = None
+    update_schema: Optional[Type[BaseModel]] = None
+    # Rôles autorisés à écrire (None = tous)
+    write_roles: Optional[Tuple[UserRole, ...]] = None
+    # Colonne du propriétaire : renseignée à la création, seul lui (ou un
+    # administrateur) peut ensuite modifier la ligne
+    owner_column: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        return self.model.__tablename__
+
+    @property
+    def writable(self) -> bool:
+        return self.create_schema is not None
+
+
+# Ordre de tirage : les références avant les lignes qui les utilisent
+SYNC_TABLES: Dict[str, SyncTable] = {table.name: table for table in (
+    SyncTable(Species),
+    SyncTable(PatrolRoute),
+    SyncTable(WaterPoint, WaterPointCreate, WaterPointUpdate, write_roles=(UserRole.ADMIN, UserRole.RANGER)),
+    SyncTable(Activity, ActivityCreate, ActivityUpdate, write_roles=(UserRole.ADMIN, UserRole.RANGER)),
+    SyncTable(Observation, ObservationCreate, ObservationUpdate, owner_column="observer_id"),
+)}
+
+
+# === Sérialisation des lignes ===
+
+def _converter(column) -> Optional[Callable[[Any], Any]]:
+    if isinstance(column.type, Enum) and column.type.enum_class is not None:
+        return lambda value: None if value is None else value.value
+    if isinstance(column.type, (DateTime, Date)):
+        return lambda value: None if value is None else value.isoformat()
+    return None
+
+
+def _sync_columns(model) -> list:
+    # Sans les colonnes chargées à la demande (location, géométries simplifiées)
+    return [prop.columns[0] for prop in inspect(model).column_attrs if not prop.deferred]
+
+
+_COLUMNS = {name: _sync_columns(table.model) for name, table in SYNC_TABLES.items()}
+_CONVERTERS = {name: [_converter(column) for column in columns] for name, columns in _COLUMNS.items()}
+
+
+def _encode_row(table: str, row: Sequence) -> list:
+    return [value if convert is None else convert(value) for convert, value in zip(_CONVERTERS[table], row)]
+
+
+def _row_dict(table: str, obj) -> Dict[str, Any]:
+    columns = _COLUMNS[table]
+    return dict(zip((column.name for column in columns), _encode_row(table, [getattr(obj, c.key) for c in columns])))
+
+
+# === Jeton ===
+
+def _encode_token(state: Dict[str, dict]) -> str:
+    raw = json.dumps({"v": TOKEN_VERSION, "tables": state}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _decode_token(token: Optional[str]) -> Dict[str, dict]:
+    if not token:
+        return {}
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if payload["v"] != TOKEN_VERSION:
+            raise ValueError(payload["v"])
+        return {name: dict(state) for name, state in payload["tables"].items() if name in SYNC_TABLES}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise ValueError("Jeton de synchronisation invalide")
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _parse_position(value: Optional[list]) -> Optional[Tuple[datetime, int]]:
+    return (datetime.fromisoformat(value[0]), int(value[1])) if value else None
+
+
+def _position(timestamp: datetime, row_id: int) -> list:
+    return [timestamp.isoformat(), row_id]
+
+
+# === Tirage ===
+
+def _page(db: Session, statement, timestamp, row_id, since: Optional[datetime],
+          after: Optional[Tuple[datetime, int]], limit: int) -> Tuple[list, bool]:
+    """Lignes datées après `since`, suivant `after` dans l'ordre (timestamp, id), au plus `limit`"""
+    if since is not None:
+        statement = statement.where(timestamp > since)
+    else:
+        statement = statement.where(timestamp.isnot(None))
+    if after is not None:
+        statement = statement.where(tuple_(timestamp, row_id) > tuple_(*after))
+    rows = db.execute(statement.order_by(timestamp, row_id).limit(limit + 1)).all()
+    return rows[:limit], len(rows) > limit
+
+
+def pull_changes(db: Session, token: Optional[str] = None, tables: Optional[List[str]] = None,
+                 limit: int = SYNC_PAGE_SIZE) -> dict:
+    """
+    Modifications depuis `token`, toutes tables ou celles demandées, dans
+    la limite de `limit` lignes et suppressions.
+
+    État d'une table dans le jeton : `s` repère du dernier passage complet,
+    `t` début du passage en cours, `a` et `b` positions dans les lignes et
+    dans les suppressions. Un passage terminé fixe le repère à son début
+    moins SYNC_OVERLAP_SECONDS : toute ligne antérieure était déjà visible.
+    """
+    unknown = set(tables or ()) - set(SYNC_TABLES)
+    if unknown:
+        raise ValueError(f"Tables non synchronisées: {', '.join(sorted(unknown))}")
+    states = _decode_token(token)
+    now = datetime.utcnow()
+    overlap = timedelta(seconds=SYNC_OVERLAP_SECONDS)
+    horizon = now - timedelta(days=SYNC_TOMBSTONE_RETENTION_DAYS)
+    budget = limit
+    changes: Dict[str, dict] = {}
+    reset: List[str] = []
+    has_more = False
+
+    for name in SYNC_TABLES:
+        if tables and name not in tables:
+            continue
+        state = states.get(name, {})
+        since = _parse_time(state.get("s"))
+        if since is not None and since < horizon:
+            # Suppressions purgées depuis : la copie du client n'est plus fiable
+            reset.append(name)
+            state, since = {}, None
+        state.setdefault("t", now.isoformat())
+        started = _parse_time(state["t"])
+        states[name] = state
+        if budget == 0:
+            has_more = True
+            continue
+
+        # Lignes modifiées, puis suppressions
+        model = SYNC_TABLES[name].model
+        table_changes = {}
+        more = False
+        if "b" not in state:
+            rows, more = _page(
+                db, select(*_COLUMNS[name]), model.updated_at, model.id,
+                since, _parse_position(state.get("a")), budget,
+            )
+            budget -= len(rows)
+            if rows:
+                table_changes["columns"] = [column.name for column in _COLUMNS[name]]
+                table_changes["rows"] = [_encode_row(name, row) for row in rows]
+                state["a"] = _position(rows[-1].updated_at, rows[-1].id)
+        done = False
+        if not more and budget > 0:
+            # Premier chargement : seules comptent les suppressions du passage
+            tombstones, more = _page(
+                db,
+                select(SyncTombstone.row_id, SyncTombstone.deleted_at, SyncTombstone.id)
+                .where(SyncTombstone.table_name == name),
+                SyncTombstone.deleted_at, SyncTombstone.id,
+                since if since is not None else started - overlap, _parse_position(state.get("b")), budget,
+            )
+            budget -= len(tombstones)
+            if tombstones:
+                table_changes["deleted"] = [tombstone.row_id for tombstone in tombstones]
+                state["b"] = _position(tombstones[-1].deleted_at, tombstones[-1].id)
+            done = not more
+        if done:
+            states[name] = {"s": (started - overlap).isoformat()}
+        else:
+            has_more = True
+        if table_changes:
+            changes[name] = table_changes
+
+    return {
+        "token": _encode_token(states),
+        "has_more": has_more,
+        "reset": reset,
+        "changes": changes,
+    }
+
+
+# === Envoi ===
+
+def _result(change: SyncChange, status: str, row_id: Optional[int] = None, updated_at: Optional[datetime] = None,
+            server: Optional[dict] = None, detail: Optional[str] = None) -> dict:
+    result = {"key": change.key, "table": change.table, "status": status, "id": row_id}
+    if updated_at is not None:
+        result["updated_at"] = updated_at.isoformat()
+    if status == CONFLICT:
+        result["server"] = server  # None : ligne supprimée sur le serveur
+    if detail:
+        result["detail"] = detail
+    return result
+
+
+def _model_values(model, values: dict) -> dict:
+    # Les schémas renvoient les valeurs des énumérations, l'ORM attend les membres
+    for name, value in values.items():
+        column_type = model.__table__.columns[name].type
+        if value is not None and isinstance(column_type, Enum) and column_type.enum_class is not None:
+            values[name] = column_type.enum_class(getattr(value, "value", value))
+        elif isinstance(value, datetime) and value.tzinfo is not None:
+            # Colonnes sans fuseau : UTC naïf, comme updated_at
+            values[name] = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return values
+
+
+def _validation_detail(error: ValidationError) -> str:
+    first = error.errors()[0]
+    return f"{'.'.join(str(part) for part in first['loc'])}: {first['msg']}"
+
+
+def _apply(db: Session, table: SyncTable, user: AuthenticatedUser, change: SyncChange) -> dict:
+    model = table.model
+    if change.id is None:
+        if change.op == "delete":
+            return _result(change, REJECTED, detail="Identifiant requis pour une suppression")
+        values = table.create_schema(**(change.data or {})).model_dump()
+        if table.owner_column:
+            values[table.owner_column] = user.id
+        obj = model(**_model_values(model, values))
+        db.add(obj)
+        db.flush()
+        return _result(change, APPLIED, obj.id, obj.updated_at)
+
+    obj = get_row(db, model, change.id, change.partition_date, with_for_update=True, populate_existing=True)
+    if obj is None:
+        if change.op == "delete":
+            return _result(change, APPLIED, change.id)  # déjà supprimée
+        return _result(change, CONFLICT, change.id)
+    if table.owner_column and user.role != UserRole.ADMIN and getattr(obj, table.owner_column) != user.id:
+        return _result(change, REJECTED, change.id, detail="Droits insuffisants")
+    if change.base_updated_at is None:
+        return _result(change, REJECTED, change.id, detail="base_updated_at requis pour modifier une ligne")
+    if obj.updated_at != change.base_updated_at:
+        return _result(change, CONFLICT, change.id, obj.updated_at, server=_row_dict(table.name, obj))
+
+    if change.op == "delete":
+        db.delete(obj)
+        db.flush()
+        return _result(change, APPLIED, change.id)
+    values = table.update_schema(**(change.data or {})).model_dump(exclude_unset=True)
+    for name, value in _model_values(model, values).items():
+        setattr(obj, name, value)
+    db.flush()
+    return _result(change, APPLIED, obj.id, obj.updated_at)
+
+
+def _apply_change(db: Session, user: AuthenticatedUser, change: SyncChange) -> dict:
+    table = SYNC_TABLES.get(change.table)
+    if table is None or not table.writable:
+        return _result(change, REJECTED, change.id, detail="Table non modifiable par synchronisation")
+    if table.write_roles and user.role not in table.write_roles:
+        return _result(change, REJECTED, change.id, detail="Droits insuffisants")
+
+    # Chaque modification dans un point de sauvegarde : un refus n'annule
+    # pas les autres modifications du lot
+    savepoint = db.begin_nested()
+    try:
+        # Réservation de la clé ; bloque tant qu'un envoi concurrent de la
+        # même clé n'est pas validé
+        claimed = db.execute(
+            pg_insert(SyncIdempotencyKey)
+            .values(user_id=user.id, key=change.key, table_name=table.name, created_at=datetime.utcnow())
+            .on_conflict_do_nothing()
+            .returning(SyncIdempotencyKey.key)
+        ).first()
+        if claimed is None:
+            savepoint.rollback()
+            stored = db.get(SyncIdempotencyKey, (user.id, change.key))
+            return {**json.loads(stored.result), "replayed": True}
+
+        result = _apply(db, table, user, change)
+        if result["status"] != APPLIED:
+            savepoint.rollback()
+            return result
+        db.execute(
+            update(SyncIdempotencyKey)
+            .where(SyncIdempotencyKey.user_id == user.id, SyncIdempotencyKey.key == change.key)
+            .values(row_id=result["id"], result=json.dumps(result))
+        )
+        savepoint.commit()
+        return result
+    except ValidationError as e:
+        savepoint.rollback()
+        return _result(change, REJECTED, change.id, detail=_validation_detail(e))
+    except IntegrityError as e:
+        # Référence inexistante (species_id...), contrainte violée
+        savepoint.rollback()
+        return _result(change, REJECTED, change.id, detail=str(e.orig).splitlines()[0])
+
+
+def push_changes(db: Session, user: AuthenticatedUser, changes: List[SyncChange]) -> List[dict]:
+    """Applique un lot de modifications (une transaction, un point de sauvegarde par modification)"""
+    if len(changes) > SYNC_MAX_PUSH_CHANGES:
+        raise ValueError(f"Au plus {SYNC_MAX_PUSH_CHANGES} modifications par envoi")
+    try:
+        results = [_apply_change(db, user, change) for change in changes]
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return results
+
+
+# === Schéma et entretien ===
+
+_SYNC_DDL = """
+CREATE OR REPLACE FUNCTION update_updated_at_column()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- La valeur écrite par l'application (datetime.utcnow) est conservée
+    IF NEW.updated_at IS NOT DISTINCT FROM OLD.updated_at THEN
+        NEW.updated_at = timezone('utc', now());
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION record_sync_tombstones()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO sync_tombstones (table_name, row_id, deleted_at)
+    SELECT TG_TABLE_NAME, id, timezone('utc', now()) FROM deleted_rows;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+_SYNC_TABLE_DDL = """
+UPDATE {table} SET updated_at = COALESCE(created_at, timezone('utc', now())) WHERE updated_at IS NULL;
+CREATE INDEX IF NOT EXISTS ix_{table}_updated_at ON {table} (updated_at);
+DROP TRIGGER IF EXISTS {table}_updated_at ON {table};
+CREATE TRIGGER {table}_updated_at BEFORE UPDATE ON {table}
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+DROP TRIGGER IF EXISTS {table}_sync_tombstones ON {table};
+CREATE TRIGGER {table}_sync_tombstones AFTER DELETE ON {table}
+    REFERENCING OLD TABLE AS deleted_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION record_sync_tombstones();
+"""
+
+
+def install_sync_schema(connection) -> None:
+    """Triggers updated_at et suppressions des tables synchronisées (idempotent)"""
+    connection.execute(text(_SYNC_DDL))
+    for name in SYNC_TABLES:
+        connection.execute(text(_SYNC_TABLE_DDL.format(table=name)))
+
+
+def purge_sync_history(session_factory) -> None:
+    """Supprime les suppressions et clés d'idempotence expirées (au démarrage)"""
+    now = datetime.utcnow()
+    with session_factory() as db:
+        try:
+            db.execute(delete(SyncTombstone).where(
+                SyncTombstone.deleted_at < now - timedelta(days=SYNC_TOMBSTONE_RETENTION_DAYS)
+            ))
+            db.execute(delete(SyncIdempotencyKey).where(
+                SyncIdempotencyKey.created_at < now - timedelta(days=SYNC_IDEMPOTENCY_RETENTION_DAYS)
+            ))
+            db.commit()
+        except Exception:
+            logger.exception("Échec de la purge de l'historique de synchronisation")
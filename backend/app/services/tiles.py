@@ -0,0 +1,210 @@
+"""
+Tuiles d'observations z/x/y (Web Mercator) au format GeoJSON.
+
+Seules les observations contenues dans l'emprise de la tuile sont lues, via
+l'index GIST `idx_observations_location_geom` (voir app.services.spatial). Aux petits niveaux de
+zoom, ou lorsqu'une tuile est trop dense, les points sont regroupés côté
+serveur en cellules de grille avec leur effectif.
+
+Aux petits zooms, sans filtre d'espèce, les cellules de la tuile couvrent
+plusieurs cellules de rollup_observations_cells : la tuile est calculée en
+mémoire depuis ces agrégats (totaux par cellule, rechargés quand les
+agrégats changent), sans lire les observations ; elle inclut donc les mois
+archivés et suit le rafraîchissement des agrégats.
+
+Les réponses sérialisées sont mises en cache par (z, x, y, espèce,
+version) : version des données pour les tuiles détaillées, version des
+agrégats pour les tuiles tirées de la grille, et sinon une période de
+TILE_CLUSTER_VERSION_SECONDS, pour que chaque écriture ne fasse pas
+recalculer les tuiles agrégées.
+"""
+import json
+import math
+import os
+import time
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.models import Observation, ObservationCellRollup, RollupState
+from app.services.data_version import data_versions
+from app.services.rollups import OBSERVATIONS, ROLLUP_CELL_DEGREES
+from app.services.spatial import OBSERVATION_FEATURE_COLUMNS, location_in_bounds, observation_feature
+from app.utils.cache import TTLCache
+
+# En dessous de ce zoom, les observations sont toujours agrégées
+TILE_CLUSTER_MAX_ZOOM = int(os.getenv("TILE_CLUSTER_MAX_ZOOM", "12"))
+# Nombre de cellules par côté de tuile pour l'agrégation
+TILE_GRID_SIZE = int(os.getenv("TILE_GRID_SIZE", "64"))
+# Au-delà de ce nombre de points, une tuile détaillée est agrégée
+TILE_MAX_POINTS = int(os.getenv("TILE_MAX_POINTS", "5000"))
+TILE_CACHE_TTL = float(os.getenv("TILE_CACHE_TTL", "60"))
+# Retard maximal des tuiles agrégées lues dans la table des observations
+TILE_CLUSTER_VERSION_SECONDS = float(os.getenv("TILE_CLUSTER_VERSION_SECONDS", "60"))
+
+MAX_ZOOM = 22
+
+tile_cache = TTLCache(ttl=TILE_CACHE_TTL, maxsize=4096)
+# Grille des agrégats, par version des agrégats
+_grid_cache = TTLCache(ttl=24 * 3600, maxsize=2)
+
+
+class CellGrid(NamedTuple):
+    """Totaux de rollup_observations_cells par cellule (centres en degrés)"""
+    longitudes: np.ndarray
+    latitudes: np.ndarray
+    observations: np.ndarray
+    individuals: np.ndarray
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Emprise (ouest, sud, est, nord) en degrés d'une tuile Web Mercator"""
+    n = 2 ** z
+
+    def lat(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+def is_valid_tile(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def _filter_tile(query, bounds, species_id: Optional[int]):
+    query = query.filter(location_in_bounds(*bounds))
+    if species_id is not None:
+        query = query.filter(Observation.species_id == species_id)
+    return query
+
+
+def _cluster_features(db: Session, bounds, species_id: Optional[int]) -> list:
+    west, south, east, north = bounds
+    cell_x = (east - west) / TILE_GRID_SIZE
+    cell_y = (north - south) / TILE_GRID_SIZE
+    query = db.query(
+        func.count(Observation.id),
+        func.coalesce(func.sum(Observation.count), 0),
+        func.avg(Observation.longitude),
+        func.avg(Observation.latitude),
+    )
+    query = _filter_tile(query, bounds, species_id).group_by(
+        func.floor((Observation.longitude - west) / cell_x),
+        func.floor((Observation.latitude - south) / cell_y),
+    )
+    return [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [float(lon), float(lat)]},
+            "properties": {"cluster": True, "point_count": total, "individuals": int(individuals)},
+        }
+        for total, individuals, lon, lat in query
+    ]
+
+
+def _load_grid(db: Session) -> CellGrid:
+    rollup = ObservationCellRollup
+    rows = db.connection().execute(
+        select(rollup.cell_x, rollup.cell_y, func.sum(rollup.observations), func.sum(rollup.individuals))
+        .group_by(rollup.cell_x, rollup.cell_y)
+    ).all()
+    # Colonnes transposées avant numpy : bien plus rapide que ligne à ligne
+    cell_x, cell_y, observations, individuals = (
+        np.array(column, dtype=np.float64) for column in (zip(*rows) if rows else ((),) * 4)
+    )
+    return CellGrid(
+        (cell_x + 0.5) * ROLLUP_CELL_DEGREES, (cell_y + 0.5) * ROLLUP_CELL_DEGREES, observations, individuals,
+    )
+
+
+def grid_cluster_features(grid: CellGrid, bounds) -> list:
+    """Mêmes groupes que `_cluster_features`, calculés depuis la grille des agrégats"""
+    west, south, east, north = bounds
+    inside = (
+        (grid.longitudes >= west) & (grid.longitudes < east)
+        & (grid.latitudes >= south) & (grid.latitudes < north)
+        & (grid.observations > 0)
+    )
+    longitudes, latitudes = grid.longitudes[inside], grid.latitudes[inside]
+    observations = grid.observations[inside]
+    cx = np.minimum(((longitudes - west) / (east - west) * TILE_GRID_SIZE).astype(np.int64), TILE_GRID_SIZE - 1)
+    cy = np.minimum(((latitudes - south) / (north - south) * TILE_GRID_SIZE).astype(np.int64), TILE_GRID_SIZE - 1)
+    cells = cy * TILE_GRID_SIZE + cx
+    size = TILE_GRID_SIZE * TILE_GRID_SIZE
+    totals = np.bincount(cells, weights=observations, minlength=size)
+    individuals = np.bincount(cells, weights=grid.individuals[inside], minlength=size)
+    # Centre pondéré par le nombre d'observations de chaque cellule d'agrégat
+    lon_sums = np.bincount(cells, weights=longitudes * observations, minlength=size)
+    lat_sums = np.bincount(cells, weights=latitudes * observations, minlength=size)
+    return [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [lon_sums[c] / totals[c], lat_sums[c] / totals[c]]},
+            "properties": {"cluster": True, "point_count": int(totals[c]), "individuals": int(individuals[c])},
+        }
+        for c in np.flatnonzero(totals).tolist()
+    ]
+
+
+def _grid_version(db: Session) -> Optional[tuple]:
+    """Version des agrégats d'observations, None s'ils n'ont jamais été calculés"""
+    state = db.get(RollupState, OBSERVATIONS)
+    if state is None or state.full_refreshed_at is None:
+        return None
+    return state.high_water_mark, state.full_refreshed_at
+
+
+def _uses_grid(z: int, x: int, y: int, species_id: Optional[int]) -> bool:
+    """Tuile agrégée sans filtre d'espèce, dont les cellules sont au moins aussi grandes que celles des agrégats"""
+    if z >= TILE_CLUSTER_MAX_ZOOM or species_id is not None:
+        return False
+    west, south, east, north = tile_bounds(z, x, y)
+    return min(east - west, north - south) / TILE_GRID_SIZE >= ROLLUP_CELL_DEGREES
+
+
+def _point_features(db: Session, bounds, species_id: Optional[int]) -> Optional[list]:
+    query = db.query(*OBSERVATION_FEATURE_COLUMNS)
+    rows = _filter_tile(query, bounds, species_id).limit(TILE_MAX_POINTS + 1).all()
+    if len(rows) > TILE_MAX_POINTS:
+        return None
+    return [observation_feature(row) for row in rows]
+
+
+def build_tile(db: Session, z: int, x: int, y: int, species_id: Optional[int] = None,
+               grid: Optional[CellGrid] = None) -> dict:
+    """`grid` : grille des agrégats, utilisée à la place des observations pour agréger"""
+    bounds = tile_bounds(z, x, y)
+    features = None
+    if z >= TILE_CLUSTER_MAX_ZOOM:
+        features = _point_features(db, bounds, species_id)
+    clustered = features is None
+    if clustered:
+        features = grid_cluster_features(grid, bounds) if grid is not None else _cluster_features(
+            db, bounds, species_id
+        )
+    return {
+        "type": "FeatureCollection",
+        "features": features,
+        "properties": {"z": z, "x": x, "y": y, "clustered": clustered},
+    }
+
+
+def get_tile(db: Session, z: int, x: int, y: int, species_id: Optional[int] = None) -> Tuple[bytes, tuple]:
+    """Tuile sérialisée (JSON) et version utilisée pour la clé"""
+    grid = None
+    if z >= TILE_CLUSTER_MAX_ZOOM:
+        version = ("data", data_versions.get(Observation.__tablename__))
+    else:
+        grid_version = _grid_version(db) if _uses_grid(z, x, y, species_id) else None
+        if grid_version is not None:
+            version = ("grid", grid_version)
+            grid = _grid_cache.get_or_set(grid_version, lambda: _load_grid(db))
+        else:
+            version = ("period", int(time.time() // TILE_CLUSTER_VERSION_SECONDS))
+    key = (z, x, y, species_id, version)
+    content = tile_cache.get_or_set(
+        key, lambda: json.dumps(build_tile(db, z, x, y, species_id, grid), separators=(",", ":")).encode("utf-8")
+    )
+    return content, version
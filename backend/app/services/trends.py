@@ -0,0 +1,353 @@
+"""
+Tendances de population par espèce.
+
+Pour chaque espèce, la série mensuelle des individus observés (agrégats
+rollup_observations_daily) est rapportée à l'effort de patrouille du mois
+(heures de patrouille des rapports) par un GLM de Poisson à lien log :
+
+    individus[s, m] ~ Poisson(effort[m] · exp(a[s] + b[s] · années[m]))
+
+`exp(b) - 1` est la variation annuelle. Toutes les espèces sont ajustées
+ensemble (Newton vectorisé sur une matrice espèces × mois) ; la
+surdispersion est prise en compte en quasi-Poisson, par la statistique de
+Pearson. Sans aucun rapport de patrouille sur la période, l'effort est
+supposé constant. La série s'arrête au dernier mois complet : le mois en
+cours, incomplet, tirerait les pentes vers le bas (fausses baisses
+significatives, niveau de menace relevé).
+
+Les résultats sont stockés dans species_trends et recalculés avec les
+agrégats (app.services.rollups) : seules les espèces ayant des
+observations nouvelles ou modifiées sont relues ; un changement de
+l'effort réajuste toutes les espèces à partir des séries déjà stockées ;
+un changement de mois ou une reconstruction complète repart des agrégats.
+"""
+import json
+import math
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import Date, cast, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.models import ObservationDailyRollup, Observation, PatrolLog, RollupState, Species, SpeciesTrend
+
+# Nombre de mois complets de la série (le mois en cours est exclu)
+TREND_WINDOW_MONTHS = int(os.getenv("TREND_WINDOW_MONTHS", "36"))
+# En deçà (mois avec observations, individus), pas d'estimation (insufficient_data)
+TREND_MIN_MONTHS = int(os.getenv("TREND_MIN_MONTHS", "6"))
+TREND_MIN_INDIVIDUALS = int(os.getenv("TREND_MIN_INDIVIDUALS", "20"))
+# Durée comptée pour un rapport de patrouille sans heures de début et de fin
+PATROL_DEFAULT_HOURS = float(os.getenv("PATROL_DEFAULT_HOURS", "4"))
+# Recouvrement appliqué aux repères (transactions validées après coup)
+TREND_OVERLAP_SECONDS = float(os.getenv("TREND_OVERLAP_SECONDS", "300"))
+
+TRENDS = "species_trends"
+
+Z_95 = 1.959964
+_MAX_ITERATIONS = 50
+# Au-delà (log de la variation annuelle), l'estimation n'est pas retenue
+_MAX_LOG_CHANGE = 5.0
+# Statut UICN -> niveau de menace
+_STATUS_LEVELS = {"LC": 0, "NT": 0, "VU": 1, "EN": 2, "CR": 3, "EW": 3, "EX": 3}
+THREAT_LEVELS = ("low", "medium", "high", "critical")
+
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def window_months(today: Optional[date] = None) -> List[date]:
+    """Premiers jours des mois de la série, jusqu'au mois précédant `today`"""
+    current = _month_start(today or datetime.utcnow().date())
+    return [_add_months(current, offset) for offset in range(-TREND_WINDOW_MONTHS, 0)]
+
+
+def _window_end(months: Sequence[date]) -> date:
+    return _add_months(months[-1], 1)
+
+
+# === Ajustement ===
+
+def fit_poisson_trends(counts: np.ndarray, effort: np.ndarray, years: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    GLM de Poisson (lien log, offset log(effort)) ajusté pour toutes les
+    lignes de `counts` (espèces × mois) à la fois ; les mois sans effort
+    sont ignorés. Renvoie pente b, erreur type (quasi-Poisson), dispersion
+    et nombre de mois avec observations.
+    """
+    used = effort > 0
+    y, e, x = counts[:, used].astype(np.float64), effort[used], years[used]
+    x = x - x.mean() if len(x) else x
+    n_species, n_months = y.shape
+    totals = y.sum(axis=1)
+    with np.errstate(divide="ignore"):
+        a = np.log(np.maximum(totals, 1e-9) / e.sum()) if n_months else np.zeros(n_species)
+    b = np.zeros(n_species)
+    for _ in range(_MAX_ITERATIONS):
+        mu = e * np.exp(a[:, None] + b[:, None] * x)
+        residual = y - mu
+        g_a, g_b = residual.sum(axis=1), (residual * x).sum(axis=1)
+        h_aa, h_ab, h_bb = mu.sum(axis=1), (mu * x).sum(axis=1), (mu * x * x).sum(axis=1)
+        det = h_aa * h_bb - h_ab ** 2
+        safe = det > 1e-12
+        det = np.where(safe, det, 1.0)
+        # Pas de Newton borné : évite les divergences sur les séries presque vides
+        step_a = np.where(safe, np.clip((h_bb * g_a - h_ab * g_b) / det, -5, 5), 0.0)
+        step_b = np.where(safe, np.clip((h_aa * g_b - h_ab * g_a) / det, -2, 2), 0.0)
+        a, b = a + step_a, b + step_b
+        if np.abs(step_b).max(initial=0.0) < 1e-9 and np.abs(step_a).max(initial=0.0) < 1e-9:
+            break
+
+    mu = e * np.exp(a[:, None] + b[:, None] * x)
+    h_aa, h_ab, h_bb = mu.sum(axis=1), (mu * x).sum(axis=1), (mu * x * x).sum(axis=1)
+    det = h_aa * h_bb - h_ab ** 2
+    degrees = max(n_months - 2, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dispersion = np.maximum(((y - mu) ** 2 / np.where(mu > 0, mu, np.inf)).sum(axis=1) / degrees, 1.0)
+        se = np.sqrt(np.where(det > 1e-12, h_aa / det, np.inf) * dispersion)
+    return {"slope": b, "se": se, "dispersion": dispersion, "months": (y > 0).sum(axis=1)}
+
+
+def _classify(slope: float, se: float, months: int, individuals: int) -> str:
+    if months < TREND_MIN_MONTHS or individuals < TREND_MIN_INDIVIDUALS:
+        return "insufficient_data"
+    # Série trop concentrée dans le temps : pente non identifiable
+    if not math.isfinite(se) or abs(slope) + Z_95 * se > _MAX_LOG_CHANGE:
+        return "insufficient_data"
+    z = slope / se if se > 0 else 0.0
+    if z >= Z_95:
+        return "increasing"
+    if z <= -Z_95:
+        return "decreasing"
+    return "stable"
+
+
+def threat_level(conservation_status: Optional[str], trend: str) -> str:
+    """Niveau tiré du statut UICN, relevé d'un cran pour une espèce en déclin significatif"""
+    level = _STATUS_LEVELS.get(conservation_status or "LC", 0)
+    if trend == "decreasing":
+        level += 1
+    return THREAT_LEVELS[min(level, len(THREAT_LEVELS) - 1)]
+
+
+# === Données ===
+
+def monthly_effort(db: Session, months: Sequence[date]) -> np.ndarray:
+    """Heures de patrouille par mois de la fenêtre"""
+    start = datetime.combine(months[0], datetime.min.time())
+    end = datetime.combine(_window_end(months), datetime.min.time())
+    month = cast(func.date_trunc("month", PatrolLog.patrol_date), Date)
+    hours = func.coalesce(
+        func.extract("epoch", PatrolLog.end_time - PatrolLog.start_time) / 3600.0, PATROL_DEFAULT_HOURS
+    )
+    rows = db.query(month, func.sum(func.greatest(hours, 0))).filter(
+        PatrolLog.patrol_date >= start, PatrolLog.patrol_date < end
+    ).group_by(month)
+    index = {m: i for i, m in enumerate(months)}
+    effort = np.zeros(len(months))
+    for m, total in rows:
+        if m in index:
+            effort[index[m]] = float(total or 0)
+    return effort
+
+
+def monthly_counts(db: Session, months: Sequence[date], species_ids: Optional[Sequence[int]] = None):
+    """(observations, individus) par espèce et par mois, depuis les agrégats journaliers"""
+    rollup = ObservationDailyRollup
+    month = cast(func.date_trunc("month", rollup.day), Date)
+    query = db.query(rollup.species_id, month, func.sum(rollup.observations), func.sum(rollup.individuals)).filter(
+        rollup.day >= months[0], rollup.day < _window_end(months)
+    )
+    if species_ids is not None:
+        query = query.filter(rollup.species_id.in_(species_ids))
+    index = {m: i for i, m in enumerate(months)}
+    counts: Dict[int, np.ndarray] = {}
+    for species_id, m, observations, individuals in query.group_by(rollup.species_id, month):
+        if m in index:
+            row = counts.setdefault(species_id, np.zeros((2, len(months)), dtype=np.int64))
+            row[:, index[m]] = (observations, individuals)
+    return counts
+
+
+def _state(db: Session, name: str) -> RollupState:
+    state = db.get(RollupState, name)
+    if state is None:
+        state = RollupState(name=name)
+        db.add(state)
+    return state
+
+
+def _stored_counts(db: Session, months: Sequence[date], exclude: set) -> Dict[int, np.ndarray]:
+    counts = {}
+    for species_id, series in db.query(SpeciesTrend.species_id, SpeciesTrend.series).filter(
+        SpeciesTrend.window_start == months[0]
+    ):
+        if species_id not in exclude:
+            data = json.loads(series)
+            counts[species_id] = np.array([data["observations"], data["individuals"]], dtype=np.int64)
+    return counts
+
+
+# === Rafraîchissement ===
+
+def _stored_effort(db: Session, months: Sequence[date]) -> Optional[np.ndarray]:
+    """Effort utilisé au dernier ajustement (identique pour toutes les espèces)"""
+    series = db.query(SpeciesTrend.series).filter(SpeciesTrend.window_start == months[0]).limit(1).scalar()
+    if series is None:
+        return None
+    effort = json.loads(series)["effort_hours"]
+    return np.zeros(len(months)) if effort is None else np.array(effort)
+
+
+def refresh_trends(db: Session, full: bool = False) -> int:
+    """
+    Met à jour species_trends (sans commit : appelé dans la transaction des
+    agrégats, après leur rafraîchissement). Renvoie le nombre d'espèces réajustées.
+    """
+    months = window_months()
+    state = _state(db, TRENDS)
+    observations_mark = db.query(func.max(Observation.updated_at)).scalar()
+    now = datetime.utcnow()
+    effort = np.round(monthly_effort(db, months), 1)
+    stored_effort = None if full else _stored_effort(db, months)
+
+    # Fenêtre décalée d'un mois (séries stockées obsolètes) ou premier calcul : tout repart des agrégats
+    if full or state.high_water_mark is None or stored_effort is None:
+        changed = set(db.scalars(select(Species.id)))
+        counts = monthly_counts(db, months)
+        state.full_refreshed_at = now
+    else:
+        since = state.high_water_mark - timedelta(seconds=TREND_OVERLAP_SECONDS)
+        changed = set()
+        if observations_mark is not None and observations_mark > since:
+            changed = set(db.scalars(select(Observation.species_id).where(Observation.updated_at > since).distinct()))
+        counts = monthly_counts(db, months, list(changed)) if changed else {}
+        if not np.array_equal(effort, stored_effort):
+            # Nouvel effort : les autres espèces sont réajustées depuis leurs séries stockées
+            counts.update(_stored_counts(db, months, changed))
+    targets = sorted(changed | set(counts))
+
+    if targets:
+        _fit_and_store(db, months, targets, counts, effort, now)
+    state.high_water_mark = observations_mark or state.high_water_mark or now
+    state.refreshed_at = now
+    return len(targets)
+
+
+def _fit_and_store(db: Session, months: Sequence[date], targets: List[int], counts: Dict[int, np.ndarray],
+                   effort: np.ndarray, now: datetime) -> None:
+    normalized = bool(effort.sum() > 0)
+    empty = np.zeros((2, len(months)), dtype=np.int64)
+    matrix = np.stack([counts.get(species_id, empty) for species_id in targets])
+    years = np.arange(len(months)) / 12.0
+    fit = fit_poisson_trends(matrix[:, 1], effort if normalized else np.ones(len(months)), years)
+    statuses = dict(db.query(Species.id, Species.conservation_status).filter(Species.id.in_(targets)))
+    labels = [m.isoformat()[:7] for m in months]
+    effort_hours = effort.tolist() if normalized else None
+    rows = []
+    for i, species_id in enumerate(targets):
+        if species_id not in statuses:
+            continue
+        individuals = int(matrix[i, 1].sum())
+        slope, se = float(fit["slope"][i]), float(fit["se"][i])
+        trend = _classify(slope, se, int(fit["months"][i]), individuals)
+        estimated = trend != "insufficient_data"
+        status = getattr(statuses[species_id], "value", statuses[species_id])
+        rows.append({
+            "species_id": species_id,
+            "window_start": months[0],
+            "months": int(fit["months"][i]),
+            "observations": int(matrix[i, 0].sum()),
+            "individuals": individuals,
+            "annual_change": round(math.expm1(slope), 4) if estimated else None,
+            "annual_change_low": round(math.expm1(slope - Z_95 * se), 4) if estimated else None,
+            "annual_change_high": round(math.expm1(slope + Z_95 * se), 4) if estimated else None,
+            "z_score": round(slope / se, 3) if estimated and se > 0 else None,
+            "dispersion": round(float(fit["dispersion"][i]), 3) if estimated else None,
+            "trend": trend,
+            "threat_level": threat_level(status, trend),
+            "effort_normalized": normalized,
+            "series": json.dumps({
+                "months": labels,
+                "observations": matrix[i, 0].tolist(),
+                "individuals": matrix[i, 1].tolist(),
+                "effort_hours": effort_hours,
+            }, separators=(",", ":")),
+            "computed_at": now,
+        })
+    if rows:
+        insert = pg_insert(SpeciesTrend)
+        # Liste de paramètres : insertion par lots (insertmanyvalues), compilée une fois
+        db.execute(insert.on_conflict_do_update(
+            index_elements=[SpeciesTrend.species_id],
+            set_={column: insert.excluded[column] for column in rows[0] if column != "species_id"},
+        ), rows)
+
+
+# === Lectures ===
+
+def list_trends(db: Session, trend: Optional[str] = None, threat_level: Optional[str] = None) -> List[dict]:
+    """Tendances de toutes les espèces (une lecture de species_trends, sans les séries)"""
+    query = db.query(SpeciesTrend, Species.common_name, Species.scientific_name).join(
+        Species, Species.id == SpeciesTrend.species_id
+    )
+    if trend is not None:
+        query = query.filter(SpeciesTrend.trend == trend)
+    if threat_level is not None:
+        query = query.filter(SpeciesTrend.threat_level == threat_level)
+    rows = query.order_by(SpeciesTrend.annual_change.asc().nulls_last(), SpeciesTrend.species_id)
+    return [_to_dict(row, common_name, scientific_name) for row, common_name, scientific_name in rows]
+
+
+def get_trend(db: Session, species_id: int) -> Optional[dict]:
+    row = (
+        db.query(SpeciesTrend, Species.common_name, Species.scientific_name)
+        .join(Species, Species.id == SpeciesTrend.species_id)
+        .filter(SpeciesTrend.species_id == species_id)
+        .first()
+    )
+    if row is None:
+        return None
+    trend, common_name, scientific_name = row
+    result = _to_dict(trend, common_name, scientific_name)
+    result["series"] = json.loads(trend.series)
+    return result
+
+
+def trend_summaries(db: Session) -> Dict[int, tuple]:
+    """{species_id: (tendance, niveau de menace)}"""
+    return {
+        species_id: (trend, level)
+        for species_id, trend, level in db.query(
+            SpeciesTrend.species_id, SpeciesTrend.trend, SpeciesTrend.threat_level
+        )
+    }
+
+
+def _to_dict(row: SpeciesTrend, common_name: str, scientific_name: str) -> dict:
+    return {
+        "species_id": row.species_id,
+        "species_name": common_name,
+        "scientific_name": scientific_name,
+        "window_start": row.window_start,
+        "months": row.months,
+        "observations": row.observations,
+        "individuals": row.individuals,
+        "annual_change": row.annual_change,
+        "annual_change_low": row.annual_change_low,
+        "annual_change_high": row.annual_change_high,
+        "z_score": row.z_score,
+        "dispersion": row.dispersion,
+        "trend": row.trend,
+        "threat_level": row.threat_level,
+        "effort_normalized": row.effort_normalized,
+        "computed_at": row.computed_at,
+    }
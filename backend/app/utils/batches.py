@@ -0,0 +1,59 @@
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from pydantic import TypeAdapter, ValidationError
+
+# Nombre maximal de messages d'erreur renvoyés (les suivants sont seulement comptés)
+MAX_REPORTED_ERRORS = 1000
+
+
+class ErrorReport:
+    """Liste d'erreurs par ligne, bornée en mémoire"""
+
+    def __init__(self, limit: int = MAX_REPORTED_ERRORS):
+        self.limit = limit
+        self.messages: List[str] = []
+        self.count = 0
+
+    def add(self, message: str) -> None:
+        self.count += 1
+        if len(self.messages) < self.limit:
+            self.messages.append(message)
+
+    def as_list(self) -> List[str]:
+        if self.count > len(self.messages):
+            return self.messages + [f"... et {self.count - len(self.messages)} autres erreurs"]
+        return list(self.messages)
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def format_validation_errors(errors: List[dict]) -> str:
+    return "; ".join(f"{'.'.join(str(loc) for loc in e['loc']) or 'ligne'}: {e['msg']}" for e in errors)
+
+
+def validate_batch(adapter: TypeAdapter, records: List[Tuple[int, dict]], errors: ErrorReport) -> List[tuple]:
+    """
+    Valide un lot (numéro de ligne, dict) en un seul appel avec un
+    TypeAdapter de liste ; en cas d'erreur, les lignes fautives sont
+    signalées et le reste du lot est revalidé sans elles.
+    """
+    try:
+        validated = adapter.validate_python([record for _, record in records])
+        return [(line_no, item) for (line_no, _), item in zip(records, validated)]
+    except ValidationError as e:
+        by_index: Dict[int, List[dict]] = {}
+        for err in e.errors():
+            by_index.setdefault(err["loc"][0], []).append({**err, "loc": err["loc"][1:]})
+    for index in sorted(by_index):
+        errors.add(f"Ligne {records[index][0]}: {format_validation_errors(by_index[index])}")
+    valid = [item for index, item in enumerate(records) if index not in by_index]
+    return validate_batch(adapter, valid, errors) if valid else []
@@ -0,0 +1,96 @@
+"""
+Encodage compact négocié pour les terminaux de terrain (liaisons lentes).
+
+Les réponses sont en MessagePack si le client l'accepte
+(`Accept: application/msgpack`), en JSON sinon, et compressées en gzip
+si `Accept-Encoding` le permet. Les corps reçus suivent les mêmes règles
+(`Content-Type`, `Content-Encoding`).
+"""
+import gzip
+import json
+import os
+import zlib
+from typing import Any
+
+from fastapi import HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import run_in_threadpool
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+# En deçà, la compression ne vaut pas son coût
+COMPACT_GZIP_MIN_BYTES = int(os.getenv("COMPACT_GZIP_MIN_BYTES", "1024"))
+COMPACT_GZIP_LEVEL = int(os.getenv("COMPACT_GZIP_LEVEL", "6"))
+# Taille maximale d'un corps reçu, une fois décompressé
+COMPACT_MAX_BODY_BYTES = int(os.getenv("COMPACT_MAX_BODY_BYTES", str(32 * 1024 * 1024)))
+
+
+def _wants_msgpack(header: str) -> bool:
+    return any(media_type in header for media_type in MSGPACK_MEDIA_TYPES)
+
+
+def compact_response(request: Request, content: Any, status_code: int = 200) -> Response:
+    """`content` doit être composé de types JSON (dates déjà converties)"""
+    if _wants_msgpack(request.headers.get("accept", "")):
+        import msgpack
+
+        body = msgpack.packb(content, use_bin_type=True)
+        media_type = MSGPACK_MEDIA_TYPES[0]
+    else:
+        body = json.dumps(jsonable_encoder(content), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        media_type = "application/json"
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if len(body) >= COMPACT_GZIP_MIN_BYTES and "gzip" in request.headers.get("accept-encoding", ""):
+        body = gzip.compress(body, compresslevel=COMPACT_GZIP_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=headers)
+
+
+async def _read_limited(request: Request) -> bytes:
+    """Corps reçu au fil de l'eau (décompressé) ; 413 dès que COMPACT_MAX_BODY_BYTES est dépassé"""
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > COMPACT_MAX_BODY_BYTES:
+        raise HTTPException(status_code=413, detail="Corps trop volumineux")
+    decompressor = None
+    if request.headers.get("content-encoding", "").lower() == "gzip":
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    chunks, received, size = [], 0, 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if decompressor is not None:
+                # Sortie bornée : une bombe gzip n'est jamais décompressée en entier
+                chunk = decompressor.decompress(chunk, COMPACT_MAX_BODY_BYTES - size + 1)
+                if decompressor.unconsumed_tail:
+                    raise HTTPException(status_code=413, detail="Corps trop volumineux")
+            size += len(chunk)
+            if size > COMPACT_MAX_BODY_BYTES or received > COMPACT_MAX_BODY_BYTES:
+                raise HTTPException(status_code=413, detail="Corps trop volumineux")
+            chunks.append(chunk)
+        if decompressor is not None:
+            chunk = decompressor.flush()
+            if not decompressor.eof:
+                raise HTTPException(status_code=400, detail="Corps gzip tronqué")
+            if size + len(chunk) > COMPACT_MAX_BODY_BYTES:
+                raise HTTPException(status_code=413, detail="Corps trop volumineux")
+            chunks.append(chunk)
+    except zlib.error:
+        raise HTTPException(status_code=400, detail="Corps gzip invalide")
+    return b"".join(chunks)
+
+
+def _parse(body: bytes, msgpack_body: bool) -> Any:
+    if msgpack_body:
+        import msgpack
+
+        # Horodatages MessagePack : datetime UTC avec fuseau
+        return msgpack.unpackb(body, raw=False, timestamp=3)
+    return json.loads(body)
+
+
+async def read_compact_body(request: Request) -> Any:
+    """Corps JSON ou MessagePack, éventuellement compressé en gzip ; décodé hors de la boucle d'événements"""
+    body = await _read_limited(request)
+    try:
+        return await run_in_threadpool(_parse, body, _wants_msgpack(request.headers.get("content-type", "")))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Corps illisible")
@@ -0,0 +1,51 @@
+"""
+Choix des stratégies de chargement à partir des schémas de réponse.
+
+Les relations SQLAlchemy sont paresseuses par défaut : sérialiser une liste
+d'objets dont le schéma imbrique des relations déclenche une requête par
+ligne et par relation. `eager_options` parcourt le schéma pydantic qui sera
+sérialisé et renvoie les options de chargement correspondantes :
+`joinedload` pour les relations vers un objet unique, `selectinload` pour
+les collections, récursivement pour les schémas imbriqués.
+"""
+from functools import lru_cache
+from typing import FrozenSet, List, Optional, Type, Union, get_args, get_origin
+
+from pydantic import BaseModel
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, selectinload
+
+
+def _nested_schema(annotation) -> Optional[Type[BaseModel]]:
+    """Schéma pydantic contenu dans une annotation (Optional[X], List[X]...)"""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    if get_origin(annotation) in (Union, list, List, tuple, set):
+        for arg in get_args(annotation):
+            nested = _nested_schema(arg)
+            if nested is not None:
+                return nested
+    return None
+
+
+@lru_cache(maxsize=256)
+def _eager_options(model, schema: Type[BaseModel], fields: Optional[FrozenSet[str]]) -> tuple:
+    relationships = inspect(model).relationships
+    options = []
+    for name, field in schema.model_fields.items():
+        if fields is not None and name not in fields:
+            continue
+        relationship = relationships.get(name)
+        nested = _nested_schema(field.annotation)
+        if relationship is None or nested is None:
+            continue
+        attribute = getattr(model, name)
+        loader = selectinload(attribute) if relationship.uselist else joinedload(attribute)
+        sub_options = _eager_options(relationship.mapper.class_, nested, None)
+        options.append(loader.options(*sub_options) if sub_options else loader)
+    return tuple(options)
+
+
+def eager_options(model, schema: Type[BaseModel], fields=None) -> list:
+    """Options de chargement des relations que `schema` sérialisera (limitées à `fields`)"""
+    return list(_eager_options(model, schema, frozenset(fields) if fields is not None else None))
@@ -0,0 +1,83 @@
+"""
+Réponses fichier avec ETag, If-None-Match et requêtes partielles (Range).
+
+Le FileResponse de Starlette 0.27 ne gère pas `Range` : les reprises de
+téléchargement sur liaison instable et la lecture partielle par les
+navigateurs relisaient tout le fichier. Une seule plage est servie ; une
+demande de plusieurs plages reçoit le fichier entier (autorisé par la RFC).
+"""
+import os
+import re
+from typing import AsyncIterator, Optional, Tuple
+
+import aiofiles
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+CHUNK_SIZE = 64 * 1024
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """(début, fin incluse), ou None pour servir le fichier entier ; ValueError si insatisfiable"""
+    match = _RANGE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffixe : les n derniers octets
+        length = int(last)
+        if not length:
+            raise ValueError("Plage vide")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Plage hors du fichier")
+    return start, end
+
+
+async def _read(path: str, start: int, length: int) -> AsyncIterator[bytes]:
+    async with aiofiles.open(path, "rb") as file:
+        await file.seek(start)
+        while length > 0:
+            chunk = await file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def file_response(request: Request, path: str, media_type: str, etag: str,
+                  cache_control: str, size: Optional[int] = None) -> Response:
+    """Fichier servi par morceaux (aiofiles), en entier ou sur la plage demandée ; corps vide pour HEAD"""
+    size = os.path.getsize(path) if size is None else size
+    quoted = f'"{etag}"'
+    headers = {"ETag": quoted, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+    if quoted in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    span = None
+    range_header = request.headers.get("range")
+    # If-Range : la plage n'est servie que si la version n'a pas changé
+    if range_header and request.headers.get("if-range", quoted) == quoted:
+        try:
+            span = _parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    status_code = 200
+    start, length = 0, size
+    if span is not None:
+        start, end = span
+        length = end - start + 1
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(length)
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    return StreamingResponse(_read(path, start, length), status_code=status_code, headers=headers,
+                             media_type=media_type)
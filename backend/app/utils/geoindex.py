@@ -0,0 +1,330 @@
+"""
+Index spatial en mémoire (grille régulière) pour les requêtes de proximité.
+
+Les points sont projetés en mètres (projection équirectangulaire centrée
+sur le jeu de points, adaptée à l'échelle d'un parc) puis rangés par
+cellule de grille. Une requête examine, pour tous les points cherchés à la
+fois (NumPy), les cellules d'un carré de rayon r autour de chacun ; les
+points dont les k voisins ne sont pas garantis sont repris avec un carré
+deux fois plus grand. Les distances renvoyées sont des distances de grand
+cercle (haversine).
+
+La taille des cellules dépend de l'emprise de l'ensemble des points : sur
+des points très groupés (quelques amas dans un grand parc), une cellule
+peut en contenir des milliers. Une telle cellule est elle-même indexée
+par une grille plus fine (récursivement), qui ne fournit que ses k
+meilleurs candidats. Les cellules dont le coin le plus proche est plus
+loin qu'une borne de la k-ième distance sont écartées avant d'examiner
+leurs points, et les candidats sont évalués par lots bornés : la mémoire
+ne dépend pas de la répartition des points.
+"""
+import math
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_M = 6_371_008.8
+
+# Nombre moyen de points visé par cellule
+POINTS_PER_CELL = 2.0
+MIN_CELL_SIZE_M = 10.0
+# Cellules de plus de DENSE_CELL_POINTS points : sous-grille de
+# SUBGRID_SIDE × SUBGRID_SIDE cellules (au plus MAX_GRID_DEPTH niveaux,
+# cellules d'au moins MIN_SUBCELL_SIZE_M)
+DENSE_CELL_POINTS = 64
+SUBGRID_SIDE = 16
+MAX_GRID_DEPTH = 12
+MIN_SUBCELL_SIZE_M = 0.01
+# Nombre de points cherchés traités ensemble (borne la mémoire de travail)
+QUERY_CHUNK_SIZE = 16384
+# Couples (point cherché, candidat) évalués ensemble
+MAX_CANDIDATES = 1_000_000
+
+
+def haversine_m(lon1, lat1, lon2, lat2) -> np.ndarray:
+    lon1, lat1, lon2, lat2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class GridIndex:
+    """Index de points (id, longitude, latitude) immuable ; reconstruire pour modifier"""
+
+    def __init__(self, ids: Sequence[int], longitudes: Sequence[float], latitudes: Sequence[float],
+                 _origin: Optional[Tuple[float, float]] = None, _depth: int = 0):
+        ids = np.asarray(ids, dtype=np.int64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.size = len(ids)
+        if _origin is not None:
+            # Sous-grille : même projection que la grille parente
+            self._lon0, self._lat0 = _origin
+        else:
+            self._lat0 = math.radians(float(latitudes.mean())) if self.size else 0.0
+            self._lon0 = float(longitudes.mean()) if self.size else 0.0
+
+        x, y = self._project(longitudes, latitudes)
+        if self.size:
+            self._x0, self._y0 = float(x.min()), float(y.min())
+            width, height = float(x.max()) - self._x0, float(y.max()) - self._y0
+        else:
+            self._x0 = self._y0 = width = height = 0.0
+        if _depth:
+            # Sous-grille : peu de cellules, elles-mêmes subdivisées si denses
+            self.cell_size = max(max(width, height) / SUBGRID_SIDE, MIN_SUBCELL_SIZE_M)
+        else:
+            area = max(width * height, MIN_CELL_SIZE_M ** 2)
+            self.cell_size = max(math.sqrt(area * POINTS_PER_CELL / max(self.size, 1)), MIN_CELL_SIZE_M)
+        self._nx = int(width // self.cell_size) + 1
+        self._ny = int(height // self.cell_size) + 1
+
+        cells = self._cell_ids(*self._cells(x, y))
+        order = np.argsort(cells, kind="stable")
+        self.ids = ids[order]
+        self.longitudes = longitudes[order]
+        self.latitudes = latitudes[order]
+        self._x, self._y = x[order], y[order]
+        # Les points de la cellule c sont aux positions _starts[c]:_starts[c + 1]
+        self._starts = np.searchsorted(cells[order], np.arange(self._nx * self._ny + 1))
+        self._occupied = np.flatnonzero(np.diff(self._starts))
+
+        # Cellules denses -> sous-grille dont les identifiants sont nos positions
+        self._children = {}
+        self._dense = np.zeros(self._nx * self._ny, dtype=bool)
+        if _depth < MAX_GRID_DEPTH:
+            for cell in np.nonzero(np.diff(self._starts) > DENSE_CELL_POINTS)[0].tolist():
+                lo, hi = int(self._starts[cell]), int(self._starts[cell + 1])
+                child = GridIndex(
+                    np.arange(lo, hi), self.longitudes[lo:hi], self.latitudes[lo:hi],
+                    _origin=(self._lon0, self._lat0), _depth=_depth + 1,
+                )
+                # Points confondus : rien à gagner à subdiviser
+                if child._nx * child._ny > 1:
+                    self._children[cell] = child
+                    self._dense[cell] = True
+
+    # --- Géométrie ---
+
+    def _project(self, longitudes, latitudes) -> Tuple[np.ndarray, np.ndarray]:
+        x = np.radians(np.asarray(longitudes, dtype=np.float64) - self._lon0) * math.cos(self._lat0) * EARTH_RADIUS_M
+        y = np.radians(np.asarray(latitudes, dtype=np.float64)) * EARTH_RADIUS_M
+        return x, y
+
+    def _cells(self, x, y) -> Tuple[np.ndarray, np.ndarray]:
+        cx = np.clip(((x - self._x0) // self.cell_size).astype(np.int64), 0, self._nx - 1)
+        cy = np.clip(((y - self._y0) // self.cell_size).astype(np.int64), 0, self._ny - 1)
+        return cx, cy
+
+    def _cell_ids(self, cx, cy) -> np.ndarray:
+        return cy * self._nx + cx
+
+    def _outside_distance(self, x, y) -> np.ndarray:
+        """Distance entre le point cherché et l'emprise de la grille (0 à l'intérieur)"""
+        x1 = self._x0 + self._nx * self.cell_size
+        y1 = self._y0 + self._ny * self.cell_size
+        dx = np.maximum(np.maximum(self._x0 - x, x - x1), 0.0)
+        dy = np.maximum(np.maximum(self._y0 - y, y - y1), 0.0)
+        return np.hypot(dx, dy)
+
+    def _box_candidates(self, x, y, cx, cy, r: int, k: int):
+        """
+        Couples (indice de requête, position de point) des cellules situées à
+        moins de r cellules de (cx, cy), par lots d'environ MAX_CANDIDATES
+        couples : (première requête, dernière + 1, requêtes relatives au lot
+        et triées, positions, couples (requête, cellule dense), borne de la
+        k-ième distance² de chaque requête).
+        """
+        steps = np.arange(-r, r + 1, dtype=np.int64)
+        # Grands carrés : parcours des seules cellules occupées
+        by_occupied = len(steps) ** 2 > len(self._occupied)
+        chunk = max(1, MAX_CANDIDATES // min(len(steps) ** 2, max(len(self._occupied), 1)))
+        for start in range(0, len(cx), chunk):
+            bx, by = cx[start:start + chunk], cy[start:start + chunk]
+            if by_occupied:
+                ox, oy = self._occupied % self._nx, self._occupied // self._nx
+                valid = (np.abs(ox[None, :] - bx[:, None]) <= r) & (np.abs(oy[None, :] - by[:, None]) <= r)
+                cells = np.broadcast_to(self._occupied[None, :], valid.shape)[valid]
+                queries = np.broadcast_to(np.arange(len(bx))[:, None], valid.shape)[valid]
+            else:
+                qx = np.broadcast_to(bx[:, None, None] + steps[None, None, :], (len(bx), len(steps), len(steps)))
+                qy = np.broadcast_to(by[:, None, None] + steps[None, :, None], qx.shape)
+                valid = (qx >= 0) & (qx < self._nx) & (qy >= 0) & (qy < self._ny)
+                cells = self._cell_ids(qx[valid], qy[valid])
+                queries = np.broadcast_to(np.arange(len(bx))[:, None, None], qx.shape)[valid]
+                occupied = self._starts[cells + 1] > self._starts[cells]
+                queries, cells = queries[occupied], cells[occupied]
+            queries, cells, bound2 = self._prune_cells(
+                x[start:start + chunk], y[start:start + chunk], queries, cells, len(bx), k
+            )
+            starts = self._starts[cells]
+            counts = self._starts[cells + 1] - starts
+            # Une cellule dense ne fournit que les k candidats de sa sous-grille
+            dense = self._dense[cells]
+            counts[dense] = 0
+
+            totals = np.cumsum(np.bincount(queries, weights=counts + dense * k, minlength=len(bx)))
+            cuts = np.searchsorted(totals, np.arange(MAX_CANDIDATES, totals[-1], MAX_CANDIDATES), side="right")
+            edges = np.unique(np.concatenate(([0], cuts, [len(bx)])))
+            for first, last in zip(edges[:-1].tolist(), edges[1:].tolist()):
+                lo, hi = np.searchsorted(queries, [first, last])
+                batch_counts = counts[lo:hi]
+                total = int(batch_counts.sum())
+                # Expansion vectorisée des plages [start, start + count)
+                offsets = np.repeat(np.cumsum(batch_counts) - batch_counts, batch_counts)
+                positions = np.repeat(starts[lo:hi], batch_counts) + (np.arange(total) - offsets)
+                batch_dense = dense[lo:hi]
+                yield (
+                    start + first, start + last, np.repeat(queries[lo:hi] - first, batch_counts), positions,
+                    queries[lo:hi][batch_dense] - first, cells[lo:hi][batch_dense], bound2[first:last],
+                )
+
+    def _prune_cells(self, x, y, queries, cells, n: int, k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Écarte les cellules qui ne peuvent contenir aucun des k plus proches
+        voisins : leur coin le plus proche est plus loin que le coin le plus
+        éloigné d'une cellule d'au moins k points. Renvoie (requêtes,
+        cellules) toujours triés par requête, et cette borne de la k-ième
+        distance² pour chaque requête.
+        """
+        left = self._x0 + (cells % self._nx) * self.cell_size
+        bottom = self._y0 + (cells // self._nx) * self.cell_size
+        px, py = x[queries], y[queries]
+        near2 = (np.maximum(np.maximum(left - px, px - left - self.cell_size), 0.0) ** 2
+                 + np.maximum(np.maximum(bottom - py, py - bottom - self.cell_size), 0.0) ** 2)
+        far2 = (np.maximum(px - left, left + self.cell_size - px) ** 2
+                + np.maximum(py - bottom, bottom + self.cell_size - py) ** 2)
+
+        bound2 = np.full(n, np.inf)
+        enough = (self._starts[cells + 1] - self._starts[cells]) >= k
+        bounded = queries[enough]
+        if len(bounded):
+            firsts = np.flatnonzero(np.r_[True, bounded[1:] != bounded[:-1]])
+            bound2[bounded[firsts]] = np.minimum.reduceat(far2[enough], firsts)
+
+        kept = near2 <= bound2[queries]
+        return queries[kept], cells[kept], bound2
+
+    def _dense_candidates(self, x, y, queries, cells, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """k meilleurs candidats de chaque couple (requête, cellule dense)"""
+        found_queries, found_positions = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+        order = np.argsort(cells, kind="stable")
+        queries, cells = queries[order], cells[order]
+        bounds = np.flatnonzero(np.diff(cells)) + 1
+        for group_queries, cell in zip(np.split(queries, bounds), cells[np.r_[0, bounds]].tolist()):
+            child = self._children[cell]
+            pos = child._search(x[group_queries], y[group_queries], k, None)
+            rows, cols = np.nonzero(pos >= 0)
+            found_queries.append(group_queries[rows])
+            found_positions.append(child.ids[pos[rows, cols]])
+        return np.concatenate(found_queries), np.concatenate(found_positions)
+
+    # --- Requêtes ---
+
+    def nearest(self, longitudes, latitudes, k: int = 1,
+                max_distance: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        k plus proches voisins de chaque point.
+
+        Renvoie (ids, distances en mètres), de forme (n, k) ; les places non
+        pourvues (index trop petit ou au-delà de `max_distance`) valent -1 / inf.
+        """
+        longitudes = np.atleast_1d(np.asarray(longitudes, dtype=np.float64))
+        latitudes = np.atleast_1d(np.asarray(latitudes, dtype=np.float64))
+        n = len(longitudes)
+        best_pos = np.full((n, k), -1, dtype=np.int64)
+        if self.size:
+            for start in range(0, n, QUERY_CHUNK_SIZE):
+                end = start + QUERY_CHUNK_SIZE
+                x, y = self._project(longitudes[start:end], latitudes[start:end])
+                best_pos[start:end] = self._search(x, y, k, max_distance)
+
+        ids = np.full((n, k), -1, dtype=np.int64)
+        distances = np.full((n, k), np.inf)
+        rows, cols = np.nonzero(best_pos >= 0)
+        pos = best_pos[rows, cols]
+        ids[rows, cols] = self.ids[pos]
+        distances[rows, cols] = haversine_m(
+            longitudes[rows], latitudes[rows], self.longitudes[pos], self.latitudes[pos]
+        )
+        if max_distance is not None:
+            beyond = distances > max_distance
+            ids[beyond] = -1
+            distances[beyond] = np.inf
+        return ids, distances
+
+    def within_distance(self, longitudes, latitudes, distance: float) -> np.ndarray:
+        """Masque des points situés à moins de `distance` mètres d'un point de l'index"""
+        _, distances = self.nearest(longitudes, latitudes, k=1, max_distance=distance)
+        return np.isfinite(distances[:, 0])
+
+    def _search(self, x, y, k: int, max_distance: Optional[float]) -> np.ndarray:
+        """Positions des k plus proches voisins des points projetés (x, y), -1 si non pourvues"""
+        cx, cy = self._cells(x, y)
+        outside2 = self._outside_distance(x, y) ** 2
+        best_pos = np.full((len(x), k), -1, dtype=np.int64)
+        active = np.arange(len(x))
+        max_ring = max(self._nx, self._ny)
+
+        r = 1
+        while len(active):
+            r = min(r, max_ring)
+            kth_d2 = np.empty(len(active))
+            pos = np.empty((len(active), k), dtype=np.int64)
+            for first, last, queries, positions, dense_queries, dense_cells, bound2 in self._box_candidates(
+                x[active], y[active], cx[active], cy[active], r, k
+            ):
+                rows = active[first:last]
+                if len(dense_queries):
+                    extra_queries, extra_positions = self._dense_candidates(
+                        x[rows], y[rows], dense_queries, dense_cells, k
+                    )
+                    queries = np.concatenate((queries, extra_queries))
+                    positions = np.concatenate((positions, extra_positions))
+                d2 = (x[rows[queries]] - self._x[positions]) ** 2 + (y[rows[queries]] - self._y[positions]) ** 2
+                # Candidats au-delà de la borne : inutile de les trier
+                kept = d2 <= bound2[queries]
+                kth_d2[first:last], pos[first:last] = self._k_smallest(
+                    queries[kept], positions[kept], d2[kept], last - first, k
+                )
+
+            # Les points hors du carré sont à au moins r cellules du projeté q'
+            # du point cherché q sur la grille ; la grille étant convexe,
+            # |p - q|² >= |p - q'|² + |q - q'|²
+            bound2 = (r * self.cell_size) ** 2 + outside2[active]
+            done = (kth_d2 <= bound2) | (r >= max_ring)
+            if max_distance is not None:
+                done |= bound2 > max_distance ** 2
+            best_pos[active[done]] = pos[done]
+            active = active[~done]
+            r *= 2
+        return best_pos
+
+    @staticmethod
+    def _k_smallest(queries, positions, d2, n: int, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        k plus petites distances par requête : (k-ième distance², positions
+        triées). Candidats regroupés par requête puis k passes de minimum
+        par groupe, sans matrice requêtes × candidats ni tri des distances.
+        """
+        if len(queries) > 1 and np.any(queries[1:] < queries[:-1]):
+            order = np.argsort(queries, kind="stable")
+            queries, positions, d2 = queries[order], positions[order], d2[order]
+        else:
+            d2 = d2.copy()
+        best = np.full((n, k), np.inf)
+        selected = np.full((n, k), -1, dtype=np.int64)
+        if not len(queries):
+            return best[:, k - 1], selected
+
+        firsts = np.flatnonzero(np.r_[True, queries[1:] != queries[:-1]])
+        sizes = np.diff(np.r_[firsts, len(queries)])
+        for rank in range(k):
+            minima = np.minimum.reduceat(d2, firsts)
+            hits = np.flatnonzero(d2 == np.repeat(minima, sizes))
+            hits = hits[np.r_[True, queries[hits][1:] != queries[hits][:-1]]]
+            found = np.isfinite(d2[hits])
+            hits = hits[found]
+            best[queries[hits], rank] = d2[hits]
+            selected[queries[hits], rank] = positions[hits]
+            d2[hits] = np.inf
+        return best[:, k - 1], selected
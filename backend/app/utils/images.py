@@ -0,0 +1,60 @@
+"""
+Traitements d'images exécutés dans le pool de processus des photos.
+
+Module volontairement léger : il est importé par les processus du pool,
+démarrés en `spawn`, et par l'API, qui ne charge Pillow qu'au premier
+envoi de photo.
+"""
+import os
+from typing import List, Tuple
+
+# Formats acceptés : format Pillow -> (type MIME, extension)
+SUPPORTED_FORMATS = {
+    "JPEG": ("image/jpeg", "jpg"),
+    "PNG": ("image/png", "png"),
+    "WEBP": ("image/webp", "webp"),
+}
+
+
+def probe_image(path: str) -> Tuple[str, int, int]:
+    """(format, largeur, hauteur) ; ValueError si le fichier n'est pas une image acceptée"""
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            image_format, (width, height) = image.format, image.size
+            image.verify()
+    except Image.DecompressionBombError:
+        raise ValueError("Image trop grande")
+    except (OSError, SyntaxError):
+        raise ValueError("Fichier non reconnu comme image")
+    if image_format not in SUPPORTED_FORMATS:
+        raise ValueError(f"Format d'image non supporté: {image_format}")
+    return image_format, width, height
+
+
+def make_variants(source: str, variants: List[Tuple[str, int]], quality: int) -> List[str]:
+    """
+    Écrit les variantes WebP (chemin, plus grand côté) de `source`, sans
+    métadonnées EXIF ; chaque fichier est écrit à côté puis renommé.
+    """
+    from PIL import Image, ImageOps
+
+    largest = max(size for _, size in variants)
+    with Image.open(source) as image:
+        # JPEG : décodage directement à une échelle réduite (1/2, 1/4, 1/8)
+        image.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        written = []
+        for path, size in sorted(variants, key=lambda variant: -variant[1]):
+            variant = image.copy()
+            variant.thumbnail((size, size), Image.LANCZOS)
+            partial = f"{path}.{os.getpid()}.part"
+            variant.save(partial, "WEBP", quality=quality, method=4)
+            os.replace(partial, path)
+            written.append(path)
+            # Les variantes suivantes, plus petites, partent de celle-ci
+            image = variant
+    return written
@@ -0,0 +1,596 @@
+"""
+Mesures de performance exposées au format Prometheus (/metrics).
+
+- MetricsMiddleware mesure chaque requête HTTP par route (modèle de chemin,
+  pas l'URL) : durée, nombre d'instructions SQL, temps passé en base,
+  attente et durée de détention d'une connexion du pool. Les compteurs
+  par requête sont ceux de app.utils.query_counter.
+- install_metrics() ajoute sur le moteur la durée de chaque instruction et
+  l'échantillonnage des requêtes lentes (instruction, paramètres, route).
+- InstrumentedQueuePool mesure l'attente d'une connexion et les délais
+  dépassés ; pool_status() alimente /health.
+- process_status() : durées de démarrage et mémoire (RSS, PSS, partagée)
+  du processus, dans /health et /metrics.
+
+Serveur préforké (app.server) : chaque worker écrit ses valeurs dans un
+répertoire partagé (METRICS_MULTIPROC_DIR, toutes les
+METRICS_FLUSH_SECONDS et à chaque scrape) ; le worker qui répond au scrape
+les agrège. Compteurs et histogrammes sont sommés (ceux des workers
+arrêtés sont conservés), les jauges sont rendues par worker (étiquette
+`worker`). Sans répertoire partagé, les valeurs sont celles du processus.
+"""
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+from app.utils.query_counter import current_counter, track_queries
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_SAMPLES = int(os.getenv("SLOW_QUERY_SAMPLES", "100"))
+# Les paramètres peuvent contenir des données personnelles : désactivable
+SLOW_QUERY_PARAMETERS = os.getenv("SLOW_QUERY_PARAMETERS", "true").lower() in ("1", "true", "yes", "on")
+_MAX_SAMPLE_LENGTH = 2000
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+
+
+# === Registre ===
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def values(self) -> List[tuple]:
+        """Valeurs courantes : (étiquettes, valeur)"""
+        raise NotImplementedError
+
+    def samples(self, values: List[tuple]) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self, values: Optional[List[tuple]] = None) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples(self.values() if values is None else values))
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def values(self):
+        with self._lock:
+            return list(self._values.items())
+
+    @staticmethod
+    def merge(total, value):
+        return total + value
+
+    def samples(self, values):
+        for labels, value in sorted(values):
+            yield f"{self.name}{_labels(self.label_names, labels)} {_number(value)}"
+
+
+class Gauge(Metric):
+    """Valeur lue au moment du scrape ; par worker (étiquette `worker`) en mode préforké"""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, callback):
+        super().__init__(name, documentation)
+        self.callback = callback
+
+    def values(self):
+        return [((), self.callback())]
+
+    def samples(self, values):
+        for labels, value in sorted(values):
+            yield f"{self.name}{_labels(('worker',) if labels else (), labels)} {_number(value)}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        # Par jeu d'étiquettes : effectifs par tranche (non cumulés), somme, nombre
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = len(self.buckets)
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = position
+                break
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def values(self):
+        with self._lock:
+            return [(labels, [list(counts), total, count]) for labels, (counts, total, count) in self._values.items()]
+
+    @staticmethod
+    def merge(total, value):
+        return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1], total[2] + value[2]]
+
+    def samples(self, values):
+        for labels, (counts, total, count) in sorted(values):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        if _shared_dir is None:
+            return "\n".join(metric.render() for metric in self._metrics) + "\n"
+        self.flush()
+        merged = _read_shared(self._metrics)
+        return "\n".join(metric.render(merged.get(metric.name, [])) for metric in self._metrics) + "\n"
+
+    def snapshot(self) -> dict:
+        return {
+            metric.name: [[list(labels), value] for labels, value in metric.values()]
+            for metric in self._metrics
+        }
+
+    def flush(self) -> None:
+        """Écrit les valeurs du processus dans le répertoire partagé"""
+        if _shared_dir is not None:
+            _write_json(os.path.join(_shared_dir, f"{os.getpid()}.json"), self.snapshot())
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "Requêtes HTTP traitées", ("method", "route", "status"),
+))
+http_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Durée des requêtes HTTP", ("method", "route"),
+))
+http_sql_statements = registry.register(Histogram(
+    "http_request_sql_statements", "Instructions SQL par requête HTTP", ("method", "route"), STATEMENT_BUCKETS,
+))
+http_db_seconds = registry.register(Histogram(
+    "http_request_db_seconds", "Temps d'exécution SQL par requête HTTP", ("method", "route"),
+))
+http_pool_wait = registry.register(Histogram(
+    "http_request_pool_wait_seconds", "Attente de connexions du pool par requête HTTP", ("method", "route"),
+    POOL_WAIT_BUCKETS,
+))
+http_connection_held = registry.register(Histogram(
+    "http_request_connection_held_seconds", "Détention de connexions du pool par requête HTTP", ("method", "route"),
+))
+db_statement_duration = registry.register(Histogram(
+    "db_statement_duration_seconds", "Durée des instructions SQL",
+))
+db_slow_statements = registry.register(Counter(
+    "db_slow_statements_total", "Instructions SQL plus longues que SLOW_QUERY_MS", ("route",),
+))
+pool_wait = registry.register(Histogram(
+    "db_pool_checkout_wait_seconds", "Attente d'une connexion du pool", buckets=POOL_WAIT_BUCKETS,
+))
+pool_timeouts = registry.register(Counter(
+    "db_pool_checkout_timeouts_total", "Connexions du pool non obtenues dans DB_POOL_TIMEOUT",
+))
+
+
+# === Agrégation entre workers (répertoire partagé) ===
+
+_shared_dir: Optional[str] = None
+_ARCHIVE = "archived"
+
+
+def _write_json(path: str, content) -> None:
+    # Remplacement atomique : un lecteur ne voit jamais un fichier partiel
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as out:
+        json.dump(content, out, separators=(",", ":"))
+    os.replace(temporary, path)
+
+
+def _read_json(path: str) -> dict:
+    try:
+        with open(path) as source:
+            return json.load(source)
+    except (OSError, ValueError):
+        return {}
+
+
+def _read_shared(metrics: List[Metric]) -> Dict[str, List[tuple]]:
+    kinds = {metric.name: metric for metric in metrics}
+    totals: Dict[str, Dict[tuple, object]] = {name: {} for name in kinds}
+    for path in glob.glob(os.path.join(_shared_dir, "*.json")):
+        worker = os.path.basename(path)[:-len(".json")]
+        for name, values in _read_json(path).items():
+            metric = kinds.get(name)
+            if metric is None:
+                continue
+            for labels, value in values:
+                if isinstance(metric, Gauge):
+                    if worker != _ARCHIVE:
+                        totals[name][(worker,)] = value
+                    continue
+                labels = tuple(labels)
+                current = totals[name].get(labels)
+                totals[name][labels] = value if current is None else metric.merge(current, value)
+    return {name: list(values.items()) for name, values in totals.items()}
+
+
+def enable_multiprocess(directory: str) -> None:
+    """
+    Active l'agrégation entre workers ; à appeler dans le processus maître
+    avant le fork (les valeurs d'une exécution précédente sont effacées)
+    """
+    global _shared_dir
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        os.remove(path)
+    _shared_dir = directory
+
+
+def mark_process_dead(pid: int) -> None:
+    """Worker arrêté (processus maître) : ses compteurs et histogrammes rejoignent l'archive"""
+    if _shared_dir is None:
+        return
+    path = os.path.join(_shared_dir, f"{pid}.json")
+    values = _read_json(path)
+    if values:
+        archive_path = os.path.join(_shared_dir, f"{_ARCHIVE}.json")
+        archive = _read_json(archive_path)
+        for metric in registry._metrics:
+            if isinstance(metric, Gauge) or metric.name not in values:
+                continue
+            merged = {tuple(labels): value for labels, value in archive.get(metric.name, [])}
+            for labels, value in values[metric.name]:
+                labels = tuple(labels)
+                merged[labels] = value if labels not in merged else metric.merge(merged[labels], value)
+            archive[metric.name] = [[list(labels), value] for labels, value in merged.items()]
+        _write_json(archive_path, archive)
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class MetricsFlusher:
+    """Écriture périodique des valeurs du worker dans le répertoire partagé"""
+
+    def __init__(self, interval: float = METRICS_FLUSH_SECONDS):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if _shared_dir is None or self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        self._flush()
+
+    def _flush(self) -> None:
+        try:
+            registry.flush()
+        except OSError:
+            logger.exception("Écriture des mesures dans %s impossible", _shared_dir)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._flush()
+
+
+metrics_flusher = MetricsFlusher()
+
+
+# === Pool de connexions ===
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool qui mesure l'attente d'une connexion et compte les demandes en attente"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waiting = 0
+        self._waiting_lock = threading.Lock()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        with self._waiting_lock:
+            self.waiting += 1
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_timeouts.inc()
+            raise
+        finally:
+            with self._waiting_lock:
+                self.waiting -= 1
+            waited = time.perf_counter() - start
+            pool_wait.observe(waited)
+            counter = current_counter()
+            if counter is not None:
+                counter.pool_wait += waited
+
+
+def pool_status(engine) -> dict:
+    """Occupation du pool synchrone (saturation = connexions prêtées / capacité)"""
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {"class": type(pool).__name__}
+    capacity = pool.size() + max(pool._max_overflow, 0)
+    checked_out = pool.checkedout()
+    return {
+        "size": pool.size(),
+        "max_overflow": pool._max_overflow,
+        "checked_out": checked_out,
+        "idle": pool.checkedin(),
+        "waiting": getattr(pool, "waiting", None),
+        "saturation": round(checked_out / capacity, 3) if capacity else None,
+    }
+
+
+def _register_pool_gauges(engine) -> None:
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return
+    registry.register(Gauge("db_pool_size", "Taille du pool", lambda: engine.pool.size()))
+    registry.register(Gauge("db_pool_checked_out", "Connexions prêtées", lambda: engine.pool.checkedout()))
+    registry.register(Gauge(
+        "db_pool_waiting", "Demandes en attente d'une connexion", lambda: getattr(engine.pool, "waiting", 0),
+    ))
+
+
+# === Instructions SQL ===
+
+_slow_samples: deque = deque(maxlen=SLOW_QUERY_SAMPLES)
+
+
+def slow_queries() -> List[dict]:
+    """Échantillons récents de requêtes lentes, les plus récentes d'abord"""
+    return list(reversed(_slow_samples))
+
+
+def _truncate(value) -> str:
+    text = value if isinstance(value, str) else repr(value)
+    return text if len(text) <= _MAX_SAMPLE_LENGTH else text[:_MAX_SAMPLE_LENGTH] + "…"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("metrics_start_time")
+    if not starts:
+        return
+    duration = time.perf_counter() - starts.pop()
+    db_statement_duration.observe(duration)
+    if duration * 1000 < SLOW_QUERY_MS:
+        return
+    counter = current_counter()
+    route = counter.route() if counter is not None and counter.route is not None else "-"
+    db_slow_statements.inc(route)
+    _slow_samples.append({
+        "at": datetime.utcnow().isoformat(timespec="seconds"),
+        "route": route,
+        "duration_ms": round(duration * 1000, 1),
+        "statement": _truncate(statement),
+        "parameters": _truncate(parameters) if SLOW_QUERY_PARAMETERS else None,
+        "executemany": executemany,
+    })
+
+
+def _checkout(dbapi_connection, connection_record, connection_proxy):
+    counter = current_counter()
+    if counter is not None:
+        connection_record.info["metrics_checkout"] = (counter, time.perf_counter())
+
+
+def _checkin(dbapi_connection, connection_record):
+    checkout = connection_record.info.pop("metrics_checkout", None)
+    if checkout is not None:
+        counter, start = checkout
+        counter.connection_held += time.perf_counter() - start
+
+
+def install_metrics(engine) -> None:
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine.pool, "checkout", _checkout)
+    event.listen(engine.pool, "checkin", _checkin)
+    _register_pool_gauges(engine)
+
+
+# === Processus : démarrage et mémoire (Linux) ===
+
+# Durées de démarrage (s) ; celles du processus maître (préchargement)
+# sont héritées par les workers au fork
+_startup: Dict[str, float] = {}
+
+
+def process_age() -> Optional[float]:
+    """Secondes écoulées depuis la création du processus (fork compris)"""
+    try:
+        with open("/proc/self/stat") as stat:
+            # starttime (22e champ, en ticks depuis le boot), après le nom entre parenthèses
+            started = int(stat.read().rsplit(")", 1)[1].split()[19]) / os.sysconf("SC_CLK_TCK")
+        with open("/proc/uptime") as uptime:
+            return round(float(uptime.read().split()[0]) - started, 2)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def record_startup(phase: str, seconds: Optional[float]) -> None:
+    if seconds is not None:
+        _startup[phase] = round(seconds, 3)
+
+
+def process_memory(pid="self") -> Dict[str, int]:
+    """
+    Mémoire du processus (octets) ; pss répartit les pages partagées entre
+    les processus qui les partagent : la somme des pss des workers est
+    l'empreinte réelle du serveur.
+    """
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as rollup:
+            for line in rollup:
+                key, _, rest = line.partition(":")
+                if rest.strip().endswith("kB"):
+                    values[key] = int(rest.split()[0]) * 1024
+    except (OSError, ValueError):
+        return {}
+    return {
+        "rss": values.get("Rss", 0),
+        "pss": values.get("Pss", 0),
+        "shared": values.get("Shared_Clean", 0) + values.get("Shared_Dirty", 0),
+        "private": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0),
+    }
+
+
+def process_status() -> dict:
+    """Démarrage et mémoire du worker qui répond (pour /health)"""
+    return {
+        "pid": os.getpid(),
+        "startup_s": dict(_startup),
+        "memory_mb": {key: round(value / 2 ** 20, 1) for key, value in process_memory().items()},
+    }
+
+
+registry.register(Gauge(
+    "process_resident_memory_bytes", "Mémoire résidente", lambda: process_memory().get("rss", 0),
+))
+registry.register(Gauge(
+    "process_proportional_memory_bytes", "Mémoire résidente, pages partagées réparties (PSS)",
+    lambda: process_memory().get("pss", 0),
+))
+registry.register(Gauge(
+    "process_shared_memory_bytes", "Mémoire résidente partagée avec d'autres processus",
+    lambda: process_memory().get("shared", 0),
+))
+registry.register(Gauge(
+    "process_ready_seconds", "Durée entre la création du processus et le démarrage de l'application",
+    lambda: _startup.get("ready", 0),
+))
+
+
+# === Requêtes HTTP ===
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI : mesures par route des requêtes HTTP. La durée va
+    jusqu'au dernier octet envoyé (flux compris).
+    """
+
+    def __init__(self, app, excluded: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.excluded = set(excluded)
+        self._routes: Dict[object, str] = {}
+
+    def _route(self, scope) -> str:
+        # Modèle de chemin (/observations/{observation_id}) : cardinalité bornée
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        route = self._routes.get(endpoint)
+        if route is None:
+            for candidate in scope["app"].routes:
+                if getattr(candidate, "endpoint", None) is endpoint:
+                    route = candidate.path
+                    break
+            route = self._routes[endpoint] = route or "unmatched"
+        return route
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.excluded:
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        with track_queries() as counter:
+            counter.route = lambda: self._route(scope)
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                route = self._route(scope)
+                method = scope["method"]
+                http_requests.inc(method, route, str(status))
+                http_duration.observe(time.perf_counter() - start, method, route)
+                http_sql_statements.observe(counter.count, method, route)
+                http_db_seconds.observe(counter.duration, method, route)
+                http_pool_wait.observe(counter.pool_wait, method, route)
+                http_connection_held.observe(counter.connection_held, method, route)
+
+
+def render_metrics() -> str:
+    return registry.render()
@@ -0,0 +1,96 @@
+"""
+Lecture en streaming des corps multipart/form-data.
+
+`request.form()` recopie chaque fichier dans un fichier temporaire avant
+de rendre la main ; ici les morceaux du corps sont passés au fur et à
+mesure au parseur de python-multipart et remis à l'appelant sous forme
+d'événements, sans jamais garder plus d'un morceau reçu en mémoire.
+"""
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+
+from fastapi import HTTPException, Request
+from multipart.multipart import MultipartParser, parse_options_header
+
+
+@dataclass
+class PartInfo:
+    name: str
+    filename: Optional[str]
+    content_type: Optional[str]
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+# ("begin", PartInfo), ("data", bytes) ou ("end", PartInfo)
+PartEvent = Tuple[str, Union[PartInfo, bytes]]
+
+
+class _Collector:
+    """Callbacks du parseur : accumule les événements d'un morceau du corps"""
+
+    def __init__(self):
+        self.events: List[PartEvent] = []
+        self.part: Optional[PartInfo] = None
+        self._headers: Dict[str, str] = {}
+        self._field = b""
+        self._value = b""
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self) -> None:
+        self._headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._value += data[start:end]
+
+    def on_header_end(self) -> None:
+        self._headers[self._field.decode("latin-1").lower()] = self._value.decode("latin-1")
+        self._field = self._value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get("content-disposition", ""))
+        filename = options.get(b"filename")
+        self.part = PartInfo(
+            name=options.get(b"name", b"").decode("utf-8", "replace"),
+            filename=filename.decode("utf-8", "replace") if filename is not None else None,
+            content_type=self._headers.get("content-type"),
+            headers=self._headers,
+        )
+        self.events.append(("begin", self.part))
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        self.events.append(("data", bytes(data[start:end])))
+
+    def on_part_end(self) -> None:
+        self.events.append(("end", self.part))
+
+
+async def iter_multipart(request: Request) -> AsyncIterator[PartEvent]:
+    """Événements des parties d'un corps multipart, dans l'ordre de réception"""
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail="Corps multipart/form-data attendu")
+    collector = _Collector()
+    parser = MultipartParser(boundary, collector.callbacks())
+    async for chunk in request.stream():
+        try:
+            parser.write(chunk)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Corps multipart invalide: {e}")
+        events, collector.events = collector.events, []
+        for event in events:
+            yield event
+    parser.finalize()
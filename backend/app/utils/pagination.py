@@ -0,0 +1,90 @@
+"""
+Pagination par curseur (keyset).
+
+Le curseur encode les valeurs de la clé de tri de la dernière ligne
+renvoyée ; la page suivante repart de cette position avec une comparaison
+de tuple indexable, au lieu d'un OFFSET dont le coût croît avec la
+profondeur.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any, column) -> Any:
+    """Valeur du curseur convertie et vérifiée selon le type de la colonne de tri"""
+    try:
+        expected = column.type.python_type
+    except (AttributeError, NotImplementedError):
+        expected = None
+    if expected is datetime:
+        if not isinstance(value, dict) or not isinstance(value.get("dt"), str):
+            raise ValueError(value)
+        return datetime.fromisoformat(value["dt"])
+    if expected is int:
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise ValueError(value)
+        return value
+    if expected is not None and not isinstance(value, expected):
+        raise ValueError(value)
+    return value
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, key_columns: Sequence) -> Tuple[Any, ...]:
+    """Valeurs de la clé de tri ; 400 si le curseur est illisible ou ne correspond pas à la clé"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, list) or len(values) != len(key_columns):
+            raise ValueError(cursor)
+        return tuple(_decode_value(v, c) for v, c in zip(values, key_columns))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
+
+
+def keyset_paginate(query, key_columns: Sequence, cursor: Optional[str], limit: int,
+                    descending: bool = False, offset: int = 0) -> Tuple[List, Optional[str]]:
+    """
+    Applique tri, position du curseur et limite à `query`.
+
+    Renvoie les lignes de la page et le curseur de la page suivante (None
+    s'il n'y en a pas). Les lignes doivent exposer les colonnes de la clé
+    sous leur nom. `offset` n'est conservé que pour les anciens clients
+    (skip/limit).
+    """
+    key = tuple_(*key_columns)
+    if cursor:
+        position = tuple_(*decode_cursor(cursor, key_columns))
+        query = query.filter(key < position if descending else key > position)
+    order = [c.desc() for c in key_columns] if descending else list(key_columns)
+    query = query.order_by(*order)
+    if offset:
+        query = query.offset(offset)
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, c.key) for c in key_columns])
+    return rows, next_cursor
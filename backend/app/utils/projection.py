@@ -0,0 +1,24 @@
+from typing import List, Optional, Sequence, Type
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+from sqlalchemy import inspect
+
+
+def parse_fields(fields: Optional[str], schema: Type[BaseModel]) -> Optional[List[str]]:
+    """Liste `fields=a,b,c` validée contre les champs du schéma de réponse"""
+    if not fields:
+        return None
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in schema.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Champs inconnus: {', '.join(unknown)}")
+    return requested
+
+
+def column_projection(model, fields: Sequence[str]) -> Optional[list]:
+    """Colonnes du modèle correspondant aux champs, ou None si un champ n'est pas une colonne"""
+    columns = inspect(model).columns
+    if any(f not in columns for f in fields):
+        return None
+    return [getattr(model, f) for f in fields]
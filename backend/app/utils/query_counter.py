@@ -0,0 +1,114 @@
+"""
+Comptage des requêtes SQL par requête HTTP.
+
+Un compteur est attaché au contexte de chaque requête HTTP ; les événements
+du moteur SQLAlchemy l'incrémentent à chaque instruction exécutée (y
+compris depuis le pool de threads des endpoints synchrones, qui hérite du
+contexte). En développement et en test, `SQL_QUERY_GUARD` permet de
+signaler (`log`) ou de faire échouer (`raise`) les requêtes qui dépassent
+`SQL_QUERY_LIMIT` instructions : les régressions N+1 sont visibles avant
+la mise en production.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+# off | log | raise
+SQL_QUERY_GUARD = os.getenv("SQL_QUERY_GUARD", "off").lower()
+SQL_QUERY_LIMIT = int(os.getenv("SQL_QUERY_LIMIT", "20"))
+
+QUERY_COUNT_HEADER = "X-SQL-Queries"
+
+
+class QueryCounter:
+    __slots__ = ("count", "duration", "pool_wait", "connection_held", "route")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        # Pool de connexions et route, renseignés par app.utils.metrics
+        self.pool_wait = 0.0
+        self.connection_held = 0.0
+        self.route = None
+
+
+_current_counter: ContextVar[Optional[QueryCounter]] = ContextVar("sql_query_counter", default=None)
+
+
+def current_counter() -> Optional[QueryCounter]:
+    return _current_counter.get()
+
+
+@contextmanager
+def track_queries():
+    """Compte les instructions SQL exécutées dans le bloc"""
+    counter = QueryCounter()
+    token = _current_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _current_counter.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_counter.get() is not None:
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    counter = _current_counter.get()
+    if counter is None:
+        return
+    counter.count += 1
+    starts = conn.info.get("query_start_time")
+    if starts:
+        counter.duration += time.perf_counter() - starts.pop()
+
+
+def install_query_counter(engine) -> None:
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class QueryGuardMiddleware(BaseHTTPMiddleware):
+    """Signale ou refuse les requêtes HTTP qui exécutent trop d'instructions SQL"""
+
+    def __init__(self, app, mode: str = SQL_QUERY_GUARD, limit: int = SQL_QUERY_LIMIT):
+        super().__init__(app)
+        self.mode = mode
+        self.limit = limit
+
+    async def dispatch(self, request: Request, call_next):
+        if self.mode == "off":
+            return await call_next(request)
+
+        # Compteur de MetricsMiddleware s'il est installé
+        existing = current_counter()
+        with nullcontext(existing) if existing is not None else track_queries() as counter:
+            response = await call_next(request)
+
+        response.headers[QUERY_COUNT_HEADER] = str(counter.count)
+        if counter.count > self.limit:
+            message = (
+                f"{request.method} {request.url.path} : {counter.count} requêtes SQL "
+                f"(limite {self.limit}), probable N+1"
+            )
+            if self.mode == "raise":
+                logger.error(message)
+                return JSONResponse(
+                    status_code=500,
+                    content={"detail": message},
+                    headers={QUERY_COUNT_HEADER: str(counter.count)},
+                )
+            logger.warning(message)
+        return response
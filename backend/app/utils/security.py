@@ -0,0 +1,144 @@
+"""
+Mots de passe, jetons JWT et dépendances d'authentification.
+
+Chemin d'une requête authentifiée, sans accès à la base ni thread :
+vérification du jeton (signature contrôlée une fois par jeton, expiration
+à chaque requête) puis utilisateur lu dans le cache de app.services.auth.
+
+bcrypt (plusieurs centaines de ms de calcul) s'exécute dans un pool de
+threads dédié et borné (AUTH_HASH_WORKERS) : une rafale de connexions
+n'occupe ni la boucle d'événements ni les threads des autres requêtes.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+
+import bcrypt
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+from jose import JWTError, jwt
+from starlette.concurrency import run_in_threadpool
+
+from app.services.auth import AuthenticatedUser, auth_cache
+from app.utils.cache import LRUCache
+
+SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "480"))
+# Jetons dont la signature a déjà été vérifiée (par processus)
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+# Hachages bcrypt simultanés (chacun occupe un cœur ; 0 = nombre de cœurs)
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", "0"))
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
+
+
+# === Mots de passe ===
+
+def hash_password(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+
+def verify_password(password: str, hashed_password: str) -> bool:
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+    except ValueError:
+        return False
+
+
+_hash_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _hash_executor() -> ThreadPoolExecutor:
+    global _hash_pool
+    if _hash_pool is None:
+        _hash_pool = ThreadPoolExecutor(AUTH_HASH_WORKERS or os.cpu_count() or 1, thread_name_prefix="bcrypt")
+    return _hash_pool
+
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_hash_executor(), hash_password, password)
+
+
+async def verify_password_async(password: str, hashed_password: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(
+        _hash_executor(), verify_password, password, hashed_password
+    )
+
+
+# === Jetons ===
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
+    to_encode = data.copy()
+    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    to_encode.update({"exp": expire})
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def _credentials_error() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Identifiants invalides",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+# jeton -> (nom d'utilisateur, expiration en secondes epoch)
+_verified_tokens = LRUCache(maxsize=AUTH_TOKEN_CACHE_SIZE)
+
+
+def token_subject(token: str) -> str:
+    """Nom d'utilisateur d'un jeton valide, sans accès à la base ; HTTPException 401 sinon"""
+    entry = _verified_tokens.get(token)
+    if entry is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            raise _credentials_error()
+        username = payload.get("sub")
+        if not isinstance(username, str):
+            raise _credentials_error()
+        entry = (username, payload.get("exp"))
+        _verified_tokens.set(token, entry)
+    username, expires_at = entry
+    if expires_at is not None and expires_at <= time.time():
+        _verified_tokens.invalidate(token)
+        raise _credentials_error()
+    return username
+
+
+# === Utilisateurs ===
+
+def _active(user: Optional[AuthenticatedUser]) -> AuthenticatedUser:
+    if user is None:
+        raise _credentials_error()
+    if not user.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Utilisateur inactif")
+    return user
+
+
+async def authenticate_user(username: str, password: str) -> Optional[AuthenticatedUser]:
+    """Utilisateur dont le mot de passe correspond (actif ou non), None sinon"""
+    credentials = await run_in_threadpool(auth_cache.credentials, username)
+    if credentials is None:
+        return None
+    user, hashed_password = credentials
+    if not await verify_password_async(password, hashed_password):
+        return None
+    return user
+
+
+def user_from_token(token: str) -> AuthenticatedUser:
+    """Utilisateur actif désigné par un jeton (appel bloquant) ; HTTPException 401/403 sinon"""
+    return _active(auth_cache.get_or_load(token_subject(token)))
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> AuthenticatedUser:
+    username = token_subject(token)
+    user = auth_cache.get(username)
+    if user is None:
+        user = await run_in_threadpool(auth_cache.load, username)
+    return _active(user)
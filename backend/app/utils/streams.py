@@ -0,0 +1,84 @@
+import asyncio
+import io
+import queue
+import threading
+from typing import AsyncIterator, Optional
+
+_EOF = None
+
+
+class ChunkQueueReader(io.RawIOBase):
+    """
+    Flux binaire synchrone alimenté par morceaux depuis une coroutine.
+
+    Permet de consommer un corps de requête en streaming avec les API
+    fichier classiques (csv, lignes...) dans un thread, sans jamais
+    garder plus de `maxsize` morceaux en mémoire. File pleine, la coroutine
+    attend un futur que le thread consommateur résout en retirant un
+    morceau : ni attente active ni thread bloqué côté producteur.
+    """
+
+    def __init__(self, maxsize: int = 16):
+        super().__init__()
+        self._queue: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=maxsize)
+        self._chunk = memoryview(b"")
+        self._eof = False
+        self._lock = threading.Lock()
+        self._space: Optional[asyncio.Future] = None
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._chunk and not self._eof:
+            chunk = self._queue.get()
+            self._wake_producer()
+            if chunk is _EOF:
+                self._eof = True
+            else:
+                self._chunk = memoryview(chunk)
+        n = min(len(b), len(self._chunk))
+        b[:n] = self._chunk[:n]
+        self._chunk = self._chunk[n:]
+        return n
+
+    async def feed(self, source: AsyncIterator[bytes], consumer: "asyncio.Future") -> None:
+        """Pousse les morceaux de `source` tant que le consommateur est actif"""
+        try:
+            async for chunk in source:
+                if chunk and not await self._put(chunk, consumer):
+                    return
+        finally:
+            await self._put(_EOF, consumer)
+
+    def _wake_producer(self) -> None:
+        with self._lock:
+            space, self._space = self._space, None
+        if space is not None:
+            space.get_loop().call_soon_threadsafe(_resolve, space)
+
+    async def _put(self, chunk, consumer) -> bool:
+        while not consumer.done():
+            try:
+                self._queue.put_nowait(chunk)
+                return True
+            except queue.Full:
+                pass
+            # Contre-pression : attente d'une place, signalée par le consommateur
+            space = asyncio.get_running_loop().create_future()
+            with self._lock:
+                self._space = space
+            # Place libérée avant l'inscription : pas de réveil à attendre
+            if not self._queue.full():
+                continue
+            await asyncio.wait((space, consumer), return_when=asyncio.FIRST_COMPLETED)
+        return False
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def open_text_stream(raw: io.RawIOBase, encoding: str = "utf-8-sig") -> io.TextIOWrapper:
+    return io.TextIOWrapper(io.BufferedReader(raw, buffer_size=64 * 1024), encoding=encoding, newline="")
@@ -0,0 +1,26 @@
+"""
+Worker Celery des tâches de fond (nécessite JOB_BROKER_URL) :
+
+    celery -A app.worker worker --concurrency=2
+"""
+from app.database import SessionLocal
+from app.services import data_version, job_tasks, stats  # noqa: F401  (déclare les gestionnaires)
+from app.services.jobs import JOB_BROKER_URL, RUN_JOB_TASK, create_celery_app, run_job
+from app.services.live_feed import live_feed
+from app.services.reference_cache import reference_cache
+
+# Les écritures des tâches (imports d'espèces...) invalident le cache de
+# référence partagé des processus API
+data_version.register_session_events(SessionLocal)
+reference_cache.register()
+# ... et sont publiées sur le flux temps réel (NOTIFY)
+live_feed.register_session_events(SessionLocal)
+# ... et aux compteurs des statistiques (NOTIFY)
+stats.register_session_events(SessionLocal)
+
+celery_app = create_celery_app(JOB_BROKER_URL)
+
+
+@celery_app.task(name=RUN_JOB_TASK)
+def run_job_task(job_id: str) -> None:
+    run_job(SessionLocal, job_id)
@@ -0,0 +1,247 @@
+"""
+Benchmark des principaux endpoints de l'API sur les données générées.
+
+L'API (app.main) est lancée par uvicorn dans un processus séparé, sur la
+base désignée par DATABASE_URL. Elle est remplie au préalable par
+benchmarks.generate_data. Chaque scénario enregistre :
+
+- le débit (requêtes/s) ;
+- les latences p50 et p99 ;
+- la taille moyenne des réponses ;
+- le pic de mémoire résidente du serveur (VmHWM, remis à zéro entre les
+  scénarios quand le noyau le permet).
+
+Les résultats sont écrits en JSON avec le commit courant, ce qui permet
+de comparer deux commits avec --baseline. Tout reste en local : API sur
+127.0.0.1 et base locale.
+
+Le scénario « import » écrit dans la base (--requests-heavy × 1000
+observations).
+
+Usage (depuis backend/) :
+
+    python -m benchmarks.generate_data --observations 1000000 --reset
+    python -m benchmarks.api --output before.json
+    python -m benchmarks.api --baseline before.json --scenarios observations_page tiles dashboard
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func, select, text
+
+from app.database import SessionLocal
+from app.models import Observation, User, UserRole, WaterPoint
+from app.utils.security import create_access_token
+from benchmarks.generate_data import PREFIX
+from benchmarks.load import (
+    backend_dir, git_commit, peak_rss_bytes, reset_peak_rss, run_load, server_env, wait_ready,
+)
+
+IMPORT_ROWS = 1000
+# Tables dont la taille (estimée) est enregistrée avec les résultats
+DATASET_TABLES = ("species", "users", "observations", "activities", "water_points", "patrol_routes", "patrol_logs")
+
+
+def _tile(latitude: float, longitude: float, zoom: int):
+    scale = 2 ** zoom
+    x = int((longitude + 180) / 360 * scale)
+    y = int((1 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2 * scale)
+    return zoom, x, y
+
+
+def _dataset(db) -> dict:
+    return {
+        table: int(db.execute(text(
+            "SELECT GREATEST(sum(c.reltuples), 0) FROM pg_class c WHERE c.oid = to_regclass(:name) "
+            "OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(:name))"
+        ), {"name": table}).scalar() or 0)
+        for table in DATASET_TABLES
+    }
+
+
+def _context(db) -> dict:
+    """Valeurs réelles des données générées (espèce fréquente, points d'eau, période)"""
+    admin = db.scalar(
+        select(User.username).where(User.role == UserRole.ADMIN, User.username.like(f"{PREFIX}\\_%"))
+    ) or db.scalar(select(User.username).where(User.role == UserRole.ADMIN))
+    if admin is None:
+        raise SystemExit("Aucun administrateur : lancer d'abord python -m benchmarks.generate_data")
+    latest = db.scalar(select(func.max(Observation.observation_date))) or datetime.utcnow()
+    species_id = db.scalar(
+        select(Observation.species_id).where(Observation.observation_date >= latest - timedelta(days=30))
+        .group_by(Observation.species_id).order_by(func.count().desc()).limit(1)
+    )
+    points = db.execute(select(WaterPoint.latitude, WaterPoint.longitude).limit(50)).all()
+    return {"admin": admin, "latest": latest, "species_id": species_id, "water_points": points or [(8.35, 13.85)]}
+
+
+def _import_body(context: dict, seed: int) -> bytes:
+    rng = np.random.default_rng(seed)
+    latitude, longitude = context["water_points"][0]
+    lines = [
+        json.dumps({
+            "species_id": context["species_id"],
+            "latitude": round(latitude + float(rng.normal(0, 0.02)), 6),
+            "longitude": round(longitude + float(rng.normal(0, 0.02)), 6),
+            "observation_date": (context["latest"] - timedelta(minutes=int(rng.integers(0, 7 * 1440)))).isoformat(),
+            "count": int(rng.integers(1, 12)),
+            "activity_type": "suivi_populations",
+        })
+        for _ in range(IMPORT_ROWS)
+    ]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def scenarios(base_url: str, context: dict, seed: int) -> dict:
+    """Nom -> (cible, lourd) ; un scénario lourd reçoit --requests-heavy requêtes"""
+    latest = context["latest"]
+    points = context["water_points"]
+    tiles = [
+        _tile(latitude, longitude, zoom)
+        for zoom in (8, 10, 12, 14) for latitude, longitude in points[:8]
+    ]
+    bboxes = [
+        f"west={lon - 0.05:.4f}&south={lat - 0.05:.4f}&east={lon + 0.05:.4f}&north={lat + 0.05:.4f}"
+        for lat, lon in points
+    ]
+    month_ago = (latest - timedelta(days=30)).isoformat()
+    body = _import_body(context, seed)
+
+    def rotating(urls):
+        return lambda client, number: client.get(urls[number % len(urls)])
+
+    def post_import(client, number):
+        return client.post(
+            f"{base_url}/observations/bulk", content=body, headers={"Content-Type": "application/x-ndjson"},
+        )
+
+    return {
+        "observations_page": (f"{base_url}/observations?limit=50", False),
+        "observations_species": (f"{base_url}/observations?limit=50&species_id={context['species_id']}", False),
+        "observations_bbox": (rotating([f"{base_url}/observations/bbox?{bbox}" for bbox in bboxes]), False),
+        "tiles": (rotating([f"{base_url}/observations/tiles/{z}/{x}/{y}" for z, x, y in tiles]), False),
+        "routes_geojson": (
+            rotating([f"{base_url}/patrol-routes/features?zoom={zoom}" for zoom in (8, 11, 14)]), False,
+        ),
+        "dashboard": (f"{base_url}/stats/dashboard", False),
+        "species_stats": (f"{base_url}/stats/species", False),
+        "import": (post_import, True),
+        "export": (f"{base_url}/observations/export?format=parquet&start_date={month_ago}", True),
+    }
+
+
+def _start_server(port: int) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        env=server_env(), cwd=backend_dir(),
+    )
+
+
+async def benchmark(args, context: dict) -> dict:
+    base_url = f"http://127.0.0.1:{args.port}"
+    available = scenarios(base_url, context, args.seed)
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': context['admin']})}"}
+    server = _start_server(args.port)
+    results = {}
+    try:
+        await wait_ready(f"{base_url}/health")
+        if server.poll() is not None:
+            raise RuntimeError(f"Le serveur s'est arrêté (port {args.port} déjà utilisé ?)")
+        for name in args.scenarios:
+            target, heavy = available[name]
+            total = args.requests_heavy if heavy else args.requests
+            concurrency = min(args.concurrency, total)
+            if not heavy:
+                await run_load(target, min(total, 100), min(concurrency, 10), args.timeout, headers)  # échauffement
+            rss_reset = reset_peak_rss(server.pid)
+            started = time.perf_counter()
+            results[name] = await run_load(target, total, concurrency, args.timeout, headers)
+            results[name].update({
+                "concurrency": concurrency,
+                "peak_rss_mb": round((peak_rss_bytes(server.pid) or 0) / 2 ** 20, 1),
+                "peak_rss_reset": rss_reset,
+            })
+            print(f"{name:>22}: {json.dumps(results[name])} ({time.perf_counter() - started:.1f} s)", flush=True)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    return results
+
+
+def compare(baseline: dict, current: dict) -> None:
+    """Écarts de débit et de p99 par scénario par rapport à un fichier de référence"""
+    print(f"\nRéférence : {baseline.get('commit')}  ->  {current.get('commit')}")
+    print(f"{'scénario':>22} {'req/s':>20} {'p99 ms':>20} {'RSS Mo':>16}")
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            continue
+
+        def change(key, width):
+            old, new = before.get(key), result.get(key)
+            if not old or new is None:
+                return f"{'-':>{width}}"
+            return f"{f'{old} → {new} ({(new - old) / old:+.0%})':>{width}}"
+        print(f"{name:>22} {change('requests_per_s', 20)} {change('p99_ms', 20)} {change('peak_rss_mb', 16)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--requests-heavy", type=int, default=20, help="Requêtes des scénarios import et export")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--scenarios", nargs="+", default=None,
+                        help="Scénarios à exécuter (tous par défaut)")
+    parser.add_argument("--output", help="Fichier JSON (par défaut benchmarks/results/<commit>.json)")
+    parser.add_argument("--baseline", help="Résultats JSON d'un autre commit à comparer")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        context = _context(db)
+        dataset = _dataset(db)
+    finally:
+        db.close()
+    names = list(scenarios("", context, args.seed))
+    args.scenarios = args.scenarios or names
+    unknown = set(args.scenarios) - set(names)
+    if unknown:
+        parser.error(f"Scénarios inconnus : {', '.join(sorted(unknown))} (disponibles : {', '.join(names)})")
+
+    results = asyncio.run(benchmark(args, context))
+    report = {
+        **git_commit(),
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "dataset": dataset,
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        backend_dir(), "benchmarks", "results", f"{(report['commit'] or 'unknown')[:12]}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Résultats : {output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Benchmark de charge : chemin synchrone vs asynchrone vers PostgreSQL.
+
+Trois variantes du même endpoint (une page de 50 observations) sont servies
+par uvicorn dans un processus séparé :
+
+- blocking : `async def` utilisant la session synchrone (bloque la boucle)
+- sync     : `def` + get_database (pool de threads de Starlette)
+- async    : `async def` + get_async_database (asyncpg)
+
+Usage (depuis backend/, base locale accessible via DATABASE_URL) :
+
+    python -m benchmarks.async_vs_sync --concurrency 500 --requests 20000
+    python -m benchmarks.async_vs_sync --db-latency-ms 20 --output results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+from fastapi import Depends, FastAPI
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.database import get_async_database, get_database
+from app.models import Observation
+from benchmarks.load import backend_dir, run_load, wait_ready
+
+MODES = ("blocking", "sync", "async")
+
+# Latence simulée ajoutée à chaque requête SQL (pg_sleep), en secondes
+QUERY_DELAY = float(os.getenv("BENCH_QUERY_DELAY_MS", "0")) / 1000
+
+PAGE_QUERY = (
+    select(
+        Observation.id, Observation.species_id, Observation.latitude,
+        Observation.longitude, Observation.observation_date,
+    )
+    .order_by(Observation.observation_date.desc(), Observation.id.desc())
+    .limit(50)
+)
+DELAY_QUERY = select(func.pg_sleep(QUERY_DELAY))
+
+
+def _rows(result) -> list:
+    return [dict(row._mapping) for row in result]
+
+
+app = FastAPI()
+
+
+@app.get("/ping")
+async def ping():
+    return {"ok": True}
+
+
+@app.get("/blocking/observations")
+async def blocking_observations(db: Session = Depends(get_database)):
+    if QUERY_DELAY:
+        db.execute(DELAY_QUERY)
+    return _rows(db.execute(PAGE_QUERY))
+
+
+@app.get("/sync/observations")
+def sync_observations(db: Session = Depends(get_database)):
+    if QUERY_DELAY:
+        db.execute(DELAY_QUERY)
+    return _rows(db.execute(PAGE_QUERY))
+
+
+@app.get("/async/observations")
+async def async_observations(db: AsyncSession = Depends(get_async_database)):
+    if QUERY_DELAY:
+        await db.execute(DELAY_QUERY)
+    return _rows(await db.execute(PAGE_QUERY))
+
+
+def _start_server(port: int, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.async_vs_sync:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        env=env,
+        cwd=backend_dir(),
+    )
+
+
+async def benchmark(args) -> dict:
+    env = {**os.environ, "BENCH_QUERY_DELAY_MS": str(args.db_latency_ms)}
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = _start_server(args.port, env)
+    results = {}
+    try:
+        await wait_ready(f"{base_url}/ping")
+        for mode in args.modes:
+            url = f"{base_url}/{mode}/observations"
+            await run_load(url, min(args.requests, 200), min(args.concurrency, 50), args.timeout)  # échauffement
+            results[mode] = await run_load(url, args.requests, args.concurrency, args.timeout)
+            print(f"{mode:>9}: {json.dumps(results[mode])}", flush=True)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            # La variante "blocking" peut laisser la boucle bloquée sur le pool
+            server.kill()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--db-latency-ms", type=float, default=0)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--output", help="Fichier JSON de résultats")
+    args = parser.parse_args()
+
+    results = asyncio.run(benchmark(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
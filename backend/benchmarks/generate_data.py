@@ -0,0 +1,379 @@
+"""
+Générateur de données synthétiques d'un parc, pour les benchmarks.
+
+Remplit species, users, water_points, patrol_routes, patrol_logs,
+activities et observations de façon reproductible (graine fixe), de 10k à
+50M observations. Les observations sont groupées spatialement : chaque
+espèce fréquente quelques points d'eau, plus densément en saison sèche.
+Les autres sont dispersées dans le parc. Les espèces suivent une
+popularité de Zipf et les heures les pics du matin et du soir.
+
+Les grandes tables sont chargées par COPY, par lots générés avec numpy.
+La mémoire reste bornée quel que soit le volume. Les mois manquants sont
+créés avant le chargement si les tables sont partitionnées. Les agrégats
+sont recalculés à la fin.
+
+Usage (depuis backend/, base locale PostgreSQL/PostGIS via DATABASE_URL,
+par ex. le service db de docker-compose, API arrêtée) :
+
+    python -m benchmarks.generate_data --observations 1000000
+    python -m benchmarks.generate_data --observations 50000000 --reset --seed 7 --no-fk-checks
+"""
+import argparse
+import io
+import json
+import logging
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pyarrow as pa
+from pyarrow import csv as pacsv
+from sqlalchemy import insert, select, text
+
+from app.database import SessionLocal
+from app.models import (
+    ActivityType, ConservationStatus, PatrolRoute, Species, SpeciesCategory, User, UserRole, WaterPoint,
+)
+from app.services import partitions
+from app.services.rollups import refresh_rollups
+from app.utils.security import hash_password
+
+logger = logging.getLogger(__name__)
+
+# Parc national de la Bénoué (Cameroun) : centre et demi-étendue en degrés
+PARK_CENTER = (8.35, 13.85)
+PARK_HALF_EXTENT = (0.45, 0.55)
+# Préfixe des noms générés (reconnaissables et supprimés par --reset)
+PREFIX = "bench"
+# Tables vidées par --reset, dans l'ordre des dépendances
+GENERATED_TABLES = (
+    "observations", "activities", "patrol_logs", "patrol_routes", "water_points",
+)
+
+_ACTIVITY_NAMES = [member.name for member in ActivityType]
+_ACTIVITY_WEIGHTS = np.array([0.45, 0.2, 0.1, 0.05, 0.05, 0.15])
+_STATUS_NAMES = [member.name for member in ConservationStatus][:5]
+_STATUS_WEIGHTS = [0.55, 0.2, 0.13, 0.08, 0.04]
+_OBSERVATION_COLUMNS = (
+    "species_id", "observer_id", "latitude", "longitude", "accuracy", "observation_date", "count",
+    "activity_type", "temperature", "humidity", "verified", "created_at", "updated_at",
+)
+
+
+def _copy(db, table: str, data: pa.Table) -> None:
+    """COPY d'un lot (colonnes de `data`, CSV sans en-tête)"""
+    buffer = io.BytesIO()
+    pacsv.write_csv(data, buffer, pacsv.WriteOptions(include_header=False))
+    buffer.seek(0)
+    cursor = db.connection().connection.driver_connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table} ({', '.join(data.column_names)}) FROM STDIN WITH (FORMAT csv)", buffer,
+        )
+    finally:
+        cursor.close()
+
+
+def _timestamps(seconds: np.ndarray) -> pa.Array:
+    return pa.array(seconds.astype("datetime64[s]"), type=pa.timestamp("s"))
+
+
+def _enum_names(names, indices: np.ndarray, null_mask=None) -> pa.Array:
+    return pa.DictionaryArray.from_arrays(
+        pa.array(indices.astype(np.int8), mask=null_mask), pa.array(names),
+    ).cast(pa.string())
+
+
+def _uniform_points(rng, size):
+    latitude = PARK_CENTER[0] + rng.uniform(-1, 1, size) * PARK_HALF_EXTENT[0]
+    longitude = PARK_CENTER[1] + rng.uniform(-1, 1, size) * PARK_HALF_EXTENT[1]
+    return latitude, longitude
+
+
+def _clip_to_park(latitude, longitude):
+    return (
+        np.clip(latitude, PARK_CENTER[0] - PARK_HALF_EXTENT[0], PARK_CENTER[0] + PARK_HALF_EXTENT[0]),
+        np.clip(longitude, PARK_CENTER[1] - PARK_HALF_EXTENT[1], PARK_CENTER[1] + PARK_HALF_EXTENT[1]),
+    )
+
+
+def _partition_months(db, table: str, first: date, last: date) -> None:
+    """Crée les partitions des mois chargés (sinon tout irait dans la partition par défaut)"""
+    connection = db.connection()
+    if not partitions.is_partitioned(connection, table):
+        return
+    existing = set(partitions.partition_months(connection, table))
+    month = date(first.year, first.month, 1)
+    while month <= last:
+        if month not in existing:
+            partitions.create_month(connection, table, month)
+        month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+# === Référentiels ===
+
+def generate_species(db, rng, count: int) -> np.ndarray:
+    names = [f"{PREFIX} species {index:05d}" for index in range(count)]
+    statuses = rng.choice(_STATUS_NAMES, size=count, p=_STATUS_WEIGHTS)
+    db.execute(
+        text(
+            "INSERT INTO species (common_name, scientific_name, category, conservation_status, "
+            "population_estimate, created_at, updated_at) VALUES (:common_name, :scientific_name, "
+            f"'{SpeciesCategory.ANIMAL.name}', :status, :population, now(), now()) "
+            "ON CONFLICT (scientific_name) DO NOTHING"
+        ),
+        [
+            {"common_name": f"Espèce synthétique {index}", "scientific_name": name, "status": str(status),
+             "population": int(rng.integers(50, 20000))}
+            for index, (name, status) in enumerate(zip(names, statuses))
+        ],
+    )
+    return np.array(db.scalars(
+        select(Species.id).where(Species.scientific_name.like(f"{PREFIX} species %")).order_by(Species.id)
+    ).all())
+
+
+def generate_users(db, count: int) -> dict:
+    """Rangers, analystes et un administrateur (mot de passe : « benchmark »)"""
+    password = hash_password("benchmark")
+    roles = [UserRole.ADMIN] + [UserRole.ANALYST] * max(1, count // 10)
+    roles += [UserRole.RANGER] * max(1, count - len(roles))
+    db.execute(
+        text(
+            "INSERT INTO users (username, email, hashed_password, full_name, role, is_active, created_at) "
+            "VALUES (:username, :email, :password, :full_name, :role, true, now()) ON CONFLICT DO NOTHING"
+        ),
+        [
+            {"username": f"{PREFIX}_{role.value}_{index}", "email": f"{PREFIX}_{index}@example.org",
+             "password": password, "full_name": f"Utilisateur {index}", "role": role.name}
+            for index, role in enumerate(roles)
+        ],
+    )
+    users = db.execute(select(User.id, User.role).where(User.username.like(f"{PREFIX}\\_%"))).all()
+    return {
+        "admin": next(user_id for user_id, role in users if role == UserRole.ADMIN),
+        "rangers": np.array([user_id for user_id, role in users if role == UserRole.RANGER]),
+        "observers": np.array([user_id for user_id, role in users if role != UserRole.ADMIN]),
+    }
+
+
+def generate_water_points(db, rng, count: int) -> np.ndarray:
+    """Points d'eau (centres des regroupements) ; renvoie leurs coordonnées"""
+    latitude, longitude = _uniform_points(rng, count)
+    kinds = rng.choice(["river", "lake", "artificial", "spring"], size=count, p=[0.4, 0.2, 0.3, 0.1])
+    db.execute(insert(WaterPoint), [
+        {"name": f"{PREFIX} point d'eau {index}", "latitude": float(lat), "longitude": float(lon),
+         "water_type": str(kind), "status": "active" if rng.random() < 0.85 else "dry",
+         "capacity": float(rng.uniform(1e4, 5e6)), "depth": float(rng.uniform(0.5, 8)),
+         "human_usage": bool(rng.random() < 0.2)}
+        for index, (lat, lon, kind) in enumerate(zip(latitude, longitude, kinds))
+    ])
+    return np.column_stack([latitude, longitude])
+
+
+def generate_routes(db, rng, count: int, water_points: np.ndarray) -> np.ndarray:
+    """Routes sinueuses reliant 3 à 6 points d'eau (métriques calculées à l'insertion)"""
+    for index in range(count):
+        stops = water_points[rng.choice(len(water_points), size=int(rng.integers(3, 7)), replace=False)]
+        coordinates = []
+        for (lat0, lon0), (lat1, lon1) in zip(stops[:-1], stops[1:]):
+            steps = int(rng.integers(20, 60))
+            fractions = np.linspace(0, 1, steps, endpoint=False)
+            wobble = np.cumsum(rng.normal(0, 0.002, (steps, 2)), axis=0)
+            coordinates.extend(zip(lon0 + (lon1 - lon0) * fractions + wobble[:, 1],
+                                   lat0 + (lat1 - lat0) * fractions + wobble[:, 0]))
+        coordinates.append((stops[-1][1], stops[-1][0]))
+        db.add(PatrolRoute(
+            name=f"{PREFIX} route {index}",
+            route_geometry=json.dumps({"type": "LineString", "coordinates": [
+                [round(float(lon), 6), round(float(lat), 6)] for lon, lat in coordinates
+            ]}),
+            frequency=str(rng.choice(["daily", "weekly", "monthly"])),
+            patrol_type=str(rng.choice(["anti_poaching", "monitoring", "maintenance"], p=[0.6, 0.3, 0.1])),
+        ))
+    db.flush()
+    return np.array(db.scalars(
+        select(PatrolRoute.id).where(PatrolRoute.name.like(f"{PREFIX} route %"))
+    ).all())
+
+
+# === Tables volumineuses ===
+
+def generate_patrol_logs(db, rng, count: int, routes: np.ndarray, rangers: np.ndarray,
+                         start: datetime, span_seconds: int, batch_size: int) -> None:
+    for offset in range(0, count, batch_size):
+        size = min(batch_size, count - offset)
+        day = (rng.integers(0, span_seconds // 86400, size) * 86400 + start.timestamp()).astype(np.int64)
+        begin = day + rng.integers(5 * 3600, 9 * 3600, size)
+        end = begin + rng.integers(2 * 3600, 9 * 3600, size)
+        _copy(db, "patrol_logs", pa.table({
+            "route_id": pa.array(rng.choice(routes, size), mask=rng.random(size) < 0.1),
+            "ranger_id": rng.choice(rangers, size),
+            "patrol_date": _timestamps(day),
+            "start_time": _timestamps(begin),
+            "end_time": _timestamps(end),
+            "incidents_reported": rng.poisson(0.3, size),
+            "wildlife_sightings": rng.poisson(6, size),
+            "created_at": _timestamps(end),
+        }))
+
+
+def generate_activities(db, rng, count: int, species: np.ndarray, users: np.ndarray,
+                        start: datetime, span_seconds: int) -> None:
+    planned = (start.timestamp() + rng.integers(0, span_seconds, count)).astype(np.int64)
+    latitude, longitude = _uniform_points(rng, count)
+    statuses = np.array(["planned", "in_progress", "completed", "cancelled"])
+    _copy(db, "activities", pa.table({
+        "species_id": rng.choice(species, count),
+        "assigned_user_id": rng.choice(users, count),
+        "activity_type": _enum_names(_ACTIVITY_NAMES, rng.choice(len(_ACTIVITY_NAMES), count, p=_ACTIVITY_WEIGHTS)),
+        "title": pa.array([f"{PREFIX} activité {index}" for index in range(count)]),
+        "planned_start_date": _timestamps(planned),
+        "planned_end_date": _timestamps(planned + rng.integers(1, 60, count) * 86400),
+        "status": statuses[rng.choice(4, count, p=[0.2, 0.2, 0.55, 0.05])],
+        "priority": np.array(["low", "medium", "high", "critical"])[rng.choice(4, count, p=[0.2, 0.5, 0.2, 0.1])],
+        "latitude": latitude,
+        "longitude": longitude,
+        "area_covered": rng.gamma(2, 5, count).round(2),
+        "budget_allocated": rng.gamma(2, 5000, count).round(0),
+        "created_at": _timestamps(planned),
+        "updated_at": _timestamps(planned),
+    }))
+
+
+def generate_observations(db, rng, count: int, species: np.ndarray, observers: np.ndarray,
+                          water_points: np.ndarray, start: datetime, span_seconds: int, batch_size: int) -> None:
+    # Paramètres par espèce : popularité, taille des groupes, 3 points d'eau fréquentés, dispersion
+    popularity = 1 / np.arange(1, len(species) + 1) ** 1.1
+    popularity = rng.permutation(popularity / popularity.sum())
+    group_size = rng.gamma(1.5, 2, len(species)) + 1
+    homes = rng.integers(0, len(water_points), (len(species), 3))
+    spread = rng.uniform(0.01, 0.05, len(species))
+    started = time.perf_counter()
+    for offset in range(0, count, batch_size):
+        size = min(batch_size, count - offset)
+        kind = rng.choice(len(species), size, p=popularity)
+        seconds = start.timestamp() + rng.integers(0, span_seconds // 86400, size) * 86400
+        # Heures d'activité : pics à 7 h et 17 h
+        hours = np.where(rng.random(size) < 0.5, rng.normal(7, 1.5, size), rng.normal(17, 1.5, size))
+        seconds = (seconds + np.clip(hours, 0, 23.99) * 3600).astype(np.int64)
+        month = seconds.astype("datetime64[s]").astype("datetime64[M]").astype(np.int64) % 12 + 1
+        dry_season = (month >= 11) | (month <= 4)
+        clustered = rng.random(size) < np.where(dry_season, 0.9, 0.6)
+        home = water_points[homes[kind, rng.integers(0, 3, size)]]
+        latitude, longitude = _uniform_points(rng, size)
+        latitude = np.where(clustered, home[:, 0] + rng.normal(0, 1, size) * spread[kind], latitude)
+        longitude = np.where(clustered, home[:, 1] + rng.normal(0, 1, size) * spread[kind], longitude)
+        latitude, longitude = _clip_to_park(latitude, longitude)
+        created = seconds + rng.integers(60, 3 * 86400, size)
+        _copy(db, "observations", pa.table({
+            "species_id": species[kind],
+            "observer_id": rng.choice(observers, size),
+            "latitude": latitude.round(6),
+            "longitude": longitude.round(6),
+            "accuracy": rng.lognormal(2.3, 0.6, size).round(1),
+            "observation_date": _timestamps(seconds),
+            "count": 1 + rng.poisson(group_size[kind] - 1),
+            "activity_type": _enum_names(
+                _ACTIVITY_NAMES, rng.choice(len(_ACTIVITY_NAMES), size, p=_ACTIVITY_WEIGHTS),
+                null_mask=rng.random(size) < 0.3,
+            ),
+            "temperature": rng.normal(29, 4, size).round(1),
+            "humidity": np.clip(rng.normal(np.where(dry_season, 35, 75), 10), 5, 100).round(0),
+            "verified": rng.random(size) < 0.7,
+            "created_at": _timestamps(created),
+            "updated_at": _timestamps(created),
+        }).select(list(_OBSERVATION_COLUMNS)))
+        db.commit()
+        done = offset + size
+        rate = done / (time.perf_counter() - started)
+        logger.info("observations : %d / %d (%.0f lignes/s)", done, count, rate)
+
+
+def reset(db) -> None:
+    """Vide les tables générées et supprime les référentiels synthétiques"""
+    db.execute(text(f"TRUNCATE {', '.join(GENERATED_TABLES)} RESTART IDENTITY CASCADE"))
+    db.execute(text("DELETE FROM species WHERE scientific_name LIKE :prefix"), {"prefix": f"{PREFIX} species %"})
+    db.execute(text("DELETE FROM jobs WHERE submitted_by IN (SELECT id FROM users WHERE username LIKE :prefix)"),
+               {"prefix": f"{PREFIX}\\_%"})
+    db.execute(text("DELETE FROM users WHERE username LIKE :prefix"), {"prefix": f"{PREFIX}\\_%"})
+    db.commit()
+
+
+def generate(args) -> dict:
+    rng = np.random.default_rng(args.seed)
+    end = datetime.combine(date.today(), datetime.min.time())
+    start = end - timedelta(days=round(args.months * 30.44))
+    span_seconds = int((end - start).total_seconds())
+    patrol_logs = args.patrol_logs if args.patrol_logs is not None else max(100, args.observations // 50)
+    activities = args.activities if args.activities is not None else max(100, args.observations // 1000)
+
+    db = SessionLocal()
+    try:
+        db.execute(text("SET statement_timeout = 0"))
+        if args.reset:
+            reset(db)
+        species = generate_species(db, rng, args.species)
+        users = generate_users(db, args.users)
+        water_points = generate_water_points(db, rng, args.water_points)
+        routes = generate_routes(db, rng, args.routes, water_points)
+        db.commit()
+        logger.info("Référentiels : %d espèces, %d utilisateurs, %d points d'eau, %d routes",
+                    len(species), len(users["observers"]) + 1, len(water_points), len(routes))
+
+        for table in ("observations", "patrol_logs"):
+            _partition_months(db, table, start.date(), end.date())
+        if args.no_fk_checks:
+            # Les identifiants viennent d'être relus : les triggers de clés étrangères
+            # (2/3 du temps de COPY) sont inutiles. Réservé aux superutilisateurs.
+            db.execute(text("SET session_replication_role = replica"))
+        generate_patrol_logs(db, rng, patrol_logs, routes, users["rangers"], start, span_seconds, args.batch_size)
+        generate_activities(db, rng, activities, species, users["observers"], start, span_seconds)
+        db.commit()
+        generate_observations(db, rng, args.observations, species, users["observers"], water_points,
+                              start, span_seconds, args.batch_size)
+
+        for table in ("species", "users", "water_points", "patrol_routes", "patrol_logs", "activities",
+                      "observations"):
+            db.execute(text(f"ANALYZE {table}"))
+        if args.no_fk_checks:
+            db.execute(text("SET session_replication_role = DEFAULT"))
+        db.commit()
+        if not args.skip_rollups:
+            logger.info("Recalcul des agrégats")
+            refresh_rollups(db, full=True)
+        return {
+            "seed": args.seed, "start": start.isoformat(), "end": end.isoformat(),
+            "observations": args.observations, "patrol_logs": patrol_logs, "activities": activities,
+        }
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--observations", type=int, default=10_000)
+    parser.add_argument("--species", type=int, default=300)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--water-points", type=int, default=150)
+    parser.add_argument("--routes", type=int, default=60)
+    parser.add_argument("--patrol-logs", type=int, help="Par défaut : observations / 50")
+    parser.add_argument("--activities", type=int, help="Par défaut : observations / 1000")
+    parser.add_argument("--months", type=int, default=36, help="Période couverte, jusqu'à aujourd'hui")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=500_000)
+    parser.add_argument("--reset", action="store_true", help="Vide d'abord les tables générées (destructif)")
+    parser.add_argument("--skip-rollups", action="store_true")
+    parser.add_argument("--no-fk-checks", action="store_true",
+                        help="Désactive les contrôles de clés étrangères pendant COPY (superutilisateur)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    started = time.perf_counter()
+    summary = generate(args)
+    logger.info("Terminé en %.1f s : %s", time.perf_counter() - started, json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Client de charge commun aux benchmarks (httpx asynchrone).
+"""
+import asyncio
+import os
+import statistics
+import subprocess
+import time
+from typing import Awaitable, Callable, Optional, Union
+
+# Requête à mesurer : URL (GET) ou fonction (client, numéro) -> réponse
+Target = Union[str, Callable[[object, int], Awaitable[object]]]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def run_load(target: Target, total: int, concurrency: int, timeout: float,
+                   headers: Optional[dict] = None) -> dict:
+    import httpx
+
+    send = (lambda client, number: client.get(target)) if isinstance(target, str) else target
+    latencies = []
+    errors = 0
+    received = 0
+    remaining = total
+
+    async def worker(client):
+        nonlocal remaining, errors, received
+        while remaining > 0:
+            remaining -= 1
+            number = total - remaining
+            start = time.perf_counter()
+            try:
+                response = await send(client, number)
+                if not 200 <= response.status_code < 300:
+                    errors += 1
+                    continue
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            received += len(response.content)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout, headers=headers) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": total,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1) if latencies else None,
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1) if latencies else None,
+        "bytes_per_response": round(received / len(latencies)) if latencies else None,
+    }
+
+
+async def wait_ready(url: str, timeout: float = 30.0) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Le serveur de benchmark n'a pas démarré")
+
+
+# === Mémoire du serveur (Linux) ===
+
+def peak_rss_bytes(pid: int) -> Optional[int]:
+    """Pic de mémoire résidente (VmHWM) du processus"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss(pid: int) -> bool:
+    """Remet le pic à la mémoire courante (False si le noyau ne le permet pas)"""
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as refs:
+            refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def child_pids(pid: int) -> list:
+    """Processus enfants directs (workers d'un serveur préforké)"""
+    children = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    return sorted(children)
+
+
+def backend_dir() -> str:
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def server_env() -> dict:
+    """Environnement des serveurs mesurés : pas de tâches périodiques pendant les mesures"""
+    env = dict(os.environ)
+    for name in ("ROLLUP_REFRESH_SECONDS", "PARTITION_MAINTENANCE_SECONDS"):
+        env.setdefault(name, "0")
+    env.setdefault("SQL_QUERY_GUARD", "off")
+    return env
+
+
+def git_commit() -> dict:
+    def git(*arguments):
+        return subprocess.run(
+            ["git", *arguments], capture_output=True, text=True, cwd=backend_dir(),
+        ).stdout.strip()
+    return {
+        "commit": git("rev-parse", "HEAD") or None,
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+    }
@@ -0,0 +1,227 @@
+"""
+Démarrage à froid et mémoire par worker de l'API.
+
+Pour chaque mode de service, le serveur est lancé sur 127.0.0.1 et on
+mesure :
+
+- le démarrage à froid : du lancement à la première réponse de /health,
+  puis jusqu'à ce que tous les workers aient répondu ;
+- la mémoire de chaque processus (maître et workers), au démarrage puis
+  après une courte charge : RSS, PSS (pages partagées réparties entre les
+  processus, leur somme est l'empreinte réelle), partagée et privée ;
+- les durées de démarrage déclarées par chaque worker (/health).
+
+Modes :
+
+- uvicorn : un seul processus (commande de développement) ;
+- uvicorn-workers : uvicorn --workers N, chaque worker importe tout ;
+- prefork : python -m app.server, workers forkés après préchargement.
+
+L'import de app.main est aussi chronométré seul, avec la liste des
+bibliothèques lourdes qu'il charge.
+
+Usage (depuis backend/) :
+
+    python -m benchmarks.startup --workers 4
+    python -m benchmarks.startup --modes prefork --workers 2 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import httpx
+from sqlalchemy import select
+
+from app.database import SessionLocal
+from app.models import User, UserRole
+from app.utils.metrics import process_memory
+from app.utils.security import create_access_token
+from benchmarks.load import backend_dir, child_pids, git_commit, run_load, server_env, wait_ready
+
+MODES = ("uvicorn", "uvicorn-workers", "prefork")
+HEAVY_MODULES = ("pandas", "pyarrow", "openpyxl", "xlrd", "PIL", "celery", "geoalchemy2", "shapely", "numpy")
+LOAD_PATHS = ("/stats/dashboard", "/observations?limit=50", "/species", "/water-points")
+
+
+def measure_import(repeat: int) -> dict:
+    """Durée d'import de app.main (meilleure de `repeat`) et bibliothèques lourdes chargées"""
+    script = (
+        "import json, sys, time\n"
+        "started = time.perf_counter()\n"
+        "import app.main\n"
+        "print(json.dumps({'seconds': time.perf_counter() - started,"
+        f" 'loaded': [name for name in {HEAVY_MODULES!r} if name in sys.modules]}}))\n"
+    )
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", script], capture_output=True, text=True, check=True,
+            cwd=backend_dir(), env=server_env(),
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        "import_s": round(min(run["seconds"] for run in runs), 3),
+        "heavy_modules_loaded": runs[0]["loaded"],
+    }
+
+
+def _command(mode: str, port: int, workers: int) -> list:
+    if mode == "prefork":
+        return [sys.executable, "-m", "app.server", "--bind", f"127.0.0.1:{port}", "--workers", str(workers)]
+    command = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+               "--log-level", "warning"]
+    return command + (["--workers", str(workers)] if mode == "uvicorn-workers" else [])
+
+
+def _memory(server_pid: int, mode: str, worker_pids: set) -> dict:
+    pids = [server_pid] if mode == "uvicorn" else [server_pid, *child_pids(server_pid)]
+    processes = []
+    for pid in pids:
+        memory = process_memory(pid)
+        if not memory:
+            continue
+        role = "worker" if pid in worker_pids else "master" if pid == server_pid else "other"
+        processes.append({"pid": pid, "role": role, **{
+            f"{key}_mb": round(value / 2 ** 20, 1) for key, value in memory.items()
+        }})
+    workers = [process for process in processes if process["role"] == "worker"]
+    return {
+        "total_rss_mb": round(sum(process["rss_mb"] for process in processes), 1),
+        "total_pss_mb": round(sum(process["pss_mb"] for process in processes), 1),
+        "worker_private_mb": round(sum(process["private_mb"] for process in workers) / len(workers), 1)
+        if workers else None,
+        "processes": processes,
+    }
+
+
+async def _workers_ready(base_url: str, expected: int, timeout: float) -> dict:
+    """Interroge /health jusqu'à avoir vu `expected` workers ; pid -> état déclaré"""
+    seen = {}
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while len(seen) < expected and time.monotonic() < deadline:
+            # Connexions neuves : réparties entre les workers par le noyau
+            responses = await asyncio.gather(
+                *(client.get(f"{base_url}/health", headers={"Connection": "close"}) for _ in range(expected * 2)),
+                return_exceptions=True,
+            )
+            for response in responses:
+                if isinstance(response, httpx.Response) and response.status_code == 200:
+                    process = response.json().get("process") or {}
+                    if "pid" in process:
+                        seen[process["pid"]] = process
+            if len(seen) < expected:
+                await asyncio.sleep(0.1)
+    return seen
+
+
+async def measure_mode(mode: str, workers: int, args, headers: dict) -> dict:
+    base_url = f"http://127.0.0.1:{args.port}"
+    expected = 1 if mode == "uvicorn" else workers
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        _command(mode, args.port, workers), env=server_env(), cwd=backend_dir(),
+        stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL,
+    )
+    try:
+        await wait_ready(f"{base_url}/health", timeout=args.timeout)
+        first_response = time.perf_counter() - started
+        if server.poll() is not None:
+            raise RuntimeError(f"Le serveur s'est arrêté (port {args.port} déjà utilisé ?)")
+        reported = await _workers_ready(base_url, expected, args.timeout)
+        all_ready = time.perf_counter() - started
+        at_start = _memory(server.pid, mode, set(reported))
+
+        urls = [f"{base_url}{path}" for path in LOAD_PATHS]
+        load = await run_load(
+            lambda client, number: client.get(urls[number % len(urls)]),
+            args.requests, min(args.concurrency, args.requests), args.timeout, headers,
+        )
+        after_load = _memory(server.pid, mode, set(reported))
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    return {
+        "mode": mode,
+        "workers": expected,
+        "workers_seen": len(reported),
+        "first_response_s": round(first_response, 2),
+        "all_workers_ready_s": round(all_ready, 2),
+        "worker_startup_s": {str(pid): process.get("startup_s") for pid, process in sorted(reported.items())},
+        "memory_at_start": at_start,
+        "memory_after_load": after_load,
+        "load": {key: load[key] for key in ("requests", "errors", "requests_per_s", "p99_ms")},
+    }
+
+
+def _admin_headers() -> dict:
+    db = SessionLocal()
+    try:
+        admin = db.scalar(select(User.username).where(User.role == UserRole.ADMIN))
+    finally:
+        db.close()
+    if admin is None:
+        raise SystemExit("Aucun administrateur : lancer d'abord python -m benchmarks.generate_data")
+    return {"Authorization": f"Bearer {create_access_token({'sub': admin})}"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--workers", type=int, nargs="+", default=[2],
+                        help="Nombres de workers mesurés (modes uvicorn-workers et prefork)")
+    parser.add_argument("--requests", type=int, default=400, help="Requêtes de la charge après démarrage")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--import-repeat", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--verbose", action="store_true", help="Affiche les journaux des serveurs")
+    parser.add_argument("--output", help="Fichier JSON (par défaut benchmarks/results/startup-<commit>.json)")
+    args = parser.parse_args()
+
+    headers = _admin_headers()
+    imported = measure_import(args.import_repeat)
+    print(f"Import de app.main : {imported['import_s']} s ; "
+          f"bibliothèques lourdes chargées : {', '.join(imported['heavy_modules_loaded']) or 'aucune'}")
+
+    results = []
+    for mode in args.modes:
+        for workers in ([1] if mode == "uvicorn" else args.workers):
+            result = asyncio.run(measure_mode(mode, workers, args, headers))
+            results.append(result)
+            start, after = result["memory_at_start"], result["memory_after_load"]
+            print(
+                f"{mode:>16} × {result['workers']}: prêt en {result['first_response_s']} s "
+                f"(tous les workers {result['all_workers_ready_s']} s) ; "
+                f"PSS total {start['total_pss_mb']} -> {after['total_pss_mb']} Mo ; "
+                f"privée par worker {start['worker_private_mb']} -> {after['worker_private_mb']} Mo",
+                flush=True,
+            )
+
+    report = {
+        **git_commit(),
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "verbose")},
+        "import": imported,
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        backend_dir(), "benchmarks", "results", f"startup-{(report['commit'] or 'unknown')[:12]}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Résultats : {output}")
+
+
+if __name__ == "__main__":
+    main()
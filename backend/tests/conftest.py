@@ -0,0 +1,58 @@
+"""
+Fixtures communes.
+
+Les tests sans base de données tournent partout. Ceux qui ont besoin de
+PostgreSQL utilisent `db` et sont ignorés si TEST_DATABASE_URL n'est pas
+défini (base initialisée par app.database.init_database).
+"""
+import os
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "")
+
+
+@pytest.fixture(scope="session")
+def db_engine():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL non défini")
+    engine = create_engine(TEST_DATABASE_URL)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(db_engine):
+    """Session dont les commits deviennent des points de sauvegarde : tout est annulé à la fin du test"""
+    connection = db_engine.connect()
+    transaction = connection.begin()
+    session = Session(bind=connection, join_transaction_mode="create_savepoint")
+    try:
+        yield session
+    finally:
+        session.close()
+        transaction.rollback()
+        connection.close()
+
+
+def wait_until(predicate, timeout: float = 5.0, interval: float = 0.02) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return predicate()
+
+
+def wait_for_listener(engine, channel: str, count: int = 1) -> None:
+    """Attend que `count` connexions écoutent `channel` (NotifyListener démarrés)"""
+    def listening() -> bool:
+        with engine.connect() as connection:
+            return connection.execute(
+                text("SELECT count(*) FROM pg_stat_activity WHERE query = :query"), {"query": f"LISTEN {channel}"},
+            ).scalar() >= count
+
+    assert wait_until(listening), f"personne n'écoute {channel}"
@@ -0,0 +1,26 @@
+import pytest
+
+from app.utils.file_response import _parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-", (0, 99)),
+    ("bytes=10-19", (10, 19)),
+    ("bytes=90-500", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    (" bytes=0-0 ", (0, 0)),
+    # Plusieurs plages, unité inconnue, en-tête mal formé : fichier entier
+    ("bytes=0-1,5-6", None),
+    ("items=0-10", None),
+    ("bytes=-", None),
+    ("bytes=abc", None),
+])
+def test_parse_range(header, expected):
+    assert _parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=150-200", "bytes=20-10", "bytes=-0"])
+def test_unsatisfiable_range(header):
+    with pytest.raises(ValueError):
+        _parse_range(header, 100)
@@ -0,0 +1,107 @@
+import math
+
+import numpy as np
+import pytest
+
+from app.utils.geoindex import EARTH_RADIUS_M, GridIndex, haversine_m
+
+
+def _clustered(rng, n_clusters: int, per_cluster: int, spread_deg: float):
+    """Amas très serrés (points d'eau, campements) dans un parc d'environ 50 km"""
+    centers = np.column_stack((rng.uniform(34.0, 34.5, n_clusters), rng.uniform(-2.5, -2.0, n_clusters)))
+    points = np.repeat(centers, per_cluster, axis=0) + rng.normal(0, spread_deg, (n_clusters * per_cluster, 2))
+    return points[:, 0], points[:, 1]
+
+
+def _brute_force(lons, lats, query_lons, query_lats, k):
+    """
+    k plus proches voisins par comparaison exhaustive, classés comme
+    l'index : distance dans la projection équirectangulaire centrée sur les
+    points ; renvoie (positions, distances haversine).
+    """
+    lon0, lat0 = lons.mean(), math.radians(lats.mean())
+
+    def project(lon, lat):
+        return np.radians(lon - lon0) * math.cos(lat0) * EARTH_RADIUS_M, np.radians(lat) * EARTH_RADIUS_M
+
+    x, y = project(lons, lats)
+    qx, qy = project(query_lons, query_lats)
+    d2 = (qx[:, None] - x[None, :]) ** 2 + (qy[:, None] - y[None, :]) ** 2
+    order = np.argsort(d2, axis=1, kind="stable")[:, :k]
+    return order, haversine_m(query_lons[:, None], query_lats[:, None], lons[order], lats[order])
+
+
+@pytest.fixture(scope="module")
+def clustered():
+    rng = np.random.default_rng(7)
+    lons, lats = _clustered(rng, 8, 1500, 2e-5)
+    # Quelques points isolés entre les amas
+    lons = np.concatenate((lons, rng.uniform(34.0, 34.5, 200)))
+    lats = np.concatenate((lats, rng.uniform(-2.5, -2.0, 200)))
+    ids = np.arange(len(lons)) + 1000
+    query_lons = np.concatenate((lons[rng.choice(len(lons), 300)] + rng.normal(0, 1e-5, 300),
+                                 rng.uniform(33.9, 34.6, 200)))
+    query_lats = np.concatenate((lats[rng.choice(len(lats), 300)] + rng.normal(0, 1e-5, 300),
+                                 rng.uniform(-2.6, -1.9, 200)))
+    return ids, lons, lats, query_lons, query_lats
+
+
+def test_dense_cells_are_subdivided(clustered):
+    ids, lons, lats, _, _ = clustered
+    assert GridIndex(ids, lons, lats)._children
+
+
+@pytest.mark.parametrize("k", [1, 5, 20])
+def test_nearest_matches_brute_force(clustered, k):
+    ids, lons, lats, query_lons, query_lats = clustered
+    found_ids, found_distances = GridIndex(ids, lons, lats).nearest(query_lons, query_lats, k=k)
+    expected_positions, expected_distances = _brute_force(lons, lats, query_lons, query_lats, k)
+
+    # Mêmes voisins, à l'ordre des ex aequo près
+    np.testing.assert_allclose(found_distances, expected_distances, rtol=1e-9, atol=1e-9)
+    assert (found_ids == ids[expected_positions]).mean() > 0.99
+    found = found_ids - 1000
+    np.testing.assert_allclose(
+        haversine_m(query_lons[:, None], query_lats[:, None], lons[found], lats[found]), found_distances, rtol=1e-12,
+    )
+
+
+def test_max_distance(clustered):
+    ids, lons, lats, query_lons, query_lats = clustered
+    found_ids, found_distances = GridIndex(ids, lons, lats).nearest(query_lons, query_lats, k=3, max_distance=50.0)
+    _, expected_distances = _brute_force(lons, lats, query_lons, query_lats, 3)
+    within = expected_distances <= 50.0
+    assert (np.isfinite(found_distances) == within).all()
+    assert (found_ids[~within] == -1).all()
+
+    mask = GridIndex(ids, lons, lats).within_distance(query_lons, query_lats, 50.0)
+    np.testing.assert_array_equal(mask, within[:, 0])
+
+
+def test_fewer_points_than_k():
+    index = GridIndex([1, 2], [34.0, 34.001], [-2.0, -2.0])
+    found_ids, found_distances = index.nearest([34.0], [-2.0], k=4)
+    assert found_ids[0].tolist() == [1, 2, -1, -1]
+    assert np.isinf(found_distances[0, 2:]).all()
+
+
+def test_empty_index():
+    found_ids, found_distances = GridIndex([], [], []).nearest([34.0, 35.0], [-2.0, -2.0], k=2)
+    assert (found_ids == -1).all() and np.isinf(found_distances).all()
+
+
+def test_coincident_points():
+    index = GridIndex(np.arange(500), np.full(500, 34.2), np.full(500, -2.2))
+    found_ids, found_distances = index.nearest([34.2], [-2.2], k=10)
+    assert len(set(found_ids[0].tolist())) == 10
+    np.testing.assert_allclose(found_distances, 0.0, atol=1e-9)
+
+
+def test_nearest_query_caps_batch_size():
+    from pydantic import ValidationError
+
+    from app.schemas import MAX_NEAREST_POINTS, NearestWaterPointsQuery
+
+    assert len(NearestWaterPointsQuery(points=[(13.4, 9.3)] * MAX_NEAREST_POINTS).points) == MAX_NEAREST_POINTS
+    with pytest.raises(ValidationError):
+        NearestWaterPointsQuery(points=[(13.4, 9.3)] * (MAX_NEAREST_POINTS + 1))
@@ -0,0 +1,162 @@
+import asyncio
+import io
+import json
+import threading
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func
+
+from app.models import Observation, Species, User
+from app.services.ingest import ingest_observations, iter_csv_records, iter_ndjson_records
+from app.utils.streams import ChunkQueueReader, open_text_stream
+
+MARKER = "test-ingest"
+
+
+def test_ndjson_records():
+    stream = io.StringIO('{"species_id": 1}\n\n[1, 2]\n{oops\n{"species_id": 2}\n')
+    records = list(iter_ndjson_records(stream))
+    assert [line for line, _ in records] == [1, 3, 4, 5]
+    assert records[0][1] == {"species_id": 1}
+    assert records[1][1] == "un objet JSON est attendu"
+    assert records[2][1].startswith("JSON invalide")
+
+
+def test_csv_records_drop_empty_cells():
+    stream = io.StringIO("species_id,latitude,notes\n1,-2.5,\n2,-2.4,vu au gué\n")
+    assert list(iter_csv_records(stream)) == [
+        (2, {"species_id": "1", "latitude": "-2.5"}),
+        (3, {"species_id": "2", "latitude": "-2.4", "notes": "vu au gué"}),
+    ]
+
+
+# === Flux du corps de requête ===
+
+async def _chunks(count: int, size: int):
+    for i in range(count):
+        yield bytes([65 + i % 26]) * size
+
+
+def test_chunk_reader_streams_with_bounded_queue():
+    async def scenario():
+        reader = ChunkQueueReader(maxsize=2)
+        peak, received = [0], []
+
+        def consume():
+            while True:
+                peak[0] = max(peak[0], reader._queue.qsize())
+                data = reader.read(1000)
+                if not data:
+                    return
+                received.append(data)
+
+        consumer = asyncio.ensure_future(asyncio.to_thread(consume))
+        await reader.feed(_chunks(200, 1000), consumer)
+        await consumer
+        return b"".join(received), peak[0]
+
+    body, peak = asyncio.run(scenario())
+    assert body == b"".join(bytes([65 + i % 26]) * 1000 for i in range(200))
+    assert peak <= 2
+
+
+def test_chunk_reader_stops_when_consumer_fails():
+    async def scenario():
+        reader = ChunkQueueReader(maxsize=1)
+        started = threading.Event()
+
+        def consume():
+            started.set()
+            reader.read(10)
+            raise ValueError("lecture interrompue")
+
+        consumer = asyncio.ensure_future(asyncio.to_thread(consume))
+        await asyncio.wait_for(reader.feed(_chunks(10_000, 100), consumer), timeout=5)
+        with pytest.raises(ValueError):
+            await consumer
+        return started.is_set()
+
+    assert asyncio.run(scenario())
+
+
+def test_text_stream_decodes_across_chunks():
+    async def scenario():
+        reader = ChunkQueueReader(maxsize=4)
+        body = "﻿espèce;été\n".encode() * 50
+
+        async def split():
+            for i in range(0, len(body), 7):
+                yield body[i:i + 7]
+
+        consumer = asyncio.ensure_future(asyncio.to_thread(lambda: open_text_stream(reader).read()))
+        await reader.feed(split(), consumer)
+        return await consumer
+
+    assert asyncio.run(scenario()) == "espèce;été\n" + "﻿espèce;été\n" * 49
+
+
+# === COPY (PostgreSQL) ===
+
+@pytest.fixture
+def known(db):
+    species_id = db.query(func.min(Species.id)).scalar()
+    observer_id = db.query(func.min(User.id)).scalar()
+    if species_id is None or observer_id is None:
+        pytest.skip("base sans espèce ni utilisateur")
+    return species_id, observer_id
+
+
+def _record(species_id: int, **fields) -> dict:
+    return {"species_id": species_id, "latitude": -2.3, "longitude": 34.8,
+            "observation_date": "2024-05-01T06:00:00", "count": 2, "notes": MARKER, **fields}
+
+
+def _imported(db):
+    return db.query(Observation).filter(Observation.notes == MARKER).order_by(Observation.id).all()
+
+
+def test_copy_writes_valid_rows_and_reports_errors(db, known):
+    species_id, observer_id = known
+    lines = [
+        json.dumps(_record(species_id, activity_type="suivi_populations", temperature=24.5)),
+        json.dumps(_record(species_id, latitude=95)),
+        "pas du json",
+        json.dumps(_record(2_000_000_001)),
+        json.dumps(_record(species_id, observation_date="2024-05-01T08:00:00+02:00", count=7)),
+    ]
+    result = ingest_observations(db, io.StringIO("\n".join(lines)), "ndjson", observer_id, batch_size=2)
+
+    assert result.imported_count == 2 and not result.success
+    assert len(result.errors) == 3
+    assert any(e.startswith("Ligne 3: JSON invalide") for e in result.errors)
+    assert any(e.startswith("Ligne 2: latitude") for e in result.errors)
+    assert any("Ligne 4: espèce inconnue" in e for e in result.errors)
+
+    first, second = _imported(db)
+    assert first.observer_id == observer_id and first.temperature == 24.5
+    assert first.activity_type.value == "suivi_populations"
+    assert not first.verified
+    # Date avec fuseau : stockée en UTC sans fuseau
+    assert second.observation_date == datetime(2024, 5, 1, 6, 0) and second.count == 7
+
+
+def test_copy_csv(db, known):
+    species_id, observer_id = known
+    body = (
+        "species_id,latitude,longitude,observation_date,count,notes\n"
+        f"{species_id},-2.31,34.81,2024-05-02 07:30:00,3,{MARKER}\n"
+        f"{species_id},-2.32,34.82,2024-05-02 07:45:00,,{MARKER}\n"
+    )
+    result = ingest_observations(db, io.StringIO(body), "csv", observer_id)
+    assert result.success and result.imported_count == 2
+    assert [o.count for o in _imported(db)] == [3, 1]
+
+
+def test_failed_batch_is_reported_and_others_kept(db, known):
+    species_id, _ = known
+    # Observateur inexistant : le lot est refusé par la clé étrangère
+    result = ingest_observations(db, io.StringIO(json.dumps(_record(species_id))), "ndjson", 2_000_000_001)
+    assert result.imported_count == 0
+    assert "échec de l'écriture" in result.errors[0]
+    assert _imported(db) == []
@@ -0,0 +1,46 @@
+import base64
+import json
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.listing import OBSERVATION_KEY, SPECIES_KEY
+from app.utils.pagination import decode_cursor, encode_cursor
+
+
+def _raw_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def test_round_trip_datetime_and_id():
+    values = (datetime(2024, 3, 1, 12, 30, 15, 250), 42)
+    assert decode_cursor(encode_cursor(values), OBSERVATION_KEY) == values
+
+
+def test_round_trip_single_column():
+    assert decode_cursor(encode_cursor([7]), SPECIES_KEY) == (7,)
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor([datetime(2024, 1, 1), 2 ** 40])
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+
+
+@pytest.mark.parametrize("cursor", [
+    _raw_cursor(["x", "y"]),
+    _raw_cursor([{"dt": "pas une date"}, 1]),
+    _raw_cursor([{"dt": 5}, 1]),
+    _raw_cursor([{"dt": "2024-01-01T00:00:00"}, "1"]),
+    _raw_cursor([{"dt": "2024-01-01T00:00:00"}, True]),
+    _raw_cursor([{"dt": "2024-01-01T00:00:00"}, 1.5]),
+    _raw_cursor([{"dt": "2024-01-01T00:00:00"}]),
+    _raw_cursor({"dt": "2024-01-01T00:00:00"}),
+    "!!!",
+    "é",
+    "",
+])
+def test_invalid_cursor_is_rejected_with_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, OBSERVATION_KEY)
+    assert error.value.status_code == 400
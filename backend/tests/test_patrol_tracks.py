@@ -0,0 +1,50 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from app.services.patrol_tracks import (
+    TrackPoints, decode_cells_batch, decode_points, encode_cells, encode_points,
+)
+
+
+def _track(n: int, seed: int = 0) -> TrackPoints:
+    rng = np.random.default_rng(seed)
+    return TrackPoints(
+        longitudes=np.round(34.5 + np.cumsum(rng.normal(0, 1e-4, n)), 7),
+        latitudes=np.round(-2.3 + np.cumsum(rng.normal(0, 1e-4, n)), 7),
+        times=np.datetime64("2024-05-01T06:00:00", "s") + np.cumsum(rng.integers(1, 60, n)).astype("timedelta64[s]"),
+    )
+
+
+def test_points_round_trip():
+    points = _track(500)
+    started_at = points.times[0].astype(datetime)
+    decoded = decode_points(encode_points(points), started_at)
+    np.testing.assert_allclose(decoded.longitudes, points.longitudes, atol=1e-7)
+    np.testing.assert_allclose(decoded.latitudes, points.latitudes, atol=1e-7)
+    np.testing.assert_array_equal(decoded.times, points.times)
+
+
+def test_points_too_far_apart_are_rejected():
+    points = TrackPoints(
+        longitudes=np.array([-179.0, 179.0]), latitudes=np.array([0.0, 0.0]),
+        times=np.array(["2024-01-01T00:00:00", "2024-01-01T00:01:00"], dtype="datetime64[s]"),
+    )
+    with pytest.raises(ValueError):
+        encode_points(points)
+
+
+def test_cells_batch_round_trip():
+    rng = np.random.default_rng(1)
+    lists = [np.unique(rng.integers(0, 10 ** 12, size)) for size in (5, 0, 1, 300, 0, 17)]
+    cells, lengths = decode_cells_batch([encode_cells(c) for c in lists])
+    assert lengths.tolist() == [len(c) for c in lists]
+    np.testing.assert_array_equal(cells, np.concatenate(lists))
+
+
+def test_cells_batch_empty():
+    cells, lengths = decode_cells_batch([encode_cells(np.empty(0, dtype=np.int64))])
+    assert len(cells) == 0 and lengths.tolist() == [0]
+    cells, lengths = decode_cells_batch([])
+    assert len(cells) == 0 and len(lengths) == 0
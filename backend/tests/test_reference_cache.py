@@ -0,0 +1,103 @@
+import pytest
+
+from app.services.data_version import data_versions
+from app.services.reference_cache import CachedResponse, ReferenceCache, compute_etag, etag_matches
+
+ETAG = compute_etag(b"[]")
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ("", False),
+    (ETAG, True),
+    (f"W/{ETAG}", True),
+    (f'"autre", {ETAG}', True),
+    ("*", True),
+    ('"autre"', False),
+    (ETAG.strip('"'), False),
+])
+def test_etag_matches(header, expected):
+    assert etag_matches(header, ETAG) is expected
+
+
+class Builder:
+    def __init__(self, body: bytes = b"[1]"):
+        self.body = body
+        self.calls = 0
+
+    def __call__(self) -> CachedResponse:
+        self.calls += 1
+        return CachedResponse(body=self.body, etag=compute_etag(self.body), headers=(("X-Total-Count", "1"),))
+
+
+def _workers(local_ttl: float = 60.0):
+    """Deux caches partageant le même Redis en mémoire (deux workers)"""
+    first = ReferenceCache(redis_url="memory://", ttl=60, local_ttl=local_ttl, tables=("species",))
+    second = ReferenceCache(redis_url="memory://", ttl=60, local_ttl=local_ttl, tables=("species",))
+    second._backend = first._get_backend()
+    return first, second
+
+
+def test_local_hit():
+    cache, _ = _workers()
+    build = Builder()
+    entry = cache.get_or_build("species", "/species?", build)
+    assert cache.get_or_build("species", "/species?", build) is entry
+    assert build.calls == 1 and cache.hits == 1 and cache.misses == 1
+
+
+def test_entry_shared_through_backend():
+    first, second = _workers()
+    build = Builder()
+    entry = first.get_or_build("species", "/species?", build)
+    shared = second.get_or_build("species", "/species?", build)
+    assert build.calls == 1 and second.remote_hits == 1
+    assert (shared.body, shared.etag, shared.headers) == (entry.body, entry.etag, entry.headers)
+
+
+def test_invalidate_reaches_other_workers():
+    first, second = _workers(local_ttl=0)
+    first.get_or_build("species", "/species?", Builder(b"[1]"))
+    assert second.get_or_build("species", "/species?", Builder(b"[1]")).body == b"[1]"
+
+    first.invalidate(["species"])
+    build = Builder(b"[1,2]")
+    assert second.get_or_build("species", "/species?", build).body == b"[1,2]"
+    assert build.calls == 1
+
+
+def test_local_write_invalidates_immediately():
+    cache = ReferenceCache(redis_url="", ttl=60, tables=("species",))
+    cache.get_or_build("species", "/species?", Builder(b"[1]"))
+    data_versions.bump("species")
+    build = Builder(b"[1,2]")
+    assert cache.get_or_build("species", "/species?", build).body == b"[1,2]"
+    assert build.calls == 1
+
+
+def test_unknown_table_is_ignored():
+    cache, _ = _workers()
+    cache.invalidate(["observations"])
+
+
+def test_backend_failure_falls_back_to_local():
+    class Broken:
+        def mget(self, *names):
+            raise ConnectionError("down")
+
+        def set(self, *args, **kwargs):
+            raise ConnectionError("down")
+
+    cache = ReferenceCache(redis_url="memory://", ttl=60, local_ttl=60, tables=("species",))
+    cache._backend = Broken()
+    build = Builder()
+    cache.get_or_build("species", "/species?", build)
+    cache.get_or_build("species", "/species?", build)
+    assert build.calls == 1
+    assert cache._get_backend() is None
+
+
+def test_serialized_entry_round_trip():
+    entry = Builder()()
+    loaded = CachedResponse.loads(entry.dumps())
+    assert (loaded.body, loaded.etag, loaded.headers) == (entry.body, entry.etag, entry.headers)
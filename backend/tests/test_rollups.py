@@ -0,0 +1,126 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import func
+
+from app.models import Observation, ObservationCellRollup, ObservationDailyRollup, RollupState, Species, User
+from app.services import rollups
+from app.services.rollups import OBSERVATIONS, ROLLUP_CELL_DEGREES, refresh_observations
+
+# Jours sans autre observation (partition par défaut)
+DAY = date(1990, 3, 14)
+NEXT_DAY = DAY + timedelta(days=1)
+
+
+def test_full_rebuild_backoff(monkeypatch):
+    monkeypatch.setattr(rollups, "ROLLUP_FULL_RETRY_SECONDS", 10)
+    monkeypatch.setattr(rollups, "ROLLUP_FULL_REFRESH_SECONDS", 25)
+    backoff = rollups._FullRebuildBackoff()
+    assert backoff.ready()
+    assert [backoff.failed() for _ in range(3)] == [10, 20, 25]
+    assert not backoff.ready()
+    backoff.succeeded()
+    assert backoff.ready() and backoff.failures == 0
+
+
+@pytest.fixture
+def mark(db):
+    """Repère placé après toutes les observations existantes : seules celles du test sont recalculées"""
+    species_id = db.query(func.min(Species.id)).scalar()
+    observer_id = db.query(func.min(User.id)).scalar()
+    if species_id is None or observer_id is None:
+        pytest.skip("base sans espèce ni utilisateur")
+    high_water_mark = (db.query(func.max(Observation.updated_at)).scalar() or datetime.utcnow()) + timedelta(hours=1)
+    refresh_observations(db)
+    db.merge(RollupState(name=OBSERVATIONS, high_water_mark=high_water_mark))
+    db.flush()
+    return species_id, observer_id, high_water_mark
+
+
+def _add(db, species_id, observer_id, updated_at, day=DAY, hour=6, longitude=34.805, latitude=-2.305, count=2):
+    observation = Observation(
+        species_id=species_id, observer_id=observer_id, latitude=latitude, longitude=longitude,
+        observation_date=datetime.combine(day, datetime.min.time()) + timedelta(hours=hour), count=count,
+        created_at=updated_at, updated_at=updated_at,
+    )
+    db.add(observation)
+    db.flush()
+    return observation
+
+
+def _daily(db, day=DAY):
+    return {
+        r.species_id: (r.observations, r.individuals)
+        for r in db.query(ObservationDailyRollup).filter(ObservationDailyRollup.day == day)
+    }
+
+
+def _cells(db, day=DAY):
+    return {
+        (r.cell_x, r.cell_y): (r.observations, r.individuals)
+        for r in db.query(ObservationCellRollup).filter(ObservationCellRollup.day == day)
+    }
+
+
+def _cell(longitude, latitude):
+    return int(longitude // ROLLUP_CELL_DEGREES), int(latitude // ROLLUP_CELL_DEGREES)
+
+
+def test_incremental_refresh_recomputes_touched_days(db, mark):
+    species_id, observer_id, high_water_mark = mark
+    later = high_water_mark + timedelta(seconds=1)
+    _add(db, species_id, observer_id, later)
+    _add(db, species_id, observer_id, later, hour=8, count=3)
+    moved = _add(db, species_id, observer_id, later, longitude=34.815, count=4)
+
+    refresh_observations(db)
+    assert _daily(db) == {species_id: (3, 9)}
+    assert _cells(db) == {_cell(34.805, -2.305): (2, 5), _cell(34.815, -2.305): (1, 4)}
+    state = db.get(RollupState, OBSERVATIONS)
+    assert state.high_water_mark == later
+
+    # Déplacement vers un autre jour : les deux jours sont recalculés
+    moved.observation_date += timedelta(days=1)
+    moved.updated_at = later + timedelta(seconds=1)
+    db.flush()
+    refresh_observations(db)
+    assert _daily(db) == {species_id: (2, 5)}
+    assert _daily(db, NEXT_DAY) == {species_id: (1, 4)}
+    assert _cells(db, NEXT_DAY) == {_cell(34.815, -2.305): (1, 4)}
+    assert state.high_water_mark == moved.updated_at
+
+
+def test_incremental_refresh_without_changes_keeps_rollups(db, mark):
+    species_id, observer_id, high_water_mark = mark
+    _add(db, species_id, observer_id, high_water_mark + timedelta(seconds=1))
+    refresh_observations(db)
+    before = db.get(RollupState, OBSERVATIONS).high_water_mark
+
+    refresh_observations(db)
+    assert _daily(db) == {species_id: (1, 2)}
+    assert db.get(RollupState, OBSERVATIONS).high_water_mark == before
+
+
+def test_full_refresh_catches_deletions(db, mark):
+    species_id, observer_id, high_water_mark = mark
+    later = high_water_mark + timedelta(seconds=1)
+    _add(db, species_id, observer_id, later)
+    deleted = _add(db, species_id, observer_id, later, day=NEXT_DAY, count=5)
+    refresh_observations(db)
+    assert _daily(db, NEXT_DAY) == {species_id: (1, 5)}
+
+    # Le jour n'a plus d'observation : la suppression ne laisse pas de trace dans updated_at
+    db.delete(deleted)
+    db.flush()
+    refresh_observations(db)
+    assert _daily(db, NEXT_DAY) == {species_id: (1, 5)}
+
+    refresh_observations(db, full=True)
+    assert _daily(db, NEXT_DAY) == {} and _cells(db, NEXT_DAY) == {}
+    assert _daily(db) == {species_id: (1, 2)}
+    state = db.get(RollupState, OBSERVATIONS)
+    assert state.full_refreshed_at == state.refreshed_at
+    # La reconstruction couvre toute la table
+    assert db.query(func.sum(ObservationDailyRollup.observations)).scalar() == db.query(
+        func.count(Observation.id)
+    ).scalar()
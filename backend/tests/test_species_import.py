@@ -0,0 +1,91 @@
+"""
+Sémantique de l'upsert des espèces : seules les colonnes présentes dans le
+fichier sont mises à jour, les lignes sont regroupées par ensemble de
+colonnes. Les tests qui utilisent la fixture `db` s'exécutent sur TEST_DATABASE_URL.
+"""
+from datetime import datetime
+
+from sqlalchemy.dialects import postgresql
+
+from app.models import ConservationStatus, Species, SpeciesCategory
+from app.schemas import SpeciesCreate
+from app.services.species_import import _to_values, _upsert_statement, upsert_species_batch
+
+NOW = datetime(2024, 6, 1, 12, 0)
+
+
+def _values(**fields) -> dict:
+    return _to_values(SpeciesCreate(**fields), NOW)
+
+
+def _update_columns(columns) -> set:
+    statement = _upsert_statement(frozenset(columns))
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    assignments = sql.split("DO UPDATE SET", 1)[1].split("RETURNING", 1)[0]
+    return {part.split("=", 1)[0].strip() for part in assignments.split(",")}
+
+
+def test_values_keep_only_fields_from_the_file():
+    values = _values(common_name="Lion", scientific_name="Panthera leo", threats="Braconnage")
+    assert set(values) == {"common_name", "scientific_name", "threats", "created_at", "updated_at"}
+
+
+def test_values_convert_enums():
+    values = _values(common_name="Lion", scientific_name="Panthera leo", category="animal", conservation_status="VU")
+    assert values["category"] is SpeciesCategory.ANIMAL
+    assert values["conservation_status"] is ConservationStatus.VU
+
+
+def test_update_sets_only_present_columns():
+    columns = _values(common_name="Lion", scientific_name="Panthera leo", threats="Braconnage")
+    assert _update_columns(columns) == {"common_name", "threats", "updated_at"}
+
+
+def test_statement_is_built_once_per_column_set():
+    columns = frozenset(_values(common_name="Lion", scientific_name="Panthera leo"))
+    assert _upsert_statement(columns) is _upsert_statement(frozenset(set(columns)))
+
+
+# === Base de données ===
+
+def _species(db, scientific_name: str) -> Species:
+    db.expire_all()
+    return db.query(Species).filter(Species.scientific_name == scientific_name).one()
+
+
+def test_insert_uses_defaults(db):
+    assert upsert_species_batch(db, [_values(common_name="Oryx", scientific_name="Oryx test-insert")]) == 1
+    species = _species(db, "Oryx test-insert")
+    assert species.category is SpeciesCategory.ANIMAL
+    assert species.conservation_status is ConservationStatus.LC
+    assert species.created_at == NOW
+
+
+def test_update_keeps_missing_columns(db):
+    upsert_species_batch(db, [_values(
+        common_name="Oryx", scientific_name="Oryx test-update", description="Antilope", threats="Chasse",
+        conservation_status="EN",
+    )])
+    later = datetime(2024, 7, 1)
+    updated = _to_values(SpeciesCreate(common_name="Oryx beisa", scientific_name="Oryx test-update",
+                                       threats="Sécheresse"), later)
+    assert upsert_species_batch(db, [updated]) == 1
+
+    species = _species(db, "Oryx test-update")
+    assert species.common_name == "Oryx beisa"
+    assert species.threats == "Sécheresse"
+    assert species.description == "Antilope"
+    assert species.conservation_status is ConservationStatus.EN
+    assert species.updated_at == later
+
+
+def test_batch_with_different_column_sets(db):
+    rows = [
+        _values(common_name="A", scientific_name="Testus alpha"),
+        _values(common_name="B", scientific_name="Testus beta", description="Deux colonnes de plus",
+                population_estimate=12),
+        _values(common_name="C", scientific_name="Testus gamma"),
+    ]
+    assert upsert_species_batch(db, rows) == 3
+    assert _species(db, "Testus beta").population_estimate == 12
+    assert _species(db, "Testus gamma").description is None
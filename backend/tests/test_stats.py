@@ -0,0 +1,169 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import Column, Integer, String, create_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from app.services.data_version import register_commit_hook
+from app.services.stats import STALE_DELTA, SpeciesCounters, StatsService, observation_deltas, species_delta
+from tests.conftest import wait_for_listener, wait_until
+
+# Espèce absente de la base : les deltas ne se confondent pas avec les données
+SPECIES_ID = 2_000_000_001
+
+
+def _recent(days: int = 1) -> datetime:
+    return datetime.utcnow().replace(microsecond=0) - timedelta(days=days)
+
+
+def test_observation_deltas_aggregate_per_species():
+    seen = _recent()
+    deltas = {d["species_id"]: d for d in observation_deltas([
+        (1, 10, 3, seen), (1, 11, None, seen - timedelta(days=2)), (1, 10, 2, seen), (2, None, 1, None),
+    ])}
+    assert deltas[1]["observations"] == 3
+    assert deltas[1]["individuals"] == 5
+    assert deltas[1]["observers"] == [10, 11]
+    assert deltas[1]["last"] == seen.isoformat()
+    assert sum(deltas[1]["days"].values()) == 3
+    assert deltas[2] == {"kind": "observations", "species_id": 2, "observations": 1, "individuals": 1,
+                         "last": None, "observers": [], "days": {}}
+
+
+def test_old_days_are_not_kept():
+    delta, = observation_deltas([(1, 1, 1, _recent(days=400))])
+    assert delta["days"] == {}
+    counters = SpeciesCounters(1)
+    counters.merge(delta, _recent(days=30).date())
+    assert counters.total_observations == 1 and counters.daily_counts == {}
+
+
+def test_apply_before_first_load_is_ignored():
+    service = StatsService()
+    service.apply(observation_deltas([(1, 1, 1, _recent())]))
+    assert service._counters == {}
+
+
+def test_own_notifications_are_skipped():
+    service = StatsService()
+    service._loaded_at = 0.0
+    delta, = observation_deltas([(SPECIES_ID, 1, 4, _recent())])
+    service._receive([{**delta, "origin": service._origin()}])
+    assert SPECIES_ID not in service._counters
+    service._receive([{**delta, "origin": "ailleurs"}])
+    assert service._counters[SPECIES_ID].total_individuals == 4
+
+
+def test_species_delta_renames():
+    service = StatsService()
+    service._loaded_at = 0.0
+    service.apply([species_delta(SPECIES_ID, "Lion", "Panthera leo", None)])
+    service.apply([species_delta(SPECIES_ID, "Lion d'Afrique", "Panthera leo", "VU")])
+    counters = service._counters[SPECIES_ID]
+    assert (counters.common_name, counters.conservation_status) == ("Lion d'Afrique", "VU")
+
+
+# === Hook de commit ===
+
+Base = declarative_base()
+
+
+class Item(Base):
+    __tablename__ = "items"
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+@pytest.fixture
+def hooked():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    applied = []
+    register_commit_hook(factory, "names", lambda s: [o.name for o in s.new if isinstance(o, Item)], applied.append)
+    yield factory, applied
+    engine.dispose()
+
+
+def test_commit_hook_applies_every_flush_after_commit(hooked):
+    factory, applied = hooked
+    with factory() as session:
+        session.add(Item(name="a"))
+        session.flush()
+        session.add(Item(name="b"))
+        assert applied == []
+        session.commit()
+    assert applied == [["a", "b"]]
+
+
+def test_commit_hook_discards_on_rollback(hooked):
+    factory, applied = hooked
+    with factory() as session:
+        session.add(Item(name="a"))
+        session.flush()
+        session.rollback()
+        session.add(Item(name="b"))
+        session.commit()
+    assert applied == [["b"]]
+
+
+# === Entre processus (PostgreSQL) ===
+
+@pytest.fixture
+def workers(db_engine):
+    """Deux services sur un canal propre au test, comme deux workers"""
+    channel = f"wt_stats_test_{uuid.uuid4().hex[:8]}"
+    factory = sessionmaker(bind=db_engine)
+    services = [StatsService(channel=channel, resync_seconds=3600) for _ in range(2)]
+    for service in services:
+        service.configure(factory)
+        with factory() as session:
+            service.reload(session)
+        service.start(db_engine)
+    wait_for_listener(db_engine, channel, count=len(services))
+    yield factory, services
+    for service in services:
+        service.stop()
+
+
+def _individuals(service: StatsService) -> int:
+    counters = service._counters.get(SPECIES_ID)
+    return counters.total_individuals if counters else 0
+
+
+def test_deltas_reach_other_processes_once(workers):
+    factory, (writer, reader) = workers
+    deltas = observation_deltas([(SPECIES_ID, 1, 3, _recent()), (SPECIES_ID, 2, 4, _recent())])
+    with factory() as session:
+        writer.publish(session, deltas)
+        session.commit()
+    writer.apply(deltas)
+
+    assert wait_until(lambda: _individuals(reader) == 7)
+    counters = reader._counters[SPECIES_ID]
+    assert counters.total_observations == 2 and counters.observers == {1, 2}
+    # Le processus émetteur ignore sa propre notification
+    assert _individuals(writer) == 7
+
+
+def test_rolled_back_deltas_are_not_delivered(workers):
+    factory, (writer, reader) = workers
+    with factory() as session:
+        writer.publish(session, observation_deltas([(SPECIES_ID, 1, 5, _recent())]))
+        session.rollback()
+    with factory() as session:
+        writer.publish(session, [species_delta(SPECIES_ID, "Témoin", "Testus testis")])
+        session.commit()
+    assert wait_until(lambda: SPECIES_ID in reader._counters)
+    assert _individuals(reader) == 0
+
+
+def test_stale_delta_triggers_reload(workers):
+    factory, (writer, reader) = workers
+    loaded_at = reader._loaded_at
+    with factory() as session:
+        writer.publish(session, [STALE_DELTA])
+        session.commit()
+    assert wait_until(lambda: reader._loaded_at != loaded_at)
+    assert writer._loaded_at is not None and not reader._stale
@@ -0,0 +1,72 @@
+import math
+
+import numpy as np
+import pytest
+
+from app.services.rollups import ROLLUP_CELL_DEGREES
+from app.services.tiles import (
+    TILE_CLUSTER_MAX_ZOOM, TILE_GRID_SIZE, CellGrid, _uses_grid, grid_cluster_features, is_valid_tile, tile_bounds,
+)
+
+
+def _tile_of(lon: float, lat: float, z: int):
+    n = 2 ** z
+    y = (1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n
+    return int((lon + 180) / 360 * n), int(y)
+
+
+def test_tile_bounds():
+    assert tile_bounds(0, 0, 0) == pytest.approx((-180, -85.0511287798, 180, 85.0511287798))
+    west, south, east, north = tile_bounds(8, *_tile_of(34.8, -2.3, 8))
+    assert west <= 34.8 < east and south <= -2.3 < north
+    assert is_valid_tile(3, 7, 7) and not is_valid_tile(3, 8, 0) and not is_valid_tile(23, 0, 0)
+
+
+def test_grid_only_for_unfiltered_coarse_tiles():
+    assert _uses_grid(0, 0, 0, None)
+    assert not _uses_grid(0, 0, 0, species_id=3)
+    assert not _uses_grid(TILE_CLUSTER_MAX_ZOOM, 0, 0, None)
+    # Cellules de tuile plus petites que celles des agrégats
+    z = next(z for z in range(TILE_CLUSTER_MAX_ZOOM) if 360 / 2 ** z / TILE_GRID_SIZE < ROLLUP_CELL_DEGREES)
+    assert not _uses_grid(z, *_tile_of(34.8, -2.3, z), None)
+
+
+def test_grid_clusters_match_direct_aggregation():
+    rng = np.random.default_rng(5)
+    cell_x = rng.integers(3300, 3600, 2000)
+    cell_y = rng.integers(-500, -100, 2000)
+    grid = CellGrid(
+        (cell_x + 0.5) * ROLLUP_CELL_DEGREES, (cell_y + 0.5) * ROLLUP_CELL_DEGREES,
+        rng.integers(0, 50, 2000).astype(float), rng.integers(0, 200, 2000).astype(float),
+    )
+    z = 6
+    x, y = _tile_of(34.8, -2.3, z)
+    west, south, east, north = bounds = tile_bounds(z, x, y)
+    features = grid_cluster_features(grid, bounds)
+
+    inside = ((grid.longitudes >= west) & (grid.longitudes < east) & (grid.latitudes >= south)
+              & (grid.latitudes < north))
+    expected = {}
+    for lon, lat, obs, ind in zip(*(a[inside] for a in grid)):
+        if not obs:
+            continue
+        key = (int((lon - west) / (east - west) * TILE_GRID_SIZE), int((lat - south) / (north - south) * TILE_GRID_SIZE))
+        total = expected.setdefault(key, [0.0, 0.0, 0.0, 0.0])
+        total[0] += obs
+        total[1] += ind
+        total[2] += lon * obs
+        total[3] += lat * obs
+
+    assert len(features) == len(expected)
+    assert sum(f["properties"]["point_count"] for f in features) == grid.observations[inside].sum()
+    for feature in features:
+        lon, lat = feature["geometry"]["coordinates"]
+        key = (int((lon - west) / (east - west) * TILE_GRID_SIZE), int((lat - south) / (north - south) * TILE_GRID_SIZE))
+        obs, ind, lon_sum, lat_sum = expected[key]
+        assert feature["properties"] == {"cluster": True, "point_count": obs, "individuals": ind}
+        assert (lon, lat) == pytest.approx((lon_sum / obs, lat_sum / obs))
+
+
+def test_empty_grid():
+    empty = np.empty(0)
+    assert grid_cluster_features(CellGrid(empty, empty, empty, empty), tile_bounds(0, 0, 0)) == []
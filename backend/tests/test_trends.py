@@ -0,0 +1,74 @@
+from datetime import date
+
+import numpy as np
+
+from app.services.trends import TREND_WINDOW_MONTHS, Z_95, fit_poisson_trends, window_months
+
+YEARS = 2021 + np.arange(36) / 12
+
+
+def test_exact_series_recover_slopes():
+    effort = np.linspace(20, 80, len(YEARS))
+    slopes = np.array([0.3, -0.5, 0.0])
+    x = YEARS - YEARS.mean()
+    counts = effort * np.exp(np.log([0.5, 2.0, 1.0])[:, None] + slopes[:, None] * x)
+    fit = fit_poisson_trends(counts, effort, YEARS)
+    np.testing.assert_allclose(fit["slope"], slopes, atol=1e-8)
+    np.testing.assert_allclose(fit["dispersion"], 1.0)
+    assert fit["months"].tolist() == [36, 36, 36]
+    assert (fit["se"] > 0).all()
+
+
+def test_effort_is_an_offset():
+    # Taux constant par heure de patrouille : l'effort croissant n'est pas une tendance
+    effort = np.linspace(10, 100, len(YEARS))
+    fit = fit_poisson_trends((effort * 0.4)[None, :], effort, YEARS)
+    np.testing.assert_allclose(fit["slope"], 0.0, atol=1e-8)
+
+
+def test_months_without_effort_are_ignored():
+    effort = np.full(len(YEARS), 50.0)
+    counts = np.full((1, len(YEARS)), 25.0)
+    effort[-6:] = 0
+    counts[0, -6:] = [0, 0, 500, 0, 900, 0]
+    fit = fit_poisson_trends(counts, effort, YEARS)
+    np.testing.assert_allclose(fit["slope"], 0.0, atol=1e-8)
+    assert fit["months"][0] == 30
+
+
+def test_empty_series():
+    fit = fit_poisson_trends(np.zeros((2, len(YEARS))), np.full(len(YEARS), 10.0), YEARS)
+    assert np.isfinite(fit["slope"]).all()
+    assert fit["months"].tolist() == [0, 0]
+
+
+def test_poisson_samples_confidence_interval():
+    """Pente estimée sans biais et intervalle à 95 % bien calibré sur des séries simulées"""
+    rng = np.random.default_rng(3)
+    effort = rng.uniform(20, 60, len(YEARS))
+    true_slope = -0.2
+    mu = effort * np.exp(np.log(0.3) + true_slope * (YEARS - YEARS.mean()))
+    counts = rng.poisson(mu, size=(400, len(YEARS)))
+    fit = fit_poisson_trends(counts, effort, YEARS)
+    assert abs(fit["slope"].mean() - true_slope) < 0.01
+    covered = np.abs(fit["slope"] - true_slope) <= Z_95 * fit["se"]
+    assert 0.9 <= covered.mean() <= 0.99
+
+
+def test_overdispersion_widens_intervals():
+    rng = np.random.default_rng(4)
+    effort = np.full(len(YEARS), 40.0)
+    # Poisson-gamma (binomiale négative) : variance bien supérieure à la moyenne
+    counts = rng.poisson(rng.gamma(2.0, 5.0, size=(200, len(YEARS))))
+    fit = fit_poisson_trends(counts, effort, YEARS)
+    assert np.median(fit["dispersion"]) > 3
+    covered = np.abs(fit["slope"]) <= Z_95 * fit["se"]
+    assert covered.mean() >= 0.85
+
+
+def test_window_excludes_current_month():
+    months = window_months(date(2024, 3, 15))
+    assert len(months) == TREND_WINDOW_MONTHS
+    assert months[-1] == date(2024, 2, 1)
+    assert all(m.day == 1 for m in months)
+    assert months == sorted(months)
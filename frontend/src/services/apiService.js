@@ -80,11 +80,42 @@ class ApiService {
     return this.request(endpoint);
   }
 
+  // Pagination par curseur : renvoie la page et le curseur de la suivante
+  async getObservationsPage(filters = {}, cursor = null) {
+    const params = new URLSearchParams();
+    Object.entries(filters).forEach(([key, value]) => {
+      if (value !== null && value !== undefined && value !== '') {
+        params.append(key, value);
+      }
+    });
+    if (cursor) {
+      params.append('cursor', cursor);
+    }
+
+    const response = await fetch(`${this.baseURL}/observations?${params.toString()}`, {
+      headers: this.getHeaders(),
+    });
+    if (!response.ok) {
+      const errorData = await response.json().catch(() => ({}));
+      throw new Error(errorData.detail || `HTTP ${response.status}: ${response.statusText}`);
+    }
+
+    return {
+      items: await response.json(),
+      nextCursor: response.headers.get('X-Next-Cursor'),
+    };
+  }
+
   async getObservationsGeoJSON(speciesId = null) {
     const endpoint = `/observations/geojson${speciesId ? `?species_id=${speciesId}` : ''}`;
     return this.request(endpoint);
   }
 
+  async getObservationTile(z, x, y, speciesId = null) {
+    const endpoint = `/observations/tiles/${z}/${x}/${y}${speciesId ? `?species_id=${speciesId}` : ''}`;
+    return this.request(endpoint);
+  }
+
   async createObservation(observationData) {
     return this.request('/observations', {
       method: 'POST',
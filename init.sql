@@ -30,11 +30,16 @@ BEGIN
     END IF;
 END $$;
 
--- Fonction pour mettre à jour automatiquement le champ updated_at
+-- Fonction pour mettre à jour automatiquement le champ updated_at (UTC,
+-- comme datetime.utcnow côté application, dont la valeur est conservée).
+-- Les triggers qui l'utilisent, et ceux des suppressions, sont posés par
+-- init_database (app.services.sync.install_sync_schema)
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
 BEGIN
-    NEW.updated_at = CURRENT_TIMESTAMP;
+    IF NEW.updated_at IS NOT DISTINCT FROM OLD.updated_at THEN
+        NEW.updated_at = timezone('utc', now());
+    END IF;
     RETURN NEW;
 END;
 $$ language 'plpgsql';
@@ -44,23 +49,52 @@ DO $$
 BEGIN
     -- Index pour la table observations (sera créé après la table)
     IF EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'observations') THEN
-        CREATE INDEX IF NOT EXISTS idx_observations_location ON observations USING GIST (ST_MakePoint(longitude, latitude));
+        -- Colonne géographique calculée (mise à jour par PostgreSQL à chaque écriture)
+        ALTER TABLE observations ADD COLUMN IF NOT EXISTS location geography(Point, 4326)
+            GENERATED ALWAYS AS (ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography) STORED;
+        DROP INDEX IF EXISTS idx_observations_location;
+        -- Rayons en mètres (ST_DWithin sur geography)
+        CREATE INDEX IF NOT EXISTS idx_observations_location ON observations USING GIST (location);
+        -- Emprises et polygones en lon/lat (&&, ST_Intersects sur geometry)
+        CREATE INDEX IF NOT EXISTS idx_observations_location_geom ON observations USING GIST (geometry(location));
         CREATE INDEX IF NOT EXISTS idx_observations_species_date ON observations (species_id, observation_date);
         CREATE INDEX IF NOT EXISTS idx_observations_date ON observations (observation_date);
+        -- Repère des rafraîchissements incrémentaux des agrégats
+        CREATE INDEX IF NOT EXISTS ix_observations_updated_at ON observations (updated_at);
+        -- Zones sensibles de braconnage (l'ORM enregistre le nom du membre de l'enum)
+        CREATE INDEX IF NOT EXISTS idx_observations_poaching_date ON observations (observation_date)
+            WHERE activity_type = 'ANTI_POACHING';
     END IF;
     
     -- Index pour la table water_points (sera créé après la table)
     IF EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'water_points') THEN
-        CREATE INDEX IF NOT EXISTS idx_water_points_location ON water_points USING GIST (ST_MakePoint(longitude, latitude));
+        ALTER TABLE water_points ADD COLUMN IF NOT EXISTS location geography(Point, 4326)
+            GENERATED ALWAYS AS (ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography) STORED;
+        DROP INDEX IF EXISTS idx_water_points_location;
+        CREATE INDEX IF NOT EXISTS idx_water_points_location ON water_points USING GIST (location);
     END IF;
     
     -- Index pour la table activities
     IF EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'activities') THEN
+        ALTER TABLE activities ADD COLUMN IF NOT EXISTS location geography(Point, 4326)
+            GENERATED ALWAYS AS (ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography) STORED;
+        CREATE INDEX IF NOT EXISTS idx_activities_location ON activities USING GIST (location);
         CREATE INDEX IF NOT EXISTS idx_activities_species ON activities (species_id);
         CREATE INDEX IF NOT EXISTS idx_activities_date ON activities (planned_start_date);
         CREATE INDEX IF NOT EXISTS idx_activities_status ON activities (status);
     END IF;
     
+    -- Colonnes dérivées de route_geometry (app.services.patrol_routes)
+    IF EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'patrol_routes') THEN
+        ALTER TABLE patrol_routes
+            ADD COLUMN IF NOT EXISTS bbox_west DOUBLE PRECISION,
+            ADD COLUMN IF NOT EXISTS bbox_south DOUBLE PRECISION,
+            ADD COLUMN IF NOT EXISTS bbox_east DOUBLE PRECISION,
+            ADD COLUMN IF NOT EXISTS bbox_north DOUBLE PRECISION,
+            ADD COLUMN IF NOT EXISTS vertex_count INTEGER,
+            ADD COLUMN IF NOT EXISTS simplified_geometries TEXT;
+    END IF;
+    
     -- Index pour les utilisateurs
     IF EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'users') THEN
         CREATE INDEX IF NOT EXISTS idx_users_role ON users (role);
@@ -77,8 +111,19 @@ END $$;
 
 -- Vues utiles pour les analyses
 
--- Vue des statistiques par espèce
-CREATE OR REPLACE VIEW species_statistics AS
+-- Statistiques par espèce, matérialisées : rafraîchies avec
+-- REFRESH MATERIALIZED VIEW CONCURRENTLY lors des reconstructions complètes
+-- des agrégats (app.services.rollups). Les rapports par jour, par cellule
+-- et par statut d'activité lisent les tables rollup_* maintenues par la
+-- même tâche.
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_views WHERE viewname = 'species_statistics') THEN
+        DROP VIEW species_statistics;
+    END IF;
+END $$;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS species_statistics AS
 SELECT 
     s.id,
     s.common_name,
@@ -94,6 +139,9 @@ FROM species s
 LEFT JOIN observations o ON s.id = o.species_id
 GROUP BY s.id, s.common_name, s.scientific_name, s.conservation_status, s.category;
 
+-- Index unique requis par REFRESH ... CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS idx_species_statistics_id ON species_statistics (id);
+
 -- Vue des observations récentes (30 derniers jours)
 CREATE OR REPLACE VIEW recent_observations AS
 SELECT 
@@ -140,10 +188,10 @@ BEGIN
         COUNT(o.id)::BIGINT,
         (COUNT(o.id)::FLOAT / (PI() * (radius_km * radius_km))) as density
     FROM species s
-    LEFT JOIN observations o ON s.id = o.species_id
+    JOIN observations o ON s.id = o.species_id
     WHERE ST_DWithin(
-        ST_MakePoint(center_lng, center_lat)::geography,
-        ST_MakePoint(o.longitude, o.latitude)::geography,
+        o.location,  -- utilise idx_observations_location
+        ST_SetSRID(ST_MakePoint(center_lng, center_lat), 4326)::geography,
         radius_km * 1000  -- Convertir km en mètres
     )
     GROUP BY s.id, s.common_name